@@ -1,6 +1,6 @@
 """
 API routers module
 """
-from . import upload, analyze, result, config, history
+from . import upload, analyze, result, config, history, batch, search, analytics, rubric, archive
 
-__all__ = ["upload", "analyze", "result", "config", "history"]
+__all__ = ["upload", "analyze", "result", "config", "history", "batch", "search", "analytics", "rubric", "archive"]
@@ -0,0 +1,112 @@
+"""
+統計分析 API
+已完成分析的分數趨勢、等級分布、各維度百分位數與後端/模型比較
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+import logging
+
+from ..database import get_db
+from ..schemas.analytics import (
+    ScoreTrendResponse, GradeDistributionResponse, DimensionStatsResponse, BackendComparisonResponse
+)
+from ..services.analytics import AnalyticsService
+
+router = APIRouter(prefix="/api/v1", tags=["analytics"])
+logger = logging.getLogger(__name__)
+
+
+@router.get("/analytics/trend", response_model=ScoreTrendResponse)
+async def get_score_trend(
+    bucket: str = Query("month", description="時間區間: day, week, month"),
+    days: int = Query(365, ge=1, le=3660, description="統計最近天數"),
+    backend: Optional[str] = Query(None, description="過濾後端"),
+    model: Optional[str] = Query(None, description="過濾模型"),
+    dimension: Optional[str] = Query(None, description="改為統計此維度的完成度 (%)"),
+    db: Session = Depends(get_db)
+):
+    """
+    分數趨勢
+
+    每個時間區間的平均、最低與最高總分 (指定 dimension 時為該維度的完成度),
+    無資料的區間也會列出 (count 為 0)
+
+    Args:
+        bucket: 時間區間
+        days: 統計天數 (往前延伸至第一個區間的起點)
+        backend: 後端
+        model: 模型
+        dimension: 評估維度
+
+    Returns:
+        依時間排序的區間統計
+    """
+    if bucket not in AnalyticsService.BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"無效的時間區間: {bucket}"
+        )
+
+    return AnalyticsService.score_trend(
+        db, bucket=bucket, days=days, backend=backend, model=model, dimension=dimension
+    )
+
+
+@router.get("/analytics/grades", response_model=GradeDistributionResponse)
+async def get_grade_distribution(
+    days: int = Query(365, ge=1, le=3660, description="統計最近天數"),
+    backend: Optional[str] = Query(None, description="過濾後端"),
+    db: Session = Depends(get_db)
+):
+    """
+    等級分布
+
+    Args:
+        days: 統計天數
+        backend: 後端
+
+    Returns:
+        各等級的任務數與比例
+    """
+    return AnalyticsService.grade_distribution(db, days=days, backend=backend)
+
+
+@router.get("/analytics/dimensions", response_model=DimensionStatsResponse)
+async def get_dimension_stats(
+    days: int = Query(365, ge=1, le=3660, description="統計最近天數"),
+    backend: Optional[str] = Query(None, description="過濾後端"),
+    model: Optional[str] = Query(None, description="過濾模型"),
+    db: Session = Depends(get_db)
+):
+    """
+    各維度評分統計
+
+    每個評估維度的平均得分、平均完成度與完成度百分位數 (p25, p50, p75, p90)
+
+    Args:
+        days: 統計天數
+        backend: 後端
+        model: 模型
+
+    Returns:
+        依評分標準順序排列的維度統計
+    """
+    return AnalyticsService.dimension_stats(db, days=days, backend=backend, model=model)
+
+
+@router.get("/analytics/backends", response_model=BackendComparisonResponse)
+async def get_backend_comparison(
+    days: int = Query(30, ge=1, le=3660, description="統計最近天數"),
+    db: Session = Depends(get_db)
+):
+    """
+    後端與模型比較
+
+    Args:
+        days: 統計天數
+
+    Returns:
+        各後端/模型的完成數、失敗數、失敗率與分數統計
+    """
+    return AnalyticsService.backend_comparison(db, days=days)
@@ -2,17 +2,29 @@
 分析任務 API
 提供 FA 報告分析任務的創建、查詢和管理功能
 """
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from pathlib import Path
+import asyncio
+import json
 import logging
 
-from ..database import get_db, SessionLocal
+from ..database import SessionLocal, get_db
 from ..models.task import AnalysisTask, TaskStatus
 from ..models.config import SystemConfig
-from ..schemas.task import AnalysisTaskCreate, AnalysisTaskResponse
-from ..services.analyzer import FAReportAnalyzerService
+from ..models.webhook import WebhookDelivery
+from ..schemas.task import AnalysisTaskCreate, AnalysisTaskResponse, AnalysisEstimateResponse, WebhookDeliveryResponse
+from ..services.model_router import ModelRouter
+from ..services.estimator import AnalysisEstimator
+from ..services.admission import AdmissionController
+from ..services.progress import get_progress_registry
+from ..services.task_queue import TaskQueue
 from ..services.task_manager import TaskManager
+from ..services.task_runner import TaskDispatcher
+from ..services.webhook import CallbackURLRejected, WebhookService
+from ..core.security import get_security_manager
 from ..config import settings
 
 router = APIRouter(prefix="/api/v1", tags=["analyze"])
@@ -37,123 +49,96 @@ def get_config_value(db: Session, key: str, default: str = None) -> str:
     return default
 
 
-async def run_analysis_background(task_id: str, file_path: str, config: dict):
+def get_secret_config_value(db: Session, key: str) -> Optional[str]:
     """
-    後台分析任務執行函數
+    從數據庫獲取並解密加密存儲的配置值 (API Key)
 
     Args:
-        task_id: 任務 ID
-        file_path: 文件路徑
-        config: 分析配置
-    """
-    db = SessionLocal()
+        db: 數據庫會話
+        key: 配置鍵
 
+    Returns:
+        解密後的配置值,不存在或無法解密時返回 None
+    """
+    value = get_config_value(db, key)
+    if not value:
+        return None
     try:
-        logger.info(f"開始後台分析任務: {task_id}")
-
-        # 記錄分析配置
-        backend = config["backend"]
-        model = config.get("model") or "auto"
-        base_url = config.get("base_url")
-        skip_images = config.get("skip_images", False)
-
-        logger.info(f"✓ 使用 {backend.upper()} 後端: {model}")
-        if base_url:
-            logger.info(f"✓ Base URL: {base_url}")
-        if skip_images:
-            logger.info(f"✓ 跳過圖片分析")
+        return get_security_manager().decrypt(value)
+    except Exception:
+        logger.error(f"無法解密配置 {key},請確認 ENCRYPTION_KEY 與保存時一致")
+        return None
 
-        # 更新任務狀態為處理中
-        task = db.query(AnalysisTask).filter(AnalysisTask.id == task_id).first()
-        if task:
-            task.status = TaskStatus.PROCESSING.value
-            db.commit()
-
-        # 創建分析服務
-        analyzer = FAReportAnalyzerService()
-
-        # 進度回調函數
-        def progress_callback(progress: int, message: str):
-            TaskManager.update_progress(db, task_id, progress, message)
-            logger.info(f"任務 {task_id} 進度: {progress}% - {message}")
-
-        # 執行分析
-        result = await analyzer.analyze_report(
-            file_path=file_path,
-            backend=backend,
-            model=config.get("model"),
-            api_key=config.get("api_key"),
-            base_url=base_url,
-            skip_images=skip_images,
-            progress_callback=progress_callback
-        )
 
-        # 標記任務完成
-        TaskManager.mark_completed(db, task_id, result)
-        logger.info(f"任務 {task_id} 完成")
+def is_model_routing_enabled(db: Session) -> bool:
+    """
+    是否啟用模型路由 (數據庫配置 > 環境變量)
 
-    except Exception as e:
-        logger.error(f"任務 {task_id} 失敗: {str(e)}")
-        TaskManager.mark_failed(db, task_id, str(e))
+    Args:
+        db: 數據庫會話
 
-    finally:
-        db.close()
+    Returns:
+        是否啟用
+    """
+    db_value = get_config_value(db, 'model_routing_enabled')
+    if db_value is not None:
+        return db_value.lower() in ("true", "1", "yes")
+    return settings.MODEL_ROUTING_ENABLED
 
 
-@router.post("/analyze", response_model=AnalysisTaskResponse)
-async def create_analysis_task(
-    request: AnalysisTaskCreate,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
-):
+def find_uploaded_file(file_id: str) -> Path:
     """
-    創建分析任務
+    根據文件 ID 查找已上傳的文件
 
     Args:
-        request: 分析任務創建請求
-        - file_id: 上傳的文件 ID
-        - backend: LLM 後端 (ollama, openai, anthropic)
-        - model: 模型名稱 (可選)
-        - api_key: API 密鑰 (可選)
-        - skip_images: 是否跳過圖片處理
+        file_id: 上傳的文件 ID
 
     Returns:
-        任務信息,包含 task_id 用於後續查詢
-    """
+        文件路徑
 
-    # 查找上傳的文件
+    Raises:
+        HTTPException: 文件不存在
+    """
     upload_dir = Path(settings.UPLOAD_DIR)
-    matching_files = list(upload_dir.glob(f"{request.file_id}.*"))
+    matching_files = list(upload_dir.glob(f"{file_id}.*"))
 
     if not matching_files:
         raise HTTPException(
             status_code=404,
-            detail=f"文件不存在: {request.file_id}"
+            detail=f"文件不存在: {file_id}"
         )
 
-    file_path = str(matching_files[0])
-    # 使用用戶提供的原始文件名,如果沒有則使用服務器文件名
-    filename = request.filename if request.filename else matching_files[0].name
+    return matching_files[0]
 
-    # 驗證 backend
-    valid_backends = ["ollama", "openai", "anthropic"]
-    if request.backend not in valid_backends:
-        raise HTTPException(
-            status_code=400,
-            detail=f"不支援的 backend: {request.backend}。支援: {', '.join(valid_backends)}"
-        )
 
-    # 處理 API Key 和 base_url：優先級為 請求參數 > 數據庫配置 > 環境變量
-    api_key = request.api_key
-    base_url = request.base_url
-    model = request.model
+def resolve_backend_config(
+    db: Session,
+    backend: str,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    model: Optional[str] = None
+) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    解析後端的 API Key、base_url 和模型
+
+    優先級為 請求參數 > 數據庫配置 > 環境變量
 
+    Args:
+        db: 數據庫會話
+        backend: LLM 後端
+        api_key: 請求提供的 API Key
+        base_url: 請求提供的 base_url
+        model: 請求提供的模型名稱
+
+    Returns:
+        (api_key, base_url, model)
+    """
     # 如果沒有提供，依次從數據庫和環境變量讀取
-    if request.backend == "openai":
+    if backend == "openai":
         # API Key
         if not api_key:
             # 先從數據庫讀取
-            db_api_key = get_config_value(db, 'openai_api_key')
+            db_api_key = get_secret_config_value(db, 'openai_api_key')
             if db_api_key:
                 api_key = db_api_key
                 logger.info("使用數據庫中的 OPENAI_API_KEY")
@@ -183,7 +168,15 @@ async def create_analysis_task(
                 model = settings.DEFAULT_MODEL
                 logger.info(f"使用環境變量中的 DEFAULT_MODEL: {model}")
 
-    elif request.backend == "ollama":
+    elif backend == "anthropic":
+        # API Key (未設定時由 SDK 讀取 ANTHROPIC_API_KEY 環境變量)
+        if not api_key:
+            db_api_key = get_secret_config_value(db, 'anthropic_api_key')
+            if db_api_key:
+                api_key = db_api_key
+                logger.info("使用數據庫中的 ANTHROPIC_API_KEY")
+
+    elif backend == "ollama":
         # Ollama Base URL
         if not base_url:
             db_base_url = get_config_value(db, 'ollama_base_url')
@@ -194,37 +187,168 @@ async def create_analysis_task(
                 base_url = settings.OLLAMA_BASE_URL
                 logger.info(f"使用環境變量中的 OLLAMA_BASE_URL: {base_url}")
 
-    # 創建分析任務
+    return api_key, base_url, model
+
+
+@router.post("/analyze", response_model=AnalysisTaskResponse)
+async def create_analysis_task(
+    request: AnalysisTaskCreate,
+    http_request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    創建分析任務
+
+    Args:
+        request: 分析任務創建請求
+        - file_id: 上傳的文件 ID
+        - backend: LLM 後端 (ollama, openai, anthropic)
+        - model: 模型名稱 (可選)
+        - api_key: API 密鑰 (可選)
+        - skip_images: 是否跳過圖片處理
+        - priority: 優先級 (urgent, normal, low)
+        - submitter: 提交者或來源 (可選,預設為客戶端地址)
+        - callback_url: 任務結束時接收 webhook 的 URL (可選)
+
+    Returns:
+        任務信息,包含 task_id 用於後續查詢
+    """
+
+    # 查找上傳的文件
+    uploaded_file = find_uploaded_file(request.file_id)
+
+    file_path = str(uploaded_file)
+    # 使用用戶提供的原始文件名,如果沒有則使用服務器文件名
+    filename = request.filename if request.filename else uploaded_file.name
+
+    # 驗證 backend
+    valid_backends = ["ollama", "openai", "anthropic"]
+    if request.backend not in valid_backends:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支援的 backend: {request.backend}。支援: {', '.join(valid_backends)}"
+        )
+
+    # 回調 URL 須解析為公開地址 (投遞前會再檢查一次)
+    if request.callback_url:
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, WebhookService.check_url, request.callback_url)
+        except CallbackURLRejected as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except OSError:
+            raise HTTPException(status_code=400, detail="無法解析 callback_url 的主機")
+
+    # 處理 API Key 和 base_url：優先級為 請求參數 > 數據庫配置 > 環境變量
+    api_key, base_url, model = resolve_backend_config(
+        db, request.backend, request.api_key, request.base_url, request.model
+    )
+
+    # 請求未指定模型時,由模型路由器依報告特徵選擇 (優先於預設模型)
+    auto_route = not request.model and is_model_routing_enabled(db)
+
+    # 准入控制: 佇列過長時拒絕,請客戶端稍後重試
+    retry_after = AdmissionController.check(db, request.backend, model, request.priority)
+    if retry_after is not None:
+        logger.warning(f"佇列已滿,拒絕分析任務: {filename} (建議 {retry_after} 秒後重試)")
+        raise HTTPException(
+            status_code=429,
+            detail=f"分析佇列已滿,請於 {retry_after} 秒後重試",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+    # 創建分析任務並放入持久化佇列,由 worker 認領執行
     task = AnalysisTask(
         filename=filename,
         file_path=file_path,
         status=TaskStatus.PENDING.value,
         backend=request.backend,
         model=model or "auto",
-        skip_images=1 if request.skip_images else 0
+        skip_images=1 if request.skip_images else 0,
+        priority=request.priority,
+        # 公平分配以提交者為單位,未指定時以客戶端地址區分來源
+        submitter=request.submitter or (http_request.client.host if http_request.client else None),
+        callback_url=request.callback_url
     )
 
-    db.add(task)
-    db.commit()
-    db.refresh(task)
-
-    logger.info(f"創建分析任務: {task.id} - {filename}")
-
-    # 啟動後台任務
-    background_tasks.add_task(
-        run_analysis_background,
-        task.id,
-        file_path,
-        {
-            "backend": request.backend,
-            "model": model,
-            "api_key": api_key,
-            "base_url": base_url,
-            "skip_images": request.skip_images
-        }
+    task = TaskQueue.enqueue(db, task, {
+        "backend": request.backend,
+        "model": model,
+        "api_key": api_key,
+        "base_url": base_url,
+        "skip_images": request.skip_images,
+        "auto_route": auto_route,
+        "routing_tiers": (get_config_value(db, 'model_routing_tiers') or settings.MODEL_ROUTING_TIERS) if auto_route else None,
+        "image_token_budget": request.image_token_budget or settings.IMAGE_TOKEN_BUDGET
+    })
+
+    logger.info(f"創建分析任務: {task.id} - {filename} (優先級: {task.priority}, 提交者: {task.submitter})")
+
+    # 喚醒本進程的分派器 (其他 worker 透過輪詢取得任務)
+    TaskDispatcher.notify()
+
+    return {**task.to_dict(), **AdmissionController.queue_info(db, task)}
+
+
+@router.post("/analyze/estimate", response_model=AnalysisEstimateResponse)
+async def estimate_analysis_task(
+    request: AnalysisTaskCreate,
+    db: Session = Depends(get_db)
+):
+    """
+    預估分析任務的成本與延遲 (不呼叫 LLM)
+
+    在本地執行報告提取、提示詞建立和圖片規劃,並依歷史任務的遙測數據
+    預估處理時間和排隊等待時間
+
+    Args:
+        request: 與創建分析任務相同的請求
+
+    Returns:
+        預估的輸入/輸出 token 數、送出的圖片數、預期延遲和排隊等待時間
+    """
+    uploaded_file = find_uploaded_file(request.file_id)
+
+    valid_backends = ["ollama", "openai", "anthropic"]
+    if request.backend not in valid_backends:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支援的 backend: {request.backend}。支援: {', '.join(valid_backends)}"
+        )
+
+    _, _, model = resolve_backend_config(
+        db, request.backend, request.api_key, request.base_url, request.model
     )
 
-    return task.to_dict()
+    # 與實際執行相同: 未指定模型且啟用路由時,依報告特徵選擇模型
+    model_router = None
+    if not request.model and is_model_routing_enabled(db):
+        model_router = ModelRouter.from_config(
+            get_config_value(db, 'model_routing_tiers') or settings.MODEL_ROUTING_TIERS
+        )
+
+    try:
+        estimate = await AnalysisEstimator.estimate(
+            db,
+            str(uploaded_file),
+            request.backend,
+            model=model,
+            skip_images=request.skip_images,
+            image_token_budget=request.image_token_budget or settings.IMAGE_TOKEN_BUDGET,
+            router=model_router,
+            priority=request.priority
+        )
+    except Exception as e:
+        logger.error(f"預估失敗: {str(e)}")
+        raise HTTPException(
+            status_code=422,
+            detail=f"無法讀取報告: {str(e)}"
+        )
+
+    logger.info(
+        f"預估 {request.file_id}: {estimate['input_tokens']} 輸入 tokens, "
+        f"{estimate['image_count']} 張圖片, 延遲 {estimate['expected_latency_ms']} ms"
+    )
+    return estimate
 
 
 @router.get("/analyze/{task_id}", response_model=AnalysisTaskResponse)
@@ -238,6 +362,11 @@ async def get_analysis_status(task_id: str, db: Session = Depends(get_db)):
     Returns:
         任務當前狀態,包括進度、狀態、錯誤信息等
     """
+    # 本進程執行中的任務直接從記憶體讀取最新進度
+    running = get_progress_registry().get(task_id)
+    if running:
+        return running
+
     task = db.query(AnalysisTask).filter(AnalysisTask.id == task_id).first()
 
     if not task:
@@ -246,44 +375,176 @@ async def get_analysis_status(task_id: str, db: Session = Depends(get_db)):
             detail=f"任務不存在: {task_id}"
         )
 
-    return task.to_dict()
+    return {**task.to_dict(), **AdmissionController.queue_info(db, task)}
 
 
-@router.delete("/analyze/{task_id}")
-async def cancel_analysis_task(task_id: str, db: Session = Depends(get_db)):
+FINAL_STATUSES = (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, TaskStatus.CANCELLED.value)
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """格式化為 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def read_task_status(task_id: str) -> Optional[Dict[str, Any]]:
+    """從資料庫讀取任務狀態 (含佇列位置),格式與 AnalysisTaskResponse 相同"""
+    db = SessionLocal()
+    try:
+        task = db.query(AnalysisTask).filter(AnalysisTask.id == task_id).first()
+        if not task:
+            return None
+        status = {**task.to_dict(), **AdmissionController.queue_info(db, task)}
+        return AnalysisTaskResponse(**status).model_dump(mode="json")
+    finally:
+        db.close()
+
+
+@router.get("/analyze/{task_id}/events")
+async def stream_analysis_events(task_id: str, request: Request, db: Session = Depends(get_db)):
     """
-    取消分析任務 (僅限未開始或進行中的任務)
+    以 Server-Sent Events 推送任務狀態
+
+    事件:
+    - snapshot: 完整任務狀態 (連線時、開始執行時及結束時)
+    - progress: {progress, message}
+    - stage: {stage} 進入的管線階段
+    - partial: {text, chars} LLM 串流輸出的片段
+
+    任務結束 (completed / failed / cancelled) 後送出最終 snapshot 並關閉連線。
+    由本進程執行的任務即時推送;由其他 worker 執行或排隊中的任務
+    每 EVENT_STREAM_POLL_SECONDS 秒從資料庫讀取一次。
 
     Args:
         task_id: 任務 ID
 
     Returns:
-        取消結果
+        text/event-stream 串流
     """
-    task = db.query(AnalysisTask).filter(AnalysisTask.id == task_id).first()
-
-    if not task:
+    if not db.query(AnalysisTask.id).filter(AnalysisTask.id == task_id).first():
         raise HTTPException(
             status_code=404,
             detail=f"任務不存在: {task_id}"
         )
 
-    if task.status == TaskStatus.COMPLETED.value:
+    registry = get_progress_registry()
+    # 先訂閱再讀取狀態,避免錯過兩者之間的事件
+    queue = registry.subscribe(task_id)
+
+    async def events():
+        try:
+            running = registry.get(task_id)
+            status = AnalysisTaskResponse(**running).model_dump(mode="json") if running else read_task_status(task_id)
+            yield format_sse("snapshot", status)
+            if not status or status["status"] in FINAL_STATUSES:
+                return
+
+            last = status
+            while not await request.is_disconnected():
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=settings.EVENT_STREAM_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    if registry.get(task_id):
+                        # 本進程執行中,事件會即時推送,僅保持連線
+                        yield ": keep-alive\n\n"
+                        continue
+                    event, data = "finished", {}
+
+                if event == "snapshot":
+                    data = AnalysisTaskResponse(**data).model_dump(mode="json")
+                elif event == "finished":
+                    # 任務離開本進程 (或由其他 worker 執行): 以資料庫狀態為準
+                    data = read_task_status(task_id)
+                    if not data:
+                        return
+                    event = "snapshot"
+                    changed = any(data.get(k) != last.get(k) for k in ("status", "progress", "message", "queue_position"))
+                    if not changed:
+                        yield ": keep-alive\n\n"
+                        continue
+
+                yield format_sse(event, data)
+                if event == "progress":
+                    last = {**last, **data}
+                elif event == "snapshot":
+                    last = data
+                    if data["status"] in FINAL_STATUSES:
+                        return
+        finally:
+            registry.unsubscribe(task_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/analyze/{task_id}/webhooks", response_model=List[WebhookDeliveryResponse])
+async def list_webhook_deliveries(task_id: str, db: Session = Depends(get_db)):
+    """
+    查詢任務的 webhook 投遞記錄
+
+    Args:
+        task_id: 任務 ID
+
+    Returns:
+        投遞記錄列表 (依建立時間排序)
+    """
+    if not db.query(AnalysisTask.id).filter(AnalysisTask.id == task_id).first():
         raise HTTPException(
-            status_code=400,
-            detail="任務已完成,無法取消"
+            status_code=404,
+            detail=f"任務不存在: {task_id}"
         )
 
-    if task.status == TaskStatus.FAILED.value:
+    deliveries = db.query(WebhookDelivery).filter(
+        WebhookDelivery.task_id == task_id
+    ).order_by(WebhookDelivery.created_at).all()
+    return [delivery.to_dict() for delivery in deliveries]
+
+
+@router.delete("/analyze/{task_id}")
+async def cancel_analysis_task(task_id: str, db: Session = Depends(get_db)):
+    """
+    取消分析任務 (僅限未開始或進行中的任務)
+
+    進行中的任務會在下一個階段前停止,進行中的 LLM 串流會被中止
+
+    Args:
+        task_id: 任務 ID
+
+    Returns:
+        取消結果
+    """
+    # 條件更新: 只有 pending/processing 的任務會被取消,已取消的任務不會再被完成覆蓋
+    if not TaskManager.cancel(db, task_id):
+        task = db.query(AnalysisTask).filter(AnalysisTask.id == task_id).first()
+
+        if not task:
+            raise HTTPException(
+                status_code=404,
+                detail=f"任務不存在: {task_id}"
+            )
+
+        if task.status == TaskStatus.COMPLETED.value:
+            raise HTTPException(
+                status_code=400,
+                detail="任務已完成,無法取消"
+            )
+
+        if task.status == TaskStatus.CANCELLED.value:
+            raise HTTPException(
+                status_code=400,
+                detail="任務已取消"
+            )
+
         raise HTTPException(
             status_code=400,
             detail="任務已失敗,無需取消"
         )
 
-    # 標記為失敗(取消)
-    task.status = TaskStatus.FAILED.value
-    task.error = "任務已被用戶取消"
-    db.commit()
+    # 本進程執行中的任務立即中止,其他 worker 在下次輪詢時發現
+    TaskDispatcher.cancel_local(task_id)
+    get_progress_registry().finish(task_id)
 
     logger.info(f"任務已取消: {task_id}")
 
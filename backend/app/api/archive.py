@@ -0,0 +1,132 @@
+"""
+歸檔 API
+查詢已歸檔的任務與歸檔分段,並可立即執行一次保留策略
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+import logging
+
+from ..config import settings
+from ..database import get_db
+from ..models.archive import ArchiveSegment, ArchivedTask
+from ..schemas.archive import ArchiveSegmentResponse, ArchivedTaskItem, RetentionRunResponse
+from ..schemas.task import AnalysisTaskResponse
+from ..services.retention import RetentionService
+
+router = APIRouter(prefix="/api/v1", tags=["archive"])
+logger = logging.getLogger(__name__)
+
+
+@router.get("/archive/tasks", response_model=List[ArchivedTaskItem])
+async def list_archived_tasks(
+    filename: Optional[str] = Query(None, description="文件名包含"),
+    status: Optional[str] = Query(None, description="過濾狀態"),
+    backend: Optional[str] = Query(None, description="過濾後端"),
+    limit: int = Query(100, ge=1, le=1000, description="返回數量限制"),
+    offset: int = Query(0, ge=0, description="偏移量"),
+    db: Session = Depends(get_db)
+):
+    """
+    已歸檔的任務列表
+
+    Args:
+        filename: 文件名關鍵字
+        status: 狀態
+        backend: 後端
+        limit: 返回數量
+        offset: 偏移量
+
+    Returns:
+        歸檔索引中的任務摘要,按創建時間倒序
+    """
+    query = db.query(ArchivedTask)
+    if filename:
+        query = query.filter(ArchivedTask.filename.contains(filename))
+    if status:
+        query = query.filter(ArchivedTask.status == status)
+    if backend:
+        query = query.filter(ArchivedTask.backend == backend)
+
+    entries = query.order_by(
+        ArchivedTask.created_at.desc(), ArchivedTask.task_id.desc()
+    ).offset(offset).limit(limit).all()
+    return [entry.to_dict() for entry in entries]
+
+
+@router.get("/archive/tasks/{task_id}", response_model=AnalysisTaskResponse)
+async def get_archived_task(task_id: str, db: Session = Depends(get_db)):
+    """
+    讀取已歸檔任務的完整記錄
+
+    只解壓縮歸檔分段中包含該任務的區塊
+
+    Args:
+        task_id: 任務 ID
+
+    Returns:
+        任務詳細信息 (歸檔時的內容)
+    """
+    try:
+        record = RetentionService.get_archived(db, task_id)
+    except (OSError, RuntimeError) as e:
+        logger.error(f"讀取歸檔失敗 {task_id}: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"讀取歸檔失敗: {str(e)}"
+        )
+
+    if record is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"歸檔中沒有此任務: {task_id}"
+        )
+
+    return record
+
+
+@router.get("/archive/segments", response_model=List[ArchiveSegmentResponse])
+async def list_archive_segments(
+    limit: int = Query(100, ge=1, le=1000, description="返回數量限制"),
+    db: Session = Depends(get_db)
+):
+    """
+    歸檔分段列表
+
+    Args:
+        limit: 返回數量
+
+    Returns:
+        歸檔分段文件,最新的在前
+    """
+    segments = db.query(ArchiveSegment).order_by(ArchiveSegment.id.desc()).limit(limit).all()
+    return [segment.to_dict() for segment in segments]
+
+
+@router.post("/archive/run", response_model=RetentionRunResponse)
+async def run_retention(
+    archive_days: Optional[int] = Query(None, ge=0, description="歸檔創建超過此天數的已結束任務 (預設 RETENTION_ARCHIVE_DAYS)"),
+    upload_days: Optional[int] = Query(None, ge=0, description="刪除超過此天數的已結束任務上傳文件 (預設 RETENTION_UPLOAD_DAYS)"),
+    orphan_hours: Optional[float] = Query(None, ge=0, description="刪除超過此時數且無任務使用的上傳文件 (預設 RETENTION_ORPHAN_UPLOAD_HOURS)")
+):
+    """
+    立即執行一次保留策略
+
+    未指定且未設定的層級不執行
+
+    Args:
+        archive_days: 歸檔天數
+        upload_days: 上傳文件保留天數
+        orphan_hours: 孤立上傳文件保留時數
+
+    Returns:
+        寫入的分段數、歸檔的任務數與待刪除的上傳文件數
+    """
+    try:
+        return await RetentionService.run_once(
+            archive_days if archive_days is not None else settings.RETENTION_ARCHIVE_DAYS,
+            upload_days if upload_days is not None else settings.RETENTION_UPLOAD_DAYS,
+            orphan_hours if orphan_hours is not None else settings.RETENTION_ORPHAN_UPLOAD_HOURS
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
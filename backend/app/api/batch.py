@@ -0,0 +1,134 @@
+"""
+批次分析 API
+透過 OpenAI Batch / Anthropic Message Batches 接口大量評分 FA 報告
+"""
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+import logging
+
+from ..database import get_db
+from ..models.batch import AnalysisBatch, BatchStatus
+from ..models.task import AnalysisTask, TaskStatus
+from ..schemas.batch import BatchCreate, BatchResponse
+from ..services.batch import BatchScoringService, PROVIDERS
+from ..core.fa_analyzer_core import FAReportAnalyzer
+from ..core.security import get_security_manager
+from .analyze import find_uploaded_file, resolve_backend_config
+
+router = APIRouter(prefix="/api/v1", tags=["batch"])
+logger = logging.getLogger(__name__)
+
+
+def _batch_response(db: Session, batch: AnalysisBatch) -> dict:
+    """組裝批次響應,包含各狀態任務數"""
+    task_ids = [
+        task_id for (task_id,) in db.query(AnalysisTask.id).filter(
+            AnalysisTask.batch_id == batch.id
+        ).all()
+    ]
+    by_status = dict(
+        db.query(AnalysisTask.status, func.count(AnalysisTask.id)).filter(
+            AnalysisTask.batch_id == batch.id
+        ).group_by(AnalysisTask.status).all()
+    )
+
+    response = batch.to_dict()
+    response["task_ids"] = task_ids
+    response["by_status"] = by_status
+    return response
+
+
+@router.post("/batch", response_model=BatchResponse)
+async def create_batch(
+    request: BatchCreate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """
+    創建批次評分任務
+
+    為每份報告創建一個 AnalysisTask,並透過供應商批次接口一次提交。
+    結果由後台輪詢器在供應商完成後回寫至各任務。
+
+    Args:
+        request: 批次創建請求
+        - items: 報告列表 (file_id, filename)
+        - backend: LLM 後端 (openai, anthropic)
+        - model: 模型名稱 (可選)
+        - api_key: API 密鑰 (可選)
+        - skip_images: 是否跳過圖片處理
+
+    Returns:
+        批次信息,包含 batch_id 和各任務 ID
+    """
+    # 驗證 backend
+    if request.backend not in PROVIDERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"此 backend 不支援批次模式: {request.backend}。支援: {', '.join(PROVIDERS)}"
+        )
+
+    # 查找所有上傳的文件
+    uploaded_files = [find_uploaded_file(item.file_id) for item in request.items]
+
+    api_key, base_url, model = resolve_backend_config(
+        db, request.backend, request.api_key, request.base_url, request.model
+    )
+    if not model:
+        model = FAReportAnalyzer(backend=request.backend, init_client=False).model
+
+    batch = AnalysisBatch(
+        backend=request.backend,
+        model=model,
+        base_url=base_url,
+        api_key=get_security_manager().encrypt(api_key) if api_key else None,
+        skip_images=1 if request.skip_images else 0,
+        status=BatchStatus.PREPARING.value,
+        task_count=len(request.items)
+    )
+    db.add(batch)
+    db.flush()
+
+    for item, uploaded_file in zip(request.items, uploaded_files):
+        db.add(AnalysisTask(
+            filename=item.filename if item.filename else uploaded_file.name,
+            file_path=str(uploaded_file),
+            status=TaskStatus.PENDING.value,
+            backend=request.backend,
+            model=model,
+            skip_images=1 if request.skip_images else 0,
+            batch_id=batch.id
+        ))
+
+    db.commit()
+    db.refresh(batch)
+
+    logger.info(f"創建批次任務: {batch.id} - {len(request.items)} 份報告 ({request.backend}/{model})")
+
+    # 後台讀取報告並提交至供應商
+    background_tasks.add_task(BatchScoringService.submit, batch.id)
+
+    return _batch_response(db, batch)
+
+
+@router.get("/batch/{batch_id}", response_model=BatchResponse)
+async def get_batch_status(batch_id: str, db: Session = Depends(get_db)):
+    """
+    查詢批次狀態
+
+    Args:
+        batch_id: 批次 ID
+
+    Returns:
+        批次狀態與各狀態任務數
+    """
+    batch = db.query(AnalysisBatch).filter(AnalysisBatch.id == batch_id).first()
+
+    if not batch:
+        raise HTTPException(
+            status_code=404,
+            detail=f"批次不存在: {batch_id}"
+        )
+
+    return _batch_response(db, batch)
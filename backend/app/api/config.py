@@ -179,7 +179,9 @@ async def _save_flat_config(config_data: dict, db: Session):
         'openai_api_key': (True, str),
         'anthropic_api_key': (True, str),
         'default_skip_images': (False, bool),
-        'auto_download': (False, bool)
+        'auto_download': (False, bool),
+        'model_routing_enabled': (False, bool),
+        'model_routing_tiers': (False, str)
     }
 
     for key, value in config_data.items():
@@ -262,7 +264,9 @@ async def save_flat_config(
         'openai_api_key': (True, str),
         'anthropic_api_key': (True, str),
         'default_skip_images': (False, bool),
-        'auto_download': (False, bool)
+        'auto_download': (False, bool),
+        'model_routing_enabled': (False, bool),
+        'model_routing_tiers': (False, str)
     }
 
     for key, value in config_data.items():
@@ -2,29 +2,102 @@
 歷史記錄 API
 提供分析任務歷史記錄的查詢、篩選和管理功能
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, or_
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
+import base64
 import logging
 
-from ..database import get_db
+from ..database import get_db, get_db_writer
 from ..models.task import AnalysisTask, TaskStatus
-from ..schemas.task import AnalysisTaskResponse
+from ..schemas.task import AnalysisTaskResponse, HistoryItemResponse
+from ..services.history_cleanup import HistoryCleanupService
+from ..services.history_stats import HistoryStatsService
+from ..services.retention import RetentionService
 
 router = APIRouter(prefix="/api/v1", tags=["history"])
 logger = logging.getLogger(__name__)
 
 
-@router.get("/history", response_model=List[AnalysisTaskResponse])
+# fields= 可選的欄位 -> 資料表欄位
+HISTORY_FIELDS = {
+    "task_id": AnalysisTask.id,
+    "filename": AnalysisTask.filename,
+    "status": AnalysisTask.status,
+    "progress": AnalysisTask.progress,
+    "message": AnalysisTask.message,
+    "backend": AnalysisTask.backend,
+    "model": AnalysisTask.model,
+    "total_score": AnalysisTask.total_score,
+    "grade": AnalysisTask.grade,
+    "rubric_version": AnalysisTask.rubric_version,
+    "result": AnalysisTask.result,
+    "created_at": AnalysisTask.created_at,
+    "completed_at": AnalysisTask.completed_at,
+    "error": AnalysisTask.error,
+    "batch_id": AnalysisTask.batch_id,
+    "telemetry": AnalysisTask.telemetry,
+    "routing": AnalysisTask.routing,
+    "attempts": AnalysisTask.attempts,
+    "priority": AnalysisTask.priority,
+    "submitter": AnalysisTask.submitter,
+    "callback_url": AnalysisTask.callback_url,
+}
+
+
+def encode_cursor(created_at: datetime, task_id: str) -> str:
+    """將列表最後一筆的 (created_at, id) 編碼為游標"""
+    raw = f"{created_at.isoformat()}|{task_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """
+    解析游標
+
+    Raises:
+        HTTPException: 游標格式無效
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, task_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), task_id
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail=f"無效的游標: {cursor}")
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """
+    解析 fields 參數 (逗號分隔),task_id 一定會返回
+
+    Raises:
+        HTTPException: 包含未知的欄位
+    """
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in HISTORY_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"未知的欄位: {', '.join(unknown)}。可用: {', '.join(HISTORY_FIELDS)}"
+        )
+    return ["task_id"] + [name for name in dict.fromkeys(names) if name != "task_id"]
+
+
+@router.get("/history", response_model=List[HistoryItemResponse], response_model_exclude_unset=True)
 async def get_history(
-    status: Optional[str] = Query(None, description="過濾狀態: pending, processing, completed, failed"),
+    response: Response,
+    status: Optional[str] = Query(None, description="過濾狀態: pending, processing, completed, failed, cancelled"),
     backend: Optional[str] = Query(None, description="過濾 LLM 後端"),
     filename: Optional[str] = Query(None, description="搜尋文件名"),
     days: Optional[int] = Query(None, description="最近 N 天的記錄"),
     limit: int = Query(50, ge=1, le=500, description="返回數量限制"),
-    offset: int = Query(0, ge=0, description="偏移量"),
+    offset: int = Query(0, ge=0, description="偏移量 (建議改用 cursor)"),
+    cursor: Optional[str] = Query(None, description="上一頁響應標頭 X-Next-Cursor 的值"),
+    fields: Optional[str] = Query(None, description="只返回這些欄位 (逗號分隔,如 task_id,filename,status,total_score,grade,created_at)"),
     db: Session = Depends(get_db)
 ):
     """
@@ -37,12 +110,24 @@ async def get_history(
     - days: 最近 N 天
     - limit: 返回數量
     - offset: 分頁偏移
+    - cursor: 游標分頁,依 (created_at, id) 從上一頁的最後一筆之後繼續,不受頁數影響
+    - fields: 欄位投影,未指定時返回完整任務 (含 result)
+
+    還有下一頁時,響應標頭 X-Next-Cursor 帶有下一頁的游標
 
     Returns:
         任務列表,按創建時間倒序排列
     """
-    # 基礎查詢
-    query = db.query(AnalysisTask)
+    names = parse_fields(fields)
+
+    # 基礎查詢: 指定欄位時只讀取需要的欄位 (不載入 result)
+    if names:
+        query = db.query(
+            AnalysisTask.created_at.label("_created_at"),
+            *[HISTORY_FIELDS[name].label(name) for name in names]
+        )
+    else:
+        query = db.query(AnalysisTask)
 
     # 過濾狀態
     if status:
@@ -66,16 +151,41 @@ async def get_history(
         cutoff_date = datetime.now() - timedelta(days=days)
         query = query.filter(AnalysisTask.created_at >= cutoff_date)
 
-    # 排序和分頁
-    query = query.order_by(desc(AnalysisTask.created_at))
+    # 游標: 上一頁最後一筆之後的記錄
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        # created_at <= 游標 讓查詢從索引中的游標位置開始,而不是從頭掃描
+        query = query.filter(
+            AnalysisTask.created_at <= cursor_created_at,
+            or_(AnalysisTask.created_at < cursor_created_at, AnalysisTask.id < cursor_id)
+        )
+
+    # 排序和分頁 (id 使同一時間的記錄順序固定)
+    query = query.order_by(desc(AnalysisTask.created_at), desc(AnalysisTask.id))
     query = query.offset(offset).limit(limit)
 
     # 執行查詢
-    tasks = query.all()
+    rows = query.all()
 
-    logger.info(f"查詢歷史記錄: {len(tasks)} 條 (status={status}, backend={backend}, filename={filename})")
+    if len(rows) == limit:
+        last = rows[-1]
+        if names:
+            response.headers["X-Next-Cursor"] = encode_cursor(last._created_at, last.task_id)
+        else:
+            response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
 
-    return [task.to_dict() for task in tasks]
+    logger.info(f"查詢歷史記錄: {len(rows)} 條 (status={status}, backend={backend}, filename={filename})")
+
+    if not names:
+        return [task.to_dict() for task in rows]
+
+    items = []
+    for row in rows:
+        item = {name: getattr(row, name) for name in names}
+        if "result" in item:
+            item["result"] = AnalysisTask.clean_result(item["result"])
+        items.append(item)
+    return items
 
 
 @router.get("/history/{task_id}", response_model=AnalysisTaskResponse)
@@ -83,6 +193,8 @@ async def get_history_detail(task_id: str, db: Session = Depends(get_db)):
     """
     獲取單個歷史記錄詳情
 
+    已歸檔的任務從歸檔分段讀取 (archived 為 true)
+
     Args:
         task_id: 任務 ID
 
@@ -92,6 +204,9 @@ async def get_history_detail(task_id: str, db: Session = Depends(get_db)):
     task = db.query(AnalysisTask).filter(AnalysisTask.id == task_id).first()
 
     if not task:
+        archived = RetentionService.get_archived(db, task_id)
+        if archived:
+            return archived
         raise HTTPException(
             status_code=404,
             detail=f"任務不存在: {task_id}"
@@ -101,37 +216,26 @@ async def get_history_detail(task_id: str, db: Session = Depends(get_db)):
 
 
 @router.delete("/history/{task_id}")
-async def delete_history(task_id: str, db: Session = Depends(get_db)):
+async def delete_history(task_id: str):
     """
     刪除歷史記錄
 
+    關聯的上傳文件 (沒有其他任務使用時) 交由背景清理執行緒刪除
+
     Args:
         task_id: 任務 ID
 
     Returns:
         刪除結果
     """
-    task = db.query(AnalysisTask).filter(AnalysisTask.id == task_id).first()
+    outcome = await get_db_writer().submit(HistoryCleanupService.delete_tasks, [task_id])
 
-    if not task:
+    if not outcome["deleted"]:
         raise HTTPException(
             status_code=404,
             detail=f"任務不存在: {task_id}"
         )
 
-    # 刪除關聯的上傳文件
-    from pathlib import Path
-    if task.file_path and Path(task.file_path).exists():
-        try:
-            Path(task.file_path).unlink()
-            logger.info(f"已刪除文件: {task.file_path}")
-        except Exception as e:
-            logger.warning(f"刪除文件失敗: {str(e)}")
-
-    # 刪除數據庫記錄
-    db.delete(task)
-    db.commit()
-
     logger.info(f"已刪除歷史記錄: {task_id}")
 
     return {
@@ -142,48 +246,23 @@ async def delete_history(task_id: str, db: Session = Depends(get_db)):
 
 @router.delete("/history")
 async def batch_delete_history(
-    task_ids: List[str] = Query(..., description="任務 ID 列表"),
-    db: Session = Depends(get_db)
+    task_ids: List[str] = Query(..., description="任務 ID 列表")
 ):
     """
     批量刪除歷史記錄
 
+    以單一交易批次刪除,關聯的上傳文件交由背景清理執行緒刪除
+
     Args:
         task_ids: 任務 ID 列表
 
     Returns:
         刪除結果統計
     """
-    deleted_count = 0
-    failed_count = 0
-    errors = []
-
-    for task_id in task_ids:
-        try:
-            task = db.query(AnalysisTask).filter(AnalysisTask.id == task_id).first()
-
-            if task:
-                # 刪除關聯文件
-                from pathlib import Path
-                if task.file_path and Path(task.file_path).exists():
-                    try:
-                        Path(task.file_path).unlink()
-                    except Exception as e:
-                        logger.warning(f"刪除文件失敗: {str(e)}")
-
-                # 刪除數據庫記錄
-                db.delete(task)
-                deleted_count += 1
-            else:
-                failed_count += 1
-                errors.append(f"任務不存在: {task_id}")
-
-        except Exception as e:
-            failed_count += 1
-            errors.append(f"{task_id}: {str(e)}")
-            logger.error(f"刪除任務失敗 {task_id}: {str(e)}")
-
-    db.commit()
+    outcome = await get_db_writer().submit(HistoryCleanupService.delete_tasks, task_ids)
+    deleted_count = len(outcome["deleted"])
+    failed_count = len(outcome["missing"])
+    errors = [f"任務不存在: {task_id}" for task_id in outcome["missing"]]
 
     logger.info(f"批量刪除歷史記錄: 成功 {deleted_count}, 失敗 {failed_count}")
 
@@ -195,48 +274,45 @@ async def batch_delete_history(
     }
 
 
-@router.get("/history/stats/summary")
-async def get_history_stats(db: Session = Depends(get_db)):
+@router.post("/history/purge")
+async def purge_history(
+    older_than_days: int = Query(..., ge=0, description="清除創建超過此天數的任務"),
+    status: Optional[List[str]] = Query(None, description="過濾狀態 (completed, failed, cancelled;預設全部)"),
+    backend: Optional[str] = Query(None, description="過濾後端")
+):
     """
-    獲取歷史統計信息
+    依條件清除歷史記錄
+
+    分批刪除符合條件的已結束任務,等待中與處理中的任務不會被清除;
+    關聯的上傳文件交由背景清理執行緒刪除
+
+    Args:
+        older_than_days: 天數
+        status: 狀態
+        backend: 後端
 
     Returns:
-        統計數據,包括總數、各狀態數量等
+        刪除的任務數、待刪除的文件數與耗時
     """
-    # 總任務數
-    total = db.query(AnalysisTask).count()
+    try:
+        outcome = await HistoryCleanupService.purge(older_than_days, status, backend)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # 各狀態數量
-    pending = db.query(AnalysisTask).filter(AnalysisTask.status == TaskStatus.PENDING.value).count()
-    processing = db.query(AnalysisTask).filter(AnalysisTask.status == TaskStatus.PROCESSING.value).count()
-    completed = db.query(AnalysisTask).filter(AnalysisTask.status == TaskStatus.COMPLETED.value).count()
-    failed = db.query(AnalysisTask).filter(AnalysisTask.status == TaskStatus.FAILED.value).count()
+    return {
+        "message": "歷史記錄清除完成",
+        **outcome
+    }
 
-    # 各後端使用統計
-    backend_stats = {}
-    for backend in ["ollama", "openai", "anthropic"]:
-        count = db.query(AnalysisTask).filter(AnalysisTask.backend == backend).count()
-        backend_stats[backend] = count
 
-    # 最近 7 天的任務數
-    cutoff_date = datetime.now() - timedelta(days=7)
-    recent_7_days = db.query(AnalysisTask).filter(AnalysisTask.created_at >= cutoff_date).count()
+@router.get("/history/stats/summary")
+async def get_history_stats(db: Session = Depends(get_db)):
+    """
+    獲取歷史統計信息
 
-    # 最近 30 天的任務數
-    cutoff_date_30 = datetime.now() - timedelta(days=30)
-    recent_30_days = db.query(AnalysisTask).filter(AnalysisTask.created_at >= cutoff_date_30).count()
+    由觸發器維護的每日統計表以單一查詢彙總,並短暫快取 (HISTORY_STATS_CACHE_SECONDS)
 
-    return {
-        "total": total,
-        "by_status": {
-            "pending": pending,
-            "processing": processing,
-            "completed": completed,
-            "failed": failed
-        },
-        "by_backend": backend_stats,
-        "recent": {
-            "last_7_days": recent_7_days,
-            "last_30_days": recent_30_days
-        }
-    }
+    Returns:
+        統計數據,包括總數、各狀態數量、各後端數量與最近 7/30 天 (含今天) 的任務數
+    """
+    return HistoryStatsService.summary(db)
@@ -0,0 +1,82 @@
+"""
+評分標準 API
+管理評分標準版本 (維度權重與等級區間),並依指定版本重新計算所有已完成任務的分數與等級
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+import logging
+
+from ..database import get_db, get_db_writer
+from ..schemas.rubric import RubricCreate, RubricResponse, RegradeResponse
+from ..services.analytics import AnalyticsService
+from ..services.rubric import RubricService
+
+router = APIRouter(prefix="/api/v1", tags=["rubric"])
+logger = logging.getLogger(__name__)
+
+
+@router.get("/rubric", response_model=RubricResponse)
+async def get_active_rubric(db: Session = Depends(get_db)):
+    """
+    目前使用的評分標準 (最新版本)
+
+    Returns:
+        評分標準版本
+    """
+    return RubricService.active(db)
+
+
+@router.get("/rubric/versions", response_model=List[RubricResponse])
+async def list_rubric_versions(db: Session = Depends(get_db)):
+    """
+    所有評分標準版本
+
+    Returns:
+        評分標準版本列表,最新的在前
+    """
+    return RubricService.list_versions(db)
+
+
+@router.post("/rubric/versions", response_model=RubricResponse)
+async def create_rubric_version(request: RubricCreate):
+    """
+    發布新的評分標準版本
+
+    新版本立即用於之後完成的任務;既有結果需呼叫 /rubric/regrade 重新評分
+
+    Args:
+        request: 維度權重 (合計 100)、等級區間與說明
+
+    Returns:
+        新的評分標準版本
+    """
+    try:
+        return await get_db_writer().submit(
+            RubricService.create, request.weights, request.grade_criteria, request.note
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/rubric/regrade", response_model=RegradeResponse)
+async def regrade_results(
+    version: Optional[int] = Query(None, description="評分標準版本 (預設為目前版本)")
+):
+    """
+    依評分標準重新評分
+
+    以已保存的各維度完成度,重新計算所有已完成任務的維度分數、總分與等級,不重新呼叫 LLM
+
+    Args:
+        version: 評分標準版本
+
+    Returns:
+        重新評分與略過的任務數
+    """
+    try:
+        outcome = await get_db_writer().submit(RubricService.regrade, version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    AnalyticsService.invalidate()
+    return outcome
@@ -0,0 +1,51 @@
+"""
+全文搜尋 API
+依文件名、報告內容、結果摘要與評語搜尋已完成或失敗的分析任務
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+import logging
+import time
+
+from ..database import get_db
+from ..models.task import TaskStatus
+from ..schemas.task import SearchResultResponse
+from ..services.search import SearchService
+
+router = APIRouter(prefix="/api/v1", tags=["search"])
+logger = logging.getLogger(__name__)
+
+
+@router.get("/search", response_model=List[SearchResultResponse])
+async def search_tasks(
+    q: str = Query(..., min_length=1, max_length=200, description="搜尋關鍵字 (以空白分隔,須全部符合)"),
+    status: Optional[str] = Query(None, description="過濾狀態: completed, failed"),
+    limit: int = Query(20, ge=1, le=100, description="返回數量限制"),
+    db: Session = Depends(get_db)
+):
+    """
+    全文搜尋分析任務
+
+    搜尋範圍包括文件名、提取的報告文字、結果摘要、各維度評語、優點、改善建議與錯誤訊息,
+    例如失效模式或根因描述。結果依相關度排序,snippet 為符合處的上下文
+    (已做 HTML 轉義,符合的文字以 <mark></mark> 標示)
+
+    Args:
+        q: 搜尋關鍵字
+        status: 任務狀態
+        limit: 返回數量
+
+    Returns:
+        符合的任務列表,最相關的在前
+    """
+    if status and status not in [s.value for s in TaskStatus]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"無效的狀態: {status}"
+        )
+
+    start = time.perf_counter()
+    results = SearchService.search(db, q, limit=limit, status=status)
+    logger.info(f"搜尋 '{q}': {len(results)} 條 ({(time.perf_counter() - start) * 1000:.1f} ms)")
+    return results
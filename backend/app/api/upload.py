@@ -4,6 +4,7 @@
 """
 from fastapi import APIRouter, UploadFile, File, HTTPException
 from pathlib import Path
+import os
 import uuid
 import logging
 from ..config import settings
@@ -11,9 +12,9 @@ from ..config import settings
 router = APIRouter(prefix="/api/v1", tags=["upload"])
 logger = logging.getLogger(__name__)
 
-# 創建上傳目錄
+# 創建上傳目錄 (多個 worker 進程同時啟動時 exist_ok 避免競爭)
 UPLOAD_DIR = Path(settings.UPLOAD_DIR)
-UPLOAD_DIR.mkdir(exist_ok=True)
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 # 支援的文件格式
 ALLOWED_EXTENSIONS = {
@@ -68,8 +69,11 @@ async def upload_file(file: UploadFile = File(...)):
     file_path = UPLOAD_DIR / f"{file_id}{file_ext}"
 
     try:
-        with open(file_path, "wb") as f:
+        # 先寫入臨時文件再原子重命名,其他進程不會讀到寫到一半的文件
+        temp_path = UPLOAD_DIR / f".{file_id}.part"
+        with open(temp_path, "wb") as f:
             f.write(content)
+        os.replace(temp_path, file_path)
 
         logger.info(f"文件上傳成功: {file.filename} -> {file_id}{file_ext}")
 
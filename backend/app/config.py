@@ -7,10 +7,40 @@ class Settings(BaseSettings):
     # Application settings
     DATABASE_URL: str = "sqlite:///./fa_analyzer.db"
     ENCRYPTION_KEY: Optional[str] = None
+    ENCRYPTION_KEY_FILE: str = ".encryption_key"  # generated and shared by all processes when ENCRYPTION_KEY is unset
     UPLOAD_DIR: str = "uploads"
     RESULT_DIR: str = "results"
     MAX_FILE_SIZE: int = 50 * 1024 * 1024  # 50MB
 
+    # SQLite tuning (ignored for other databases)
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # wait this long for a lock instead of failing with "database is locked"
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024
+    DB_SINGLE_WRITER: bool = True  # serialize background writes of each process through one thread
+
+    # History statistics cache (per process)
+    HISTORY_STATS_CACHE_SECONDS: float = 5.0
+
+    # Analytics cache (per process): closed time buckets and whole summaries
+    ANALYTICS_CACHE_SECONDS: float = 60.0
+
+    # Retention (each tier is disabled while unset): finished tasks older than
+    # RETENTION_ARCHIVE_DAYS move to compressed segments in ARCHIVE_DIR, uploads of
+    # finished tasks are deleted after RETENTION_UPLOAD_DAYS and uploads no task
+    # refers to after RETENTION_ORPHAN_UPLOAD_HOURS
+    ARCHIVE_DIR: str = "archive"
+    ARCHIVE_CODEC: str = "zstd"  # zstd (needs the zstandard package, else gzip) or gzip
+    ARCHIVE_SEGMENT_TASKS: int = 1000  # tasks per segment file (one transaction each)
+    RETENTION_ARCHIVE_DAYS: Optional[int] = None
+    RETENTION_UPLOAD_DAYS: Optional[int] = None
+    RETENTION_ORPHAN_UPLOAD_HOURS: Optional[float] = None
+    RETENTION_INTERVAL_SECONDS: float = 3600.0
+
+    # Full-text search: longest extracted report text indexed per task
+    SEARCH_MAX_REPORT_CHARS: int = 200000
+
     # LLM settings
     OPENAI_API_KEY: Optional[str] = None
     OPENAI_BASE_URL: Optional[str] = None
@@ -18,6 +48,39 @@ class Settings(BaseSettings):
     OLLAMA_API_KEY: Optional[str] = None
     OLLAMA_BASE_URL: Optional[str] = None
 
+    # Image token budget per analysis task (see core/image_budget.py)
+    IMAGE_TOKEN_BUDGET: int = 30000
+
+    # Model routing settings
+    MODEL_ROUTING_ENABLED: bool = False  # route tasks without an explicit model by report features
+    MODEL_ROUTING_TIERS: Optional[str] = None  # JSON: {"openai": [{"name", "model", "max_tokens", "max_images", "file_types"}, ...]}
+
+    # Task queue settings
+    EMBEDDED_WORKER: bool = True  # run queued tasks inside the API process
+    WORKER_CONCURRENCY: int = 4  # analyses run at the same time per worker
+    QUEUE_POLL_INTERVAL: float = 2.0  # seconds between queue polls when idle
+    TASK_LEASE_SECONDS: int = 120  # a task whose lease is not renewed in time is requeued
+    TASK_MAX_ATTEMPTS: int = 3  # claims before an interrupted task is marked failed
+    PROGRESS_CHECKPOINT_SECONDS: float = 5.0  # progress of running tasks is written to the database at most this often
+    EVENT_STREAM_POLL_SECONDS: float = 5.0  # event streams re-read tasks not running in this process this often
+    ADMISSION_MAX_QUEUE_DEPTH: int = 200  # pending tasks ahead of a new task before it is rejected with 429 (0 disables)
+    ADMISSION_MAX_DRAIN_SECONDS: int = 1800  # estimated time to start the tasks ahead before 429 (0 disables)
+    ADMISSION_SERVICE_MS_CACHE_SECONDS: float = 30.0  # historical processing time per backend/model is cached this long
+    OFFPEAK_WINDOWS: Optional[str] = None  # local time windows for low-priority tasks, e.g. "22:00-06:00,12:00-13:30" (any time if unset)
+    PIPELINE_STAGE_WORKERS: Optional[str] = None  # JSON: threads per stage, e.g. {"extract": 2, "llm": 8}
+
+    # Completion webhook settings
+    WEBHOOK_SECRET: Optional[str] = None  # HMAC-SHA256 key for X-FA-Signature (unsigned if unset)
+    WEBHOOK_CONCURRENCY: int = 8  # deliveries in flight per process
+    WEBHOOK_TIMEOUT: float = 10.0  # seconds per delivery attempt
+    WEBHOOK_MAX_ATTEMPTS: int = 6  # attempts before a delivery is marked failed
+    WEBHOOK_RETRY_BASE_SECONDS: float = 10.0  # first retry delay, doubled per attempt
+    WEBHOOK_POLL_INTERVAL: float = 2.0  # seconds between polls for due deliveries
+    WEBHOOK_ALLOWED_HOSTS: Optional[str] = None  # comma-separated callback hosts allowed to resolve to private addresses
+
+    # Batch API settings
+    BATCH_POLL_INTERVAL: int = 60  # seconds between provider batch status polls
+
     class Config:
         env_file = ".env"
 
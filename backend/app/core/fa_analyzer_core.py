@@ -5,20 +5,26 @@ FA Report Analyzer v2.0 - 失效分析報告評估工具
 
 import json
 import base64
+import socket
 import anthropic
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Tuple, Optional, Any
+from typing import Callable, Dict, List, Tuple, Optional, Any
 import sys
 import io
+import threading
+import time
 
+from .image_budget import ImageBudgetPlanner
+from .rubric import DIMENSION_CRITERIA, DIMENSION_WEIGHTS, GRADE_CRITERIA, grade_for
+
+# 可選依賴
 try:
     import pandas as pd
+    HAS_PANDAS = True
 except ImportError:
-    print("需要安裝 pandas: pip install pandas --break-system-packages")
-    sys.exit(1)
+    HAS_PANDAS = False
 
-# 可選依賴
 try:
     from PIL import Image
     HAS_PIL = True
@@ -38,6 +44,35 @@ except ImportError:
     HAS_OPENAI = False
 
 
+class AnalysisCancelled(Exception):
+    """分析已被取消"""
+
+
+class _OllamaStream:
+    """
+    進行中的 Ollama 串流連線
+
+    ollama 客戶端沒有中斷串流的方法,以 httpx 回應鉤子取得連線,
+    close() 關閉其 socket 以喚醒阻塞中的讀取 (可從其他執行緒調用)
+    """
+
+    def __init__(self):
+        self.response = None
+
+    def attach(self, response) -> None:
+        self.response = response
+
+    def close(self) -> None:
+        if self.response is None:
+            return
+        network_stream = self.response.extensions.get("network_stream")
+        sock = network_stream.get_extra_info("socket") if network_stream else None
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+        else:
+            self.response.close()
+
+
 class FAReportAnalyzer:
     """FA 報告分析器 v2.0 - 支援多種 LLM 後端和圖片解析"""
     
@@ -46,7 +81,10 @@ class FAReportAnalyzer:
                  model: str = None,
                  api_key: str = None,
                  base_url: str = None,
-                 skip_images: bool = False):
+                 skip_images: bool = False,
+                 init_client: bool = True,
+                 image_token_budget: int = None,
+                 rubric: Dict[str, Any] = None):
         """初始化分析器
 
         Args:
@@ -55,12 +93,22 @@ class FAReportAnalyzer:
             api_key: API key (OpenAI/Anthropic 需要)
             base_url: API base URL (OpenAI 相容接口)
             skip_images: 是否跳過圖片分析 (僅分析文字)
+            init_client: 是否初始化 LLM 客戶端 (僅讀取報告/構建提示詞時可關閉)
+            image_token_budget: 每個任務的圖片 token 預算 (預設 DEFAULT_IMAGE_TOKEN_BUDGET)
+            rubric: 評分標準 {"weights", "grade_criteria"} (預設為內建標準),提示詞依此列出維度權重與等級
         """
         self.backend = backend.lower()
         self.api_key = api_key
         self.base_url = base_url
         self.skip_images = skip_images
         self.temp_files = []  # 用於追蹤需要清理的臨時文件
+        self.max_retries = 2  # LLM 調用遇到暫時性錯誤時的重試次數
+        self.image_token_budget = image_token_budget or self.DEFAULT_IMAGE_TOKEN_BUDGET
+        self.image_plan: Optional[Dict[str, Any]] = None  # 最近一次的圖片規劃摘要
+        self.telemetry: Dict[str, Any] = {}  # 最近一次 LLM 調用的遙測數據
+        self.cancel_event = threading.Event()  # 設定後中止進行中的 LLM 串流並停止重試
+        self._active_stream = None  # 進行中的 LLM 串流 (供其他執行緒取消時關閉)
+        self.stream_callback: Optional[Callable[[str], None]] = None  # 接收 LLM 串流的文字片段
         
         # 設定預設模型
         if model:
@@ -79,26 +127,18 @@ class FAReportAnalyzer:
                 self.model = "llama3.2-vision:latest"
         
         # 初始化客戶端
-        self._init_client()
+        self.client = None
+        if init_client:
+            self._init_client()
         
         # 評估維度與權重
-        self.dimensions = {
-            "基本資訊完整性": 15,
-            "問題描述與定義": 15,
-            "分析方法與流程": 20,
-            "數據與證據支持": 20,
-            "根因分析": 20,
-            "改善對策": 10
-        }
+        self.dimensions = dict(rubric["weights"] if rubric else DIMENSION_WEIGHTS)
         
         # 評分標準
-        self.grade_criteria = {
-            'A': (90, 100, '卓越報告'),
-            'B': (80, 89, '良好報告'),
-            'C': (70, 79, '合格報告'),
-            'D': (60, 69, '待改進報告'),
-            'F': (0, 59, '不合格報告')
-        }
+        self.grade_criteria = (
+            {grade: tuple(band) for grade, band in rubric["grade_criteria"].items()} if rubric
+            else dict(GRADE_CRITERIA)
+        )
     
     def _init_client(self):
         """初始化 LLM 客戶端"""
@@ -118,12 +158,13 @@ class FAReportAnalyzer:
                 raise ImportError("需要安裝 openai: pip install openai --break-system-packages")
             self.client = OpenAI(
                 api_key=self.api_key,
-                base_url=self.base_url
+                base_url=self.base_url,
+                max_retries=0  # 由 _call_with_retries 統一處理重試
             )
             print(f"✓ 使用 OpenAI API: {self.model}")
         
         elif self.backend == "anthropic":
-            self.client = anthropic.Anthropic(api_key=self.api_key)
+            self.client = anthropic.Anthropic(api_key=self.api_key, max_retries=0)
             print(f"✓ 使用 Anthropic Claude: {self.model}")
         
         else:
@@ -474,6 +515,34 @@ class FAReportAnalyzer:
         
         return text_content, images
     
+    def _dimensions_text(self) -> str:
+        """提示詞中的評估維度、權重與評估要點 (依評分標準)"""
+        sections = []
+        for number, (name, weight) in enumerate(self.dimensions.items(), 1):
+            lines = [f"{number}. **{name}** ({weight:g}%)"]
+            lines.extend(f"   - {point}" for point in DIMENSION_CRITERIA.get(name, []))
+            sections.append("\n".join(lines))
+        return "\n\n".join(sections)
+
+    def _grades_text(self) -> str:
+        """提示詞中的等級區間 (依評分標準,最低等級寫作「低於上一級的最低分」)"""
+        bands = sorted(self.grade_criteria.items(), key=lambda item: item[1][0], reverse=True)
+        lines = []
+        for index, (grade, (min_score, max_score, description)) in enumerate(bands):
+            if min_score == 0 and index > 0:
+                score_range = f"<{bands[index - 1][1][0]:g}分"
+            else:
+                score_range = f"{min_score:g}-{max_score:g}分"
+            lines.append(f"- **{grade}級 ({score_range})**:{description}")
+        return "\n".join(lines)
+
+    def _dimension_scores_template(self) -> str:
+        """提示詞中 JSON 格式的 dimension_scores 欄位 (依評分標準的維度)"""
+        return ",\n".join(
+            f'    "{name}": {{"score": <分數>, "percentage": <百分比數字>, "comment": "<評語>"}}'
+            for name in self.dimensions
+        )
+
     def create_analysis_prompt(self, report_content: str, has_images: bool = False) -> str:
         """創建分析提示詞
         
@@ -496,48 +565,10 @@ class FAReportAnalyzer:
         prompt = f"""請分析這份 Failure Analysis Report,並根據以下評估維度進行全面評分:
 {image_note}
 【評估維度與權重】
-1. **基本資訊完整性** (15%)
-   - 產品資訊(型號、批號、製造日期)
-   - 客戶資訊與投訴內容
-   - FA 編號與日期
-   - 負責工程師資訊
-
-2. **問題描述與定義** (15%)
-   - 失效現象描述的清晰度
-   - 失效模式的準確性
-   - 問題範圍與影響評估
-   - 失效率數據
-
-3. **分析方法與流程** (20%)
-   - 分析方法的適當性(如:光學檢查、SEM、FIB、X-ray等)
-   - 分析步驟的邏輯性與完整性
-   - 實驗設計的合理性
-   - 分析設備使用的正確性
-
-4. **數據與證據支持** (20%)
-   - 分析數據的充分性
-   - 圖片/圖表的清晰度與標註
-   - 量化數據的準確性
-   - 對照組/比較樣本的使用
-
-5. **根因分析** (20%)
-   - 根本原因的深度與準確度
-   - 因果關係的邏輯推導
-   - 5-Why 或 Fishbone 分析的應用
-   - 排除其他可能原因的論證
-
-6. **改善對策** (10%)
-   - 短期與長期對策的完整性
-   - 對策的可行性與有效性
-   - 預防措施的提出
-   - 驗證計畫
+{self._dimensions_text()}
 
 【評分標準】
-- **A級 (90-100分)**:卓越報告
-- **B級 (80-89分)**:良好報告
-- **C級 (70-79分)**:合格報告
-- **D級 (60-69分)**:待改進報告
-- **F級 (<60分)**:不合格報告
+{self._grades_text()}
 
 請以 JSON 格式回傳評估結果,格式如下:
 
@@ -545,12 +576,7 @@ class FAReportAnalyzer:
   "total_score": <總分數字>,
   "grade": "<等級字母>",
   "dimension_scores": {{
-    "基本資訊完整性": {{"score": <分數>, "percentage": <百分比數字>, "comment": "<評語>"}},
-    "問題描述與定義": {{"score": <分數>, "percentage": <百分比數字>, "comment": "<評語>"}},
-    "分析方法與流程": {{"score": <分數>, "percentage": <百分比數字>, "comment": "<評語>"}},
-    "數據與證據支持": {{"score": <分數>, "percentage": <百分比數字>, "comment": "<評語>"}},
-    "根因分析": {{"score": <分數>, "percentage": <百分比數字>, "comment": "<評語>"}},
-    "改善對策": {{"score": <分數>, "percentage": <百分比數字>, "comment": "<評語>"}}
+{self._dimension_scores_template()}
   }},
   "strengths": [
     "<具體優點1>",
@@ -601,33 +627,258 @@ class FAReportAnalyzer:
 
         return response_text
 
-    def analyze_with_ai(self, report_content: str, images: List[Dict] = None) -> Dict:
-        """使用 AI 分析報告
+    # 單次分析的最大輸出 token 數
+    MAX_OUTPUT_TOKENS = 4000
+
+    # 每個任務預設的圖片 token 預算
+    DEFAULT_IMAGE_TOKEN_BUDGET = 30000
+
+    # 各後端單次請求最多送出的圖片數
+    MAX_IMAGES = {
+        "ollama": 5,
+        "openai": 10,
+        "anthropic": 20,
+    }
+
+    # 原始響應日誌中的後端名稱
+    BACKEND_LABELS = {"ollama": "Ollama", "openai": "OpenAI", "anthropic": "Anthropic Claude"}
+
+    # 可重試的暫時性錯誤 (OpenAI / Anthropic SDK 的異常類名)
+    RETRYABLE_ERRORS = (
+        "APIConnectionError",
+        "APITimeoutError",
+        "RateLimitError",
+        "InternalServerError",
+    )
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """粗略估算文字的 token 數 (不調用 tokenizer)
+
+        中日韓字元約 1 token/字,其他字元約 4 字元/token
 
         Args:
-            report_content: 報告文字內容
-            images: 圖片列表
+            text: 文字內容
 
         Returns:
-            分析結果字典
+            估算的 token 數
+        """
+        cjk = sum(1 for ch in text if '\u4e00' <= ch <= '\u9fff' or '\u3000' <= ch <= '\u30ff')
+        return cjk + (len(text) - cjk + 3) // 4
+
+    @staticmethod
+    def _elapsed_ms(start: float) -> int:
+        """計算從 start (perf_counter) 到現在經過的毫秒數"""
+        return int((time.perf_counter() - start) * 1000)
+
+    def _start_telemetry(self, images: List[Dict]) -> None:
+        """重置並初始化本次 LLM 調用的遙測數據
+
+        Args:
+            images: 實際送出的圖片列表
+        """
+        self.telemetry = {
+            "backend": self.backend,
+            "model": self.model,
+            "ttft_ms": None,
+            "llm_latency_ms": None,
+            "input_tokens": None,
+            "output_tokens": None,
+            "image_count": len(images),
+            "image_bytes": sum(len(img['data']) for img in images),
+            "llm_attempts": 0,
+            "retries": 0,
+            "parse_ms": None,
+            "image_plan": self.image_plan,
+        }
+
+    def cancel(self) -> None:
+        """取消分析: 關閉進行中的 LLM 串流 (可從其他執行緒調用)"""
+        self.cancel_event.set()
+        stream = self._active_stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def raise_if_cancelled(self) -> None:
+        """已取消時拋出 AnalysisCancelled"""
+        if self.cancel_event.is_set():
+            raise AnalysisCancelled("分析已被取消")
+
+    def _emit_chunk(self, text: str) -> None:
+        """轉發串流文字片段給 stream_callback (回調出錯不影響分析)"""
+        if self.stream_callback and text:
+            try:
+                self.stream_callback(text)
+            except Exception as e:
+                print(f"⚠️  串流回調失敗: {e}")
+
+    def _is_retryable(self, error: Exception) -> bool:
+        """判斷錯誤是否為可重試的暫時性錯誤"""
+        if type(error).__name__ in self.RETRYABLE_ERRORS:
+            return True
+        if isinstance(error, (ConnectionError, TimeoutError)):
+            return True
+        status_code = getattr(error, "status_code", None)
+        return isinstance(status_code, int) and (status_code == 429 or status_code >= 500)
+
+    def _call_with_retries(self, call) -> str:
+        """執行 LLM 調用,遇到暫時性錯誤時以指數退避重試
+
+        Args:
+            call: 無參數的調用函數,返回完整響應文本
+
+        Returns:
+            響應文本
+        """
+        attempt = 0
+        while True:
+            self.raise_if_cancelled()
+            # 首 token 時間、延遲與 token 數只記錄產生結果的那一次調用
+            self.telemetry.update({
+                "llm_attempts": attempt + 1,
+                "ttft_ms": None,
+                "llm_latency_ms": None,
+                "input_tokens": None,
+                "output_tokens": None,
+            })
+            try:
+                return call()
+            except AnalysisCancelled:
+                raise
+            except Exception as e:
+                # 串流被取消關閉時會以連線錯誤結束
+                self.raise_if_cancelled()
+                if attempt >= self.max_retries or not self._is_retryable(e):
+                    raise
+                attempt += 1
+                self.telemetry["retries"] = attempt
+                print(f"⚠️  LLM 調用失敗 ({e}),第 {attempt} 次重試...")
+                # 等待退避時間,期間被取消則立即結束
+                self.cancel_event.wait(min(2 ** attempt, 10))
+            finally:
+                self._active_stream = None
+
+    def parse_response(self, response_text: str) -> Dict:
+        """清理並解析 JSON 響應,記錄解析耗時
+
+        Args:
+            response_text: 原始響應文本
+
+        Returns:
+            解析後的結果字典
+        """
+        parse_start = time.perf_counter()
+        try:
+            return json.loads(self._clean_json_response(response_text))
+        finally:
+            self.telemetry["parse_ms"] = self._elapsed_ms(parse_start)
+
+    def plan_images(self, images: List[Dict] = None) -> List[Dict]:
+        """依 skip_images 設定與圖片 token 預算規劃實際送出的圖片
+
+        Args:
+            images: 提取出的圖片列表
+
+        Returns:
+            規劃後的圖片列表 (規劃摘要記錄於 self.image_plan)
         """
         # 根據 skip_images 設定決定是否使用圖片
         if self.skip_images and images:
             print("⚠️  已啟用 --skip-images,將僅分析文字內容")
             images = None
 
-        has_images = images and len(images) > 0
-        prompt = self.create_analysis_prompt(report_content, has_images)
+        # 在 token 預算內規劃圖片數量、解析度和 detail 等級
+        self.image_plan = None
+        if images:
+            planner = ImageBudgetPlanner(
+                backend=self.backend,
+                model=self.model,
+                budget_tokens=self.image_token_budget,
+                max_images=self.MAX_IMAGES.get(self.backend, 5)
+            )
+            images, self.image_plan = planner.plan(images)
+            print(f"✓ 圖片規劃: 送出 {self.image_plan['selected']}/{self.image_plan['candidates']} 張, "
+                  f"預估 {self.image_plan['estimated_tokens']} tokens (預算 {self.image_token_budget})")
+
+        return images or []
+
+    def prepare_analysis(self, report_content: str, images: List[Dict] = None) -> Tuple[str, List[Dict]]:
+        """準備提示詞與實際送出的圖片
+
+        Args:
+            report_content: 報告文字內容
+            images: 圖片列表
+
+        Returns:
+            (提示詞, 依圖片 token 預算規劃後的圖片列表)
+        """
+        images = self.plan_images(images)
+        prompt = self.create_analysis_prompt(report_content, len(images) > 0)
+        return prompt, images
+
+    def build_openai_messages(self, prompt: str, images: List[Dict]) -> List[Dict]:
+        """構建 OpenAI Chat Completions 消息 (互動與批次模式共用)"""
+        content = []
+        content.append({
+            "type": "text",
+            "text": prompt
+        })
+
+        for img in images:
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:image/{img['format']};base64,{img['data']}",
+                    "detail": img.get('detail', 'auto')
+                }
+            })
+
+        return [{
+            "role": "user",
+            "content": content
+        }]
+
+    def build_anthropic_messages(self, prompt: str, images: List[Dict]) -> List[Dict]:
+        """構建 Anthropic Messages 消息 (互動與批次模式共用)"""
+        content = []
+
+        # 添加圖片
+        for img in images:
+            content.append({
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": f"image/{img['format']}",
+                    "data": img['data']
+                }
+            })
+
+        # 添加文字提示
+        content.append({
+            "type": "text",
+            "text": prompt
+        })
+
+        return [{"role": "user", "content": content}]
+
+    def analyze_with_ai(self, report_content: str, images: List[Dict] = None) -> Dict:
+        """使用 AI 分析報告
+
+        Args:
+            report_content: 報告文字內容
+            images: 圖片列表
+
+        Returns:
+            分析結果字典
+        """
+        prompt, images = self.prepare_analysis(report_content, images)
 
         try:
-            if self.backend == "ollama":
-                return self._analyze_with_ollama(prompt, images)
-            elif self.backend == "openai":
-                return self._analyze_with_openai(prompt, images)
-            elif self.backend == "anthropic":
-                return self._analyze_with_anthropic(prompt, images)
-            else:
-                raise ValueError(f"不支援的後端: {self.backend}")
+            response_text = self.call_llm(prompt, images)
+            return self.parse_llm_response(response_text)
 
         except json.JSONDecodeError as e:
             print(f"JSON 解析錯誤: {e}")
@@ -635,50 +886,54 @@ class FAReportAnalyzer:
         except Exception as e:
             print(f"分析過程發生錯誤: {e}")
             raise
-    
-    def _analyze_with_ollama(self, prompt: str, images: List[Dict] = None) -> Dict:
-        """使用 Ollama 進行分析"""
-        messages = []
-        
-        # 構建消息內容
-        if images and len(images) > 0:
-            # 多模態消息
-            content_parts = [prompt]
-            for img in images[:5]:  # 限制最多 5 張圖片
-                content_parts.append({
-                    'type': 'image',
-                    'data': img['data']
-                })
-            messages.append({
-                'role': 'user',
-                'content': prompt,
-                'images': [img['data'] for img in images[:5]]
-            })
+
+    def call_llm(self, prompt: str, images: List[Dict] = None) -> str:
+        """調用 LLM 後端並返回原始響應文本 (含重試與遙測)
+
+        Args:
+            prompt: 分析提示詞
+            images: 實際送出的圖片列表
+
+        Returns:
+            原始響應文本
+        """
+        images = images or []
+        self._start_telemetry(images)
+
+        if self.backend == "ollama":
+            call = self._call_ollama(prompt, images)
+        elif self.backend == "openai":
+            call = self._call_openai(prompt, images)
+        elif self.backend == "anthropic":
+            call = self._call_anthropic(prompt, images)
         else:
-            messages.append({
-                'role': 'user',
-                'content': prompt
-            })
-        
-        # 調用 Ollama
-        response = ollama.chat(
-            model=self.model,
-            messages=messages
-        )
-        
-        response_text = response['message']['content'].strip()
+            raise ValueError(f"不支援的後端: {self.backend}")
+
+        response_text = self._call_with_retries(call).strip()
 
-        print("=== Ollama raw response ===")
+        print(f"=== {self.BACKEND_LABELS.get(self.backend, self.backend)} raw response ===")
         print(response_text)
         print("=== End raw response ===")
 
-        # 清理並解析 JSON
-        response_text = self._clean_json_response(response_text)
+        return response_text
+
+    def parse_llm_response(self, response_text: str) -> Dict:
+        """解析 LLM 響應為分析結果,解析失敗時輸出診斷信息
+
+        Args:
+            response_text: call_llm 返回的原始響應文本
+
+        Returns:
+            分析結果字典
+        """
+        if self.backend == "openai":
+            return self._parse_openai_response(response_text)
 
+        # 清理並解析 JSON
         try:
-            result = json.loads(response_text)
-            return result
+            return self.parse_response(response_text)
         except json.JSONDecodeError as e:
+            response_text = self._clean_json_response(response_text)
             print(f"\nJSON 解析錯誤: {e}")
             print(f"清理後的響應文本:")
             print(response_text)
@@ -689,72 +944,105 @@ class FAReportAnalyzer:
                 print(f"...{response_text[start:end]}...")
                 print(f"    {' ' * (min(50, e.pos - start))}^")
             raise
-    
-    def _analyze_with_openai(self, prompt: str, images: List[Dict] = None) -> Dict:
-        """使用 OpenAI API 進行分析"""
-        messages = []
 
+    def _call_ollama(self, prompt: str, images: List[Dict]) -> Callable[[], str]:
+        """構建 Ollama 調用"""
         # 構建消息內容
-        content = []
-        content.append({
-            "type": "text",
-            "text": prompt
-        })
-
-        if images and len(images) > 0:
-            for img in images[:10]:  # 限制最多 10 張圖片
-                content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/{img['format']};base64,{img['data']}"
-                    }
-                })
-
-        messages.append({
-            "role": "user",
-            "content": content
-        })
+        message = {
+            'role': 'user',
+            'content': prompt
+        }
+        if images:
+            # 多模態消息
+            message['images'] = [img['data'] for img in images]
+
+        def call() -> str:
+            # 以串流方式調用 Ollama,記錄首個 token 時間
+            start = time.perf_counter()
+            chunks = []
+            # 每次調用使用獨立的客戶端,取消時關閉其串流連線
+            stream = _OllamaStream()
+            client = ollama.Client(event_hooks={"response": [stream.attach]})
+            self._active_stream = stream
+            try:
+                for chunk in client.chat(model=self.model, messages=[message], stream=True):
+                    self.raise_if_cancelled()
+                    if self.telemetry["ttft_ms"] is None:
+                        self.telemetry["ttft_ms"] = self._elapsed_ms(start)
+                    chunks.append(chunk['message']['content'])
+                    self._emit_chunk(chunk['message']['content'])
+                    if chunk.get('done'):
+                        self.telemetry["input_tokens"] = chunk.get('prompt_eval_count')
+                        self.telemetry["output_tokens"] = chunk.get('eval_count')
+            finally:
+                # ollama 0.4+ 提供 close();舊版只能關閉其內部的 httpx 客戶端 (屬性不存在時略過)
+                close = getattr(client, "close", None) or getattr(getattr(client, "_client", None), "close", None)
+                if close:
+                    close()
+            self.telemetry["llm_latency_ms"] = self._elapsed_ms(start)
+            return "".join(chunks)
+
+        return call
+
+    def _call_openai(self, prompt: str, images: List[Dict]) -> Callable[[], str]:
+        """構建 OpenAI 調用"""
+        # 構建消息內容
+        messages = self.build_openai_messages(prompt, images)
 
-        # 調用 OpenAI
-        try:
-            response = self.client.chat.completions.create(
+        def call() -> str:
+            # 以串流方式調用 OpenAI,最後一個 chunk 帶有 token 用量
+            start = time.perf_counter()
+            chunks = []
+            stream = self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
-                max_tokens=4000
+                max_tokens=self.MAX_OUTPUT_TOKENS,
+                stream=True,
+                stream_options={"include_usage": True}
             )
+            self._active_stream = stream
+            for chunk in stream:
+                self.raise_if_cancelled()
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if self.telemetry["ttft_ms"] is None:
+                        self.telemetry["ttft_ms"] = self._elapsed_ms(start)
+                    chunks.append(chunk.choices[0].delta.content)
+                    self._emit_chunk(chunk.choices[0].delta.content)
+                if chunk.usage:
+                    self.telemetry["input_tokens"] = chunk.usage.prompt_tokens
+                    self.telemetry["output_tokens"] = chunk.usage.completion_tokens
+            self.telemetry["llm_latency_ms"] = self._elapsed_ms(start)
+            return "".join(chunks)
+
+        return call
+
+    def _parse_openai_response(self, response_text: str) -> Dict:
+        """解析 OpenAI 響應 (含內容審核拒絕的檢查)"""
+        # 檢查是否被拒絕
+        if "I'm sorry" in response_text or "I cannot" in response_text or "I can't" in response_text:
+            print("\n" + "=" * 80)
+            print("⚠️  OpenAI 內容審核拒絕了此請求")
+            print("=" * 80)
+            print("\n可能原因:")
+            print("1. 圖片內容觸發了安全過濾器")
+            print("2. 技術術語被誤判為敏感內容")
+            print("3. 圖片與文字組合觸發了限制\n")
+            print("建議解決方案:")
+            print("1. 嘗試不含圖片的純文字分析:")
+            print("   python fa_report_analyzer_v2.py -i <文字檔>.txt -b openai -k YOUR_KEY")
+            print("\n2. 使用 Ollama 本地模型 (無內容限制):")
+            print("   python fa_report_analyzer_v2.py -i <檔案> -b ollama")
+            print("\n3. 使用 Anthropic Claude (較少限制):")
+            print("   python fa_report_analyzer_v2.py -i <檔案> -b anthropic -k YOUR_KEY")
+            print("=" * 80 + "\n")
+            raise ValueError("OpenAI API 拒絕處理此請求,請嘗試其他後端或純文字分析")
 
-            response_text = response.choices[0].message.content.strip()
-
-            print("=== OpenAI raw response ===")
-            print(response_text)
-            print("=== End raw response ===")
-
-            # 檢查是否被拒絕
-            if "I'm sorry" in response_text or "I cannot" in response_text or "I can't" in response_text:
-                print("\n" + "=" * 80)
-                print("⚠️  OpenAI 內容審核拒絕了此請求")
-                print("=" * 80)
-                print("\n可能原因:")
-                print("1. 圖片內容觸發了安全過濾器")
-                print("2. 技術術語被誤判為敏感內容")
-                print("3. 圖片與文字組合觸發了限制\n")
-                print("建議解決方案:")
-                print("1. 嘗試不含圖片的純文字分析:")
-                print("   python fa_report_analyzer_v2.py -i <文字檔>.txt -b openai -k YOUR_KEY")
-                print("\n2. 使用 Ollama 本地模型 (無內容限制):")
-                print("   python fa_report_analyzer_v2.py -i <檔案> -b ollama")
-                print("\n3. 使用 Anthropic Claude (較少限制):")
-                print("   python fa_report_analyzer_v2.py -i <檔案> -b anthropic -k YOUR_KEY")
-                print("=" * 80 + "\n")
-                raise ValueError("OpenAI API 拒絕處理此請求,請嘗試其他後端或純文字分析")
-
-            # 清理並解析 JSON
-            response_text = self._clean_json_response(response_text)
-
-            result = json.loads(response_text)
-            return result
+        # 清理並解析 JSON
+        try:
+            return self.parse_response(response_text)
 
         except json.JSONDecodeError as e:
+            response_text = self._clean_json_response(response_text)
             print("\n" + "=" * 80)
             print("⚠️  OpenAI 返回了無效的 JSON 格式")
             print("=" * 80)
@@ -773,68 +1061,39 @@ class FAReportAnalyzer:
             print("\n建議: 嘗試使用其他後端 (ollama 或 anthropic)")
             print("=" * 80 + "\n")
             raise
-    
-    def _analyze_with_anthropic(self, prompt: str, images: List[Dict] = None) -> Dict:
-        """使用 Anthropic Claude 進行分析"""
-        content = []
-        
-        # 添加圖片
-        if images and len(images) > 0:
-            for img in images[:20]:  # Claude 支持較多圖片
-                content.append({
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": f"image/{img['format']}",
-                        "data": img['data']
-                    }
-                })
-        
-        # 添加文字提示
-        content.append({
-            "type": "text",
-            "text": prompt
-        })
-        
-        # 調用 Claude
-        message = self.client.messages.create(
-            model=self.model,
-            max_tokens=4000,
-            messages=[
-                {"role": "user", "content": content}
-            ]
-        )
-        
-        response_text = message.content[0].text.strip()
 
-        print("=== Anthropic Claude raw response ===")
-        print(response_text)
-        print("=== End raw response ===")
-
-        # 清理並解析 JSON
-        response_text = self._clean_json_response(response_text)
+    def _call_anthropic(self, prompt: str, images: List[Dict]) -> Callable[[], str]:
+        """構建 Anthropic Claude 調用"""
+        # 構建消息內容
+        messages = self.build_anthropic_messages(prompt, images)
 
-        try:
-            result = json.loads(response_text)
-            return result
-        except json.JSONDecodeError as e:
-            print(f"\nJSON 解析錯誤: {e}")
-            print(f"清理後的響應文本:")
-            print(response_text)
-            print(f"\n錯誤位置附近的內容:")
-            if e.pos < len(response_text):
-                start = max(0, e.pos - 50)
-                end = min(len(response_text), e.pos + 50)
-                print(f"...{response_text[start:end]}...")
-                print(f"    {' ' * (min(50, e.pos - start))}^")
-            raise
+        def call() -> str:
+            # 以串流方式調用 Claude,最終消息帶有 token 用量
+            start = time.perf_counter()
+            chunks = []
+            with self.client.messages.stream(
+                model=self.model,
+                max_tokens=self.MAX_OUTPUT_TOKENS,
+                messages=messages
+            ) as stream:
+                self._active_stream = stream
+                for text in stream.text_stream:
+                    self.raise_if_cancelled()
+                    if self.telemetry["ttft_ms"] is None:
+                        self.telemetry["ttft_ms"] = self._elapsed_ms(start)
+                    chunks.append(text)
+                    self._emit_chunk(text)
+                message = stream.get_final_message()
+            self.telemetry["llm_latency_ms"] = self._elapsed_ms(start)
+            self.telemetry["input_tokens"] = message.usage.input_tokens
+            self.telemetry["output_tokens"] = message.usage.output_tokens
+            return "".join(chunks)
+
+        return call
     
     def calculate_grade(self, total_score: float) -> Tuple[str, str]:
         """計算等級"""
-        for grade, (min_score, max_score, description) in self.grade_criteria.items():
-            if min_score <= total_score <= max_score:
-                return grade, description
-        return 'F', '不合格報告'
+        return grade_for(total_score, self.grade_criteria)
     
     def generate_report(self, analysis_result: Dict, output_path: str = None, source_file: str = None) -> str:
         """生成評估報告"""
@@ -872,8 +1131,13 @@ class FAReportAnalyzer:
                 '評語': dim_info['comment']
             })
         
-        df = pd.DataFrame(dimension_data)
-        report.append(df.to_string(index=False))
+        if HAS_PANDAS:
+            report.append(pd.DataFrame(dimension_data).to_string(index=False))
+        else:
+            columns = list(dimension_data[0].keys()) if dimension_data else []
+            report.append("  ".join(columns))
+            for row in dimension_data:
+                report.append("  ".join(str(row[column]) for column in columns))
         report.append("")
         
         # 3. 優點分析
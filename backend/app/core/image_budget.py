@@ -0,0 +1,253 @@
+"""
+圖片 token 成本模型
+依各後端的圖片計費方式,在每個任務的 token 預算內規劃送出哪些圖片、以何種解析度和 detail 等級
+"""
+
+import base64
+import hashlib
+import io
+import math
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+
+class ImageCostModel(ABC):
+    """圖片 token 成本模型基類"""
+
+    # 送出前允許的最長邊 (超過時由後端自動縮小,事先縮小可減少傳輸量)
+    max_long_edge = 2048
+
+    @abstractmethod
+    def tokens(self, width: int, height: int, detail: str = "high") -> int:
+        """估算單張圖片的 token 數"""
+
+
+class OpenAIImageCost(ImageCostModel):
+    """OpenAI 視覺模型: low detail 固定成本,high detail 按 512px 區塊計費"""
+
+    max_long_edge = 2048
+
+    def __init__(self, model: str = ""):
+        # gpt-4o-mini 的圖片 token 數約為 gpt-4o 的 33 倍 (單價較低)
+        if "4o-mini" in model:
+            self.base_tokens, self.tile_tokens = 2833, 5667
+        else:
+            self.base_tokens, self.tile_tokens = 85, 170
+
+    @staticmethod
+    def scaled_size(width: int, height: int) -> Tuple[int, int]:
+        """OpenAI high detail 的縮放規則: 先縮至 2048 見方內,再將短邊縮至 768"""
+        scale = min(1.0, 2048 / max(width, height))
+        width, height = width * scale, height * scale
+        scale = min(1.0, 768 / min(width, height))
+        return int(width * scale), int(height * scale)
+
+    def tokens(self, width, height, detail="high"):
+        if detail == "low":
+            return self.base_tokens
+        width, height = self.scaled_size(width, height)
+        tiles = math.ceil(width / 512) * math.ceil(height / 512)
+        return self.base_tokens + self.tile_tokens * tiles
+
+
+class AnthropicImageCost(ImageCostModel):
+    """Anthropic Claude: 長邊超過 1568px 時縮小,token 數約為 寬 x 高 / 750"""
+
+    max_long_edge = 1568
+
+    def tokens(self, width, height, detail="high"):
+        scale = min(1.0, self.max_long_edge / max(width, height))
+        return math.ceil((width * scale) * (height * scale) / 750)
+
+
+class OllamaImageCost(ImageCostModel):
+    """Ollama 視覺模型: 圖片編碼為固定數量的 token,與解析度無關"""
+
+    max_long_edge = 1120
+    fixed_tokens = 768
+
+    def tokens(self, width, height, detail="high"):
+        return self.fixed_tokens
+
+
+def get_cost_model(backend: str, model: str = "") -> ImageCostModel:
+    """取得後端的圖片成本模型"""
+    if backend == "openai":
+        return OpenAIImageCost(model)
+    if backend == "anthropic":
+        return AnthropicImageCost()
+    return OllamaImageCost()
+
+
+class ImageBudgetPlanner:
+    """在 token 預算內規劃圖片的數量、解析度和 detail 等級"""
+
+    # 短邊小於此值的圖片視為圖示/Logo,不送出
+    MIN_IMAGE_EDGE = 64
+    # 縮小圖片時長邊的下限,避免圖片內容無法辨識
+    MIN_LONG_EDGE = 512
+    # 無法讀取尺寸時使用的假設尺寸
+    DEFAULT_SIZE = (1024, 1024)
+
+    def __init__(self, backend: str, model: str, budget_tokens: int, max_images: int):
+        """
+        Args:
+            backend: LLM 後端
+            model: 模型名稱
+            budget_tokens: 每個任務的圖片 token 預算
+            max_images: 單次請求最多送出的圖片數
+        """
+        self.backend = backend
+        self.cost = get_cost_model(backend, model)
+        self.budget_tokens = budget_tokens
+        self.max_images = max_images
+
+    @staticmethod
+    def _image_size(image: Dict) -> Optional[Tuple[int, int]]:
+        if not HAS_PIL:
+            return None
+        try:
+            with Image.open(io.BytesIO(base64.b64decode(image['data']))) as im:
+                return im.size
+        except Exception:
+            return None
+
+    @staticmethod
+    def _resize(image: Dict, width: int, height: int) -> Dict:
+        """縮小圖片並重新編碼"""
+        with Image.open(io.BytesIO(base64.b64decode(image['data']))) as im:
+            is_jpeg = image.get('format', '').lower() in ('jpg', 'jpeg')
+            if is_jpeg and im.mode not in ('RGB', 'L'):
+                im = im.convert('RGB')
+            resized = im.resize((width, height))
+            buffer = io.BytesIO()
+            resized.save(buffer, format='JPEG' if is_jpeg else 'PNG')
+
+        resized_image = dict(image)
+        resized_image['data'] = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        resized_image['format'] = 'jpeg' if is_jpeg else 'png'
+        return resized_image
+
+    def plan(self, images: List[Dict]) -> Tuple[List[Dict], Dict]:
+        """規劃要送出的圖片
+
+        步驟:
+        1. 過濾圖示大小的圖片與重複圖片 (例如每頁重複的 Logo)
+        2. 依文件順序取前 max_images 張,縮至後端的最長邊限制
+        3. 超出預算時: OpenAI 逐張改用 low detail,Anthropic 等比例縮小解析度
+        4. 仍超出預算時,從後面捨棄圖片
+
+        Args:
+            images: 提取出的圖片列表
+
+        Returns:
+            (實際送出的圖片列表, 規劃摘要)
+        """
+        summary = {
+            "budget_tokens": self.budget_tokens,
+            "candidates": len(images),
+            "dropped_small": 0,
+            "dropped_duplicate": 0,
+            "dropped_budget": 0,
+            "downscaled": 0,
+            "detail_low": 0,
+            "selected": 0,
+            "estimated_tokens": 0,
+            "images": [],
+        }
+
+        # 1. 過濾圖示與重複圖片
+        entries = []
+        seen = set()
+        for index, image in enumerate(images):
+            digest = hashlib.sha1(image['data'].encode('utf-8')).hexdigest()
+            if digest in seen:
+                summary["dropped_duplicate"] += 1
+                continue
+            seen.add(digest)
+
+            size = self._image_size(image)
+            if size and min(size) < self.MIN_IMAGE_EDGE:
+                summary["dropped_small"] += 1
+                continue
+
+            width, height = size or self.DEFAULT_SIZE
+            scale = min(1.0, self.cost.max_long_edge / max(width, height))
+            entries.append({
+                "index": index,
+                "image": image,
+                "size_known": size is not None,
+                "width": width,
+                "height": height,
+                "target_width": max(1, int(width * scale)),
+                "target_height": max(1, int(height * scale)),
+                "detail": "high",
+            })
+
+        # 2. 數量上限
+        summary["dropped_budget"] += max(0, len(entries) - self.max_images)
+        entries = entries[:self.max_images]
+
+        def entry_tokens(entry):
+            return self.cost.tokens(entry["target_width"], entry["target_height"], entry["detail"])
+
+        def total_tokens():
+            return sum(entry_tokens(entry) for entry in entries)
+
+        # 3. 降低成本以符合預算
+        if total_tokens() > self.budget_tokens:
+            if self.backend == "openai":
+                for entry in sorted(entries, key=entry_tokens, reverse=True):
+                    # low detail 以 512px 處理,事先縮小以減少傳輸量
+                    entry["detail"] = "low"
+                    scale = min(1.0, 512 / max(entry["target_width"], entry["target_height"]))
+                    entry["target_width"] = max(1, int(entry["target_width"] * scale))
+                    entry["target_height"] = max(1, int(entry["target_height"] * scale))
+                    if total_tokens() <= self.budget_tokens:
+                        break
+            elif self.backend == "anthropic":
+                factor = math.sqrt(self.budget_tokens / total_tokens())
+                for entry in entries:
+                    long_edge = max(entry["target_width"], entry["target_height"])
+                    scale = max(factor, min(1.0, self.MIN_LONG_EDGE / long_edge))
+                    entry["target_width"] = max(1, int(entry["target_width"] * scale))
+                    entry["target_height"] = max(1, int(entry["target_height"] * scale))
+
+        # 4. 從後面捨棄圖片
+        while entries and total_tokens() > self.budget_tokens:
+            entries.pop()
+            summary["dropped_budget"] += 1
+
+        # 套用規劃結果
+        selected = []
+        for entry in entries:
+            image = entry["image"]
+            resized = (entry["target_width"], entry["target_height"]) != (entry["width"], entry["height"])
+            if resized and entry["size_known"]:
+                image = self._resize(image, entry["target_width"], entry["target_height"])
+                summary["downscaled"] += 1
+            if self.backend == "openai":
+                image = dict(image, detail=entry["detail"])
+                if entry["detail"] == "low":
+                    summary["detail_low"] += 1
+            selected.append(image)
+
+            summary["images"].append({
+                "index": entry["index"],
+                "width": entry["width"],
+                "height": entry["height"],
+                "sent_width": entry["target_width"],
+                "sent_height": entry["target_height"],
+                "detail": entry["detail"] if self.backend == "openai" else None,
+                "tokens": entry_tokens(entry),
+            })
+
+        summary["selected"] = len(selected)
+        summary["estimated_tokens"] = total_tokens()
+        return selected, summary
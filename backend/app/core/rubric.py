@@ -0,0 +1,177 @@
+"""
+評分標準
+評估維度與權重 (滿分) 以及等級區間,分析器、結果寫入、統計與重新評分共用
+
+內建標準為版本 1;QA 調整後的版本保存在 rubric_versions 表 (見 services/rubric.py)
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional, Tuple
+
+# 內建評分標準的版本號
+DEFAULT_RUBRIC_VERSION = 1
+
+# 評估維度與權重 (各維度滿分,合計 100)
+DIMENSION_WEIGHTS: Dict[str, float] = {
+    "基本資訊完整性": 15,
+    "問題描述與定義": 15,
+    "分析方法與流程": 20,
+    "數據與證據支持": 20,
+    "根因分析": 20,
+    "改善對策": 10
+}
+
+# 各維度的評估要點 (寫入分析提示詞;QA 新增的維度沒有要點時只列出名稱與權重)
+DIMENSION_CRITERIA: Dict[str, List[str]] = {
+    "基本資訊完整性": [
+        "產品資訊(型號、批號、製造日期)",
+        "客戶資訊與投訴內容",
+        "FA 編號與日期",
+        "負責工程師資訊",
+    ],
+    "問題描述與定義": [
+        "失效現象描述的清晰度",
+        "失效模式的準確性",
+        "問題範圍與影響評估",
+        "失效率數據",
+    ],
+    "分析方法與流程": [
+        "分析方法的適當性(如:光學檢查、SEM、FIB、X-ray等)",
+        "分析步驟的邏輯性與完整性",
+        "實驗設計的合理性",
+        "分析設備使用的正確性",
+    ],
+    "數據與證據支持": [
+        "分析數據的充分性",
+        "圖片/圖表的清晰度與標註",
+        "量化數據的準確性",
+        "對照組/比較樣本的使用",
+    ],
+    "根因分析": [
+        "根本原因的深度與準確度",
+        "因果關係的邏輯推導",
+        "5-Why 或 Fishbone 分析的應用",
+        "排除其他可能原因的論證",
+    ],
+    "改善對策": [
+        "短期與長期對策的完整性",
+        "對策的可行性與有效性",
+        "預防措施的提出",
+        "驗證計畫",
+    ],
+}
+
+# 等級: (最低分, 最高分, 說明)
+GRADE_CRITERIA: Dict[str, Tuple[float, float, str]] = {
+    "A": (90, 100, "卓越報告"),
+    "B": (80, 89, "良好報告"),
+    "C": (70, 79, "合格報告"),
+    "D": (60, 69, "待改進報告"),
+    "F": (0, 59, "不合格報告")
+}
+
+
+def dimension_weight(
+    name: str, data: Dict[str, Any], weights: Optional[Dict[str, float]] = None
+) -> Optional[float]:
+    """
+    維度的權重 (滿分)
+
+    不在評分標準中的維度,依 LLM 返回的分數與百分比推算
+
+    Args:
+        name: 維度名稱
+        data: 結果中的維度數據 {"score", "percentage", ...}
+        weights: 評分標準的權重 (預設為內建標準)
+
+    Returns:
+        權重,無法推算時為 None
+    """
+    weights = DIMENSION_WEIGHTS if weights is None else weights
+    if name in weights:
+        return float(weights[name])
+    try:
+        score = float(data.get("score"))
+        percentage = float(data.get("percentage"))
+    except (TypeError, ValueError):
+        return None
+    return round(score / percentage * 100, 2) if percentage > 0 else None
+
+
+def grade_for(total_score: float, criteria: Optional[Dict[str, Tuple[float, float, str]]] = None) -> Tuple[str, str]:
+    """
+    依總分取得等級
+
+    取最低分不高於總分的最高等級,因此 89.5 之類落在兩個區間之間的分數歸入較低的等級
+
+    Args:
+        total_score: 總分
+        criteria: 等級區間 (預設為內建標準)
+
+    Returns:
+        (等級, 說明)
+    """
+    bands = sorted((criteria or GRADE_CRITERIA).items(), key=lambda item: item[1][0], reverse=True)
+    for grade, (min_score, _, description) in bands:
+        if total_score >= min_score:
+            return grade, description
+    grade, (_, _, description) = bands[-1]
+    return grade, description
+
+
+def apply_rubric(
+    result: Dict[str, Any],
+    weights: Dict[str, float],
+    criteria: Dict[str, Tuple[float, float, str]],
+    version: int
+) -> Dict[str, Any]:
+    """
+    依評分標準重新計算總分、等級與各維度分數
+
+    各維度的完成度 (percentage) 是 LLM 的評估,與權重無關;
+    維度分數 = 完成度 × 權重 / 100,總分為各維度分數之和
+
+    Args:
+        result: 分析結果
+        weights: 維度權重
+        criteria: 等級區間
+        version: 評分標準版本
+
+    Returns:
+        新的結果 (原結果不變);缺少任一維度的完成度時返回原結果
+    """
+    dimensions = result.get("dimension_scores") if isinstance(result, dict) else None
+    if not isinstance(dimensions, dict):
+        return result
+    percentages = {}
+    for name in weights:
+        data = dimensions.get(name)
+        if not isinstance(data, dict):
+            return result
+        try:
+            percentages[name] = float(data["percentage"])
+        except (TypeError, KeyError, ValueError):
+            # 未返回完成度時依內建權重由分數推算 (與 dimension_scores 表一致)
+            try:
+                percentages[name] = round(float(data["score"]) / float(DIMENSION_WEIGHTS[name]) * 100, 2)
+            except (TypeError, KeyError, ValueError):
+                return result
+
+    result = dict(result)
+    result["dimension_scores"] = dict(dimensions)
+    for name, weight in weights.items():
+        result["dimension_scores"][name] = {
+            **dimensions[name],
+            "score": round_half_up(percentages[name] * weight / 100, 2),
+            "percentage": percentages[name]
+        }
+    total_score = round_half_up(sum(percentages[name] * weight for name, weight in weights.items()) / 100, 1)
+    result["total_score"] = total_score
+    result["grade"] = grade_for(total_score, criteria)[0]
+    result["rubric_version"] = version
+    return result
+
+
+def round_half_up(value: float, digits: int) -> float:
+    """四捨五入到指定位數 (依十進位表示,與資料庫的 ROUND 一致;內建 round 依二進位值,75.55 會得到 75.5)"""
+    return float(Decimal(repr(value)).quantize(Decimal(1).scaleb(-digits), rounding=ROUND_HALF_UP))
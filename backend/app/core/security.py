@@ -3,9 +3,13 @@
 提供 API Key 加密/解密功能
 """
 from cryptography.fernet import Fernet
+from pathlib import Path
 import base64
 import hashlib
 import logging
+import os
+import secrets
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +22,7 @@ class SecurityManager:
         初始化安全管理器
 
         Args:
-            encryption_key: 加密密鑰,如果為 None 則使用默認密鑰
+            encryption_key: 加密密鑰,如果為 None 則使用隨機密鑰 (僅在本進程內有效)
         """
         if encryption_key:
             # 使用提供的密鑰生成 Fernet 密鑰
@@ -85,6 +89,43 @@ class SecurityManager:
             raise
 
 
+def load_or_create_key_file(key_file: str) -> str:
+    """
+    讀取共享的加密密鑰文件,不存在時原子地創建
+
+    未設定 ENCRYPTION_KEY 時,同一台機器上的所有進程 (uvicorn workers、
+    分析 worker) 透過此文件使用相同的密鑰。多個進程同時啟動時只有一個能創建文件,
+    其他進程等待內容寫入後讀取。
+
+    Args:
+        key_file: 密鑰文件路徑
+
+    Returns:
+        密鑰字符串
+    """
+    path = Path(key_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    try:
+        fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # 其他進程正在創建,等待內容寫入
+        for _ in range(50):
+            key = path.read_text().strip()
+            if key:
+                return key
+            time.sleep(0.1)
+        raise RuntimeError(f"加密密鑰文件為空: {path}")
+
+    key = secrets.token_urlsafe(32)
+    with os.fdopen(fd, "w") as f:
+        f.write(key)
+        f.flush()
+        os.fsync(f.fileno())
+    logger.warning(f"未設定 ENCRYPTION_KEY,已生成加密密鑰文件: {path} (請妥善備份)")
+    return key
+
+
 # 全局安全管理器實例 (延遲初始化)
 _security_manager = None
 
@@ -104,6 +145,9 @@ def get_security_manager(encryption_key: str = None) -> SecurityManager:
     if _security_manager is None:
         from ..config import settings
         key = encryption_key or settings.ENCRYPTION_KEY
+        if not key:
+            # 所有進程共用同一個密鑰,避免一個進程加密的數據在另一個進程無法解密
+            key = load_or_create_key_file(settings.ENCRYPTION_KEY_FILE)
         _security_manager = SecurityManager(key)
 
     return _security_manager
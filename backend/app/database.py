@@ -1,17 +1,143 @@
-from sqlalchemy import create_engine
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
 
+logger = logging.getLogger(__name__)
+
 engine = create_engine(
     settings.DATABASE_URL,
     connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
 )
 
+IS_SQLITE = engine.url.get_backend_name() == "sqlite"
+
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """
+        Production SQLite profile, applied to every new connection
+
+        WAL lets the status readers run while a task result is being written;
+        synchronous=NORMAL is durable across application crashes in WAL mode.
+        """
+        cursor = dbapi_connection.cursor()
+        try:
+            if engine.url.database not in (None, "", ":memory:"):
+                cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+            cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+            # Negative cache_size is in KiB
+            cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+        finally:
+            cursor.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+class DatabaseWriter:
+    """
+    Dedicated thread that performs queue and task writes one at a time
+
+    SQLite allows a single writer; funnelling the background writes of this
+    process (claims, lease renewals, progress checkpoints, results, webhook
+    bookkeeping) through one thread removes lock contention between them.
+    Each call gets its own session: fn(db, *args) must commit its changes.
+    With other databases, or DB_SINGLE_WRITER=false, calls run in the caller.
+    """
+
+    THREAD_NAME = "db-writer"
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.THREAD_NAME) if enabled else None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _call(self, fn: Callable, args, kwargs) -> Any:
+        db = SessionLocal()
+        try:
+            return fn(db, *args, **kwargs)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _tracked_call(self, fn: Callable, args, kwargs) -> Any:
+        try:
+            result = self._call(fn, args, kwargs)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+                self.failed += 1
+            raise
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+        return result
+
+    def _queue(self, fn: Callable, args, kwargs):
+        with self._lock:
+            self.pending += 1
+        return self._executor.submit(self._tracked_call, fn, args, kwargs)
+
+    def _inline(self) -> bool:
+        # Nested calls from the writer thread would wait on themselves
+        return not self.enabled or threading.current_thread().name.startswith(self.THREAD_NAME)
+
+    def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn(db, *args) on the writer thread and wait for the result (sync callers)"""
+        if self._inline():
+            return self._call(fn, args, kwargs)
+        return self._queue(fn, args, kwargs).result()
+
+    async def submit(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn(db, *args) on the writer thread without blocking the event loop"""
+        if self._inline():
+            return self._call(fn, args, kwargs)
+        return await asyncio.wrap_future(self._queue(fn, args, kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and counters of the writer"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "pending": self.pending,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+
+_writer: Optional[DatabaseWriter] = None
+
+
+def get_db_writer() -> DatabaseWriter:
+    """Process-wide database writer (created on first use)"""
+    global _writer
+    if _writer is None:
+        _writer = DatabaseWriter(IS_SQLITE and settings.DB_SINGLE_WRITER)
+    return _writer
+
+
 def get_db():
     """Database dependency injection"""
     db = SessionLocal()
@@ -21,6 +147,83 @@ def get_db():
         db.close()
 
 
+def _init_lock_path() -> Path:
+    """Lock file guarding schema creation (next to the SQLite file, else in the temp dir)"""
+    if IS_SQLITE and engine.url.database not in (None, "", ":memory:"):
+        return Path(f"{engine.url.database}.init.lock")
+    return Path(tempfile.gettempdir()) / "fa_analyzer_init.lock"
+
+
+@contextmanager
+def _init_lock():
+    """
+    Inter-process lock around schema creation
+
+    uvicorn --workers N and standalone workers all call init_db() on startup;
+    without the lock they race on CREATE TABLE / ALTER TABLE.
+    """
+    path = _init_lock_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as lock_file:
+        if os.name == "nt":
+            import msvcrt
+            lock_file.seek(0)
+            # LK_LOCK retries for ~10 seconds, keep trying until acquired
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
 def init_db():
     """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
+    from .migrations import run_migrations
+
+    with _init_lock():
+        Base.metadata.create_all(bind=engine)
+        _add_missing_columns()
+        run_migrations(engine)
+
+
+def _add_missing_columns():
+    """
+    Add columns declared on the models but missing from existing tables
+
+    create_all() never alters tables that already exist, so databases created
+    by an older version would otherwise fail on newly added nullable columns.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                try:
+                    with conn.begin_nested():
+                        conn.execute(text(
+                            f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                        ))
+                except (OperationalError, ProgrammingError) as e:
+                    # Another host sharing the database added it first (the file lock is per machine)
+                    logger.warning(f"Column {table.name}.{column.name} not added: {e.orig}")
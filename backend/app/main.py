@@ -6,6 +6,7 @@ from pathlib import Path
 import logging
 import sys
 import io
+import asyncio
 from starlette.responses import Response
 from starlette.types import Scope
 
@@ -14,11 +15,18 @@ if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-from .database import init_db
+from .database import get_db_writer, init_db
 from . import models  # Import models to register them with Base
 
 # Import API routers
-from .api import upload, analyze, result, config, history
+from .api import upload, analyze, result, config, history, batch, search, analytics, rubric, archive
+from .services.batch import BatchScoringService
+from .services.webhook import WebhookService
+from .services.task_runner import TaskDispatcher
+from .services.pipeline import get_pipeline
+from .services.janitor import get_file_janitor
+from .services.retention import RetentionService
+from .config import settings
 
 # Configure logging
 logging.basicConfig(
@@ -82,8 +90,37 @@ async def startup_event():
     logger.info("正在初始化資料庫...")
     init_db()
     logger.info("資料庫初始化完成")
+    # 啟動供應商批次輪詢器
+    app.state.batch_poller = asyncio.create_task(BatchScoringService.run_poller())
+    # 發送任務完成 webhook
+    app.state.webhook_sender = asyncio.create_task(WebhookService.run_sender())
+    # 保留策略: 歸檔舊任務並刪除過期與孤立的上傳文件 (未設定任何層級時不啟動)
+    app.state.retention_policy = None
+    if RetentionService.enabled():
+        app.state.retention_policy = asyncio.create_task(RetentionService.run_policy())
+    # 在 API 進程內執行佇列中的分析任務 (EMBEDDED_WORKER=false 時改由獨立 worker 執行)
+    app.state.task_dispatcher = None
+    if settings.EMBEDDED_WORKER:
+        app.state.task_dispatcher = TaskDispatcher()
+        app.state.dispatcher_loop = asyncio.create_task(app.state.task_dispatcher.run())
     logger.info("FA Report Analyzer v3.0 API 已啟動")
 
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # 交還執行中的任務,讓重啟後或其他 worker 繼續處理
+    if app.state.task_dispatcher:
+        await app.state.task_dispatcher.stop()
+        app.state.dispatcher_loop.cancel()
+    # 交還發送中的 webhook
+    app.state.webhook_sender.cancel()
+    await asyncio.gather(app.state.webhook_sender, return_exceptions=True)
+    if app.state.retention_policy:
+        app.state.retention_policy.cancel()
+        await asyncio.gather(app.state.retention_policy, return_exceptions=True)
+    # 刪除已排入清理佇列的上傳文件
+    get_file_janitor().stop()
+
 # CORS settings
 app.add_middleware(
     CORSMiddleware,
@@ -91,6 +128,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After"],
 )
 
 # Register API routers
@@ -99,8 +137,13 @@ app.include_router(analyze.router)
 app.include_router(result.router)
 app.include_router(config.router)
 app.include_router(history.router)
+app.include_router(batch.router)
+app.include_router(search.router)
+app.include_router(analytics.router)
+app.include_router(rubric.router)
+app.include_router(archive.router)
 
-logger.info("已註冊 API 路由: upload, analyze, result, config, history")
+logger.info("已註冊 API 路由: upload, analyze, result, config, history, batch, search, analytics, rubric, archive")
 
 # Mount static files directory with fixed MIME types
 static_path = Path(__file__).parent / "static"
@@ -159,6 +202,28 @@ async def health_check():
     }
 
 
+@app.get("/api/v1/pipeline")
+async def pipeline_stats():
+    """
+    分析管線狀態 (本進程)
+
+    Returns:
+        各階段的執行緒數、排隊數、執行中數量與累計數,資料庫寫入執行緒與文件清理執行緒的排隊數,
+        以及本進程分派器執行中的任務數
+    """
+    dispatcher = app.state.task_dispatcher
+    return {
+        "stages": get_pipeline().stats(),
+        "db_writer": get_db_writer().stats(),
+        "file_janitor": get_file_janitor().stats(),
+        "dispatcher": {
+            "owner": dispatcher.owner,
+            "concurrency": dispatcher.concurrency,
+            "running": len(dispatcher.running),
+        } if dispatcher else None
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
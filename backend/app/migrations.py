@@ -0,0 +1,413 @@
+"""
+Versioned schema migrations
+
+init_db() creates missing tables and adds missing columns, but create_all()
+never changes a table that already exists. Everything else an existing
+database needs (indexes, data backfills) is registered here as a numbered
+migration. Pending migrations run once per database, in version order, at
+startup under the init lock; applied versions are recorded in the
+schema_migrations table.
+
+Adding a migration:
+
+    @migration(3, "describe the change")
+    def _my_change(conn: Connection):
+        ...
+"""
+from datetime import datetime
+from typing import Callable, List, Set, Tuple
+import logging
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+
+from .core.rubric import DEFAULT_RUBRIC_VERSION, DIMENSION_WEIGHTS, GRADE_CRITERIA
+from .database import Base
+from . import models  # noqa: F401  (register every table on Base.metadata)
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# (version, name, apply)
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = []
+
+
+def migration(version: int, name: str):
+    """Register a migration; versions must be unique and are applied in ascending order"""
+    def register(fn: Callable[[Connection], None]):
+        if any(v == version for v, _, _ in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version: {version}")
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return register
+
+
+def create_model_indexes(conn: Connection, table_name: str, *index_names: str):
+    """Create indexes declared on a model (skipped when they already exist)"""
+    table = Base.metadata.tables[table_name]
+    for index in table.indexes:
+        if index.name in index_names:
+            index.create(conn, checkfirst=True)
+
+
+@migration(1, "analysis_tasks history, queue and latency indexes")
+def _analysis_task_indexes(conn: Connection):
+    create_model_indexes(
+        conn, "analysis_tasks",
+        "ix_analysis_tasks_created_at",
+        "ix_analysis_tasks_status_created_at",
+        "ix_analysis_tasks_backend_created_at",
+        "ix_analysis_tasks_batch_id",
+        "ix_analysis_tasks_status_backend_completed_at",
+    )
+
+
+@migration(2, "webhook_deliveries due index")
+def _webhook_delivery_indexes(conn: Connection):
+    create_model_indexes(conn, "webhook_deliveries", "ix_webhook_deliveries_status_next_attempt_at")
+
+
+# Dialects whose analysis_tasks triggers maintain task_stat_counters
+STAT_COUNTER_DIALECTS = ("sqlite", "postgresql")
+
+_SQLITE_DAY = "coalesce(date({row}.created_at), date('now', 'localtime'))"
+
+_SQLITE_STAT_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS analysis_tasks_stats_insert AFTER INSERT ON analysis_tasks
+    BEGIN
+        INSERT INTO task_stat_counters (day, backend, status, count)
+        VALUES ({_SQLITE_DAY.format(row="NEW")}, NEW.backend, coalesce(NEW.status, 'pending'), 1)
+        ON CONFLICT (day, backend, status) DO UPDATE SET count = count + 1;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS analysis_tasks_stats_update
+    AFTER UPDATE OF status, backend, created_at ON analysis_tasks
+    WHEN OLD.status IS NOT NEW.status OR OLD.backend IS NOT NEW.backend
+        OR date(OLD.created_at) IS NOT date(NEW.created_at)
+    BEGIN
+        UPDATE task_stat_counters SET count = count - 1
+        WHERE day = {_SQLITE_DAY.format(row="OLD")} AND backend = OLD.backend
+            AND status = coalesce(OLD.status, 'pending');
+        INSERT INTO task_stat_counters (day, backend, status, count)
+        VALUES ({_SQLITE_DAY.format(row="NEW")}, NEW.backend, coalesce(NEW.status, 'pending'), 1)
+        ON CONFLICT (day, backend, status) DO UPDATE SET count = count + 1;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS analysis_tasks_stats_delete AFTER DELETE ON analysis_tasks
+    BEGIN
+        UPDATE task_stat_counters SET count = count - 1
+        WHERE day = {_SQLITE_DAY.format(row="OLD")} AND backend = OLD.backend
+            AND status = coalesce(OLD.status, 'pending');
+    END
+    """,
+]
+
+_POSTGRESQL_STAT_TRIGGERS = [
+    """
+    CREATE OR REPLACE FUNCTION analysis_tasks_stats() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE task_stat_counters SET count = count - 1
+            WHERE day = coalesce(OLD.created_at::date, current_date) AND backend = OLD.backend
+                AND status = coalesce(OLD.status, 'pending');
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO task_stat_counters (day, backend, status, count)
+            VALUES (coalesce(NEW.created_at::date, current_date), NEW.backend, coalesce(NEW.status, 'pending'), 1)
+            ON CONFLICT (day, backend, status) DO UPDATE SET count = task_stat_counters.count + 1;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS analysis_tasks_stats_insert_delete ON analysis_tasks",
+    """
+    CREATE TRIGGER analysis_tasks_stats_insert_delete AFTER INSERT OR DELETE ON analysis_tasks
+    FOR EACH ROW EXECUTE FUNCTION analysis_tasks_stats()
+    """,
+    "DROP TRIGGER IF EXISTS analysis_tasks_stats_update ON analysis_tasks",
+    """
+    CREATE TRIGGER analysis_tasks_stats_update AFTER UPDATE OF status, backend, created_at ON analysis_tasks
+    FOR EACH ROW WHEN (
+        OLD.status IS DISTINCT FROM NEW.status OR OLD.backend IS DISTINCT FROM NEW.backend
+        OR OLD.created_at::date IS DISTINCT FROM NEW.created_at::date
+    )
+    EXECUTE FUNCTION analysis_tasks_stats()
+    """,
+]
+
+
+@migration(3, "task_stat_counters rollup triggers and backfill")
+def _task_stat_counters(conn: Connection):
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        statements, day = _SQLITE_STAT_TRIGGERS, _SQLITE_DAY.format(row="analysis_tasks")
+    elif dialect == "postgresql":
+        statements, day = _POSTGRESQL_STAT_TRIGGERS, "coalesce(created_at::date, current_date)"
+    else:
+        logger.warning(f"No task_stat_counters triggers for {dialect}; history stats use an aggregate query")
+        return
+
+    for statement in statements:
+        conn.exec_driver_sql(statement)
+    # Triggers and backfill share one transaction, so no concurrent write is counted twice or missed
+    conn.exec_driver_sql("DELETE FROM task_stat_counters")
+    conn.exec_driver_sql(f"""
+        INSERT INTO task_stat_counters (day, backend, status, count)
+        SELECT {day}, backend, coalesce(status, 'pending'), count(*)
+        FROM analysis_tasks
+        GROUP BY 1, 2, 3
+    """)
+
+
+@migration(4, "analysis_tasks keyset indexes and total_score/grade backfill")
+def _history_keyset_and_scores(conn: Connection):
+    # The history indexes now end with id so (created_at, id) cursors need no sort
+    for name in (
+        "ix_analysis_tasks_created_at",
+        "ix_analysis_tasks_status_created_at",
+        "ix_analysis_tasks_backend_created_at",
+    ):
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+    create_model_indexes(
+        conn, "analysis_tasks",
+        "ix_analysis_tasks_created_at_id",
+        "ix_analysis_tasks_status_created_at_id",
+        "ix_analysis_tasks_backend_created_at_id",
+    )
+
+    tasks = Base.metadata.tables["analysis_tasks"]
+    last_id = ""
+    while True:
+        rows = conn.execute(
+            select(tasks.c.id, tasks.c.result).where(
+                tasks.c.id > last_id,
+                tasks.c.result.isnot(None),
+                tasks.c.total_score.is_(None)
+            ).order_by(tasks.c.id).limit(1000)
+        ).all()
+        if not rows:
+            break
+        for task_id, result in rows:
+            total_score, grade = models.AnalysisTask.extract_score(result)
+            if total_score is not None or grade is not None:
+                conn.execute(tasks.update().where(tasks.c.id == task_id).values(
+                    total_score=total_score, grade=grade
+                ))
+        last_id = rows[-1][0]
+
+
+_SQLITE_SEARCH_INDEX = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS task_search USING fts5(
+        filename, report_text, summary, commentary,
+        content='task_search_docs', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS task_search_docs_insert AFTER INSERT ON task_search_docs
+    BEGIN
+        INSERT INTO task_search (rowid, filename, report_text, summary, commentary)
+        VALUES (NEW.id, NEW.filename, NEW.report_text, NEW.summary, NEW.commentary);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS task_search_docs_delete AFTER DELETE ON task_search_docs
+    BEGIN
+        INSERT INTO task_search (task_search, rowid, filename, report_text, summary, commentary)
+        VALUES ('delete', OLD.id, OLD.filename, OLD.report_text, OLD.summary, OLD.commentary);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS task_search_docs_update AFTER UPDATE ON task_search_docs
+    BEGIN
+        INSERT INTO task_search (task_search, rowid, filename, report_text, summary, commentary)
+        VALUES ('delete', OLD.id, OLD.filename, OLD.report_text, OLD.summary, OLD.commentary);
+        INSERT INTO task_search (rowid, filename, report_text, summary, commentary)
+        VALUES (NEW.id, NEW.filename, NEW.report_text, NEW.summary, NEW.commentary);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS analysis_tasks_search_delete AFTER DELETE ON analysis_tasks
+    BEGIN
+        DELETE FROM task_search_docs WHERE task_id = OLD.id;
+    END
+    """,
+]
+
+
+def sqlite_fts5_trigram(conn: Connection) -> bool:
+    """Whether this SQLite build has FTS5 and the trigram tokenizer (3.34+)"""
+    version = tuple(int(part) for part in conn.exec_driver_sql("SELECT sqlite_version()").scalar().split("."))
+    options = set(conn.exec_driver_sql("PRAGMA compile_options").scalars())
+    return version >= (3, 34, 0) and "ENABLE_FTS5" in options
+
+
+@migration(5, "task_search full-text index and backfill")
+def _task_search(conn: Connection):
+    if conn.dialect.name == "sqlite" and not sqlite_fts5_trigram(conn):
+        logger.warning("SQLite lacks FTS5 or the trigram tokenizer; search uses LIKE over the documents")
+    elif conn.dialect.name == "sqlite":
+        for statement in _SQLITE_SEARCH_INDEX:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql("INSERT INTO task_search (task_search) VALUES ('rebuild')")
+
+    # Finished tasks get their documents (report text is only indexed for new analyses)
+    tasks = Base.metadata.tables["analysis_tasks"]
+    docs = Base.metadata.tables["task_search_docs"]
+    finished = ("completed", "failed")
+    last_id = ""
+    while True:
+        rows = conn.execute(
+            select(tasks.c.id, tasks.c.filename, tasks.c.result, tasks.c.error).where(
+                tasks.c.id > last_id,
+                tasks.c.status.in_(finished),
+                ~tasks.c.id.in_(select(docs.c.task_id))
+            ).order_by(tasks.c.id).limit(1000)
+        ).all()
+        if not rows:
+            break
+        conn.execute(docs.insert(), [
+            {"task_id": row.id, **models.TaskSearchDocument.texts_from(row)} for row in rows
+        ])
+        last_id = rows[-1].id
+
+
+_DIMENSION_SCORE_CLEANUP = {
+    "sqlite": [
+        """
+        CREATE TRIGGER IF NOT EXISTS analysis_tasks_dimension_scores_delete AFTER DELETE ON analysis_tasks
+        BEGIN
+            DELETE FROM dimension_scores WHERE task_id = OLD.id;
+        END
+        """,
+    ],
+    "postgresql": [
+        """
+        CREATE OR REPLACE FUNCTION analysis_tasks_dimension_scores_delete() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM dimension_scores WHERE task_id = OLD.id;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS analysis_tasks_dimension_scores_delete ON analysis_tasks",
+        """
+        CREATE TRIGGER analysis_tasks_dimension_scores_delete AFTER DELETE ON analysis_tasks
+        FOR EACH ROW EXECUTE FUNCTION analysis_tasks_dimension_scores_delete()
+        """,
+    ],
+}
+
+
+@migration(6, "dimension_scores cleanup trigger and backfill")
+def _dimension_scores(conn: Connection):
+    for statement in _DIMENSION_SCORE_CLEANUP.get(conn.dialect.name, []):
+        conn.exec_driver_sql(statement)
+
+    tasks = Base.metadata.tables["analysis_tasks"]
+    scores = Base.metadata.tables["dimension_scores"]
+    last_id = ""
+    while True:
+        rows = conn.execute(
+            select(tasks.c.id, tasks.c.result, tasks.c.completed_at).where(
+                tasks.c.id > last_id,
+                tasks.c.status == "completed",
+                tasks.c.result.isnot(None),
+                ~tasks.c.id.in_(select(scores.c.task_id))
+            ).order_by(tasks.c.id).limit(1000)
+        ).all()
+        if not rows:
+            break
+        values = [
+            score
+            for row in rows
+            for score in models.TaskDimensionScore.rows_from(row.id, row.result, row.completed_at)
+        ]
+        if values:
+            conn.execute(scores.insert(), values)
+        last_id = rows[-1].id
+
+
+@migration(7, "analytics covering indexes")
+def _analytics_indexes(conn: Connection):
+    create_model_indexes(conn, "analysis_tasks", "ix_analysis_tasks_status_completed_at_scores")
+    create_model_indexes(conn, "dimension_scores", "ix_dimension_scores_dimension_percentage")
+
+
+@migration(8, "built-in rubric as version 1")
+def _builtin_rubric(conn: Connection):
+    rubrics = Base.metadata.tables["rubric_versions"]
+    exists = conn.execute(
+        select(rubrics.c.version).where(rubrics.c.version == DEFAULT_RUBRIC_VERSION)
+    ).first()
+    if not exists:
+        conn.execute(rubrics.insert().values(
+            version=DEFAULT_RUBRIC_VERSION,
+            weights={name: float(weight) for name, weight in DIMENSION_WEIGHTS.items()},
+            grade_criteria={grade: list(band) for grade, band in GRADE_CRITERIA.items()},
+            note="內建評分標準",
+            created_at=datetime.now()
+        ))
+
+
+@migration(9, "analysis_tasks file_path index")
+def _file_path_index(conn: Connection):
+    create_model_indexes(conn, "analysis_tasks", "ix_analysis_tasks_file_path")
+
+
+@migration(10, "rename the status/backend/model/completed_at index")
+def _rename_latency_index(conn: Connection):
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_analysis_tasks_status_backend_completed_at")
+    create_model_indexes(conn, "analysis_tasks", "ix_analysis_tasks_status_backend_model_completed_at")
+
+
+def applied_versions(engine: Engine) -> Set[int]:
+    """Versions already applied to the database"""
+    with engine.connect() as conn:
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """
+    Apply pending migrations, each in its own transaction
+
+    Returns:
+        Versions applied by this call
+    """
+    _metadata.create_all(bind=engine)
+    applied = applied_versions(engine)
+
+    newly_applied = []
+    for version, name, apply in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied:
+            continue
+        try:
+            with engine.begin() as conn:
+                apply(conn)
+                conn.execute(schema_migrations.insert().values(
+                    version=version, name=name, applied_at=datetime.now()
+                ))
+        except IntegrityError:
+            # Another host sharing the database applied it first (the init lock is per machine);
+            # any other constraint failure in the migration itself is an error
+            if version not in applied_versions(engine):
+                raise
+            logger.info(f"Migration {version} already applied elsewhere")
+            continue
+        logger.info(f"Applied migration {version}: {name}")
+        newly_applied.append(version)
+    return newly_applied
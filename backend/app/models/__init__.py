@@ -1,4 +1,13 @@
-from .task import AnalysisTask, TaskStatus
+from .task import AnalysisTask, TaskStatus, TaskPriority
 from .config import SystemConfig
+from .batch import AnalysisBatch, BatchStatus
+from .webhook import WebhookDelivery, WebhookStatus
+from .stats import TaskStatCounter
+from .search import TaskSearchDocument
+from .dimension import TaskDimensionScore
+from .rubric import RubricVersion
+from .archive import ArchiveSegment, ArchivedTask
 
-__all__ = ["AnalysisTask", "TaskStatus", "SystemConfig"]
+__all__ = ["AnalysisTask", "TaskStatus", "TaskPriority", "SystemConfig", "AnalysisBatch", "BatchStatus",
+           "WebhookDelivery", "WebhookStatus", "TaskStatCounter",
+           "TaskSearchDocument", "TaskDimensionScore", "RubricVersion", "ArchiveSegment", "ArchivedTask"]
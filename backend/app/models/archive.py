@@ -0,0 +1,80 @@
+from sqlalchemy import Column, String, Integer, BigInteger, Float, DateTime, Index
+from ..database import Base
+from datetime import datetime
+
+
+class ArchiveSegment(Base):
+    """
+    A compressed JSONL file of archived tasks in ARCHIVE_DIR
+
+    The file is a sequence of independently compressed blocks (zstd frames
+    or gzip members), so it decompresses as a whole with zstd -d / gunzip
+    and a single task is read by decompressing only its block.
+    """
+    __tablename__ = "archive_segments"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    filename = Column(String, nullable=False, unique=True)  # ARCHIVE_DIR 內的文件名
+    codec = Column(String, nullable=False)  # zstd 或 gzip
+    task_count = Column(Integer, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)  # 壓縮後大小
+    raw_bytes = Column(BigInteger, nullable=False)  # 壓縮前大小
+    first_created_at = Column(DateTime, nullable=True)  # 段內任務的最早/最晚創建時間
+    last_created_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+
+    def to_dict(self):
+        return {
+            "segment_id": self.id,
+            "filename": self.filename,
+            "codec": self.codec,
+            "task_count": self.task_count,
+            "size_bytes": self.size_bytes,
+            "raw_bytes": self.raw_bytes,
+            "first_created_at": self.first_created_at.isoformat() if self.first_created_at else None,
+            "last_created_at": self.last_created_at.isoformat() if self.last_created_at else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+class ArchivedTask(Base):
+    """
+    Index entry of an archived task
+
+    Keeps the summary columns of the history list and the location of the
+    full record (segment, block offset and length) in its segment file.
+    """
+    __tablename__ = "archived_tasks"
+    __table_args__ = (
+        Index("ix_archived_tasks_created_at_task_id", "created_at", "task_id"),
+    )
+
+    task_id = Column(String, primary_key=True)
+    segment_id = Column(Integer, nullable=False, index=True)
+    block_offset = Column(BigInteger, nullable=False)
+    block_length = Column(Integer, nullable=False)
+
+    filename = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    backend = Column(String, nullable=True)
+    model = Column(String, nullable=True)
+    total_score = Column(Float, nullable=True)
+    grade = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, default=datetime.now)
+
+    def to_dict(self):
+        return {
+            "task_id": self.task_id,
+            "segment_id": self.segment_id,
+            "filename": self.filename,
+            "status": self.status,
+            "backend": self.backend,
+            "model": self.model,
+            "total_score": self.total_score,
+            "grade": self.grade,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+            "archived_at": self.archived_at.isoformat() if self.archived_at else None,
+        }
@@ -0,0 +1,48 @@
+from sqlalchemy import Column, String, Integer, DateTime, Text
+from ..database import Base
+import uuid
+import enum
+from datetime import datetime
+
+
+class BatchStatus(enum.Enum):
+    PREPARING = "preparing"
+    SUBMITTING = "submitting"  # one process is reading the reports and submitting them
+    SUBMITTED = "submitted"
+    COLLECTING = "collecting"  # one process is writing the results back
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class AnalysisBatch(Base):
+    """Provider batch-API submission grouping many analysis tasks"""
+    __tablename__ = "analysis_batches"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    backend = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    base_url = Column(String, nullable=True)
+    api_key = Column(String, nullable=True)  # encrypted with SecurityManager
+    skip_images = Column(Integer, default=0)
+
+    provider_batch_id = Column(String, nullable=True)
+    status = Column(String, default=BatchStatus.PREPARING.value)
+    task_count = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    completed_at = Column(DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            "batch_id": self.id,
+            "backend": self.backend,
+            "model": self.model,
+            "provider_batch_id": self.provider_batch_id,
+            "status": self.status,
+            "task_count": self.task_count,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None
+        }
@@ -0,0 +1,65 @@
+from sqlalchemy import Column, String, Integer, Float, DateTime, Index
+from ..core.rubric import dimension_weight
+from ..database import Base
+
+
+class TaskDimensionScore(Base):
+    """
+    One dimension score of a completed analysis
+
+    Written with the result when a task completes, so per-dimension
+    analytics are SQL aggregates instead of scans of the result JSON.
+    completed_at is copied from the task for index-only time-range queries.
+    """
+    __tablename__ = "dimension_scores"
+    __table_args__ = (
+        Index("ix_dimension_scores_dimension_completed_at", "dimension", "completed_at"),
+        # 百分位數直方圖: 依 (dimension, percentage) 順序分組,不需暫存排序
+        Index("ix_dimension_scores_dimension_percentage", "dimension", "percentage", "completed_at", "score"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    task_id = Column(String, nullable=False, index=True)
+    dimension = Column(String, nullable=False)
+    score = Column(Float, nullable=True)
+    percentage = Column(Float, nullable=True)
+    weight = Column(Float, nullable=True)  # 維度滿分
+    completed_at = Column(DateTime, nullable=True)
+
+    @staticmethod
+    def rows_from(task_id: str, result, completed_at=None, weights=None):
+        """
+        Dimension rows of an analysis result
+
+        Args:
+            task_id: Task ID
+            result: Analysis result (dimension_scores is read)
+            completed_at: Completion time of the task
+            weights: Rubric weights the result was scored with (built-in rubric if None)
+        """
+        dimensions = result.get("dimension_scores") if isinstance(result, dict) else None
+        rows = []
+        for name, data in (dimensions or {}).items():
+            if not isinstance(data, dict):
+                continue
+            score = _number(data.get("score"))
+            weight = dimension_weight(name, data, weights)
+            percentage = _number(data.get("percentage"))
+            if percentage is None and score is not None and weight:
+                percentage = round(score / weight * 100, 2)
+            rows.append({
+                "task_id": task_id,
+                "dimension": name,
+                "score": score,
+                "percentage": percentage,
+                "weight": weight,
+                "completed_at": completed_at,
+            })
+        return rows
+
+
+def _number(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, String, Integer, DateTime, JSON
+from ..database import Base
+from datetime import datetime
+
+
+class RubricVersion(Base):
+    """
+    A version of the scoring rubric (dimension weights and grade bands)
+
+    The newest version is active: completed tasks are scored with it, and
+    a re-grade recomputes stored results with it from their per-dimension
+    percentages. Version 1 is the built-in rubric of core/rubric.py.
+    """
+    __tablename__ = "rubric_versions"
+
+    version = Column(Integer, primary_key=True)
+    weights = Column(JSON, nullable=False)  # {維度: 滿分}
+    grade_criteria = Column(JSON, nullable=False)  # {等級: [最低分, 最高分, 說明]}
+    note = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    regraded_at = Column(DateTime, nullable=True)  # 最後一次以此版本重新評分的時間
+
+    def to_dict(self):
+        return {
+            "version": self.version,
+            "weights": self.weights,
+            "grade_criteria": self.grade_criteria,
+            "note": self.note,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "regraded_at": self.regraded_at.isoformat() if self.regraded_at else None,
+        }
@@ -0,0 +1,51 @@
+from sqlalchemy import Column, String, Integer, Text
+from ..database import Base
+
+
+class TaskSearchDocument(Base):
+    """
+    Searchable text of a finished analysis task
+
+    On SQLite this is the external content table of the task_search FTS5
+    index (kept in sync by triggers, see migrations.py); other databases
+    search it with LIKE.
+    """
+    __tablename__ = "task_search_docs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)  # FTS5 rowid
+    task_id = Column(String, nullable=False, unique=True)
+    filename = Column(String, nullable=False)
+    report_text = Column(Text, nullable=True)  # 提取的報告文字
+    summary = Column(Text, nullable=True)
+    commentary = Column(Text, nullable=True)  # 各維度評語、優點、改善建議與錯誤訊息
+
+    @staticmethod
+    def texts_from(task, report_text=None, max_chars: int = 200000):
+        """
+        Searchable columns of a task
+
+        Args:
+            task: AnalysisTask (result and error are read)
+            report_text: Text extracted from the report, if available
+            max_chars: Report text beyond this length is not indexed
+        """
+        result = task.result if isinstance(task.result, dict) else {}
+        commentary = []
+        for name, dimension in (result.get("dimension_scores") or {}).items():
+            if isinstance(dimension, dict) and dimension.get("comment"):
+                commentary.append(f"{name}: {dimension['comment']}")
+        commentary.extend(str(item) for item in result.get("strengths") or [])
+        for item in result.get("improvements") or []:
+            if isinstance(item, dict):
+                commentary.append(" ".join(str(item[key]) for key in ("item", "suggestion") if item.get(key)))
+            else:
+                commentary.append(str(item))
+        if task.error:
+            commentary.append(task.error)
+
+        return {
+            "filename": task.filename,
+            "report_text": report_text[:max_chars] if report_text else None,
+            "summary": result.get("summary"),
+            "commentary": "\n".join(commentary) or None,
+        }
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, Integer, Date
+from ..database import Base
+
+
+class TaskStatCounter(Base):
+    """
+    Number of analysis tasks per creation day, backend and status
+
+    Maintained by database triggers on analysis_tasks (see migrations.py),
+    so every insert, status change and delete updates it in the same
+    transaction, including bulk UPDATEs that bypass the ORM.
+    """
+    __tablename__ = "task_stat_counters"
+
+    day = Column(Date, primary_key=True)
+    backend = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
@@ -1,9 +1,10 @@
-from sqlalchemy import Column, String, Integer, Float, DateTime, JSON, Text
+from sqlalchemy import Column, String, Integer, Float, DateTime, JSON, Text, Index
 from sqlalchemy.sql import func
 from ..database import Base
 import uuid
 import enum
 from datetime import datetime
+from typing import Optional, Tuple
 
 
 class TaskStatus(enum.Enum):
@@ -11,10 +12,34 @@ class TaskStatus(enum.Enum):
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class TaskPriority(enum.Enum):
+    URGENT = "urgent"
+    NORMAL = "normal"
+    LOW = "low"  # 設定離峰時段時只在離峰時段執行
 
 
 class AnalysisTask(Base):
     __tablename__ = "analysis_tasks"
+    __table_args__ = (
+        # 歷史記錄: 依狀態/後端過濾並按創建時間倒序,以及依時間範圍統計
+        # 含 id 以支援 (created_at, id) 游標分頁
+        Index("ix_analysis_tasks_created_at_id", "created_at", "id"),
+        Index("ix_analysis_tasks_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_analysis_tasks_backend_created_at_id", "backend", "created_at", "id"),
+        # 佇列認領、批次回寫與歷史延遲估算
+        Index("ix_analysis_tasks_batch_id", "batch_id"),
+        Index("ix_analysis_tasks_status_backend_model_completed_at", "status", "backend", "model", "completed_at"),
+        # 統計分析: 依完成時間的分數趨勢、等級分布與模型比較 (覆蓋索引)
+        Index(
+            "ix_analysis_tasks_status_completed_at_scores",
+            "status", "completed_at", "backend", "model", "total_score", "grade"
+        ),
+        # 刪除記錄時檢查上傳文件是否仍被其他任務使用
+        Index("ix_analysis_tasks_file_path", "file_path"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     filename = Column(String, nullable=False)
@@ -27,20 +52,56 @@ class AnalysisTask(Base):
     backend = Column(String, nullable=False)
     model = Column(String, nullable=False)
     skip_images = Column(Integer, default=0)
+    batch_id = Column(String, nullable=True)  # 批次模式所屬的 AnalysisBatch
 
     result = Column(JSON, nullable=True)
+    # 從 result 複製的摘要欄位,列表查詢不需載入整個 result
+    total_score = Column(Float, nullable=True)
+    grade = Column(String, nullable=True)
+    rubric_version = Column(Integer, nullable=True)  # 計算總分與等級所用的評分標準版本
     error = Column(Text, nullable=True)
+    telemetry = Column(JSON, nullable=True)
+    routing = Column(JSON, nullable=True)  # 模型路由決策
+
+    # 持久化任務佇列: 執行配置 (API Key 已加密) 與租約
+    options = Column(JSON, nullable=True)
+    attempts = Column(Integer, default=0)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+
+    # 排程: 優先級與提交者 (同優先級內按提交者公平分配)
+    priority = Column(String, default=TaskPriority.NORMAL.value)
+    submitter = Column(String, nullable=True)
+
+    callback_url = Column(String, nullable=True)  # 完成或失敗時發送 webhook
 
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     completed_at = Column(DateTime, nullable=True)
 
-    def to_dict(self):
+    @staticmethod
+    def extract_score(result) -> Tuple[Optional[float], Optional[str]]:
+        """從分析結果取出總分與等級 (等級移除"級"字)"""
+        if not isinstance(result, dict):
+            return None, None
+        try:
+            total_score = float(result["total_score"]) if result.get("total_score") is not None else None
+        except (TypeError, ValueError):
+            total_score = None
+        grade = result.get("grade")
+        grade = str(grade).replace('級', '').strip() or None if grade is not None else None
+        return total_score, grade
+
+    @staticmethod
+    def clean_result(result):
         # 清理 result 中的 grade 字段，移除"級"字
-        result = self.result
         if result and isinstance(result, dict) and 'grade' in result:
             result = dict(result)  # 創建副本避免修改原始數據
             result['grade'] = result['grade'].replace('級', '')
+        return result
+
+    def to_dict(self):
+        result = self.clean_result(self.result)
 
         return {
             "task_id": self.id,
@@ -51,5 +112,15 @@ class AnalysisTask(Base):
             "result": result,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "completed_at": self.completed_at.isoformat() if self.completed_at else None,
-            "error": self.error
+            "error": self.error,
+            "batch_id": self.batch_id,
+            "telemetry": self.telemetry,
+            "routing": self.routing,
+            "attempts": self.attempts or 0,
+            "priority": self.priority or TaskPriority.NORMAL.value,
+            "submitter": self.submitter,
+            "callback_url": self.callback_url,
+            "total_score": self.total_score,
+            "grade": self.grade,
+            "rubric_version": self.rubric_version
         }
@@ -0,0 +1,51 @@
+from sqlalchemy import Column, String, Integer, DateTime, JSON, Text, Index
+from ..database import Base
+import uuid
+import enum
+from datetime import datetime
+
+
+class WebhookStatus(enum.Enum):
+    PENDING = "pending"  # waiting for its next attempt
+    DELIVERING = "delivering"  # claimed by a process sending it
+    DELIVERED = "delivered"
+    FAILED = "failed"  # retries exhausted or rejected by the receiver
+
+
+class WebhookDelivery(Base):
+    """Completion callback to a task's callback_url, and its delivery log"""
+    __tablename__ = "webhook_deliveries"
+    __table_args__ = (
+        Index("ix_webhook_deliveries_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    task_id = Column(String, nullable=False, index=True)
+    url = Column(String, nullable=False)
+    event = Column(String, nullable=False)  # task.completed / task.failed / task.cancelled
+    payload = Column(JSON, nullable=False)
+
+    status = Column(String, default=WebhookStatus.PENDING.value)
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.now)
+    last_status_code = Column(Integer, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    delivered_at = Column(DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            "delivery_id": self.id,
+            "task_id": self.task_id,
+            "url": self.url,
+            "event": self.event,
+            "status": self.status,
+            "attempts": self.attempts or 0,
+            "next_attempt_at": self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            "last_status_code": self.last_status_code,
+            "last_error": self.last_error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "delivered_at": self.delivered_at.isoformat() if self.delivered_at else None
+        }
@@ -1,14 +1,40 @@
-from .task import AnalysisTaskCreate, AnalysisTaskResponse
+from .task import (
+    AnalysisTaskCreate, AnalysisTaskResponse, AnalysisEstimateResponse, WebhookDeliveryResponse, HistoryItemResponse,
+    SearchResultResponse
+)
 from .result import DimensionScore, AnalysisResult, ResultDownloadRequest
 from .config import ConfigItem, ConfigUpdate, ConfigResponse
+from .batch import BatchItem, BatchCreate, BatchResponse
+from .analytics import (
+    ScoreTrendResponse, GradeDistributionResponse, DimensionStatsResponse, BackendComparisonResponse
+)
+from .rubric import RubricCreate, RubricResponse, RegradeResponse
+from .archive import ArchiveSegmentResponse, ArchivedTaskItem, RetentionRunResponse
 
 __all__ = [
     "AnalysisTaskCreate",
     "AnalysisTaskResponse",
+    "AnalysisEstimateResponse",
+    "WebhookDeliveryResponse",
+    "HistoryItemResponse",
+    "SearchResultResponse",
     "DimensionScore",
     "AnalysisResult",
     "ResultDownloadRequest",
     "ConfigItem",
     "ConfigUpdate",
     "ConfigResponse",
+    "BatchItem",
+    "BatchCreate",
+    "BatchResponse",
+    "ScoreTrendResponse",
+    "GradeDistributionResponse",
+    "DimensionStatsResponse",
+    "BackendComparisonResponse",
+    "RubricCreate",
+    "RubricResponse",
+    "RegradeResponse",
+    "ArchiveSegmentResponse",
+    "ArchivedTaskItem",
+    "RetentionRunResponse",
 ]
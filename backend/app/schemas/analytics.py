@@ -0,0 +1,67 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict
+
+
+class TrendPoint(BaseModel):
+    """Schema for one time bucket of a score trend"""
+    bucket: str = Field(description="First day of the bucket (ISO date)")
+    count: int
+    average: Optional[float] = None
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+
+
+class ScoreTrendResponse(BaseModel):
+    """Schema for a score trend"""
+    bucket: str
+    metric: str = Field(description="total_score, or percentage for a dimension trend")
+    dimension: Optional[str] = None
+    points: List[TrendPoint]
+
+
+class GradeCount(BaseModel):
+    """Schema for the completed tasks of one grade"""
+    grade: str
+    count: int
+    share: float
+
+
+class GradeDistributionResponse(BaseModel):
+    """Schema for the grade distribution"""
+    days: int
+    total: int
+    grades: List[GradeCount]
+
+
+class DimensionStats(BaseModel):
+    """Schema for the score distribution of one dimension"""
+    dimension: str
+    weight: Optional[float] = Field(default=None, description="Maximum score of the dimension in the rubric")
+    count: int
+    mean_score: Optional[float] = None
+    mean_percentage: Optional[float] = None
+    percentiles: Dict[str, Optional[float]] = Field(description="Percentage percentiles (p25, p50, p75, p90)")
+
+
+class DimensionStatsResponse(BaseModel):
+    """Schema for per-dimension statistics"""
+    days: int
+    dimensions: List[DimensionStats]
+
+
+class ModelComparison(BaseModel):
+    """Schema for the outcomes of one backend and model"""
+    backend: str
+    model: str
+    completed: int
+    failed: int
+    failure_rate: float
+    average_score: Optional[float] = None
+    minimum_score: Optional[float] = None
+    maximum_score: Optional[float] = None
+
+
+class BackendComparisonResponse(BaseModel):
+    """Schema for the backend and model comparison"""
+    days: int
+    models: List[ModelComparison]
@@ -0,0 +1,39 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+
+class ArchiveSegmentResponse(BaseModel):
+    """Schema for an archive segment file"""
+    segment_id: int
+    filename: str
+    codec: str = Field(description="zstd or gzip")
+    task_count: int
+    size_bytes: int = Field(description="Compressed size")
+    raw_bytes: int = Field(description="Uncompressed JSONL size")
+    first_created_at: Optional[str] = None
+    last_created_at: Optional[str] = None
+    created_at: Optional[str] = None
+
+
+class ArchivedTaskItem(BaseModel):
+    """Schema for the index entry of an archived task"""
+    task_id: str
+    segment_id: int
+    filename: str
+    status: str
+    backend: Optional[str] = None
+    model: Optional[str] = None
+    total_score: Optional[float] = None
+    grade: Optional[str] = None
+    created_at: Optional[str] = None
+    completed_at: Optional[str] = None
+    archived_at: Optional[str] = None
+
+
+class RetentionRunResponse(BaseModel):
+    """Schema for the outcome of a retention run"""
+    segments: int = Field(description="Segment files written")
+    archived: int = Field(description="Tasks moved to the archive")
+    expired_uploads: int = Field(description="Uploads of finished tasks queued for removal")
+    orphaned_uploads: int = Field(description="Uploads no task refers to queued for removal")
+    elapsed_ms: float
@@ -0,0 +1,33 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any
+
+
+class BatchItem(BaseModel):
+    """Schema for a single report in a batch submission"""
+    file_id: str
+    filename: Optional[str] = Field(default=None, description="Original filename")
+
+
+class BatchCreate(BaseModel):
+    """Schema for creating a provider batch-API scoring job"""
+    items: List[BatchItem] = Field(..., min_length=1, description="Uploaded reports to score")
+    backend: str = Field(default="openai", description="LLM backend with a batch API (openai, anthropic)")
+    model: Optional[str] = Field(default=None, description="Model name (auto if not specified)")
+    api_key: Optional[str] = Field(default=None, description="API key for the LLM backend")
+    base_url: Optional[str] = Field(default=None, description="API base URL")
+    skip_images: bool = Field(default=False, description="Skip image analysis")
+
+
+class BatchResponse(BaseModel):
+    """Schema for batch job response"""
+    batch_id: str
+    backend: str
+    model: str
+    provider_batch_id: Optional[str] = None
+    status: str
+    task_count: int
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    completed_at: Optional[str] = None
+    task_ids: List[str] = []
+    by_status: Dict[str, int] = {}
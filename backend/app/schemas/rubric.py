@@ -0,0 +1,29 @@
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Tuple
+
+
+class RubricCreate(BaseModel):
+    """Schema for publishing a new rubric version"""
+    weights: Dict[str, float] = Field(..., description="Maximum score of each dimension (must add up to 100)")
+    grade_criteria: Optional[Dict[str, Tuple[float, float, str]]] = Field(
+        default=None, description="{grade: [min_score, max_score, description]} (current bands if omitted)"
+    )
+    note: Optional[str] = Field(default=None, description="What changed")
+
+
+class RubricResponse(BaseModel):
+    """Schema for a rubric version"""
+    version: int
+    weights: Dict[str, float]
+    grade_criteria: Dict[str, Tuple[float, float, str]]
+    note: Optional[str] = None
+    created_at: Optional[str] = None
+    regraded_at: Optional[str] = None
+
+
+class RegradeResponse(BaseModel):
+    """Schema for the outcome of a bulk re-grade"""
+    version: int
+    regraded: int = Field(description="Completed tasks re-scored")
+    skipped: int = Field(description="Completed tasks missing a dimension percentage (scores unchanged)")
+    elapsed_ms: float
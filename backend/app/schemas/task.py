@@ -8,10 +8,33 @@ class AnalysisTaskCreate(BaseModel):
     file_id: str
     filename: Optional[str] = Field(default=None, description="Original filename")
     backend: str = Field(default="ollama", description="LLM backend (ollama, openai, anthropic)")
-    model: Optional[str] = Field(default=None, description="Model name (auto if not specified)")
+    model: Optional[str] = Field(default=None, description="Model name (routed or backend default if not specified)")
     api_key: Optional[str] = Field(default=None, description="API key for the LLM backend")
     base_url: Optional[str] = Field(default=None, description="API base URL for OpenAI-compatible endpoints")
     skip_images: bool = Field(default=False, description="Skip image analysis")
+    image_token_budget: Optional[int] = Field(default=None, gt=0, description="Image token budget for this task (server default if not specified)")
+    priority: str = Field(default="normal", pattern="^(urgent|normal|low)$", description="Scheduling priority (urgent, normal, low)")
+    submitter: Optional[str] = Field(default=None, max_length=100, description="Submitter or source for fair-share scheduling (client address if not specified)")
+    callback_url: Optional[str] = Field(default=None, max_length=2000, pattern="^https?://", description="URL receiving a signed POST when the task completes, fails or is cancelled (must resolve to a public address unless its host is in WEBHOOK_ALLOWED_HOSTS)")
+
+
+class AnalysisEstimateResponse(BaseModel):
+    """Schema for pre-flight analysis estimate"""
+    backend: str
+    model: str
+    routing: Optional[Dict[str, Any]] = Field(default=None, description="Model routing decision the task would get")
+    char_count: int
+    input_tokens: int = Field(description="Estimated input tokens (text + images)")
+    text_tokens: int
+    image_tokens: int
+    output_tokens: int = Field(description="Expected output tokens (historical median or default)")
+    image_candidates: int = Field(description="Images extracted from the report")
+    image_count: int = Field(description="Images that would be sent after filtering and budgeting")
+    image_plan: Optional[Dict[str, Any]] = None
+    expected_latency_ms: Optional[int] = Field(default=None, description="Historical median processing time (None without history)")
+    latency_samples: int = Field(description="Completed tasks the latency estimate is based on")
+    queue_depth: int = Field(description="Tasks waiting or running")
+    expected_queue_wait_ms: Optional[int] = Field(default=None, description="Expected wait before processing starts")
 
 
 class AnalysisTaskResponse(BaseModel):
@@ -25,6 +48,73 @@ class AnalysisTaskResponse(BaseModel):
     created_at: datetime
     completed_at: Optional[datetime] = None
     error: Optional[str] = None
+    batch_id: Optional[str] = None
+    telemetry: Optional[Dict[str, Any]] = Field(default=None, description="LLM call telemetry (latency, tokens, images, retries)")
+    routing: Optional[Dict[str, Any]] = Field(default=None, description="Model routing decision")
+    attempts: int = Field(default=0, description="Times the task has been claimed by a worker")
+    priority: str = Field(default="normal", description="Scheduling priority")
+    submitter: Optional[str] = None
+    callback_url: Optional[str] = None
+    stage: Optional[str] = Field(default=None, description="Pipeline stage (tasks running in the API process)")
+    queue_position: Optional[int] = Field(default=None, description="1-based position among pending tasks (0 while processing)")
+    eta_seconds: Optional[int] = Field(default=None, description="Estimated seconds until the task completes")
+    total_score: Optional[float] = Field(default=None, description="Total score of a completed analysis")
+    grade: Optional[str] = Field(default=None, description="Grade of a completed analysis")
+    rubric_version: Optional[int] = Field(default=None, description="Rubric version the score and grade were computed with")
+    archived: bool = Field(default=False, description="Read from the archive (see /archive)")
+    archived_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
+
+
+class HistoryItemResponse(BaseModel):
+    """Schema for a history list item (only the requested fields are returned)"""
+    task_id: str
+    filename: Optional[str] = None
+    status: Optional[str] = None
+    progress: Optional[int] = None
+    message: Optional[str] = None
+    backend: Optional[str] = None
+    model: Optional[str] = None
+    total_score: Optional[float] = None
+    grade: Optional[str] = None
+    rubric_version: Optional[int] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    error: Optional[str] = None
+    batch_id: Optional[str] = None
+    telemetry: Optional[Dict[str, Any]] = None
+    routing: Optional[Dict[str, Any]] = None
+    attempts: Optional[int] = None
+    priority: Optional[str] = None
+    submitter: Optional[str] = None
+    callback_url: Optional[str] = None
+
+
+class WebhookDeliveryResponse(BaseModel):
+    """Schema for a completion webhook delivery"""
+    delivery_id: str
+    task_id: str
+    url: str
+    event: str
+    status: str = Field(description="pending, delivering, delivered or failed")
+    attempts: int
+    next_attempt_at: Optional[datetime] = None
+    last_status_code: Optional[int] = None
+    last_error: Optional[str] = None
+    created_at: datetime
+    delivered_at: Optional[datetime] = None
+
+
+class SearchResultResponse(BaseModel):
+    """Schema for a full-text search hit"""
+    task_id: str
+    filename: str
+    status: str
+    total_score: Optional[float] = None
+    grade: Optional[str] = None
+    created_at: Optional[datetime] = None
+    rank: Optional[float] = Field(default=None, description="Relevance (higher is better; None for short-term matches)")
+    snippet: str = Field(description="HTML-escaped context with matches wrapped in <mark></mark>")
@@ -1,4 +1,22 @@
 from .analyzer import FAReportAnalyzerService
 from .task_manager import TaskManager
+from .batch import BatchScoringService
+from .model_router import ModelRouter
+from .estimator import AnalysisEstimator
+from .admission import AdmissionController
+from .progress import ProgressRegistry, get_progress_registry
+from .webhook import WebhookService
+from .history_stats import HistoryStatsService
+from .search import SearchService
+from .analytics import AnalyticsService
+from .rubric import RubricService
+from .janitor import FileJanitor, get_file_janitor
+from .history_cleanup import HistoryCleanupService
+from .retention import RetentionService
 
-__all__ = ["FAReportAnalyzerService", "TaskManager"]
+__all__ = [
+    "FAReportAnalyzerService", "TaskManager", "BatchScoringService", "ModelRouter",
+    "AnalysisEstimator", "AdmissionController", "ProgressRegistry", "get_progress_registry",
+    "WebhookService", "HistoryStatsService", "SearchService", "AnalyticsService", "RubricService",
+    "FileJanitor", "get_file_janitor", "HistoryCleanupService", "RetentionService"
+]
@@ -0,0 +1,166 @@
+"""
+Admission control for the analysis queue
+
+New tasks are rejected with 429 when the work queued ahead of them would
+take too long to drain, instead of letting latency grow for everyone. The
+same drain estimate gives each pending task its queue position and ETA.
+The historical processing time per (backend, model) is cached per process
+for ADMISSION_SERVICE_MS_CACHE_SECONDS.
+"""
+import math
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models.task import AnalysisTask, TaskPriority, TaskStatus
+from .estimator import AnalysisEstimator
+from .task_queue import TaskQueue
+
+
+class AdmissionController:
+    """Queue-depth and drain-time based admission control"""
+
+    # Assumed processing time of one task before any history exists
+    DEFAULT_SERVICE_MS = 60000
+
+    _lock = threading.Lock()
+    _cache: Dict[Tuple[str, str], Tuple[float, int]] = {}
+
+    @staticmethod
+    def running(db: Session) -> int:
+        """Number of queued tasks currently being processed"""
+        return db.query(AnalysisTask).filter(
+            AnalysisTask.status == TaskStatus.PROCESSING.value,
+            AnalysisTask.batch_id.is_(None)
+        ).count()
+
+    @staticmethod
+    def capacity(running: int) -> int:
+        """
+        Analysis slots currently draining the queue
+
+        At least WORKER_CONCURRENCY; more when several workers are running
+        tasks at the same time.
+        """
+        return max(settings.WORKER_CONCURRENCY, running, 1)
+
+    @classmethod
+    def service_ms(cls, db: Session, backend: str, model: Optional[str] = None) -> int:
+        """Typical processing time of one task (historical median, else the default)"""
+        key = (backend, model or "auto")
+        now = time.monotonic()
+        with cls._lock:
+            entry = cls._cache.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+
+        history = AnalysisEstimator._history(db, backend, key[1])
+        value = history["latency_ms"] or cls.DEFAULT_SERVICE_MS
+        with cls._lock:
+            cls._cache[key] = (now + settings.ADMISSION_SERVICE_MS_CACHE_SECONDS, value)
+        return value
+
+    @staticmethod
+    def drain_seconds(waiting: int, capacity: int, service_ms: int) -> int:
+        """Seconds until `waiting` queued tasks have all been started"""
+        return math.ceil(waiting / capacity) * service_ms // 1000
+
+    @staticmethod
+    def check(db: Session, backend: str, model: Optional[str] = None, priority: Optional[str] = None) -> Optional[int]:
+        """
+        Decide whether a new task may be queued
+
+        Only pending tasks that would be claimed before the new task count,
+        so urgent work is still admitted while a low-priority backlog drains.
+
+        Args:
+            db: Database session
+            backend: LLM backend of the new task
+            model: Model of the new task
+            priority: Priority of the new task
+
+        Returns:
+            None if admitted, otherwise the seconds after which to retry
+        """
+        max_depth = settings.ADMISSION_MAX_QUEUE_DEPTH
+        max_drain = settings.ADMISSION_MAX_DRAIN_SECONDS
+        if max_depth <= 0 and max_drain <= 0:
+            return None
+
+        running = AdmissionController.running(db)
+        capacity = AdmissionController.capacity(running)
+        waiting = max(0, AnalysisEstimator.queue_depth(db, priority) - running)
+        service_ms = AdmissionController.service_ms(db, backend, model)
+        drain = AdmissionController.drain_seconds(waiting, capacity, service_ms)
+
+        over_depth = max_depth > 0 and waiting >= max_depth
+        over_drain = max_drain > 0 and drain > max_drain
+        if not (over_depth or over_drain):
+            return None
+
+        retry_after = 0
+        if over_depth:
+            # 等待佇列降到上限以下所需的時間
+            retry_after = AdmissionController.drain_seconds(waiting - max_depth + 1, capacity, service_ms)
+        if over_drain:
+            retry_after = max(retry_after, drain - max_drain)
+        return max(1, retry_after)
+
+    @staticmethod
+    def queue_info(db: Session, task: AnalysisTask) -> Dict[str, Any]:
+        """
+        Queue position and ETA of a task
+
+        Position counts the pending tasks that would be claimed before this
+        one by priority and age (fair share between submitters is ignored).
+        Low-priority tasks outside the off-peak windows have no ETA.
+
+        Args:
+            db: Database session
+            task: Analysis task
+
+        Returns:
+            {"queue_position", "eta_seconds"} (None when not applicable)
+        """
+        info = {"queue_position": None, "eta_seconds": None}
+        if task.batch_id:
+            return info
+
+        if task.status == TaskStatus.PROCESSING.value:
+            service_ms = AdmissionController.service_ms(db, task.backend, task.model)
+            info["queue_position"] = 0
+            info["eta_seconds"] = math.ceil(service_ms * (100 - (task.progress or 0)) / 100 / 1000)
+            return info
+
+        if task.status != TaskStatus.PENDING.value:
+            return info
+
+        priority = task.priority or TaskPriority.NORMAL.value
+        rank = TaskQueue.PRIORITY_RANK.get(priority, 1)
+        higher = [p for p, r in TaskQueue.PRIORITY_RANK.items() if r < rank]
+        task_priority = func.coalesce(AnalysisTask.priority, TaskPriority.NORMAL.value)
+        ahead = db.query(AnalysisTask).filter(
+            AnalysisTask.status == TaskStatus.PENDING.value,
+            AnalysisTask.batch_id.is_(None),
+            AnalysisTask.id != task.id,
+            or_(
+                task_priority.in_(higher),
+                and_(task_priority == priority, AnalysisTask.created_at < task.created_at)
+            )
+        ).count()
+        info["queue_position"] = ahead + 1
+
+        if priority == TaskPriority.LOW.value and not TaskQueue.is_offpeak():
+            return info
+
+        running = AdmissionController.running(db)
+        capacity = AdmissionController.capacity(running)
+        service_ms = AdmissionController.service_ms(db, task.backend, task.model)
+        # 前方任務與執行中任務佔用名額,再加上自身的處理時間
+        waiting_waves = math.ceil(max(0, ahead + running - capacity + 1) / capacity)
+        info["eta_seconds"] = (waiting_waves + 1) * service_ms // 1000
+        return info
@@ -0,0 +1,391 @@
+"""
+Score analytics
+
+Dashboards read aggregates of completed analyses: score trends per time
+bucket, grade distribution, per-dimension percentiles and backend/model
+comparisons. All of them are SQL aggregates over covering indexes on
+analysis_tasks and the normalized dimension_scores table. Percentiles are
+read from a per-dimension histogram (percentages are near-integers, so a
+year of scores groups into a few hundred rows) and interpolated exactly as
+numpy/pandas do, without loading the individual scores.
+
+Results are cached per process for ANALYTICS_CACHE_SECONDS. A trend caches
+its closed buckets only and re-queries the current bucket on every call,
+so a year of monthly buckets costs one small indexed range query once warm.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, time as day_start, timedelta
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Date, cast, func
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..core.rubric import DIMENSION_WEIGHTS
+from ..models.dimension import TaskDimensionScore
+from ..models.task import AnalysisTask, TaskStatus
+
+
+class AnalyticsService:
+    """Aggregates over completed analyses for dashboards"""
+
+    BUCKETS = ("day", "week", "month")
+
+    # Grades in display order (others are appended as they appear)
+    GRADES = ("A", "B", "C", "D", "F")
+
+    # Percentiles reported per dimension
+    PERCENTILES = (25, 50, 75, 90)
+
+    _lock = threading.Lock()
+    _cache: Dict[Hashable, Tuple[float, Any]] = {}
+
+    @staticmethod
+    def bucket_start(day: date, bucket: str) -> date:
+        """First day of the bucket containing a day (weeks start on Monday)"""
+        if bucket == "week":
+            return day - timedelta(days=day.weekday())
+        if bucket == "month":
+            return day.replace(day=1)
+        return day
+
+    @staticmethod
+    def next_bucket(start: date, bucket: str) -> date:
+        """First day of the following bucket"""
+        if bucket == "week":
+            return start + timedelta(days=7)
+        if bucket == "month":
+            return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return start + timedelta(days=1)
+
+    @staticmethod
+    def _bucket_column(db: Session, bucket: str, column):
+        """SQL expression of the bucket start of a timestamp column"""
+        if db.get_bind().dialect.name == "sqlite":
+            if bucket == "week":
+                return func.date(column, "-6 days", "weekday 1")
+            if bucket == "month":
+                return func.strftime("%Y-%m-01", column)
+            return func.date(column)
+        return cast(func.date_trunc(bucket, column), Date)
+
+    @staticmethod
+    def _since(days: int) -> datetime:
+        """Start of the window of the last `days` calendar days, today included"""
+        return datetime.combine(date.today() - timedelta(days=days - 1), day_start.min)
+
+    @classmethod
+    def _cached(cls, key: Hashable, compute: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with cls._lock:
+            entry = cls._cache.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+
+        value = compute()
+        with cls._lock:
+            # 清除過期項目,避免不同參數的快取無限累積
+            for stale in [k for k, (expires, _) in cls._cache.items() if expires <= now]:
+                del cls._cache[stale]
+            cls._cache[key] = (now + settings.ANALYTICS_CACHE_SECONDS, value)
+        return value
+
+    @classmethod
+    def invalidate(cls):
+        """Drop cached results (e.g. after deleting or re-grading history)"""
+        with cls._lock:
+            cls._cache.clear()
+
+    @classmethod
+    def score_trend(
+        cls,
+        db: Session,
+        bucket: str = "month",
+        days: int = 365,
+        backend: Optional[str] = None,
+        model: Optional[str] = None,
+        dimension: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Average, minimum and maximum score per time bucket
+
+        Args:
+            db: Database session
+            bucket: day, week or month
+            days: Calendar days covered (extended back to the start of the first bucket)
+            backend: Only tasks of this backend
+            model: Only tasks of this model
+            dimension: Trend of this dimension's percentage instead of the total score
+
+        Returns:
+            {"bucket", "metric", "points": [{"bucket", "count", "average", "minimum", "maximum"}]}
+            with one point per bucket, empty buckets included
+        """
+        today = date.today()
+        first = cls.bucket_start(today - timedelta(days=days - 1), bucket)
+        current = cls.bucket_start(today, bucket)
+
+        closed = cls._cached(
+            ("trend", bucket, first, current, backend, model, dimension),
+            lambda: cls._trend_rows(db, bucket, first, current, backend, model, dimension)
+        )
+        rows = {**closed, **cls._trend_rows(db, bucket, current, None, backend, model, dimension)}
+
+        points = []
+        start = first
+        while start <= current:
+            count, average, minimum, maximum = rows.get(start, (0, None, None, None))
+            points.append({
+                "bucket": start.isoformat(),
+                "count": count,
+                "average": average,
+                "minimum": minimum,
+                "maximum": maximum,
+            })
+            start = cls.next_bucket(start, bucket)
+
+        return {
+            "bucket": bucket,
+            "metric": "percentage" if dimension else "total_score",
+            "dimension": dimension,
+            "points": points,
+        }
+
+    @classmethod
+    def _trend_rows(
+        cls,
+        db: Session,
+        bucket: str,
+        start: date,
+        end: Optional[date],
+        backend: Optional[str],
+        model: Optional[str],
+        dimension: Optional[str]
+    ) -> Dict[date, Tuple[int, Optional[float], Optional[float], Optional[float]]]:
+        """Aggregates per bucket of completions in [start, end)"""
+        if dimension:
+            value = TaskDimensionScore.percentage
+            completed_at = TaskDimensionScore.completed_at
+            query = db.query(TaskDimensionScore).filter(TaskDimensionScore.dimension == dimension)
+            if backend or model:
+                query = query.join(AnalysisTask, AnalysisTask.id == TaskDimensionScore.task_id)
+        else:
+            value = AnalysisTask.total_score
+            completed_at = AnalysisTask.completed_at
+            query = db.query(AnalysisTask).filter(AnalysisTask.status == TaskStatus.COMPLETED.value)
+        if backend:
+            query = query.filter(AnalysisTask.backend == backend)
+        if model:
+            query = query.filter(AnalysisTask.model == model)
+
+        query = query.filter(value.isnot(None), completed_at >= datetime.combine(start, day_start.min))
+        if end is not None:
+            query = query.filter(completed_at < datetime.combine(end, day_start.min))
+
+        key = cls._bucket_column(db, bucket, completed_at)
+        rows = query.with_entities(
+            key, func.count(value), func.avg(value), func.min(value), func.max(value)
+        ).group_by(key).all()
+        return {
+            date.fromisoformat(str(start_day)[:10]): (
+                int(count), _rounded(average), _rounded(minimum), _rounded(maximum)
+            )
+            for start_day, count, average, minimum, maximum in rows
+        }
+
+    @classmethod
+    def grade_distribution(cls, db: Session, days: int = 365, backend: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Completed tasks per grade
+
+        Args:
+            db: Database session
+            days: Calendar days covered, today included
+            backend: Only tasks of this backend
+
+        Returns:
+            {"days", "total", "grades": [{"grade", "count", "share"}]}
+        """
+        def compute():
+            query = db.query(AnalysisTask.grade, func.count(AnalysisTask.id)).filter(
+                AnalysisTask.status == TaskStatus.COMPLETED.value,
+                AnalysisTask.completed_at >= cls._since(days)
+            )
+            if backend:
+                query = query.filter(AnalysisTask.backend == backend)
+            counts = {grade: 0 for grade in cls.GRADES}
+            for grade, count in query.group_by(AnalysisTask.grade).all():
+                counts[grade or "unknown"] = counts.get(grade or "unknown", 0) + int(count)
+
+            total = sum(counts.values())
+            return {
+                "days": days,
+                "total": total,
+                "grades": [
+                    {"grade": grade, "count": count, "share": round(count / total, 4) if total else 0.0}
+                    for grade, count in counts.items()
+                ],
+            }
+
+        return cls._cached(("grades", date.today(), days, backend), compute)
+
+    @classmethod
+    def dimension_stats(
+        cls,
+        db: Session,
+        days: int = 365,
+        backend: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Score and percentage distribution of each rubric dimension
+
+        Args:
+            db: Database session
+            days: Calendar days covered, today included
+            backend: Only tasks of this backend
+            model: Only tasks of this model
+
+        Returns:
+            {"days", "dimensions": [{"dimension", "weight", "count", "mean_score",
+            "mean_percentage", "percentiles": {"p25", "p50", ...}}]}
+        """
+        def compute():
+            query = db.query(
+                TaskDimensionScore.dimension,
+                TaskDimensionScore.percentage,
+                func.count(TaskDimensionScore.id),
+                func.count(TaskDimensionScore.score),
+                func.sum(TaskDimensionScore.score)
+            ).filter(
+                TaskDimensionScore.completed_at >= cls._since(days),
+                TaskDimensionScore.percentage.isnot(None)
+            )
+            if backend or model:
+                query = query.join(AnalysisTask, AnalysisTask.id == TaskDimensionScore.task_id)
+                if backend:
+                    query = query.filter(AnalysisTask.backend == backend)
+                if model:
+                    query = query.filter(AnalysisTask.model == model)
+            histogram = query.group_by(TaskDimensionScore.dimension, TaskDimensionScore.percentage).order_by(
+                TaskDimensionScore.dimension, TaskDimensionScore.percentage
+            ).all()
+
+            stats = _dimension_stats(histogram)
+            order = {name: i for i, name in enumerate(DIMENSION_WEIGHTS)}
+            dimensions = sorted(stats, key=lambda name: (order.get(name, len(order)), name))
+            return {
+                "days": days,
+                "dimensions": [
+                    {"dimension": name, "weight": DIMENSION_WEIGHTS.get(name), **stats[name]}
+                    for name in dimensions
+                ],
+            }
+
+        return cls._cached(("dimensions", date.today(), days, backend, model), compute)
+
+    @classmethod
+    def backend_comparison(cls, db: Session, days: int = 30) -> Dict[str, Any]:
+        """
+        Outcomes and scores per backend and model
+
+        Args:
+            db: Database session
+            days: Calendar days covered, today included
+
+        Returns:
+            {"days", "models": [{"backend", "model", "completed", "failed", "failure_rate",
+            "average_score", "minimum_score", "maximum_score"}]}
+        """
+        def compute():
+            since = cls._since(days)
+            models: Dict[Tuple[str, str], Dict[str, Any]] = defaultdict(lambda: {
+                "completed": 0, "failed": 0,
+                "average_score": None, "minimum_score": None, "maximum_score": None,
+            })
+
+            completed = db.query(
+                AnalysisTask.backend, AnalysisTask.model, func.count(AnalysisTask.id),
+                func.avg(AnalysisTask.total_score), func.min(AnalysisTask.total_score),
+                func.max(AnalysisTask.total_score)
+            ).filter(
+                AnalysisTask.status == TaskStatus.COMPLETED.value,
+                AnalysisTask.completed_at >= since
+            ).group_by(AnalysisTask.backend, AnalysisTask.model).all()
+            for backend, model, count, average, minimum, maximum in completed:
+                models[(backend, model)].update({
+                    "completed": int(count),
+                    "average_score": _rounded(average),
+                    "minimum_score": _rounded(minimum),
+                    "maximum_score": _rounded(maximum),
+                })
+
+            # 失敗的任務沒有完成時間,依創建時間計入
+            failed = db.query(AnalysisTask.backend, AnalysisTask.model, func.count(AnalysisTask.id)).filter(
+                AnalysisTask.status == TaskStatus.FAILED.value,
+                AnalysisTask.created_at >= since
+            ).group_by(AnalysisTask.backend, AnalysisTask.model).all()
+            for backend, model, count in failed:
+                models[(backend, model)]["failed"] = int(count)
+
+            result = []
+            for (backend, model), values in sorted(models.items()):
+                finished = values["completed"] + values["failed"]
+                result.append({
+                    "backend": backend,
+                    "model": model,
+                    **values,
+                    "failure_rate": round(values["failed"] / finished, 4) if finished else 0.0,
+                })
+            return {"days": days, "models": result}
+
+        return cls._cached(("backends", date.today(), days), compute)
+
+
+def _rounded(value) -> Optional[float]:
+    return round(float(value), 2) if value is not None else None
+
+
+def _dimension_stats(histogram: Sequence[Tuple]) -> Dict[str, Dict[str, Any]]:
+    """
+    Per-dimension statistics from (dimension, percentage, count, score_count, score_sum)
+    rows ordered by dimension and percentage
+    """
+    buckets: Dict[str, List[Tuple[float, int]]] = defaultdict(list)
+    scores: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])
+    for name, percentage, count, score_count, score_sum in histogram:
+        buckets[name].append((float(percentage), int(count)))
+        scores[name][0] += int(score_count)
+        scores[name][1] += float(score_sum or 0)
+
+    stats = {}
+    for name, values in buckets.items():
+        total = sum(count for _, count in values)
+        score_count, score_sum = scores[name]
+        stats[name] = {
+            "count": total,
+            "mean_score": _rounded(score_sum / score_count) if score_count else None,
+            "mean_percentage": _rounded(sum(value * count for value, count in values) / total),
+            "percentiles": {
+                f"p{p}": _rounded(_quantile(values, total, p / 100)) for p in AnalyticsService.PERCENTILES
+            },
+        }
+    return stats
+
+
+def _quantile(values: List[Tuple[float, int]], total: int, q: float) -> float:
+    """Linear-interpolated quantile of sorted (value, count) pairs"""
+    position = (total - 1) * q
+    lower = int(position)
+    return _nth(values, lower) + (_nth(values, min(lower + 1, total - 1)) - _nth(values, lower)) * (position - lower)
+
+
+def _nth(values: List[Tuple[float, int]], index: int) -> float:
+    """index-th smallest value (0-based) of sorted (value, count) pairs"""
+    for value, count in values:
+        if index < count:
+            return value
+        index -= count
+    return values[-1][0]
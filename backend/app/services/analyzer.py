@@ -1,6 +1,8 @@
-import asyncio
-from typing import Callable, Optional, Dict
-from ..core.fa_analyzer_core import FAReportAnalyzer
+import json
+from typing import Any, Callable, Optional, Dict
+from ..core.fa_analyzer_core import AnalysisCancelled, FAReportAnalyzer
+from .model_router import ModelRouter
+from .pipeline import get_pipeline
 
 
 class FAReportAnalyzerService:
@@ -8,6 +10,29 @@ class FAReportAnalyzerService:
 
     def __init__(self):
         self.analyzer: Optional[FAReportAnalyzer] = None
+        # Timings and LLM call telemetry of the last analysis
+        self.telemetry: Dict[str, Any] = {}
+        # Model routing decision of the last analysis (None if not routed)
+        self.routing: Optional[Dict[str, Any]] = None
+        # Set by cancel(); checked between pipeline stages
+        self.cancelled = False
+        # Text extracted from the report of the last analysis (for the search index)
+        self.report_text: Optional[str] = None
+
+    def cancel(self):
+        """
+        Cancel the running analysis
+
+        Stops before the next stage and closes an in-flight LLM stream.
+        Safe to call from any thread.
+        """
+        self.cancelled = True
+        if self.analyzer:
+            self.analyzer.cancel()
+
+    def _check_cancelled(self):
+        if self.cancelled:
+            raise AnalysisCancelled("分析已被取消")
 
     async def analyze_report(
         self,
@@ -17,11 +42,20 @@ class FAReportAnalyzerService:
         api_key: Optional[str] = None,
         base_url: Optional[str] = None,
         skip_images: bool = False,
-        progress_callback: Optional[Callable[[int, str], None]] = None
+        progress_callback: Optional[Callable[[int, str], None]] = None,
+        router: Optional[ModelRouter] = None,
+        image_token_budget: Optional[int] = None,
+        stage_callback: Optional[Callable[[str], None]] = None,
+        stream_callback: Optional[Callable[[str], None]] = None,
+        rubric: Optional[Dict[str, Any]] = None
     ) -> Dict:
         """
         Asynchronously execute report analysis
 
+        The analysis runs through the staged pipeline (extract,
+        preprocess_images, build_prompt, llm, parse); the caller persists the
+        result through the persist stage.
+
         Args:
             file_path: Path to the report file
             backend: LLM backend ('ollama', 'openai', 'anthropic')
@@ -30,38 +64,115 @@ class FAReportAnalyzerService:
             base_url: API base URL for OpenAI-compatible endpoints
             skip_images: Skip image analysis
             progress_callback: Progress callback function (progress, message)
+            router: Model router choosing the model from report features
+            image_token_budget: Image token budget for this task
+            stage_callback: Called with the stage name when a stage starts
+            stream_callback: Called with each text chunk streamed by the LLM
+            rubric: Rubric the prompt lists weights and grade bands from (built-in if None)
 
         Returns:
             Analysis result dictionary
         """
-        loop = asyncio.get_event_loop()
-
-        def run_sync():
-            # Create analyzer
-            self.analyzer = FAReportAnalyzer(
-                backend=backend,
-                model=model,
-                api_key=api_key,
-                base_url=base_url,
-                skip_images=skip_images
-            )
+        pipeline = get_pipeline()
+        stages = self.telemetry.setdefault("stages", {})
+
+        # Create analyzer
+        self.analyzer = FAReportAnalyzer(
+            backend=backend,
+            model=model,
+            api_key=api_key,
+            base_url=base_url,
+            skip_images=skip_images,
+            image_token_budget=image_token_budget,
+            rubric=rubric
+        )
+        analyzer = self.analyzer
+        analyzer.stream_callback = stream_callback
+        if self.cancelled:
+            analyzer.cancel_event.set()
 
+        def enter(stage: str):
+            self._check_cancelled()
+            if stage_callback:
+                stage_callback(stage)
+
+        try:
             # Progress callback
             if progress_callback:
                 progress_callback(10, "Reading report...")
 
-            # Read report
-            report_content, images = self.analyzer.read_report(file_path)
+            # Prompts built so far, keyed by whether they include the image note
+            prompts: Dict[bool, str] = {}
+
+            def build_prompt(content: str, has_images: bool) -> str:
+                if has_images not in prompts:
+                    prompts[has_images] = analyzer.create_analysis_prompt(content, has_images)
+                return prompts[has_images]
+
+            def extract():
+                content, extracted_images = analyzer.read_report(file_path)
+
+                # Route to a model tier based on cheap report features
+                if router:
+                    candidate_images = [] if skip_images else extracted_images
+                    prompt = build_prompt(content, bool(candidate_images))
+                    features = router.extract_features(file_path, prompt, content, candidate_images)
+                    self.routing = router.route(analyzer.backend, features)
+                    if self.routing:
+                        analyzer.model = self.routing["model"]
+
+                return content, extracted_images
+
+            enter("extract")
+            # Extract: read report and route (CPU / disk bound)
+            report_content, images = await pipeline.run("extract", extract, timings=stages)
+            self.report_text = report_content
+            self.telemetry["extract_ms"] = stages["extract"]["run_ms"]
+
+            enter("preprocess_images")
+            # Preprocess images: dedupe, filter and downscale within the token budget
+            images = await pipeline.run(
+                "preprocess_images", analyzer.plan_images, images, timings=stages
+            )
+
+            enter("build_prompt")
+            # Build prompt (the routing prompt is reused unless image planning dropped every image)
+            prompt = await pipeline.run(
+                "build_prompt", build_prompt, report_content, bool(images), timings=stages
+            )
 
             if progress_callback:
                 progress_callback(30, "Starting AI analysis...")
 
-            # Analyze
-            result = self.analyzer.analyze_with_ai(report_content, images)
+            enter("llm")
+            # LLM call (network bound)
+            try:
+                response_text = await pipeline.run(
+                    "llm", analyzer.call_llm, prompt, images, timings=stages
+                )
+            except AnalysisCancelled:
+                raise
+            except Exception as e:
+                print(f"分析過程發生錯誤: {e}")
+                raise
 
             if progress_callback:
-                progress_callback(100, "Analysis completed")
+                progress_callback(90, "Parsing analysis result...")
+
+            enter("parse")
+            # Parse
+            try:
+                result = await pipeline.run(
+                    "parse", analyzer.parse_llm_response, response_text, timings=stages
+                )
+            except json.JSONDecodeError as e:
+                print(f"JSON 解析錯誤: {e}")
+                raise
+        finally:
+            self.telemetry.update(analyzer.telemetry)
+            analyzer._cleanup_temp_files()
 
-            return result
+        if progress_callback:
+            progress_callback(100, "Analysis completed")
 
-        return await loop.run_in_executor(None, run_sync)
+        return result
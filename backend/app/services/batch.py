@@ -0,0 +1,466 @@
+"""
+Provider batch-API scoring
+
+Submits many analysis prompts at once through the OpenAI Batch API or the
+Anthropic Message Batches API, polls the provider for completion and fans
+the results back into the individual AnalysisTask rows.
+"""
+import asyncio
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..core.fa_analyzer_core import FAReportAnalyzer
+from ..core.security import get_security_manager
+from ..database import SessionLocal
+from ..models.batch import AnalysisBatch, BatchStatus
+from ..models.task import AnalysisTask, TaskStatus
+from .rubric import RubricService
+from .task_manager import TaskManager
+
+logger = logging.getLogger(__name__)
+
+
+class BatchProvider(ABC):
+    """Base class for provider batch APIs"""
+
+    def __init__(self, api_key: Optional[str], base_url: Optional[str], model: str):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+
+    @abstractmethod
+    def build_request(self, custom_id: str, analyzer: FAReportAnalyzer, prompt: str,
+                      images: List[Dict]) -> Dict[str, Any]:
+        """Build one provider batch request line"""
+
+    @abstractmethod
+    def submit(self, requests: List[Dict[str, Any]]) -> str:
+        """Submit requests and return the provider batch ID"""
+
+    @abstractmethod
+    def is_finished(self, provider_batch_id: str) -> bool:
+        """Whether the provider batch has finished processing"""
+
+    @abstractmethod
+    def results(self, provider_batch_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over per-request results
+
+        Yields:
+            dict with custom_id and either text (plus token usage) or error
+        """
+
+
+class OpenAIBatchProvider(BatchProvider):
+    """OpenAI Batch API (/v1/batches over /v1/chat/completions)"""
+
+    ENDPOINT = "/v1/chat/completions"
+    FINISHED_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+    def __init__(self, api_key: Optional[str], base_url: Optional[str], model: str):
+        super().__init__(api_key, base_url, model)
+        from openai import OpenAI
+        self.client = OpenAI(api_key=api_key, base_url=base_url)
+
+    def build_request(self, custom_id, analyzer, prompt, images):
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": self.ENDPOINT,
+            "body": {
+                "model": self.model,
+                "messages": analyzer.build_openai_messages(prompt, images),
+                "max_tokens": analyzer.MAX_OUTPUT_TOKENS
+            }
+        }
+
+    def submit(self, requests):
+        payload = "\n".join(json.dumps(r, ensure_ascii=False) for r in requests).encode("utf-8")
+        input_file = self.client.files.create(
+            file=("batch_input.jsonl", payload),
+            purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=self.ENDPOINT,
+            completion_window="24h"
+        )
+        return batch.id
+
+    def is_finished(self, provider_batch_id):
+        batch = self.client.batches.retrieve(provider_batch_id)
+        return batch.status in self.FINISHED_STATUSES
+
+    def results(self, provider_batch_id):
+        batch = self.client.batches.retrieve(provider_batch_id)
+
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = self.client.files.content(file_id).text
+            for line in content.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get("response") or {}
+                body = response.get("body") or {}
+
+                if item.get("error") or response.get("status_code") != 200:
+                    yield {
+                        "custom_id": item.get("custom_id"),
+                        "error": str(item.get("error") or body.get("error") or "批次請求失敗")
+                    }
+                    continue
+
+                usage = body.get("usage") or {}
+                yield {
+                    "custom_id": item.get("custom_id"),
+                    "text": body["choices"][0]["message"]["content"],
+                    "input_tokens": usage.get("prompt_tokens"),
+                    "output_tokens": usage.get("completion_tokens")
+                }
+
+
+class AnthropicBatchProvider(BatchProvider):
+    """Anthropic Message Batches API (/v1/messages/batches)"""
+
+    def __init__(self, api_key: Optional[str], base_url: Optional[str], model: str):
+        super().__init__(api_key, base_url, model)
+        import anthropic
+        self.client = anthropic.Anthropic(api_key=api_key, base_url=base_url)
+
+    def build_request(self, custom_id, analyzer, prompt, images):
+        return {
+            "custom_id": custom_id,
+            "params": {
+                "model": self.model,
+                "max_tokens": analyzer.MAX_OUTPUT_TOKENS,
+                "messages": analyzer.build_anthropic_messages(prompt, images)
+            }
+        }
+
+    def submit(self, requests):
+        batch = self.client.messages.batches.create(requests=requests)
+        return batch.id
+
+    def is_finished(self, provider_batch_id):
+        batch = self.client.messages.batches.retrieve(provider_batch_id)
+        return batch.processing_status == "ended"
+
+    def results(self, provider_batch_id):
+        for entry in self.client.messages.batches.results(provider_batch_id):
+            result = entry.result
+            if result.type != "succeeded":
+                error = getattr(result, "error", None)
+                yield {
+                    "custom_id": entry.custom_id,
+                    "error": f"批次請求未成功 ({result.type}): {error}" if error else f"批次請求未成功 ({result.type})"
+                }
+                continue
+
+            message = result.message
+            yield {
+                "custom_id": entry.custom_id,
+                "text": "".join(block.text for block in message.content if block.type == "text"),
+                "input_tokens": message.usage.input_tokens,
+                "output_tokens": message.usage.output_tokens
+            }
+
+
+PROVIDERS = {
+    "openai": OpenAIBatchProvider,
+    "anthropic": AnthropicBatchProvider,
+}
+
+
+class BatchScoringService:
+    """Provider batch-API scoring service"""
+
+    # Seconds after which a batch left in collecting (collector process died) is polled again
+    COLLECT_TIMEOUT = 1800
+    # Seconds after which a batch left in submitting (submitting process died) is submitted again
+    SUBMIT_TIMEOUT = 1800
+
+    @staticmethod
+    def create_provider(batch: AnalysisBatch) -> BatchProvider:
+        """
+        Create the provider client for a batch
+
+        Args:
+            batch: Batch record
+
+        Returns:
+            Batch provider
+        """
+        api_key = get_security_manager().decrypt(batch.api_key) if batch.api_key else None
+        return PROVIDERS[batch.backend](api_key, batch.base_url, batch.model)
+
+    @staticmethod
+    async def submit(batch_id: str):
+        """
+        Extract every report of a batch and submit the prompts to the provider
+
+        Args:
+            batch_id: Batch ID
+        """
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, BatchScoringService._submit_sync, batch_id)
+
+    @staticmethod
+    def _submit_sync(batch_id: str):
+        db = SessionLocal()
+        try:
+            # 條件更新: 創建請求的後台任務與輪詢器只有一方負責提交
+            claimed = db.query(AnalysisBatch).filter(
+                AnalysisBatch.id == batch_id,
+                AnalysisBatch.status == BatchStatus.PREPARING.value
+            ).update({
+                AnalysisBatch.status: BatchStatus.SUBMITTING.value,
+                AnalysisBatch.updated_at: datetime.now()
+            }, synchronize_session=False)
+            db.commit()
+            if not claimed:
+                return
+            batch = db.query(AnalysisBatch).filter(AnalysisBatch.id == batch_id).first()
+
+            # 中斷後重新提交時,略過已失敗的任務
+            tasks = db.query(AnalysisTask).filter(
+                AnalysisTask.batch_id == batch_id,
+                AnalysisTask.status.in_([TaskStatus.PENDING.value, TaskStatus.PROCESSING.value])
+            ).all()
+            analyzer = FAReportAnalyzer(
+                backend=batch.backend,
+                model=batch.model,
+                skip_images=bool(batch.skip_images),
+                init_client=False,
+                image_token_budget=settings.IMAGE_TOKEN_BUDGET,
+                rubric=RubricService.active(db)
+            )
+            provider = BatchScoringService.create_provider(batch)
+
+            requests = []
+            try:
+                for task in tasks:
+                    try:
+                        TaskManager.update_progress(db, task.id, 10, "Reading report...")
+                        extract_start = time.perf_counter()
+                        report_content, images = analyzer.read_report(task.file_path)
+                        prompt, images = analyzer.prepare_analysis(report_content, images)
+                        requests.append(provider.build_request(task.id, analyzer, prompt, images))
+
+                        task.telemetry = {
+                            "mode": "batch",
+                            "backend": batch.backend,
+                            "model": batch.model,
+                            "extract_ms": int((time.perf_counter() - extract_start) * 1000),
+                            "image_count": len(images),
+                            "image_bytes": sum(len(img['data']) for img in images),
+                            "image_plan": analyzer.image_plan
+                        }
+                        db.commit()
+                    except Exception as e:
+                        logger.error(f"批次 {batch_id} 讀取報告失敗 {task.id}: {str(e)}")
+                        TaskManager.mark_failed(db, task.id, f"讀取報告失敗: {str(e)}")
+            finally:
+                analyzer._cleanup_temp_files()
+
+            if not requests:
+                batch.status = BatchStatus.FAILED.value
+                batch.error = "沒有可提交的報告"
+                batch.completed_at = datetime.now()
+                db.commit()
+                return
+
+            batch.provider_batch_id = provider.submit(requests)
+            batch.status = BatchStatus.SUBMITTED.value
+            db.commit()
+
+            for request in requests:
+                TaskManager.update_progress(
+                    db, request["custom_id"], 30, "Submitted to provider batch API, waiting for results..."
+                )
+
+            logger.info(f"批次 {batch_id} 已提交: {batch.provider_batch_id} ({len(requests)} 個請求)")
+
+        except Exception as e:
+            logger.error(f"批次 {batch_id} 提交失敗: {str(e)}")
+            BatchScoringService._fail_batch(db, batch_id, f"批次提交失敗: {str(e)}")
+
+        finally:
+            db.close()
+
+    @staticmethod
+    def _fail_batch(db: Session, batch_id: str, error: str):
+        """Mark a batch and all of its unfinished tasks as failed"""
+        db.rollback()
+        batch = db.query(AnalysisBatch).filter(AnalysisBatch.id == batch_id).first()
+        if batch:
+            batch.status = BatchStatus.FAILED.value
+            batch.error = error
+            batch.completed_at = datetime.now()
+            db.commit()
+
+        unfinished = db.query(AnalysisTask.id).filter(
+            AnalysisTask.batch_id == batch_id,
+            AnalysisTask.status.in_([TaskStatus.PENDING.value, TaskStatus.PROCESSING.value])
+        ).all()
+        for (task_id,) in unfinished:
+            TaskManager.mark_failed(db, task_id, error)
+
+    @staticmethod
+    def collect(batch_id: str) -> bool:
+        """
+        Fan the results of a finished provider batch back into its tasks
+
+        Args:
+            batch_id: Batch ID
+
+        Returns:
+            True if the provider batch had finished and results were collected
+        """
+        db = SessionLocal()
+        try:
+            batch = db.query(AnalysisBatch).filter(AnalysisBatch.id == batch_id).first()
+            if not batch or batch.status != BatchStatus.SUBMITTED.value:
+                return False
+
+            provider = BatchScoringService.create_provider(batch)
+            if not provider.is_finished(batch.provider_batch_id):
+                return False
+
+            # 條件更新: 多個進程同時輪詢時只有一個負責回寫結果
+            claimed = db.query(AnalysisBatch).filter(
+                AnalysisBatch.id == batch_id,
+                AnalysisBatch.status == BatchStatus.SUBMITTED.value
+            ).update({
+                AnalysisBatch.status: BatchStatus.COLLECTING.value,
+                AnalysisBatch.updated_at: datetime.now()
+            }, synchronize_session=False)
+            db.commit()
+            if not claimed:
+                return False
+            db.refresh(batch)
+
+            batch_latency_ms = int((datetime.now() - batch.created_at).total_seconds() * 1000)
+            analyzer = FAReportAnalyzer(backend=batch.backend, model=batch.model, init_client=False)
+
+            for item in provider.results(batch.provider_batch_id):
+                task = db.query(AnalysisTask).filter(
+                    AnalysisTask.id == item["custom_id"],
+                    AnalysisTask.batch_id == batch_id
+                ).first()
+                if not task:
+                    continue
+
+                telemetry = dict(task.telemetry or {})
+                telemetry["llm_latency_ms"] = batch_latency_ms
+
+                if "error" in item:
+                    TaskManager.mark_failed(db, task.id, item["error"], telemetry)
+                    continue
+
+                telemetry["input_tokens"] = item.get("input_tokens")
+                telemetry["output_tokens"] = item.get("output_tokens")
+                try:
+                    result = analyzer.parse_response(item["text"])
+                except json.JSONDecodeError as e:
+                    telemetry["parse_ms"] = analyzer.telemetry.get("parse_ms")
+                    TaskManager.mark_failed(db, task.id, f"JSON 解析錯誤: {str(e)}", telemetry)
+                    continue
+
+                telemetry["parse_ms"] = analyzer.telemetry.get("parse_ms")
+                TaskManager.mark_completed(db, task.id, result, telemetry)
+
+            # 供應商未返回結果的任務 (例如批次過期)
+            missing = db.query(AnalysisTask.id).filter(
+                AnalysisTask.batch_id == batch_id,
+                AnalysisTask.status.in_([TaskStatus.PENDING.value, TaskStatus.PROCESSING.value])
+            ).all()
+            for (task_id,) in missing:
+                TaskManager.mark_failed(db, task_id, "批次已結束但未返回此報告的結果")
+
+            batch.status = BatchStatus.COMPLETED.value
+            batch.completed_at = datetime.now()
+            db.commit()
+
+            logger.info(f"批次 {batch_id} 結果已回寫")
+            return True
+
+        except Exception as e:
+            logger.error(f"批次 {batch_id} 結果回寫失敗: {str(e)}")
+            # 交還給下一次輪詢重試
+            db.rollback()
+            db.query(AnalysisBatch).filter(
+                AnalysisBatch.id == batch_id,
+                AnalysisBatch.status == BatchStatus.COLLECTING.value
+            ).update({AnalysisBatch.status: BatchStatus.SUBMITTED.value}, synchronize_session=False)
+            db.commit()
+            return False
+
+        finally:
+            db.close()
+
+    @staticmethod
+    async def poll_submitted():
+        """
+        Poll every submitted batch once and collect finished ones
+
+        Batches whose submission never ran or was interrupted (process
+        restarted while preparing) are submitted here as well.
+        """
+        db = SessionLocal()
+        try:
+            now = datetime.now()
+            # 回寫中途進程終止的批次,超時後重新輪詢
+            db.query(AnalysisBatch).filter(
+                AnalysisBatch.status == BatchStatus.COLLECTING.value,
+                AnalysisBatch.updated_at < now - timedelta(seconds=BatchScoringService.COLLECT_TIMEOUT)
+            ).update({AnalysisBatch.status: BatchStatus.SUBMITTED.value}, synchronize_session=False)
+            # 提交中途進程終止的批次,超時後重新提交
+            db.query(AnalysisBatch).filter(
+                AnalysisBatch.status == BatchStatus.SUBMITTING.value,
+                AnalysisBatch.updated_at < now - timedelta(seconds=BatchScoringService.SUBMIT_TIMEOUT)
+            ).update({AnalysisBatch.status: BatchStatus.PREPARING.value}, synchronize_session=False)
+            db.commit()
+
+            preparing = [
+                batch_id for (batch_id,) in db.query(AnalysisBatch.id).filter(
+                    AnalysisBatch.status == BatchStatus.PREPARING.value
+                ).all()
+            ]
+            batch_ids = [
+                batch_id for (batch_id,) in db.query(AnalysisBatch.id).filter(
+                    AnalysisBatch.status == BatchStatus.SUBMITTED.value
+                ).all()
+            ]
+        finally:
+            db.close()
+
+        loop = asyncio.get_event_loop()
+        for batch_id in preparing:
+            await loop.run_in_executor(None, BatchScoringService._submit_sync, batch_id)
+        for batch_id in batch_ids:
+            await loop.run_in_executor(None, BatchScoringService.collect, batch_id)
+
+    @staticmethod
+    async def run_poller(interval: Optional[int] = None):
+        """
+        Poll provider batches forever
+
+        Args:
+            interval: Seconds between polls (defaults to settings.BATCH_POLL_INTERVAL)
+        """
+        interval = interval or settings.BATCH_POLL_INTERVAL
+        while True:
+            try:
+                await BatchScoringService.poll_submitted()
+            except Exception as e:
+                logger.error(f"批次輪詢失敗: {str(e)}")
+            await asyncio.sleep(interval)
@@ -0,0 +1,204 @@
+"""
+Pre-flight cost and latency estimation
+
+Runs the cheap local part of an analysis (report extraction, prompt
+building, image planning) and combines it with historical task telemetry
+to predict token usage, latency and queue wait without calling an LLM.
+"""
+import asyncio
+import statistics
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..core.fa_analyzer_core import FAReportAnalyzer
+from ..models.task import AnalysisTask, TaskPriority, TaskStatus
+from .model_router import ModelRouter
+from .task_queue import TaskQueue
+
+
+class AnalysisEstimator:
+    """Pre-flight analysis estimator"""
+
+    # Number of recent completed tasks used as latency history
+    HISTORY_SAMPLES = 50
+    # Output tokens assumed when there is no history (the JSON result is ~1.5k tokens)
+    DEFAULT_OUTPUT_TOKENS = 1500
+
+    @staticmethod
+    def concurrency() -> int:
+        """Number of analyses that run at the same time"""
+        return settings.WORKER_CONCURRENCY
+
+    @staticmethod
+    def _extract(file_path: str, backend: str, model: Optional[str], skip_images: bool,
+                 image_token_budget: Optional[int], router: Optional[ModelRouter]) -> Dict[str, Any]:
+        analyzer = FAReportAnalyzer(
+            backend=backend,
+            model=model,
+            skip_images=skip_images,
+            init_client=False,
+            image_token_budget=image_token_budget
+        )
+        try:
+            report_content, images = analyzer.read_report(file_path)
+
+            routing = None
+            if router:
+                candidate_images = [] if skip_images else images
+                prompt = analyzer.create_analysis_prompt(report_content, bool(candidate_images))
+                features = router.extract_features(file_path, prompt, report_content, candidate_images)
+                routing = router.route(backend, features)
+                if routing:
+                    analyzer.model = routing["model"]
+
+            prompt, selected_images = analyzer.prepare_analysis(report_content, images)
+            image_plan = analyzer.image_plan or {}
+
+            return {
+                "model": analyzer.model,
+                "routing": routing,
+                "char_count": len(report_content),
+                "text_tokens": analyzer.estimate_tokens(prompt),
+                "image_tokens": image_plan.get("estimated_tokens", 0),
+                "image_candidates": len(images),
+                "image_count": len(selected_images),
+                "image_plan": {k: v for k, v in image_plan.items() if k != "images"} or None,
+            }
+        finally:
+            analyzer._cleanup_temp_files()
+
+    @staticmethod
+    def _history(db: Session, backend: str, model: str) -> Dict[str, Any]:
+        """Median latency and output tokens of recent completed tasks (same model, else same backend)"""
+        samples: List[Dict[str, Any]] = []
+        for filters in (
+            [AnalysisTask.backend == backend, AnalysisTask.model == model],
+            [AnalysisTask.backend == backend],
+        ):
+            rows = db.query(AnalysisTask.telemetry).filter(
+                AnalysisTask.status == TaskStatus.COMPLETED.value,
+                AnalysisTask.telemetry.isnot(None),
+                *filters
+            ).order_by(AnalysisTask.completed_at.desc()).limit(AnalysisEstimator.HISTORY_SAMPLES).all()
+            samples = [
+                telemetry for (telemetry,) in rows
+                if telemetry and telemetry.get("llm_latency_ms") is not None and telemetry.get("mode") != "batch"
+            ]
+            if samples:
+                break
+
+        latencies = [
+            (t.get("extract_ms") or 0) + t["llm_latency_ms"] + (t.get("parse_ms") or 0)
+            for t in samples
+        ]
+        output_tokens = [t["output_tokens"] for t in samples if t.get("output_tokens")]
+
+        return {
+            "samples": len(samples),
+            "latency_ms": int(statistics.median(latencies)) if latencies else None,
+            "output_tokens": int(statistics.median(output_tokens)) if output_tokens else None,
+        }
+
+    @staticmethod
+    def queue_depth(db: Session, priority: Optional[str] = None) -> int:
+        """
+        Number of tasks waiting for or holding an analysis slot
+
+        Args:
+            db: Database session
+            priority: Only count pending tasks that would be claimed before
+                a task of this priority (all pending tasks if None)
+        """
+        query = db.query(AnalysisTask).filter(
+            AnalysisTask.status.in_([TaskStatus.PENDING.value, TaskStatus.PROCESSING.value]),
+            AnalysisTask.batch_id.is_(None)
+        )
+        if priority:
+            rank = TaskQueue.PRIORITY_RANK.get(priority, 1)
+            ahead = [p for p, r in TaskQueue.PRIORITY_RANK.items() if r <= rank]
+            query = query.filter(or_(
+                AnalysisTask.status == TaskStatus.PROCESSING.value,
+                func.coalesce(AnalysisTask.priority, TaskPriority.NORMAL.value).in_(ahead)
+            ))
+        return query.count()
+
+    @staticmethod
+    def expected_queue_wait_ms(depth: int, service_ms: Optional[int], concurrency: int) -> Optional[int]:
+        """
+        Expected wait before a new task gets a slot
+
+        Args:
+            depth: Tasks already waiting or running
+            service_ms: Typical processing time of one task
+            concurrency: Number of parallel analysis slots
+
+        Returns:
+            Expected wait in milliseconds, or None without latency history
+        """
+        if depth < concurrency:
+            return 0
+        if service_ms is None:
+            return None
+        waves = (depth - concurrency) // concurrency + 1
+        return waves * service_ms
+
+    @staticmethod
+    async def estimate(
+        db: Session,
+        file_path: str,
+        backend: str,
+        model: Optional[str] = None,
+        skip_images: bool = False,
+        image_token_budget: Optional[int] = None,
+        router: Optional[ModelRouter] = None,
+        priority: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Estimate token usage, latency and queue wait of an analysis
+
+        Args:
+            db: Database session
+            file_path: Report file path
+            backend: LLM backend
+            model: Model name (backend default or routed if not specified)
+            skip_images: Skip image analysis
+            image_token_budget: Image token budget for the task
+            router: Model router used when no model is specified
+            priority: Priority the task would be queued with
+
+        Returns:
+            Estimate dictionary
+        """
+        loop = asyncio.get_event_loop()
+        stats = await loop.run_in_executor(
+            None,
+            AnalysisEstimator._extract,
+            file_path, backend, model, skip_images, image_token_budget, router
+        )
+
+        history = AnalysisEstimator._history(db, backend, stats["model"])
+        depth = AnalysisEstimator.queue_depth(db, priority)
+        concurrency = AnalysisEstimator.concurrency()
+
+        return {
+            "backend": backend,
+            "model": stats["model"],
+            "routing": stats["routing"],
+            "char_count": stats["char_count"],
+            "input_tokens": stats["text_tokens"] + stats["image_tokens"],
+            "text_tokens": stats["text_tokens"],
+            "image_tokens": stats["image_tokens"],
+            "output_tokens": history["output_tokens"] or AnalysisEstimator.DEFAULT_OUTPUT_TOKENS,
+            "image_candidates": stats["image_candidates"],
+            "image_count": stats["image_count"],
+            "image_plan": stats["image_plan"],
+            "expected_latency_ms": history["latency_ms"],
+            "latency_samples": history["samples"],
+            "queue_depth": depth,
+            "expected_queue_wait_ms": AnalysisEstimator.expected_queue_wait_ms(
+                depth, history["latency_ms"], concurrency
+            ),
+        }
@@ -0,0 +1,180 @@
+"""
+Bulk deletion of history
+
+Tasks are deleted with set-based DELETE ... WHERE id IN (...) statements
+that return the deleted ids and upload paths (RETURNING on SQLite 3.35+
+and PostgreSQL; a select of the same rows first elsewhere). Database
+triggers clean up the search index, dimension scores and stat counters.
+Uploads no other task still points at are handed to the file janitor
+after the commit instead of being unlinked inline.
+
+Purges by filter (age, status, backend) delete in chunks, each its own
+writer call and transaction, so other writes interleave with a large
+purge instead of waiting for all of it. Pending and processing tasks are
+never purged.
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from ..database import get_db_writer
+from ..models.task import AnalysisTask, TaskStatus
+from .analytics import AnalyticsService
+from .history_stats import HistoryStatsService
+from .janitor import get_file_janitor
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryCleanupService:
+    """Set-based deletion of tasks and their uploads"""
+
+    # Ids per DELETE statement (well under SQLite's bound parameter limit)
+    CHUNK_SIZE = 500
+
+    # Statuses a purge may delete
+    PURGEABLE_STATUSES = (
+        TaskStatus.COMPLETED.value,
+        TaskStatus.FAILED.value,
+        TaskStatus.CANCELLED.value,
+    )
+
+    @staticmethod
+    def _chunks(items: Sequence, size: int) -> Iterable[Sequence]:
+        for i in range(0, len(items), size):
+            yield items[i:i + size]
+
+    @staticmethod
+    def _delete_where(db: Session, condition) -> List[Tuple[str, str]]:
+        """Delete the matching tasks and return their (id, file_path)"""
+        if db.get_bind().dialect.delete_returning:
+            return [tuple(row) for row in db.execute(
+                delete(AnalysisTask).where(condition).returning(AnalysisTask.id, AnalysisTask.file_path),
+                execution_options={"synchronize_session": False}
+            )]
+
+        rows = [tuple(row) for row in db.execute(
+            select(AnalysisTask.id, AnalysisTask.file_path).where(condition)
+        )]
+        for chunk in HistoryCleanupService._chunks([task_id for task_id, _ in rows], HistoryCleanupService.CHUNK_SIZE):
+            db.execute(
+                delete(AnalysisTask).where(AnalysisTask.id.in_(chunk)),
+                execution_options={"synchronize_session": False}
+            )
+        return rows
+
+    @staticmethod
+    def _unreferenced(db: Session, paths: Iterable[str]) -> List[str]:
+        """Paths that no remaining task points at (a file can be analyzed more than once)"""
+        paths = sorted({path for path in paths if path})
+        referenced = set()
+        for chunk in HistoryCleanupService._chunks(paths, HistoryCleanupService.CHUNK_SIZE):
+            referenced.update(db.execute(
+                select(AnalysisTask.file_path).where(AnalysisTask.file_path.in_(chunk)).distinct()
+            ).scalars())
+        return [path for path in paths if path not in referenced]
+
+    @staticmethod
+    def _finish(db: Session, rows: List[Tuple[str, str]]) -> int:
+        """Commit a delete, queue the freed uploads and invalidate cached statistics"""
+        files = HistoryCleanupService._unreferenced(db, [path for _, path in rows])
+        db.commit()
+        if rows:
+            HistoryStatsService.invalidate()
+            AnalyticsService.invalidate()
+        return get_file_janitor().discard(files)
+
+    @staticmethod
+    def delete_tasks(db: Session, task_ids: List[str]) -> Dict[str, Any]:
+        """
+        Delete tasks by id in one transaction
+
+        Args:
+            db: Database session
+            task_ids: Task IDs
+
+        Returns:
+            {"deleted": [ids], "missing": [ids], "files": uploads queued for removal}
+        """
+        task_ids = list(dict.fromkeys(task_ids))
+        rows: List[Tuple[str, str]] = []
+        for chunk in HistoryCleanupService._chunks(task_ids, HistoryCleanupService.CHUNK_SIZE):
+            rows.extend(HistoryCleanupService._delete_where(db, AnalysisTask.id.in_(chunk)))
+        files = HistoryCleanupService._finish(db, rows)
+
+        deleted = {task_id for task_id, _ in rows}
+        return {
+            "deleted": [task_id for task_id in task_ids if task_id in deleted],
+            "missing": [task_id for task_id in task_ids if task_id not in deleted],
+            "files": files,
+        }
+
+    @staticmethod
+    def purge_chunk(
+        db: Session,
+        created_before: datetime,
+        statuses: Sequence[str],
+        backend: Optional[str] = None,
+        limit: int = CHUNK_SIZE
+    ) -> Tuple[int, int]:
+        """
+        Delete up to limit of the oldest tasks matching a purge filter
+
+        Returns:
+            (tasks deleted, uploads queued for removal)
+        """
+        chosen = select(AnalysisTask.id).where(
+            AnalysisTask.created_at < created_before,
+            AnalysisTask.status.in_(statuses)
+        )
+        if backend:
+            chosen = chosen.where(AnalysisTask.backend == backend)
+        chosen = chosen.order_by(AnalysisTask.created_at).limit(limit)
+
+        rows = HistoryCleanupService._delete_where(db, AnalysisTask.id.in_(chosen.scalar_subquery()))
+        return len(rows), HistoryCleanupService._finish(db, rows)
+
+    @staticmethod
+    async def purge(
+        older_than_days: int,
+        statuses: Optional[Sequence[str]] = None,
+        backend: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Delete finished tasks created more than older_than_days ago
+
+        Args:
+            older_than_days: Minimum age in days
+            statuses: Statuses to delete (all finished statuses if None)
+            backend: Only tasks of this backend
+
+        Returns:
+            {"deleted", "files", "elapsed_ms"}
+
+        Raises:
+            ValueError: A status that is not finished
+        """
+        statuses = list(statuses or HistoryCleanupService.PURGEABLE_STATUSES)
+        invalid = [status for status in statuses if status not in HistoryCleanupService.PURGEABLE_STATUSES]
+        if invalid:
+            raise ValueError(f"只能清除已結束的任務,無效的狀態: {', '.join(invalid)}")
+
+        created_before = datetime.now() - timedelta(days=older_than_days)
+        start = time.perf_counter()
+        deleted = files = 0
+        while True:
+            chunk_deleted, chunk_files = await get_db_writer().submit(
+                HistoryCleanupService.purge_chunk, created_before, statuses, backend
+            )
+            deleted += chunk_deleted
+            files += chunk_files
+            if chunk_deleted < HistoryCleanupService.CHUNK_SIZE:
+                break
+
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"已清除 {older_than_days} 天前的歷史記錄 {deleted} 筆,待刪除文件 {files} 個 ({elapsed_ms} ms)")
+        return {"deleted": deleted, "files": files, "elapsed_ms": elapsed_ms}
@@ -0,0 +1,112 @@
+"""
+History statistics
+
+The dashboard summary is read from task_stat_counters, a per-day rollup
+that database triggers keep current on every task insert, status change
+and delete (see migrations.py). One grouped query over the rollup costs
+the same however many tasks the history holds. On databases without the
+triggers a single grouped aggregate over analysis_tasks is used instead.
+Summaries are cached per process for HISTORY_STATS_CACHE_SECONDS.
+"""
+import threading
+import time
+from datetime import date, datetime, time as day_start, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..migrations import STAT_COUNTER_DIALECTS
+from ..models.stats import TaskStatCounter
+from ..models.task import AnalysisTask, TaskStatus
+
+
+class HistoryStatsService:
+    """Task counts by status, backend and recent days"""
+
+    # Backends always listed in by_backend (others appear once used)
+    BACKENDS = ("ollama", "openai", "anthropic")
+
+    # Recent windows in calendar days, today included
+    WINDOWS = {"last_7_days": 7, "last_30_days": 30}
+
+    _lock = threading.Lock()
+    _cached: Optional[Tuple[float, Dict[str, Any]]] = None
+
+    @staticmethod
+    def _rows(db: Session) -> List[Tuple]:
+        """(status, backend, total, last_7_days, last_30_days) per status and backend"""
+        today = date.today()
+        first_days = {name: today - timedelta(days=days - 1) for name, days in HistoryStatsService.WINDOWS.items()}
+
+        if db.get_bind().dialect.name in STAT_COUNTER_DIALECTS:
+            counter = TaskStatCounter
+            return db.query(
+                counter.status,
+                counter.backend,
+                func.sum(counter.count),
+                *[
+                    func.sum(case((counter.day >= first_day, counter.count), else_=0))
+                    for first_day in first_days.values()
+                ]
+            ).group_by(counter.status, counter.backend).all()
+
+        return db.query(
+            AnalysisTask.status,
+            AnalysisTask.backend,
+            func.count(AnalysisTask.id),
+            *[
+                func.sum(case((AnalysisTask.created_at >= datetime.combine(first_day, day_start.min), 1), else_=0))
+                for first_day in first_days.values()
+            ]
+        ).group_by(AnalysisTask.status, AnalysisTask.backend).all()
+
+    @staticmethod
+    def compute(db: Session) -> Dict[str, Any]:
+        """
+        Build the summary from the database (uncached)
+
+        Returns:
+            {"total", "by_status", "by_backend", "recent"}
+        """
+        by_status = {status.value: 0 for status in TaskStatus}
+        by_backend = {backend: 0 for backend in HistoryStatsService.BACKENDS}
+        recent = {name: 0 for name in HistoryStatsService.WINDOWS}
+        total = 0
+
+        for status, backend, count, *windows in HistoryStatsService._rows(db):
+            count = int(count or 0)
+            if count <= 0:
+                continue
+            total += count
+            by_status[status] = by_status.get(status, 0) + count
+            by_backend[backend] = by_backend.get(backend, 0) + count
+            for name, window_count in zip(HistoryStatsService.WINDOWS, windows):
+                recent[name] += int(window_count or 0)
+
+        return {
+            "total": total,
+            "by_status": by_status,
+            "by_backend": by_backend,
+            "recent": recent,
+        }
+
+    @classmethod
+    def summary(cls, db: Session) -> Dict[str, Any]:
+        """Summary served from the short-lived cache, recomputed when expired"""
+        now = time.monotonic()
+        with cls._lock:
+            if cls._cached and cls._cached[0] > now:
+                return cls._cached[1]
+
+        stats = cls.compute(db)
+        with cls._lock:
+            cls._cached = (now + settings.HISTORY_STATS_CACHE_SECONDS, stats)
+        return stats
+
+    @classmethod
+    def invalidate(cls):
+        """Drop the cached summary (e.g. after deleting history)"""
+        with cls._lock:
+            cls._cached = None
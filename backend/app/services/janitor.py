@@ -0,0 +1,119 @@
+"""
+Background file removal
+
+Deleting history only has to commit the database rows; the uploaded
+reports the deleted tasks pointed at are handed to a janitor thread and
+unlinked off the request path, so a large delete never blocks the event
+loop (or the database writer) on filesystem calls.
+
+Queued paths are lost if the process dies before the janitor gets to
+them; such files are left as orphans in UPLOAD_DIR.
+"""
+import logging
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FileJanitor:
+    """Unlinks discarded files on a background thread"""
+
+    THREAD_NAME = "file-janitor"
+
+    def __init__(self):
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.removed = 0
+        self.missing = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.THREAD_NAME, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                if path is None:
+                    return
+                self._remove(path)
+            finally:
+                self._queue.task_done()
+
+    def _remove(self, path: str):
+        try:
+            Path(path).unlink()
+        except FileNotFoundError:
+            with self._lock:
+                self.missing += 1
+            return
+        except OSError as e:
+            with self._lock:
+                self.failed += 1
+            logger.warning(f"刪除文件失敗 {path}: {str(e)}")
+            return
+        with self._lock:
+            self.removed += 1
+        logger.debug(f"已刪除文件: {path}")
+
+    def discard(self, paths: Iterable[str]) -> int:
+        """
+        Queue files for removal
+
+        Args:
+            paths: File paths (missing files are counted, not reported)
+
+        Returns:
+            Number of paths queued
+        """
+        queued = 0
+        for path in paths:
+            if path:
+                self._queue.put(path)
+                queued += 1
+        if queued:
+            self._ensure_started()
+        return queued
+
+    def join(self):
+        """Wait until every queued file has been handled"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def stop(self, timeout: float = 5.0):
+        """Finish the queued removals (up to timeout seconds) and stop the thread"""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning(f"文件清理未在 {timeout:g} 秒內完成,剩餘 {self._queue.qsize()} 個文件")
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and counters of the janitor"""
+        with self._lock:
+            return {
+                "pending": self._queue.qsize(),
+                "removed": self.removed,
+                "missing": self.missing,
+                "failed": self.failed,
+            }
+
+
+_janitor: Optional[FileJanitor] = None
+
+
+def get_file_janitor() -> FileJanitor:
+    """Process-wide file janitor (created on first use)"""
+    global _janitor
+    if _janitor is None:
+        _janitor = FileJanitor()
+    return _janitor
@@ -0,0 +1,122 @@
+"""
+Latency/cost-aware model router
+
+Picks a model per task from a tier list (light to heavy) using cheap report
+features, so short text reports go to fast models and large image decks go
+to the heavy ones.
+"""
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ..core.fa_analyzer_core import FAReportAnalyzer
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRouter:
+    """Per-task model router"""
+
+    # Tiers are ordered light to heavy. A report goes to the first tier whose
+    # limits it fits; a limit that is not set does not constrain the tier.
+    DEFAULT_TIERS: Dict[str, List[Dict[str, Any]]] = {
+        "ollama": [
+            {"name": "text", "model": "llama3.1:latest", "max_tokens": 8000, "max_images": 0},
+            {"name": "vision", "model": "llama3.2-vision:latest"},
+        ],
+        "openai": [
+            {"name": "fast", "model": "gpt-4o-mini-2024-07-18", "max_tokens": 20000, "max_images": 5},
+            {"name": "heavy", "model": "gpt-4o-2024-08-06"},
+        ],
+        "anthropic": [
+            {"name": "fast", "model": "claude-3-5-haiku-20241022", "max_tokens": 20000, "max_images": 5},
+            {"name": "heavy", "model": "claude-sonnet-4-20250514"},
+        ],
+    }
+
+    def __init__(self, tiers: Optional[Dict[str, List[Dict[str, Any]]]] = None):
+        self.tiers = tiers if tiers is not None else self.DEFAULT_TIERS
+
+    @classmethod
+    def from_config(cls, raw_tiers: Optional[str]) -> "ModelRouter":
+        """
+        Build a router from a JSON tier configuration
+
+        Backends missing from the configuration keep their default tiers.
+
+        Args:
+            raw_tiers: JSON object mapping backend to a list of tiers
+
+        Returns:
+            Model router
+        """
+        tiers = dict(cls.DEFAULT_TIERS)
+        if raw_tiers:
+            try:
+                tiers.update(json.loads(raw_tiers))
+            except (json.JSONDecodeError, TypeError) as e:
+                logger.warning(f"模型路由配置無效,使用預設層級: {str(e)}")
+        return cls(tiers)
+
+    @staticmethod
+    def extract_features(file_path: str, prompt: str, report_content: str,
+                         images: List[Dict]) -> Dict[str, Any]:
+        """
+        Compute cheap routing features of a report
+
+        Args:
+            file_path: Report file path
+            prompt: Analysis prompt that will be sent
+            report_content: Extracted report text
+            images: Images that will be considered for the request
+
+        Returns:
+            Feature dictionary
+        """
+        return {
+            "file_type": Path(file_path).suffix.lower().lstrip("."),
+            "char_count": len(report_content),
+            "estimated_tokens": FAReportAnalyzer.estimate_tokens(prompt),
+            "image_count": len(images),
+        }
+
+    @staticmethod
+    def _fits(tier: Dict[str, Any], features: Dict[str, Any]) -> bool:
+        if tier.get("max_tokens") is not None and features["estimated_tokens"] > tier["max_tokens"]:
+            return False
+        if tier.get("max_images") is not None and features["image_count"] > tier["max_images"]:
+            return False
+        if tier.get("file_types") and features["file_type"] not in tier["file_types"]:
+            return False
+        return True
+
+    def route(self, backend: str, features: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Choose a model tier for a report
+
+        Args:
+            backend: LLM backend
+            features: Report features from extract_features
+
+        Returns:
+            Routing decision, or None if the backend has no tiers
+        """
+        tiers = self.tiers.get(backend)
+        if not tiers:
+            return None
+
+        for tier in tiers:
+            if self._fits(tier, features):
+                reason = "fits tier limits"
+                break
+        else:
+            tier = tiers[-1]
+            reason = "exceeds all tier limits, using heaviest tier"
+
+        return {
+            "tier": tier.get("name"),
+            "model": tier["model"],
+            "reason": reason,
+            "features": features,
+        }
@@ -0,0 +1,181 @@
+"""
+Staged analysis pipeline
+
+An analysis runs as a sequence of stages (extract, preprocess_images,
+build_prompt, llm, parse, persist). Each stage has its own bounded thread
+pool, so CPU-heavy extraction of one task overlaps with another task
+waiting on the LLM instead of competing for the same default executor.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineStage:
+    """A pipeline stage with a bounded worker pool and admission queue"""
+
+    def __init__(self, name: str, workers: int, queue_size: int):
+        """
+        Args:
+            name: Stage name
+            workers: Threads running the stage
+            queue_size: Tasks allowed to wait for a free thread; further tasks
+                wait in the previous stage (backpressure)
+        """
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"stage-{name}")
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _admission(self) -> asyncio.Semaphore:
+        # Created lazily inside the running event loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers + self.queue_size)
+        return self._slots
+
+    async def run(self, fn: Callable, *args, timings: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        Run a function on this stage's pool
+
+        Args:
+            fn: Blocking function to run
+            *args: Function arguments
+            timings: Dict receiving {stage: {"wait_ms", "run_ms"}} for telemetry
+
+        Returns:
+            Function result
+        """
+        enqueued = time.perf_counter()
+        started = None
+
+        def work():
+            nonlocal started
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+        async with self._admission():
+            with self._lock:
+                self.queued += 1
+            loop = asyncio.get_event_loop()
+            try:
+                result = await loop.run_in_executor(self.executor, work)
+            except BaseException:
+                with self._lock:
+                    if started is None:
+                        # Cancelled before a thread picked it up
+                        self.queued -= 1
+                    self.failed += 1
+                raise
+
+        with self._lock:
+            self.completed += 1
+        if timings is not None:
+            finished = time.perf_counter()
+            timings[self.name] = {
+                "wait_ms": int(((started or finished) - enqueued) * 1000),
+                "run_ms": int((finished - (started or finished)) * 1000),
+            }
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Current depth and counters of the stage"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "queued": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+
+class AnalysisPipeline:
+    """Per-process set of analysis stages"""
+
+    STAGES = ("extract", "preprocess_images", "build_prompt", "llm", "parse", "persist")
+
+    # Threads per stage. The LLM stage is I/O bound (waiting on the provider),
+    # the others are CPU or local-disk bound.
+    DEFAULT_WORKERS = {
+        "extract": 2,
+        "preprocess_images": 2,
+        "build_prompt": 2,
+        "llm": 8,
+        "parse": 2,
+        "persist": 2,
+    }
+
+    def __init__(self, workers: Optional[Dict[str, int]] = None, queue_factor: int = 2):
+        """
+        Args:
+            workers: Threads per stage (defaults for stages not given)
+            queue_factor: Admission queue size as a multiple of the stage's workers
+        """
+        workers = {**self.DEFAULT_WORKERS, **(workers or {})}
+        self.stages = {
+            name: PipelineStage(name, workers[name], workers[name] * queue_factor)
+            for name in self.STAGES
+        }
+
+    @classmethod
+    def from_config(cls, raw_workers: Optional[str]) -> "AnalysisPipeline":
+        """
+        Build a pipeline from a JSON object of stage thread counts
+
+        Args:
+            raw_workers: JSON like {"extract": 4, "llm": 16}
+
+        Returns:
+            Analysis pipeline
+        """
+        workers = {}
+        if raw_workers:
+            try:
+                workers = {
+                    name: int(count) for name, count in json.loads(raw_workers).items()
+                    if name in cls.STAGES and int(count) > 0
+                }
+            except (json.JSONDecodeError, TypeError, ValueError, AttributeError) as e:
+                logger.warning(f"管線 worker 配置無效,使用預設值: {str(e)}")
+        return cls(workers)
+
+    async def run(self, stage: str, fn: Callable, *args, timings: Optional[Dict[str, Any]] = None) -> Any:
+        """Run a function on the named stage"""
+        return await self.stages[stage].run(fn, *args, timings=timings)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Queue depth and counters of every stage"""
+        return {name: stage.stats() for name, stage in self.stages.items()}
+
+
+_pipeline: Optional[AnalysisPipeline] = None
+
+
+def get_pipeline() -> AnalysisPipeline:
+    """Process-wide analysis pipeline (created on first use)"""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = AnalysisPipeline.from_config(settings.PIPELINE_STAGE_WORKERS)
+    return _pipeline
@@ -0,0 +1,212 @@
+"""
+In-memory progress of running analyses
+
+Progress callbacks update a process-wide registry instead of the database.
+Status reads for tasks running in this process are served from memory, and
+the dispatcher writes the changed entries back in one transaction per
+checkpoint interval, so the database only sees status transitions and
+periodic checkpoints.
+
+Event stream subscribers get every change pushed to an asyncio queue:
+("snapshot", task dict) when a task starts, ("progress", ...),
+("stage", ...), throttled ("partial", ...) LLM output, and ("finished", {})
+once the task stops running in this process.
+"""
+import asyncio
+import copy
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import settings
+
+
+class ProgressRegistry:
+    """Thread-safe registry of running task snapshots"""
+
+    # Minimum seconds between partial LLM output events of one task
+    PARTIAL_INTERVAL = 0.25
+
+    def __init__(self, checkpoint_seconds: float):
+        """
+        Args:
+            checkpoint_seconds: Minimum seconds between database checkpoints
+        """
+        self.checkpoint_seconds = checkpoint_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._dirty: Dict[str, Tuple[int, str]] = {}
+        self._last_checkpoint = 0.0
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+
+    def subscribe(self, task_id: str) -> asyncio.Queue:
+        """
+        Receive the events of a task (call from the event loop)
+
+        Returns:
+            Queue of (event, data) tuples
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers.setdefault(task_id, []).append((loop, queue))
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        """Stop receiving the events of a task"""
+        with self._lock:
+            subscribers = [s for s in self._subscribers.get(task_id, []) if s[1] is not queue]
+            if subscribers:
+                self._subscribers[task_id] = subscribers
+            else:
+                self._subscribers.pop(task_id, None)
+
+    def _publish(self, task_id: str, event: str, data: Dict[str, Any]):
+        # Callers may run on executor threads; hand the event to each subscriber's loop
+        with self._lock:
+            subscribers = list(self._subscribers.get(task_id, []))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+            except RuntimeError:
+                # Event loop already closed
+                pass
+
+    def start(self, snapshot: Dict[str, Any], service_ms: Optional[int] = None):
+        """
+        Track a task that started running in this process
+
+        Args:
+            snapshot: Task dictionary (AnalysisTask.to_dict()) at claim time
+            service_ms: Expected processing time, used for the ETA
+        """
+        with self._lock:
+            self._entries[snapshot["task_id"]] = {
+                "snapshot": dict(snapshot),
+                "service_ms": service_ms,
+                "output_chars": 0,
+                "partial": [],
+                "partial_at": 0.0,
+            }
+        self._publish(snapshot["task_id"], "snapshot", self.get(snapshot["task_id"]))
+
+    def update(self, task_id: str, progress: int, message: str = ""):
+        """Record progress in memory; persisted at the next checkpoint"""
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if not entry:
+                return
+            entry["snapshot"]["progress"] = progress
+            entry["snapshot"]["message"] = message
+            self._dirty[task_id] = (progress, message)
+        self._publish(task_id, "progress", {"progress": progress, "message": message})
+
+    def stage(self, task_id: str, stage: str):
+        """Record the pipeline stage a task entered"""
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if not entry:
+                return
+            entry["snapshot"]["stage"] = stage
+            partial = self._take_partial(entry)
+        if partial:
+            self._publish(task_id, "partial", partial)
+        self._publish(task_id, "stage", {"stage": stage})
+
+    def partial(self, task_id: str, text: str):
+        """Record streamed LLM output; published at most every PARTIAL_INTERVAL"""
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if not entry:
+                return
+            entry["output_chars"] += len(text)
+            entry["partial"].append(text)
+            partial = None
+            if time.monotonic() - entry["partial_at"] >= self.PARTIAL_INTERVAL:
+                partial = self._take_partial(entry)
+        if partial:
+            self._publish(task_id, "partial", partial)
+
+    @staticmethod
+    def _take_partial(entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Caller holds the lock
+        if not entry["partial"]:
+            return None
+        text = "".join(entry["partial"])
+        entry["partial"] = []
+        entry["partial_at"] = time.monotonic()
+        return {"text": text, "chars": entry["output_chars"]}
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Current status of a task running in this process
+
+        Returns:
+            Task dictionary with queue_position and eta_seconds, or None if
+            the task is not running here
+        """
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if not entry:
+                return None
+            snapshot = copy.deepcopy(entry["snapshot"])
+            service_ms = entry["service_ms"]
+
+        snapshot["queue_position"] = 0
+        snapshot["eta_seconds"] = (
+            math.ceil(service_ms * (100 - (snapshot["progress"] or 0)) / 100 / 1000)
+            if service_ms else None
+        )
+        return snapshot
+
+    def finish(self, task_id: str) -> Optional[Tuple[int, str]]:
+        """
+        Stop tracking a task and tell subscribers to read its final state
+
+        Returns:
+            Last (progress, message) of the task, or None if it was not tracked
+        """
+        with self._lock:
+            self._dirty.pop(task_id, None)
+            entry = self._entries.pop(task_id, None)
+        self._publish(task_id, "finished", {})
+        if not entry:
+            return None
+        return entry["snapshot"]["progress"], entry["snapshot"]["message"]
+
+    def take_checkpoint(self, force: bool = False) -> Dict[str, Tuple[int, str]]:
+        """
+        Progress changed since the last checkpoint, if a checkpoint is due
+
+        Args:
+            force: Ignore the checkpoint interval
+
+        Returns:
+            {task_id: (progress, message)} to persist (empty if not due)
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not self._dirty or (not force and now - self._last_checkpoint < self.checkpoint_seconds):
+                return {}
+            dirty, self._dirty = self._dirty, {}
+            self._last_checkpoint = now
+        return dirty
+
+    def restore(self, updates: Dict[str, Tuple[int, str]]):
+        """Put back updates whose checkpoint failed (newer updates win)"""
+        with self._lock:
+            for task_id, value in updates.items():
+                if task_id in self._entries:
+                    self._dirty.setdefault(task_id, value)
+
+
+_registry: Optional[ProgressRegistry] = None
+
+
+def get_progress_registry() -> ProgressRegistry:
+    """Process-wide progress registry (created on first use)"""
+    global _registry
+    if _registry is None:
+        _registry = ProgressRegistry(settings.PROGRESS_CHECKPOINT_SECONDS)
+    return _registry
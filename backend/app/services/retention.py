@@ -0,0 +1,430 @@
+"""
+Tiered retention of tasks and uploads
+
+Three tiers, each disabled until configured:
+
+- Archive: finished tasks created more than RETENTION_ARCHIVE_DAYS ago are
+  written to a compressed JSONL segment in ARCHIVE_DIR and deleted from
+  analysis_tasks (triggers drop their search, dimension and stat rows).
+  archived_tasks keeps a small index row per task with the block of the
+  segment holding its full record, so archived results stay retrievable.
+  Segments are zstd when the zstandard package is installed, gzip
+  otherwise; either way every block is an independent frame, so a whole
+  segment also decompresses with the standard command-line tools.
+- Uploads: files of finished tasks are deleted RETENTION_UPLOAD_DAYS after
+  upload (results are kept; the report can no longer be re-analyzed).
+- Orphans: uploads no task refers to are deleted after
+  RETENTION_ORPHAN_UPLOAD_HOURS.
+
+Segments are read, encoded, compressed and fsynced outside the database
+writer with their own read session. The writer only deletes the tasks and
+inserts their index rows, one transaction per segment; tasks changed,
+deleted or archived by another process after they were read are left out
+of the index (and stay in analysis_tasks if they still exist). Uploads of
+archived tasks are released like deleted ones.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import SessionLocal, get_db_writer
+from ..models.archive import ArchiveSegment, ArchivedTask
+from ..models.task import AnalysisTask
+from .history_cleanup import HistoryCleanupService
+from .janitor import get_file_janitor
+
+# 可選依賴
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionService:
+    """Archives old tasks and purges expired uploads"""
+
+    CODECS = ("zstd", "gzip")
+    EXTENSIONS = {"zstd": ".jsonl.zst", "gzip": ".jsonl.gz"}
+
+    # Tasks per compressed block (unit of random access within a segment)
+    BLOCK_TASKS = 50
+
+    ZSTD_LEVEL = 9
+    GZIP_LEVEL = 6
+
+    @staticmethod
+    def codec() -> str:
+        """Codec for new segments (gzip when zstd is requested but unavailable)"""
+        codec = settings.ARCHIVE_CODEC.lower()
+        if codec not in RetentionService.CODECS:
+            raise ValueError(f"不支援的壓縮格式: {settings.ARCHIVE_CODEC}")
+        if codec == "zstd" and not HAS_ZSTD:
+            return "gzip"
+        return codec
+
+    @staticmethod
+    def _compress(codec: str, data: bytes) -> bytes:
+        if codec == "zstd":
+            return zstandard.ZstdCompressor(level=RetentionService.ZSTD_LEVEL).compress(data)
+        return gzip.compress(data, compresslevel=RetentionService.GZIP_LEVEL)
+
+    @staticmethod
+    def _decompress(codec: str, data: bytes) -> bytes:
+        if codec == "zstd":
+            if not HAS_ZSTD:
+                raise RuntimeError("讀取 zstd 歸檔需要安裝 zstandard: pip install zstandard")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    @staticmethod
+    def archive_dir() -> Path:
+        archive_dir = Path(settings.ARCHIVE_DIR)
+        archive_dir.mkdir(parents=True, exist_ok=True)
+        return archive_dir
+
+    @staticmethod
+    def record(task: AnalysisTask) -> Dict[str, Any]:
+        """Archived form of a task (queue options, which hold encrypted API keys, are left out)"""
+        record = task.to_dict()
+        record.update({"backend": task.backend, "model": task.model, "file_path": task.file_path})
+        return record
+
+    @staticmethod
+    def _write_segment(tasks: List[AnalysisTask], codec: str) -> Tuple[str, Dict[str, Tuple[int, int]], int, int]:
+        """
+        Write tasks to a new segment file
+
+        Returns:
+            (filename, {task_id: (block_offset, block_length)}, size_bytes, raw_bytes)
+        """
+        archive_dir = RetentionService.archive_dir()
+        filename = (
+            f"segment-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+            f"{RetentionService.EXTENSIONS[codec]}"
+        )
+        temp_path = archive_dir / f".{filename}.part"
+
+        locations: Dict[str, Tuple[int, int]] = {}
+        offset = raw_bytes = 0
+        with open(temp_path, "wb") as f:
+            for i in range(0, len(tasks), RetentionService.BLOCK_TASKS):
+                block = tasks[i:i + RetentionService.BLOCK_TASKS]
+                data = "".join(
+                    json.dumps(RetentionService.record(task), ensure_ascii=False, default=str) + "\n"
+                    for task in block
+                ).encode("utf-8")
+                frame = RetentionService._compress(codec, data)
+                f.write(frame)
+                for task in block:
+                    locations[task.id] = (offset, len(frame))
+                offset += len(frame)
+                raw_bytes += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, archive_dir / filename)
+        return filename, locations, offset, raw_bytes
+
+    @staticmethod
+    def _snapshot(task) -> Tuple:
+        """Columns that change when a task is updated after it was read for archiving"""
+        return (task.status, task.rubric_version, task.total_score, task.updated_at)
+
+    @staticmethod
+    def write_segment(created_before: datetime) -> Optional[Dict[str, Any]]:
+        """
+        Write up to ARCHIVE_SEGMENT_TASKS of the oldest finished tasks created
+        before created_before to a new segment file (own read session, no writer)
+
+        Returns:
+            {"filename", "codec", "size_bytes", "raw_bytes", "entries", "snapshots"}
+            for commit_segment, or None if no task is due
+        """
+        db = SessionLocal()
+        try:
+            tasks = db.query(AnalysisTask).filter(
+                AnalysisTask.created_at < created_before,
+                AnalysisTask.status.in_(HistoryCleanupService.PURGEABLE_STATUSES)
+            ).order_by(AnalysisTask.created_at, AnalysisTask.id).limit(settings.ARCHIVE_SEGMENT_TASKS).all()
+            if not tasks:
+                return None
+
+            codec = RetentionService.codec()
+            filename, locations, size_bytes, raw_bytes = RetentionService._write_segment(tasks, codec)
+            return {
+                "filename": filename,
+                "codec": codec,
+                "size_bytes": size_bytes,
+                "raw_bytes": raw_bytes,
+                "entries": [
+                    {
+                        "task_id": task.id,
+                        "block_offset": locations[task.id][0],
+                        "block_length": locations[task.id][1],
+                        "filename": task.filename,
+                        "status": task.status,
+                        "backend": task.backend,
+                        "model": task.model,
+                        "total_score": task.total_score,
+                        "grade": task.grade,
+                        "created_at": task.created_at,
+                        "completed_at": task.completed_at,
+                    }
+                    for task in tasks
+                ],
+                "snapshots": {task.id: RetentionService._snapshot(task) for task in tasks},
+            }
+        finally:
+            db.close()
+
+    @staticmethod
+    def commit_segment(db: Session, prepared: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Delete the tasks of a written segment and index them (writer call)
+
+        Tasks changed or deleted since write_segment read them stay as they
+        are; their lines in the file are left out of the index.
+
+        Returns:
+            The segment, or None if none of its tasks could be archived (the file is removed)
+        """
+        segment_path = RetentionService.archive_dir() / prepared["filename"]
+        snapshots = prepared["snapshots"]
+        try:
+            ids = list(snapshots)
+            unchanged = []
+            for i in range(0, len(ids), HistoryCleanupService.CHUNK_SIZE):
+                chunk = ids[i:i + HistoryCleanupService.CHUNK_SIZE]
+                unchanged.extend(
+                    task_id for task_id, *state in db.query(
+                        AnalysisTask.id, AnalysisTask.status, AnalysisTask.rubric_version,
+                        AnalysisTask.total_score, AnalysisTask.updated_at
+                    ).filter(AnalysisTask.id.in_(chunk))
+                    if tuple(state) == snapshots[task_id]
+                )
+
+            rows = []
+            for i in range(0, len(unchanged), HistoryCleanupService.CHUNK_SIZE):
+                chunk = unchanged[i:i + HistoryCleanupService.CHUNK_SIZE]
+                rows.extend(HistoryCleanupService._delete_where(db, AnalysisTask.id.in_(chunk)))
+            deleted = {task_id for task_id, _ in rows}
+            if not deleted:
+                db.rollback()
+                segment_path.unlink(missing_ok=True)
+                return None
+
+            archived = [entry for entry in prepared["entries"] if entry["task_id"] in deleted]
+            segment = ArchiveSegment(
+                filename=prepared["filename"],
+                codec=prepared["codec"],
+                task_count=len(archived),
+                size_bytes=prepared["size_bytes"],
+                raw_bytes=prepared["raw_bytes"],
+                first_created_at=archived[0]["created_at"],
+                last_created_at=archived[-1]["created_at"]
+            )
+            db.add(segment)
+            db.flush()
+            db.add_all([ArchivedTask(segment_id=segment.id, **entry) for entry in archived])
+            HistoryCleanupService._finish(db, rows)
+        except Exception:
+            db.rollback()
+            segment_path.unlink(missing_ok=True)
+            raise
+
+        logger.info(
+            f"已歸檔 {len(archived)} 個任務至 {prepared['filename']} "
+            f"({prepared['raw_bytes']} -> {prepared['size_bytes']} bytes)"
+        )
+        return segment.to_dict()
+
+    @staticmethod
+    async def archive(older_than_days: int) -> Dict[str, Any]:
+        """
+        Archive every finished task created more than older_than_days ago
+
+        Returns:
+            {"segments", "archived", "elapsed_ms"}
+        """
+        created_before = datetime.now() - timedelta(days=older_than_days)
+        start = time.perf_counter()
+        loop = asyncio.get_event_loop()
+        segments = archived = 0
+        while True:
+            # 讀取、編碼、壓縮與 fsync 在寫入執行緒之外執行,寫入執行緒只刪除任務並寫入索引
+            prepared = await loop.run_in_executor(None, RetentionService.write_segment, created_before)
+            if prepared is None:
+                break
+            segment = await get_db_writer().submit(RetentionService.commit_segment, prepared)
+            if segment is not None:
+                segments += 1
+                archived += segment["task_count"]
+            if len(prepared["entries"]) < settings.ARCHIVE_SEGMENT_TASKS or segment is None:
+                break
+        return {
+            "segments": segments,
+            "archived": archived,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+
+    @staticmethod
+    def sweep_uploads(upload_days: Optional[int], orphan_hours: Optional[float]) -> Dict[str, int]:
+        """
+        Queue expired and orphaned uploads for removal
+
+        Args:
+            upload_days: Delete files of finished tasks uploaded this many days ago (skip if None)
+            orphan_hours: Delete files no task refers to after this many hours (skip if None)
+
+        Returns:
+            {"expired", "orphaned"} files queued
+        """
+        upload_dir = Path(settings.UPLOAD_DIR)
+        if (upload_days is None and orphan_hours is None) or not upload_dir.is_dir():
+            return {"expired": 0, "orphaned": 0}
+
+        now = time.time()
+        expired_before = now - upload_days * 86400 if upload_days is not None else None
+        orphaned_before = now - orphan_hours * 3600 if orphan_hours is not None else None
+        oldest = max(t for t in (expired_before, orphaned_before) if t is not None)
+
+        # 以與任務相同的形式組成路徑 (str(UPLOAD_DIR / 文件名)),臨時文件 (.part) 不處理
+        candidates: Dict[str, float] = {}
+        for entry in os.scandir(upload_dir):
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            mtime = entry.stat().st_mtime
+            if mtime < oldest:
+                candidates[str(upload_dir / entry.name)] = mtime
+
+        statuses: Dict[str, set] = {}
+        db = SessionLocal()
+        try:
+            paths = list(candidates)
+            for i in range(0, len(paths), HistoryCleanupService.CHUNK_SIZE):
+                chunk = paths[i:i + HistoryCleanupService.CHUNK_SIZE]
+                for path, status in db.query(AnalysisTask.file_path, AnalysisTask.status).filter(
+                    AnalysisTask.file_path.in_(chunk)
+                ).distinct():
+                    statuses.setdefault(path, set()).add(status)
+        finally:
+            db.close()
+
+        expired, orphaned = [], []
+        for path, mtime in candidates.items():
+            used_by = statuses.get(path)
+            if not used_by:
+                if orphaned_before is not None and mtime < orphaned_before:
+                    orphaned.append(path)
+            elif expired_before is not None and mtime < expired_before \
+                    and used_by <= set(HistoryCleanupService.PURGEABLE_STATUSES):
+                expired.append(path)
+
+        janitor = get_file_janitor()
+        return {"expired": janitor.discard(expired), "orphaned": janitor.discard(orphaned)}
+
+    @staticmethod
+    async def run_once(
+        archive_days: Optional[int] = None,
+        upload_days: Optional[int] = None,
+        orphan_hours: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Apply the retention tiers once
+
+        Args:
+            archive_days: Archive finished tasks older than this (skip if None)
+            upload_days: Delete uploads of finished tasks older than this (skip if None)
+            orphan_hours: Delete unreferenced uploads older than this (skip if None)
+
+        Returns:
+            {"segments", "archived", "expired_uploads", "orphaned_uploads", "elapsed_ms"}
+        """
+        start = time.perf_counter()
+        outcome = {"segments": 0, "archived": 0}
+        if archive_days is not None:
+            archived = await RetentionService.archive(archive_days)
+            outcome = {"segments": archived["segments"], "archived": archived["archived"]}
+
+        loop = asyncio.get_event_loop()
+        swept = await loop.run_in_executor(None, RetentionService.sweep_uploads, upload_days, orphan_hours)
+
+        outcome.update({
+            "expired_uploads": swept["expired"],
+            "orphaned_uploads": swept["orphaned"],
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        })
+        if outcome["archived"] or swept["expired"] or swept["orphaned"]:
+            logger.info(
+                f"保留策略: 歸檔 {outcome['archived']} 個任務 ({outcome['segments']} 個分段),"
+                f"刪除過期上傳 {swept['expired']} 個、孤立上傳 {swept['orphaned']} 個"
+            )
+        return outcome
+
+    @staticmethod
+    async def run_policy(interval: Optional[float] = None):
+        """
+        Apply the configured retention tiers forever
+
+        Args:
+            interval: Seconds between runs (defaults to settings.RETENTION_INTERVAL_SECONDS)
+        """
+        interval = interval or settings.RETENTION_INTERVAL_SECONDS
+        while True:
+            try:
+                await RetentionService.run_once(
+                    settings.RETENTION_ARCHIVE_DAYS,
+                    settings.RETENTION_UPLOAD_DAYS,
+                    settings.RETENTION_ORPHAN_UPLOAD_HOURS
+                )
+            except Exception as e:
+                logger.error(f"保留策略執行失敗: {str(e)}")
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    def enabled() -> bool:
+        """Whether any retention tier is configured"""
+        return any(days is not None for days in (
+            settings.RETENTION_ARCHIVE_DAYS, settings.RETENTION_UPLOAD_DAYS, settings.RETENTION_ORPHAN_UPLOAD_HOURS
+        ))
+
+    @staticmethod
+    def get_archived(db: Session, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Full record of an archived task
+
+        Returns:
+            The task as AnalysisTask.to_dict() returned it when archived, plus
+            "archived": True and "archived_at"; None if the task is not archived
+        """
+        entry = db.query(ArchivedTask).filter(ArchivedTask.task_id == task_id).first()
+        if entry is None:
+            return None
+        segment = db.query(ArchiveSegment).filter(ArchiveSegment.id == entry.segment_id).first()
+        if segment is None:
+            return None
+
+        with open(Path(settings.ARCHIVE_DIR) / segment.filename, "rb") as f:
+            f.seek(entry.block_offset)
+            block = RetentionService._decompress(segment.codec, f.read(entry.block_length))
+        for line in block.decode("utf-8").splitlines():
+            record = json.loads(line)
+            if record.get("task_id") == task_id:
+                record.update({
+                    "archived": True,
+                    "archived_at": entry.archived_at.isoformat() if entry.archived_at else None,
+                })
+                return record
+        return None
@@ -0,0 +1,305 @@
+"""
+Versioned scoring rubric and bulk re-grading
+
+The LLM judges each dimension as a completion percentage, which does not
+depend on the rubric. Dimension scores, the total and the grade follow
+from those percentages and the rubric's weights and grade bands, so when
+QA publishes a new rubric version every stored result can be re-scored
+without calling the LLM again.
+
+Completed tasks are scored with the active (newest) version. A re-grade
+recomputes all completed tasks with one version set-based: the new totals
+of the tasks that have a percentage for every dimension are summed once
+into a temporary table, their dimension scores are rescaled in the
+dimension_scores table, then each task's total, grade (a CASE over the
+total) and result JSON are written in one row rewrite (json_set on SQLite,
+jsonb on PostgreSQL). Other tasks are left unchanged. Other databases
+re-score the results row by row.
+"""
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from ..core.rubric import DEFAULT_RUBRIC_VERSION, DIMENSION_WEIGHTS, GRADE_CRITERIA, apply_rubric
+from ..models.dimension import TaskDimensionScore
+from ..models.rubric import RubricVersion
+from ..models.task import AnalysisTask, TaskStatus
+
+logger = logging.getLogger(__name__)
+
+# Dialects re-graded with set-based SQL
+REGRADE_SQL_DIALECTS = ("sqlite", "postgresql")
+
+
+class RubricService:
+    """Rubric versions and re-grading of stored results"""
+
+    @staticmethod
+    def builtin() -> Dict[str, Any]:
+        """The built-in rubric (version 1)"""
+        return {
+            "version": DEFAULT_RUBRIC_VERSION,
+            "weights": dict(DIMENSION_WEIGHTS),
+            "grade_criteria": {grade: list(band) for grade, band in GRADE_CRITERIA.items()},
+            "note": "內建評分標準",
+            "created_at": None,
+            "regraded_at": None,
+        }
+
+    @staticmethod
+    def active(db: Session) -> Dict[str, Any]:
+        """The newest rubric version (the built-in rubric if none is stored)"""
+        rubric = db.query(RubricVersion).order_by(RubricVersion.version.desc()).first()
+        return rubric.to_dict() if rubric else RubricService.builtin()
+
+    @staticmethod
+    def get(db: Session, version: int) -> Optional[Dict[str, Any]]:
+        """A rubric version, or None if it does not exist"""
+        rubric = db.query(RubricVersion).filter(RubricVersion.version == version).first()
+        if rubric:
+            return rubric.to_dict()
+        return RubricService.builtin() if version == DEFAULT_RUBRIC_VERSION else None
+
+    @staticmethod
+    def list_versions(db: Session) -> List[Dict[str, Any]]:
+        """All rubric versions, newest first"""
+        versions = [rubric.to_dict() for rubric in db.query(RubricVersion).order_by(RubricVersion.version.desc())]
+        return versions or [RubricService.builtin()]
+
+    @staticmethod
+    def validate(weights: Dict[str, float], grade_criteria: Dict[str, Any]):
+        """
+        Check a rubric
+
+        Raises:
+            ValueError: Weights or grade bands are invalid
+        """
+        if not weights:
+            raise ValueError("至少需要一個評估維度")
+        for name, weight in weights.items():
+            if not name or '"' in name:
+                raise ValueError(f"無效的維度名稱: {name}")
+            if weight <= 0:
+                raise ValueError(f"維度權重必須大於 0: {name}")
+        if abs(sum(weights.values()) - 100) > 0.01:
+            raise ValueError(f"維度權重合計必須為 100 (目前為 {sum(weights.values()):g})")
+
+        if not grade_criteria:
+            raise ValueError("至少需要一個等級")
+        for grade, band in grade_criteria.items():
+            min_score, max_score, _ = band
+            if not grade or not 0 <= min_score <= max_score <= 100:
+                raise ValueError(f"無效的等級區間: {grade}")
+        if min(band[0] for band in grade_criteria.values()) > 0:
+            raise ValueError("最低的等級須從 0 分開始")
+
+    @staticmethod
+    def create(
+        db: Session,
+        weights: Dict[str, float],
+        grade_criteria: Optional[Dict[str, Tuple[float, float, str]]] = None,
+        note: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Publish a new rubric version, which becomes active
+
+        Args:
+            db: Database session
+            weights: Maximum score of each dimension (must add up to 100)
+            grade_criteria: {grade: (min_score, max_score, description)} (active bands if None)
+            note: What changed
+
+        Returns:
+            The new version
+
+        Raises:
+            ValueError: Weights or grade bands are invalid
+        """
+        active = RubricService.active(db)
+        grade_criteria = grade_criteria or active["grade_criteria"]
+        RubricService.validate(weights, grade_criteria)
+
+        latest = db.query(func.max(RubricVersion.version)).scalar() or DEFAULT_RUBRIC_VERSION
+        rubric = RubricVersion(
+            version=latest + 1,
+            weights={name: float(weight) for name, weight in weights.items()},
+            grade_criteria={grade: list(band) for grade, band in grade_criteria.items()},
+            note=note
+        )
+        db.add(rubric)
+        db.commit()
+        logger.info(f"已發布評分標準版本 {rubric.version}")
+        return rubric.to_dict()
+
+    @staticmethod
+    def apply(result: Dict[str, Any], rubric: Dict[str, Any]) -> Dict[str, Any]:
+        """Score a result with a rubric (unchanged if a dimension percentage is missing)"""
+        return apply_rubric(
+            result,
+            rubric["weights"],
+            {grade: tuple(band) for grade, band in rubric["grade_criteria"].items()},
+            rubric["version"]
+        )
+
+    @staticmethod
+    def regrade(db: Session, version: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Recompute dimension scores, total_score and grade of every completed task
+
+        Args:
+            db: Database session
+            version: Rubric version (the active one if None)
+
+        Returns:
+            {"version", "regraded", "skipped", "elapsed_ms"}; skipped tasks lack
+            a percentage for some dimension of the rubric and keep their scores
+
+        Raises:
+            ValueError: The version does not exist
+        """
+        rubric = RubricService.active(db) if version is None else RubricService.get(db, version)
+        if rubric is None:
+            raise ValueError(f"評分標準版本不存在: {version}")
+
+        start = time.perf_counter()
+        if db.get_bind().dialect.name in REGRADE_SQL_DIALECTS:
+            regraded = RubricService._regrade_sql(db, rubric)
+        else:
+            regraded = RubricService._regrade_rows(db, rubric)
+
+        db.query(RubricVersion).filter(RubricVersion.version == rubric["version"]).update(
+            {RubricVersion.regraded_at: datetime.now()}, synchronize_session=False
+        )
+        db.commit()
+
+        completed = db.query(func.count(AnalysisTask.id)).filter(
+            AnalysisTask.status == TaskStatus.COMPLETED.value
+        ).scalar()
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"已依評分標準版本 {rubric['version']} 重新評分 {regraded} 個任務 ({elapsed_ms} ms)")
+        return {
+            "version": rubric["version"],
+            "regraded": regraded,
+            "skipped": completed - regraded,
+            "elapsed_ms": elapsed_ms,
+        }
+
+    @staticmethod
+    def _regrade_sql(db: Session, rubric: Dict[str, Any]) -> int:
+        postgresql = db.get_bind().dialect.name == "postgresql"
+
+        def rounded(expression: str, digits: int) -> str:
+            if postgresql:
+                return f"ROUND(CAST({expression} AS NUMERIC), {digits})"
+            return f"ROUND({expression}, {digits})"
+
+        weights = list(rubric["weights"].items())
+        bands = sorted(rubric["grade_criteria"].items(), key=lambda item: item[1][0], reverse=True)
+        params: Dict[str, Any] = {
+            "version": rubric["version"],
+            "completed": TaskStatus.COMPLETED.value,
+            "dimension_count": len(weights),
+        }
+        for i, (name, weight) in enumerate(weights):
+            params[f"d{i}"] = name
+            params[f"w{i}"] = float(weight)
+        for i, (grade, band) in enumerate(bands):
+            params[f"g{i}"] = grade
+            params[f"m{i}"] = float(band[0])
+
+        names = ", ".join(f":d{i}" for i in range(len(weights)))
+        weight = "CASE dimension " + " ".join(f"WHEN :d{i} THEN :w{i}" for i in range(len(weights))) + " END"
+        grade = f":g{len(bands) - 1}"
+        if len(bands) > 1:
+            grade = "CASE " + " ".join(
+                f"WHEN totals.total >= :m{i} THEN :g{i}" for i in range(len(bands) - 1)
+            ) + f" ELSE {grade} END"
+
+        # result JSON 的總分、等級、版本與各維度分數在第 3 步的同一次改寫中更新
+        # (維度名稱經 json_each 解碼後比對,不受 JSON 中 \u 跳脫的影響)
+        if postgresql:
+            dimensions = """(
+                SELECT jsonb_object_agg(e.key, CASE WHEN ds.score IS NULL THEN e.value
+                    ELSE e.value || jsonb_build_object('score', ds.score, 'percentage', ds.percentage) END)
+                FROM jsonb_each(CAST(analysis_tasks.result AS JSONB) -> 'dimension_scores') AS e
+                LEFT JOIN dimension_scores ds ON ds.task_id = analysis_tasks.id AND ds.dimension = e.key
+            )"""
+            result = (
+                "CAST(CAST(result AS JSONB) || jsonb_build_object('total_score', totals.total, "
+                f"'grade', {grade}, 'rubric_version', CAST(:version AS INTEGER), 'dimension_scores', {dimensions}) AS JSON)"
+            )
+        else:
+            dimensions = """(
+                SELECT json_group_object(e.key, CASE WHEN ds.score IS NULL THEN json(e.value)
+                    ELSE json_set(e.value, '$.score', ds.score, '$.percentage', ds.percentage) END)
+                FROM json_each(analysis_tasks.result, '$.dimension_scores') AS e
+                LEFT JOIN dimension_scores ds ON ds.task_id = analysis_tasks.id AND ds.dimension = e.key
+            )"""
+            result = (
+                f"json_set(result, '$.total_score', totals.total, '$.grade', {grade}, "
+                f"'$.rubric_version', :version, '$.dimension_scores', {dimensions})"
+            )
+
+        # 1. 重新評分的任務 (已完成且所有維度都有完成度) 與新總分 (各維度完成度 × 新權重之和),
+        # 只計算一次;其餘任務的維度分數、總分與等級都保持不變
+        db.execute(text("DROP TABLE IF EXISTS regrade_totals"))
+        db.execute(text(f"""
+            CREATE TEMPORARY TABLE regrade_totals AS
+            SELECT scores.task_id AS task_id, {rounded(f"SUM(scores.percentage * {weight}) / 100.0", 1)} AS total
+            FROM dimension_scores AS scores
+            JOIN analysis_tasks ON analysis_tasks.id = scores.task_id
+            WHERE analysis_tasks.status = :completed
+                AND scores.dimension IN ({names}) AND scores.percentage IS NOT NULL
+            GROUP BY scores.task_id
+            HAVING COUNT(DISTINCT scores.dimension) = :dimension_count
+        """), params)
+        try:
+            # 2. 維度分數 = 完成度 × 新權重
+            db.execute(text(f"""
+                UPDATE dimension_scores
+                SET weight = {weight}, score = {rounded(f"percentage * {weight} / 100.0", 2)}
+                WHERE dimension IN ({names}) AND percentage IS NOT NULL
+                    AND task_id IN (SELECT task_id FROM regrade_totals)
+            """), params)
+
+            # 3. 總分、等級與 result JSON
+            return db.execute(text(f"""
+                UPDATE analysis_tasks
+                SET total_score = totals.total, grade = {grade}, rubric_version = :version, result = {result}
+                FROM regrade_totals AS totals
+                WHERE analysis_tasks.id = totals.task_id AND analysis_tasks.status = :completed
+            """), params).rowcount
+        finally:
+            db.execute(text("DROP TABLE IF EXISTS regrade_totals"))
+
+    @staticmethod
+    def _regrade_rows(db: Session, rubric: Dict[str, Any]) -> int:
+        regraded = 0
+        last_id = ""
+        while True:
+            tasks = db.query(AnalysisTask).filter(
+                AnalysisTask.id > last_id,
+                AnalysisTask.status == TaskStatus.COMPLETED.value,
+                AnalysisTask.result.isnot(None)
+            ).order_by(AnalysisTask.id).limit(1000).all()
+            if not tasks:
+                return regraded
+            for task in tasks:
+                result = RubricService.apply(task.result, rubric)
+                if result is task.result:
+                    continue
+                task.result = result
+                task.total_score, task.grade = AnalysisTask.extract_score(result)
+                task.rubric_version = rubric["version"]
+                db.query(TaskDimensionScore).filter(
+                    TaskDimensionScore.task_id == task.id
+                ).delete(synchronize_session=False)
+                for row in TaskDimensionScore.rows_from(task.id, result, task.completed_at, rubric["weights"]):
+                    db.add(TaskDimensionScore(**row))
+                regraded += 1
+            db.flush()
+            last_id = tasks[-1].id
@@ -0,0 +1,203 @@
+"""
+Full-text search over finished analyses
+
+Each completed or failed task has a TaskSearchDocument holding its
+filename, extracted report text, result summary and commentary (dimension
+comments, strengths, improvements, error). On SQLite the documents are
+indexed by the task_search FTS5 table with the trigram tokenizer, which
+matches Chinese text without word segmentation: results are ranked with
+bm25 and highlighted with snippet(). Trigram matching needs at least three
+characters, so shorter terms (common for Chinese failure modes such as
+"短路"), other databases and SQLite builds without FTS5 or the trigram
+tokenizer (the index is not created there) use LIKE over the documents
+instead.
+
+Snippets are HTML-escaped with matches wrapped in <mark></mark>.
+"""
+import html
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, or_, text
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models.search import TaskSearchDocument
+from ..models.task import AnalysisTask
+
+# Characters around a match in LIKE snippets
+SNIPPET_CONTEXT = 40
+
+# bm25 weights of filename, report_text, summary, commentary
+COLUMN_WEIGHTS = (8.0, 1.0, 4.0, 2.0)
+
+# Private-use markers passed to snippet(), replaced after escaping
+_OPEN, _CLOSE, _ELLIPSIS = "\ue000", "\ue001", "\ue002"
+
+
+class SearchService:
+    """Indexes finished tasks and runs ranked searches"""
+
+    # Shortest term the trigram index can match
+    MIN_FTS_TERM = 3
+
+    _lock = threading.Lock()
+    _has_index: Optional[bool] = None
+
+    @staticmethod
+    def index_task(db: Session, task: AnalysisTask, report_text: Optional[str] = None):
+        """
+        Add or refresh the search document of a task (committed by the caller)
+
+        Args:
+            db: Database session
+            task: Task that just completed or failed
+            report_text: Text extracted from the report (kept from an earlier document if None)
+        """
+        texts = TaskSearchDocument.texts_from(task, report_text, settings.SEARCH_MAX_REPORT_CHARS)
+        document = db.query(TaskSearchDocument).filter(TaskSearchDocument.task_id == task.id).first()
+        if document is None:
+            db.add(TaskSearchDocument(task_id=task.id, **texts))
+            return
+        if texts["report_text"] is None:
+            texts.pop("report_text")
+        for key, value in texts.items():
+            setattr(document, key, value)
+
+    @staticmethod
+    def terms(query: str) -> List[str]:
+        """Whitespace-separated terms of a query, all of which must match"""
+        return [term for term in query.replace('"', " ").split() if term]
+
+    @staticmethod
+    def search(db: Session, query: str, limit: int = 20, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Search finished tasks
+
+        Args:
+            db: Database session
+            query: Search terms (all must match, in any searchable field)
+            limit: Maximum results
+            status: Only tasks with this status
+
+        Returns:
+            Matching tasks, best match first, each with a highlighted snippet
+        """
+        terms = SearchService.terms(query)
+        if not terms:
+            return []
+        fts_terms = [term for term in terms if len(term) >= SearchService.MIN_FTS_TERM]
+        if fts_terms and SearchService.has_index(db):
+            like_terms = [term for term in terms if len(term) < SearchService.MIN_FTS_TERM]
+            return SearchService._fts_search(db, fts_terms, like_terms, limit, status)
+        return SearchService._like_search(db, terms, limit, status)
+
+    @classmethod
+    def has_index(cls, db: Session) -> bool:
+        """Whether the task_search FTS5 index exists (checked once per process)"""
+        with cls._lock:
+            if cls._has_index is None:
+                cls._has_index = db.get_bind().dialect.name == "sqlite" and db.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'task_search'"
+                )).first() is not None
+            return cls._has_index
+
+    @staticmethod
+    def _fts_search(
+        db: Session, fts_terms: List[str], like_terms: List[str], limit: int, status: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        params: Dict[str, Any] = {
+            "match": " ".join(f'"{term}"' for term in fts_terms),
+            "limit": limit,
+            "open": _OPEN,
+            "close": _CLOSE,
+            "ellipsis": _ELLIPSIS,
+        }
+        conditions = ["task_search MATCH :match"]
+        if status:
+            conditions.append("t.status = :status")
+            params["status"] = status
+        for i, term in enumerate(like_terms):
+            params[f"like{i}"] = f"%{term}%"
+            conditions.append("(" + " OR ".join(
+                f"d.{column} LIKE :like{i}" for column in ("filename", "report_text", "summary", "commentary")
+            ) + ")")
+
+        weights = ", ".join(str(weight) for weight in COLUMN_WEIGHTS)
+        rows = db.execute(text(f"""
+            SELECT t.id, t.filename, t.status, t.total_score, t.grade, t.created_at,
+                   bm25(task_search, {weights}) AS rank,
+                   snippet(task_search, -1, :open, :close, :ellipsis, 24) AS snippet
+            FROM task_search
+            JOIN task_search_docs d ON d.id = task_search.rowid
+            JOIN analysis_tasks t ON t.id = d.task_id
+            WHERE {" AND ".join(conditions)}
+            ORDER BY rank
+            LIMIT :limit
+        """), params).all()
+
+        return [{
+            "task_id": row.id,
+            "filename": row.filename,
+            "status": row.status,
+            "total_score": row.total_score,
+            "grade": row.grade,
+            "created_at": row.created_at,
+            "rank": -row.rank,  # bm25 is lower for better matches
+            "snippet": SearchService._render(row.snippet or ""),
+        } for row in rows]
+
+    @staticmethod
+    def _like_search(db: Session, terms: List[str], limit: int, status: Optional[str]) -> List[Dict[str, Any]]:
+        columns = (
+            TaskSearchDocument.filename, TaskSearchDocument.summary,
+            TaskSearchDocument.commentary, TaskSearchDocument.report_text,
+        )
+        query = db.query(TaskSearchDocument, AnalysisTask).join(
+            AnalysisTask, AnalysisTask.id == TaskSearchDocument.task_id
+        ).filter(and_(*[
+            or_(*[column.like(f"%{term}%") for column in columns]) for term in terms
+        ]))
+        if status:
+            query = query.filter(AnalysisTask.status == status)
+        rows = query.order_by(AnalysisTask.created_at.desc()).limit(limit).all()
+
+        return [{
+            "task_id": task.id,
+            "filename": task.filename,
+            "status": task.status,
+            "total_score": task.total_score,
+            "grade": task.grade,
+            "created_at": task.created_at,
+            "rank": None,
+            "snippet": SearchService._like_snippet(document, terms),
+        } for document, task in rows]
+
+    @staticmethod
+    def _like_snippet(document: TaskSearchDocument, terms: List[str]) -> str:
+        """Context around the first match, in field priority order"""
+        for value in (document.summary, document.commentary, document.report_text, document.filename):
+            if not value:
+                continue
+            lowered = value.lower()
+            positions = [lowered.find(term.lower()) for term in terms]
+            positions = [position for position in positions if position >= 0]
+            if not positions:
+                continue
+            start = max(0, min(positions) - SNIPPET_CONTEXT)
+            end = min(len(value), min(positions) + SNIPPET_CONTEXT * 2)
+            excerpt = value[start:end]
+            pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+            excerpt = pattern.sub(lambda m: f"{_OPEN}{m.group(0)}{_CLOSE}", excerpt)
+            return SearchService._render(
+                (_ELLIPSIS if start > 0 else "") + excerpt + (_ELLIPSIS if end < len(value) else "")
+            )
+        return ""
+
+    @staticmethod
+    def _render(snippet: str) -> str:
+        """Escape a snippet and turn the markers into <mark> tags"""
+        return html.escape(snippet.replace("\n", " ")).replace(_OPEN, "<mark>").replace(
+            _CLOSE, "</mark>"
+        ).replace(_ELLIPSIS, "…")
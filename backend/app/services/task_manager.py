@@ -1,7 +1,11 @@
 from sqlalchemy.orm import Session
+from ..models.dimension import TaskDimensionScore
 from ..models.task import AnalysisTask, TaskStatus
+from .rubric import RubricService
+from .search import SearchService
+from .webhook import WebhookService
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 
 
 class TaskManager:
@@ -19,14 +23,46 @@ class TaskManager:
             message: Progress message
         """
         task = db.query(AnalysisTask).filter(AnalysisTask.id == task_id).first()
-        if task:
+        if task and task.status in (TaskStatus.PENDING.value, TaskStatus.PROCESSING.value):
             task.progress = progress
             task.message = message
             task.status = TaskStatus.PROCESSING.value if progress < 100 else task.status
             db.commit()
 
     @staticmethod
-    def mark_completed(db: Session, task_id: str, result: Dict[str, Any]):
+    def checkpoint_progress(db: Session, updates: Dict[str, Tuple[int, str]]) -> int:
+        """
+        Persist coalesced progress of running tasks in one transaction
+
+        Args:
+            db: Database session
+            updates: {task_id: (progress, message)}
+
+        Returns:
+            Number of tasks updated (finished or cancelled tasks are skipped)
+        """
+        count = 0
+        for task_id, (progress, message) in updates.items():
+            count += db.query(AnalysisTask).filter(
+                AnalysisTask.id == task_id,
+                AnalysisTask.status == TaskStatus.PROCESSING.value
+            ).update({
+                AnalysisTask.progress: progress,
+                AnalysisTask.message: message,
+            }, synchronize_session=False)
+        db.commit()
+        return count
+
+    @staticmethod
+    def mark_completed(
+        db: Session,
+        task_id: str,
+        result: Dict[str, Any],
+        telemetry: Optional[Dict[str, Any]] = None,
+        lease_owner: Optional[str] = None,
+        message: Optional[str] = None,
+        report_text: Optional[str] = None
+    ) -> bool:
         """
         Mark task as completed
 
@@ -34,17 +70,64 @@ class TaskManager:
             db: Database session
             task_id: Task ID
             result: Analysis result dictionary
+            telemetry: LLM call telemetry
+            lease_owner: Queue worker holding the task lease (only the holder may finish it)
+            message: Final progress message
+            report_text: Text extracted from the report, indexed for search
+
+        Returns:
+            Whether the task was updated
         """
-        task = db.query(AnalysisTask).filter(AnalysisTask.id == task_id).first()
-        if task:
-            task.status = TaskStatus.COMPLETED.value
-            task.progress = 100
-            task.result = result
-            task.completed_at = datetime.now()
-            db.commit()
+        # 依目前的評分標準計算維度分數、總分與等級
+        rubric = RubricService.active(db)
+        result = RubricService.apply(result, rubric)
+        total_score, grade = AnalysisTask.extract_score(result)
+        values = {
+            AnalysisTask.status: TaskStatus.COMPLETED.value,
+            AnalysisTask.progress: 100,
+            AnalysisTask.result: result,
+            AnalysisTask.total_score: total_score,
+            AnalysisTask.grade: grade,
+            AnalysisTask.rubric_version: result.get("rubric_version") if isinstance(result, dict) else None,
+            AnalysisTask.telemetry: telemetry,
+            AnalysisTask.completed_at: datetime.now(),
+        }
+        if message is not None:
+            values[AnalysisTask.message] = message
+        task = TaskManager._finish(db, task_id, lease_owner, values)
+        if not task:
+            return False
+        TaskManager.record_dimension_scores(db, task, rubric["weights"])
+        SearchService.index_task(db, task, report_text)
+        WebhookService.schedule(db, task)
+        db.commit()
+        return True
+
+    @staticmethod
+    def record_dimension_scores(db: Session, task: AnalysisTask, weights: Optional[Dict[str, float]] = None):
+        """
+        Replace the dimension_scores rows of a completed task (committed by the caller)
+
+        Args:
+            db: Database session
+            task: Task whose result was just written
+            weights: Rubric weights the result was scored with
+        """
+        db.query(TaskDimensionScore).filter(
+            TaskDimensionScore.task_id == task.id
+        ).delete(synchronize_session=False)
+        for row in TaskDimensionScore.rows_from(task.id, task.result, task.completed_at, weights):
+            db.add(TaskDimensionScore(**row))
 
     @staticmethod
-    def mark_failed(db: Session, task_id: str, error: str):
+    def mark_failed(
+        db: Session,
+        task_id: str,
+        error: str,
+        telemetry: Optional[Dict[str, Any]] = None,
+        lease_owner: Optional[str] = None,
+        report_text: Optional[str] = None
+    ) -> bool:
         """
         Mark task as failed
 
@@ -52,11 +135,103 @@ class TaskManager:
             db: Database session
             task_id: Task ID
             error: Error message
+            telemetry: LLM call telemetry collected before the failure
+            lease_owner: Queue worker holding the task lease (only the holder may finish it)
+            report_text: Text extracted from the report, indexed for search
+
+        Returns:
+            Whether the task was updated
+        """
+        values = {AnalysisTask.status: TaskStatus.FAILED.value, AnalysisTask.error: error}
+        if telemetry:
+            values[AnalysisTask.telemetry] = telemetry
+        task = TaskManager._finish(db, task_id, lease_owner, values)
+        if not task:
+            return False
+        SearchService.index_task(db, task, report_text)
+        WebhookService.schedule(db, task)
+        db.commit()
+        return True
+
+    @staticmethod
+    def _finish(
+        db: Session, task_id: str, lease_owner: Optional[str], values: Dict[Any, Any]
+    ) -> Optional[AnalysisTask]:
+        """
+        Move a task to a final status unless it was cancelled or its lease lost
+
+        The checks are part of the UPDATE (like cancel), so a cancel committed
+        after the caller read the task makes this a no-op instead of being
+        overwritten. Side effects (dimension scores, search index, webhook)
+        are written by the caller only when the task is returned.
+
+        Returns:
+            The updated task, or None if it may no longer be finished
+        """
+        query = db.query(AnalysisTask).filter(
+            AnalysisTask.id == task_id,
+            AnalysisTask.status != TaskStatus.CANCELLED.value
+        )
+        if lease_owner:
+            query = query.filter(
+                AnalysisTask.lease_owner == lease_owner,
+                AnalysisTask.status == TaskStatus.PROCESSING.value
+            )
+        updated = query.update({
+            **values,
+            AnalysisTask.lease_owner: None,
+            AnalysisTask.lease_expires_at: None,
+        }, synchronize_session=False)
+        if not updated:
+            return None
+        return db.query(AnalysisTask).populate_existing().filter(AnalysisTask.id == task_id).first()
+
+    @staticmethod
+    def cancel(db: Session, task_id: str) -> bool:
+        """
+        Cancel a pending or processing task
+
+        The status check is part of the UPDATE, so a task that completes at
+        the same moment is either cancelled or completed, never both.
+
+        Args:
+            db: Database session
+            task_id: Task ID
+
+        Returns:
+            Whether the task was cancelled
+        """
+        cancelled = db.query(AnalysisTask).filter(
+            AnalysisTask.id == task_id,
+            AnalysisTask.status.in_([TaskStatus.PENDING.value, TaskStatus.PROCESSING.value])
+        ).update({
+            AnalysisTask.status: TaskStatus.CANCELLED.value,
+            AnalysisTask.error: "任務已被用戶取消",
+            AnalysisTask.message: "任務已被用戶取消",
+            AnalysisTask.completed_at: datetime.now(),
+            AnalysisTask.lease_owner: None,
+            AnalysisTask.lease_expires_at: None,
+        }, synchronize_session=False)
+        if cancelled:
+            task = db.query(AnalysisTask).populate_existing().filter(AnalysisTask.id == task_id).first()
+            WebhookService.schedule(db, task)
+        db.commit()
+        return bool(cancelled)
+
+    @staticmethod
+    def record_routing(db: Session, task_id: str, routing: Dict[str, Any]):
+        """
+        Record the model routing decision of a task
+
+        Args:
+            db: Database session
+            task_id: Task ID
+            routing: Routing decision (the chosen model becomes the task model)
         """
         task = db.query(AnalysisTask).filter(AnalysisTask.id == task_id).first()
         if task:
-            task.status = TaskStatus.FAILED.value
-            task.error = error
+            task.routing = routing
+            task.model = routing["model"]
             db.commit()
 
     @staticmethod
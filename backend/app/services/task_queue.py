@@ -0,0 +1,332 @@
+"""
+Durable analysis task queue
+
+Queued work lives in the analysis_tasks table instead of process memory:
+a worker claims a pending task with a conditional UPDATE, holds a lease
+that it renews while the task runs, and a task whose lease expires (the
+worker crashed or was restarted) is put back in the queue.
+
+Claims follow priority (urgent, normal, low); within a priority the
+submitter with the fewest running tasks goes first, so one large
+submission cannot starve everyone else. Low-priority tasks can be held
+back to the OFFPEAK_WINDOWS.
+"""
+import logging
+from datetime import datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from cryptography.fernet import InvalidToken
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..core.security import get_security_manager
+from ..models.task import AnalysisTask, TaskPriority, TaskStatus
+from .webhook import WebhookService
+
+logger = logging.getLogger(__name__)
+
+
+class TaskQueue:
+    """Database-backed task queue with leases"""
+
+    # Pending tasks inspected per claim attempt (another worker may win some of them)
+    CLAIM_CANDIDATES = 5
+
+    # Claim order of the priority classes
+    PRIORITY_RANK = {
+        TaskPriority.URGENT.value: 0,
+        TaskPriority.NORMAL.value: 1,
+        TaskPriority.LOW.value: 2,
+    }
+
+    @staticmethod
+    def enqueue(db: Session, task: AnalysisTask, config: Dict[str, Any]) -> AnalysisTask:
+        """
+        Store the run configuration of a new task and make it claimable
+
+        Args:
+            db: Database session
+            task: Pending analysis task
+            config: Run configuration (the API key is stored encrypted)
+
+        Returns:
+            The queued task
+        """
+        options = dict(config)
+        if options.get("api_key"):
+            options["api_key"] = get_security_manager().encrypt(options["api_key"])
+
+        task.options = options
+        task.status = TaskStatus.PENDING.value
+        task.attempts = 0
+        db.add(task)
+        db.commit()
+        db.refresh(task)
+        return task
+
+    @staticmethod
+    def load_config(task: AnalysisTask) -> Dict[str, Any]:
+        """
+        Run configuration of a claimed task
+
+        Tasks queued before the queue existed have no options; they run with
+        the backend, model and image settings recorded on the task.
+
+        Args:
+            task: Analysis task
+
+        Returns:
+            Run configuration with the API key decrypted
+        """
+        if not task.options:
+            return {
+                "backend": task.backend,
+                "model": None if task.model == "auto" else task.model,
+                "skip_images": bool(task.skip_images),
+                "image_token_budget": settings.IMAGE_TOKEN_BUDGET,
+            }
+
+        config = dict(task.options)
+        if config.get("api_key"):
+            try:
+                config["api_key"] = get_security_manager().decrypt(config["api_key"])
+            except InvalidToken:
+                raise ValueError("無法解密任務的 API Key,API 伺服器與 worker 必須使用相同的 ENCRYPTION_KEY")
+        return config
+
+    @staticmethod
+    def _lease_deadline() -> datetime:
+        return datetime.now() + timedelta(seconds=settings.TASK_LEASE_SECONDS)
+
+    @staticmethod
+    def parse_windows(raw: Optional[str]) -> List[Tuple[time, time]]:
+        """
+        Parse off-peak windows
+
+        Args:
+            raw: Comma separated "HH:MM-HH:MM" windows; a window may wrap past midnight
+
+        Returns:
+            List of (start, end) times
+        """
+        windows = []
+        for part in (raw or "").split(","):
+            part = part.strip()
+            if not part:
+                continue
+            try:
+                start, end = part.split("-")
+                windows.append((
+                    datetime.strptime(start.strip(), "%H:%M").time(),
+                    datetime.strptime(end.strip(), "%H:%M").time()
+                ))
+            except ValueError:
+                logger.warning(f"離峰時段格式無效,已忽略: {part}")
+        return windows
+
+    @staticmethod
+    def is_offpeak(now: Optional[datetime] = None) -> bool:
+        """
+        Whether low-priority tasks may run now
+
+        Always true when OFFPEAK_WINDOWS is not configured.
+        """
+        windows = TaskQueue.parse_windows(settings.OFFPEAK_WINDOWS)
+        if not windows:
+            return True
+        current = (now or datetime.now()).time()
+        for start, end in windows:
+            if start <= end:
+                if start <= current < end:
+                    return True
+            elif current >= start or current < end:
+                return True
+        return False
+
+    @staticmethod
+    def _schedule(db: Session, backends: Optional[List[str]] = None) -> List[str]:
+        """
+        Pending task IDs in claim order
+
+        Groups pending tasks by (priority, submitter), orders the groups by
+        priority, then by the submitter's running tasks, then by the age of
+        the group's oldest task, and takes the oldest task of each group.
+
+        Args:
+            db: Database session
+            backends: Only consider tasks for these backends (all if None)
+
+        Returns:
+            Up to CLAIM_CANDIDATES task IDs
+        """
+        priority = func.coalesce(AnalysisTask.priority, TaskPriority.NORMAL.value)
+        pending = [
+            AnalysisTask.status == TaskStatus.PENDING.value,
+            AnalysisTask.batch_id.is_(None)
+        ]
+        if backends:
+            pending.append(AnalysisTask.backend.in_(backends))
+        if not TaskQueue.is_offpeak():
+            pending.append(priority != TaskPriority.LOW.value)
+
+        groups = db.query(
+            priority, AnalysisTask.submitter, func.min(AnalysisTask.created_at)
+        ).filter(*pending).group_by(priority, AnalysisTask.submitter).all()
+        if not groups:
+            return []
+
+        running = dict(db.query(
+            AnalysisTask.submitter, func.count(AnalysisTask.id)
+        ).filter(
+            AnalysisTask.status == TaskStatus.PROCESSING.value
+        ).group_by(AnalysisTask.submitter).all())
+
+        groups.sort(key=lambda g: (
+            TaskQueue.PRIORITY_RANK.get(g[0], 1), running.get(g[1], 0), g[2]
+        ))
+
+        candidates = []
+        for group_priority, submitter, _ in groups[:TaskQueue.CLAIM_CANDIDATES]:
+            task_id = db.query(AnalysisTask.id).filter(
+                *pending,
+                priority == group_priority,
+                AnalysisTask.submitter.is_(None) if submitter is None else AnalysisTask.submitter == submitter
+            ).order_by(AnalysisTask.created_at).limit(1).scalar()
+            if task_id:
+                candidates.append(task_id)
+        return candidates
+
+    @staticmethod
+    def claim(db: Session, owner: str, backends: Optional[List[str]] = None) -> Optional[AnalysisTask]:
+        """
+        Claim the next pending task by priority and fair share
+
+        The status check is part of the UPDATE, so when several workers race
+        for the same task exactly one of them gets it.
+
+        Args:
+            db: Database session
+            owner: Worker identifier
+            backends: Only claim tasks for these backends (all if None)
+
+        Returns:
+            Claimed task, or None if nothing is claimable
+        """
+        for task_id in TaskQueue._schedule(db, backends):
+            claimed = db.query(AnalysisTask).filter(
+                AnalysisTask.id == task_id,
+                AnalysisTask.status == TaskStatus.PENDING.value
+            ).update({
+                AnalysisTask.status: TaskStatus.PROCESSING.value,
+                AnalysisTask.lease_owner: owner,
+                AnalysisTask.lease_expires_at: TaskQueue._lease_deadline(),
+                AnalysisTask.attempts: func.coalesce(AnalysisTask.attempts, 0) + 1,
+            }, synchronize_session=False)
+            db.commit()
+            if claimed:
+                return db.query(AnalysisTask).filter(AnalysisTask.id == task_id).first()
+
+        return None
+
+    @staticmethod
+    def heartbeat(db: Session, task_id: str, owner: str) -> bool:
+        """
+        Renew the lease of a running task
+
+        Args:
+            db: Database session
+            task_id: Task ID
+            owner: Worker identifier
+
+        Returns:
+            False if the worker no longer holds the task (lease expired and requeued, or cancelled)
+        """
+        renewed = db.query(AnalysisTask).filter(
+            AnalysisTask.id == task_id,
+            AnalysisTask.lease_owner == owner,
+            AnalysisTask.status == TaskStatus.PROCESSING.value
+        ).update({
+            AnalysisTask.lease_expires_at: TaskQueue._lease_deadline()
+        }, synchronize_session=False)
+        db.commit()
+        return bool(renewed)
+
+    @staticmethod
+    def release(db: Session, task_id: str, owner: str):
+        """
+        Put a task back in the queue without counting the attempt (worker shutdown)
+
+        Args:
+            db: Database session
+            task_id: Task ID
+            owner: Worker identifier
+        """
+        db.query(AnalysisTask).filter(
+            AnalysisTask.id == task_id,
+            AnalysisTask.lease_owner == owner,
+            AnalysisTask.status == TaskStatus.PROCESSING.value
+        ).update({
+            AnalysisTask.status: TaskStatus.PENDING.value,
+            AnalysisTask.lease_owner: None,
+            AnalysisTask.lease_expires_at: None,
+            AnalysisTask.attempts: AnalysisTask.attempts - 1,
+            AnalysisTask.progress: 0,
+            AnalysisTask.message: "",
+        }, synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    def requeue_expired(db: Session) -> int:
+        """
+        Requeue processing tasks whose lease expired
+
+        Tasks left in processing without a lease (started before the queue
+        existed) count as expired. Tasks that reached TASK_MAX_ATTEMPTS are
+        marked failed instead.
+
+        Args:
+            db: Database session
+
+        Returns:
+            Number of tasks requeued or failed
+        """
+        now = datetime.now()
+        is_expired = [
+            AnalysisTask.status == TaskStatus.PROCESSING.value,
+            AnalysisTask.batch_id.is_(None),
+            or_(AnalysisTask.lease_expires_at.is_(None), AnalysisTask.lease_expires_at < now)
+        ]
+        expired = db.query(
+            AnalysisTask.id, AnalysisTask.attempts, AnalysisTask.lease_owner
+        ).filter(*is_expired).all()
+
+        count = 0
+        for task_id, attempts, lease_owner in expired:
+            if (attempts or 0) >= settings.TASK_MAX_ATTEMPTS:
+                values = {
+                    AnalysisTask.status: TaskStatus.FAILED.value,
+                    AnalysisTask.error: f"任務執行中斷 {attempts} 次,已停止重試",
+                }
+                logger.warning(f"任務 {task_id} 租約過期且已達最大嘗試次數,標記為失敗")
+            else:
+                values = {
+                    AnalysisTask.status: TaskStatus.PENDING.value,
+                    AnalysisTask.progress: 0,
+                    AnalysisTask.message: "任務執行中斷,重新排隊",
+                }
+                logger.warning(f"任務 {task_id} 租約過期 (worker: {lease_owner}),重新排隊")
+            values[AnalysisTask.lease_owner] = None
+            values[AnalysisTask.lease_expires_at] = None
+
+            # 條件更新: 其他 worker 可能已先一步重新排隊並認領此任務
+            updated = db.query(AnalysisTask).filter(
+                AnalysisTask.id == task_id, *is_expired
+            ).update(values, synchronize_session=False)
+            if updated and values[AnalysisTask.status] == TaskStatus.FAILED.value:
+                task = db.query(AnalysisTask).populate_existing().filter(AnalysisTask.id == task_id).first()
+                WebhookService.schedule(db, task)
+            count += updated
+
+        db.commit()
+        return count
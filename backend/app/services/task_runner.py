@@ -0,0 +1,360 @@
+"""
+Queue worker for analysis tasks
+
+TaskRunner executes one claimed task while renewing its lease;
+TaskDispatcher keeps up to `concurrency` tasks running by claiming from
+the durable queue and periodically requeues tasks with expired leases.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from ..config import settings
+from ..database import SessionLocal, get_db_writer
+from ..core.fa_analyzer_core import AnalysisCancelled
+from ..models.task import AnalysisTask, TaskStatus
+from .admission import AdmissionController
+from .analyzer import FAReportAnalyzerService
+from .model_router import ModelRouter
+from .pipeline import get_pipeline
+from .progress import get_progress_registry
+from .rubric import RubricService
+from .task_manager import TaskManager
+from .task_queue import TaskQueue
+
+logger = logging.getLogger(__name__)
+
+
+class TaskRunner:
+    """Runs a single claimed analysis task"""
+
+    @staticmethod
+    async def _keep_lease(task_id: str, owner: str):
+        """Renew the task lease until cancelled"""
+        interval = max(1, settings.TASK_LEASE_SECONDS // 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await get_db_writer().submit(TaskQueue.heartbeat, task_id, owner):
+                    logger.warning(f"任務 {task_id} 的租約已失效,結果將不會寫入")
+                    return
+            except Exception as e:
+                logger.error(f"任務 {task_id} 租約續期失敗: {str(e)}")
+
+    @staticmethod
+    def _load(task_id: str) -> Tuple[AnalysisTask, Dict[str, Any], int, Dict[str, Any]]:
+        """The claimed task (detached), its run configuration, the expected service time and the active rubric"""
+        db = SessionLocal()
+        try:
+            task = db.query(AnalysisTask).filter(AnalysisTask.id == task_id).first()
+            config = TaskQueue.load_config(task)
+            service_ms = AdmissionController.service_ms(db, config["backend"], task.model)
+            rubric = RubricService.active(db)
+            db.expunge(task)
+            return task, config, service_ms, rubric
+        finally:
+            db.close()
+
+    @staticmethod
+    async def run(task_id: str, owner: str, analyzer: Optional[FAReportAnalyzerService] = None):
+        """
+        Execute a claimed task
+
+        Args:
+            task_id: Task ID
+            owner: Worker identifier holding the lease
+            analyzer: Analysis service (the dispatcher keeps it to cancel the task)
+        """
+        writer = get_db_writer()
+        analyzer = analyzer or FAReportAnalyzerService()
+        registry = get_progress_registry()
+        telemetry = {}
+        lease_keeper = asyncio.create_task(TaskRunner._keep_lease(task_id, owner))
+        loop = asyncio.get_event_loop()
+
+        try:
+            logger.info(f"開始分析任務: {task_id} (worker: {owner})")
+
+            # 讀取任務與配置不阻塞事件迴圈
+            task, config, service_ms, rubric = await loop.run_in_executor(None, TaskRunner._load, task_id)
+            # 排隊等待時間: 從任務創建到開始處理
+            telemetry["queue_wait_ms"] = int((datetime.now() - task.created_at).total_seconds() * 1000)
+            telemetry["attempt"] = task.attempts
+            file_path = task.file_path
+
+            # 記錄分析配置
+            backend = config["backend"]
+            model = config.get("model") or "auto"
+            base_url = config.get("base_url")
+            skip_images = config.get("skip_images", False)
+
+            logger.info(f"✓ 使用 {backend.upper()} 後端: {model}")
+            if base_url:
+                logger.info(f"✓ Base URL: {base_url}")
+            if skip_images:
+                logger.info(f"✓ 跳過圖片分析")
+
+            # 未指定模型時依報告特徵選擇模型層級
+            model_router = None
+            if config.get("auto_route"):
+                model_router = ModelRouter.from_config(config.get("routing_tiers"))
+
+            # 進度只寫入記憶體,由分派器定期合併寫入資料庫
+            registry.start(task.to_dict(), service_ms)
+
+            def progress_callback(progress: int, message: str):
+                registry.update(task_id, progress, message)
+                logger.info(f"任務 {task_id} 進度: {progress}% - {message}")
+
+            # 執行分析
+            result = await analyzer.analyze_report(
+                file_path=file_path,
+                backend=backend,
+                model=config.get("model"),
+                api_key=config.get("api_key"),
+                base_url=base_url,
+                skip_images=skip_images,
+                progress_callback=progress_callback,
+                router=model_router,
+                image_token_budget=config.get("image_token_budget"),
+                stage_callback=lambda stage: registry.stage(task_id, stage),
+                stream_callback=lambda text: registry.partial(task_id, text),
+                rubric=rubric
+            )
+
+            if analyzer.routing:
+                logger.info(f"任務 {task_id} 路由至 {analyzer.routing['tier']}: {analyzer.routing['model']}")
+
+            # 標記任務完成 (僅在仍持有租約時),於管線的 persist 階段經由寫入執行緒寫入
+            telemetry.update(analyzer.telemetry)
+
+            def save(persist_db) -> bool:
+                latest = registry.get(task_id)
+                if analyzer.routing:
+                    TaskManager.record_routing(persist_db, task_id, analyzer.routing)
+                return TaskManager.mark_completed(
+                    persist_db, task_id, result, telemetry, lease_owner=owner,
+                    message=latest["message"] if latest else None,
+                    report_text=analyzer.report_text
+                )
+
+            def persist() -> bool:
+                return writer.run(save)
+
+            registry.stage(task_id, "persist")
+            if await get_pipeline().run("persist", persist):
+                logger.info(f"任務 {task_id} 完成, 遙測: {telemetry}")
+            else:
+                logger.warning(f"任務 {task_id} 已不屬於此 worker,捨棄結果")
+
+        except asyncio.CancelledError:
+            if analyzer.cancelled:
+                # 任務已被取消 (狀態已由取消操作寫入),釋放名額
+                logger.info(f"任務 {task_id} 已取消,停止執行")
+                return
+            # Worker 停止: 中止進行中的 LLM 調用 (不再消耗 token,執行緒得以結束),
+            # 交還任務由其他 worker 重新執行
+            logger.info(f"Worker 停止,任務 {task_id} 重新排隊")
+            analyzer.cancel()
+            await asyncio.shield(writer.submit(TaskQueue.release, task_id, owner))
+            raise
+
+        except AnalysisCancelled:
+            logger.info(f"任務 {task_id} 已取消,停止執行")
+
+        except Exception as e:
+            logger.error(f"任務 {task_id} 失敗: {str(e)}")
+            telemetry.update(analyzer.telemetry)
+
+            def fail(fail_db):
+                if analyzer.routing:
+                    TaskManager.record_routing(fail_db, task_id, analyzer.routing)
+                TaskManager.mark_failed(
+                    fail_db, task_id, str(e), telemetry, lease_owner=owner, report_text=analyzer.report_text
+                )
+
+            await writer.submit(fail)
+
+        finally:
+            registry.finish(task_id)
+            lease_keeper.cancel()
+
+
+class TaskDispatcher:
+    """Claims queued tasks and runs them with bounded concurrency"""
+
+    # Dispatchers running in this process, woken when a task is enqueued here
+    _active: Set["TaskDispatcher"] = set()
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        backends: Optional[List[str]] = None,
+        poll_interval: Optional[float] = None
+    ):
+        """
+        Args:
+            concurrency: Maximum tasks running at the same time
+            backends: Only claim tasks for these backends (all if None)
+            poll_interval: Seconds between queue polls when idle
+        """
+        self.concurrency = concurrency or settings.WORKER_CONCURRENCY
+        self.backends = backends
+        self.poll_interval = poll_interval or settings.QUEUE_POLL_INTERVAL
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # task_id -> (asyncio 任務, 分析服務)
+        self.running: Dict[str, Tuple[asyncio.Task, FAReportAnalyzerService]] = {}
+        self._wake = asyncio.Event()
+        self._stopping = False
+
+    @classmethod
+    def notify(cls):
+        """Wake the dispatchers of this process (a task was just enqueued)"""
+        for dispatcher in cls._active:
+            dispatcher._wake.set()
+
+    @classmethod
+    def cancel_local(cls, task_id: str):
+        """Stop a task if a dispatcher of this process is running it"""
+        for dispatcher in cls._active:
+            dispatcher.cancel_task(task_id)
+
+    def cancel_task(self, task_id: str) -> bool:
+        """
+        Stop a running task: abort its LLM stream and free its slot
+
+        Args:
+            task_id: Task ID
+
+        Returns:
+            Whether this dispatcher was running the task
+        """
+        entry = self.running.get(task_id)
+        if not entry:
+            return False
+        job, analyzer = entry
+        analyzer.cancel()
+        job.cancel()
+        return True
+
+    @staticmethod
+    def _task_states(task_ids: List[str]) -> List[Tuple[str, str, Optional[str]]]:
+        """(id, status, lease_owner) of the given tasks"""
+        db = SessionLocal()
+        try:
+            return db.query(AnalysisTask.id, AnalysisTask.status, AnalysisTask.lease_owner).filter(
+                AnalysisTask.id.in_(task_ids)
+            ).all()
+        finally:
+            db.close()
+
+    async def _stop_abandoned(self):
+        """Stop running tasks that were cancelled or whose lease another worker took over"""
+        if not self.running:
+            return
+        loop = asyncio.get_event_loop()
+        rows = await loop.run_in_executor(None, TaskDispatcher._task_states, list(self.running))
+
+        for task_id, status, lease_owner in rows:
+            if status == TaskStatus.CANCELLED.value:
+                logger.info(f"任務 {task_id} 已在其他進程取消,中止執行")
+            elif status == TaskStatus.PROCESSING.value and lease_owner != self.owner:
+                logger.warning(f"任務 {task_id} 已由其他 worker 接手,中止執行")
+            else:
+                continue
+            self.cancel_task(task_id)
+
+    async def _checkpoint_progress(self):
+        """Persist coalesced progress of running tasks when a checkpoint is due"""
+        registry = get_progress_registry()
+        updates = registry.take_checkpoint()
+        if not updates:
+            return
+        try:
+            await get_db_writer().submit(TaskManager.checkpoint_progress, updates)
+        except Exception:
+            registry.restore(updates)
+            raise
+
+    async def _requeue_expired(self):
+        requeued = await get_db_writer().submit(TaskQueue.requeue_expired)
+        if requeued:
+            logger.info(f"已重新排隊 {requeued} 個租約過期的任務")
+
+    def _claim_id(self, db) -> Optional[str]:
+        task = TaskQueue.claim(db, self.owner, self.backends)
+        return task.id if task else None
+
+    async def _claim(self) -> Optional[str]:
+        return await get_db_writer().submit(self._claim_id)
+
+    async def run(self):
+        """Dispatch loop (runs until cancelled)"""
+        TaskDispatcher._active.add(self)
+        logger.info(
+            f"任務分派器已啟動: {self.owner}, 並行數 {self.concurrency}"
+            + (f", 後端 {', '.join(self.backends)}" if self.backends else "")
+        )
+        last_requeue = 0.0
+        loop = asyncio.get_event_loop()
+
+        try:
+            while not self._stopping:
+                # 租約過期檢查的間隔與續期間隔相同
+                if loop.time() - last_requeue >= max(1, settings.TASK_LEASE_SECONDS // 3):
+                    try:
+                        await self._requeue_expired()
+                    except Exception as e:
+                        logger.error(f"重新排隊過期任務失敗: {str(e)}")
+                    last_requeue = loop.time()
+
+                try:
+                    await self._stop_abandoned()
+                except Exception as e:
+                    logger.error(f"檢查已取消任務失敗: {str(e)}")
+
+                try:
+                    await self._checkpoint_progress()
+                except Exception as e:
+                    logger.error(f"寫入任務進度失敗: {str(e)}")
+
+                while len(self.running) < self.concurrency:
+                    try:
+                        task_id = await self._claim()
+                    except Exception as e:
+                        logger.error(f"認領任務失敗: {str(e)}")
+                        task_id = None
+                    if not task_id:
+                        break
+                    analyzer = FAReportAnalyzerService()
+                    job = asyncio.create_task(TaskRunner.run(task_id, self.owner, analyzer))
+                    self.running[task_id] = (job, analyzer)
+                    job.add_done_callback(lambda _, task_id=task_id: self._on_done(task_id))
+
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            TaskDispatcher._active.discard(self)
+
+    def _on_done(self, task_id: str):
+        self.running.pop(task_id, None)
+        # 空出名額,立即認領下一個任務
+        self._wake.set()
+
+    async def stop(self):
+        """Stop claiming and hand running tasks back to the queue"""
+        self._stopping = True
+        self._wake.set()
+        jobs = [job for job, _ in self.running.values()]
+        # 各任務在交還前中止進行中的 LLM 調用 (見 TaskRunner.run)
+        for job in jobs:
+            job.cancel()
+        if jobs:
+            await asyncio.gather(*jobs, return_exceptions=True)
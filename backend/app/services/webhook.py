@@ -0,0 +1,352 @@
+"""
+Completion webhooks
+
+When a task with a callback_url completes, fails or is cancelled, a
+WebhookDelivery row is written in the same transaction as the status
+change. A sender loop in every API and worker process claims due
+deliveries with a conditional UPDATE and POSTs them with bounded
+concurrency. Failed deliveries are retried with exponential backoff,
+and the table doubles as the delivery log.
+
+Each POST carries X-FA-Event, X-FA-Delivery and X-FA-Timestamp headers.
+When WEBHOOK_SECRET is set it also carries
+X-FA-Signature: sha256=HMAC(secret, "<timestamp>.<body>").
+
+Callback URLs must resolve to public addresses (checked when the task is
+submitted and again before every POST), so a task cannot make the server
+call loopback, private or link-local services. Internal receivers are
+allowed by listing their host in WEBHOOK_ALLOWED_HOSTS.
+"""
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import random
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import urlsplit
+
+import httpx
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import get_db_writer
+from ..models.task import AnalysisTask, TaskStatus
+from ..models.webhook import WebhookDelivery, WebhookStatus
+
+logger = logging.getLogger(__name__)
+
+
+class CallbackURLRejected(ValueError):
+    """A callback URL the server must not call"""
+
+
+class WebhookService:
+    """Schedules, signs and sends completion webhooks"""
+
+    # Task status -> webhook event
+    EVENTS = {
+        TaskStatus.COMPLETED.value: "task.completed",
+        TaskStatus.FAILED.value: "task.failed",
+        TaskStatus.CANCELLED.value: "task.cancelled",
+    }
+
+    # Deliveries left in delivering this long (process died mid-send) are retried
+    DELIVERING_TIMEOUT = 300
+
+    # Receiver responses that are worth retrying (besides 5xx and network errors)
+    RETRYABLE_STATUS = (408, 425, 429)
+
+    @staticmethod
+    def allowed_hosts() -> Set[str]:
+        """Hosts that may receive webhooks whatever they resolve to (WEBHOOK_ALLOWED_HOSTS)"""
+        return {host.strip().lower() for host in (settings.WEBHOOK_ALLOWED_HOSTS or "").split(",") if host.strip()}
+
+    @staticmethod
+    def check_url(url: str):
+        """
+        Check that a callback URL may be called from the server
+
+        Resolves the host; every address must be public unless the host is
+        in WEBHOOK_ALLOWED_HOSTS.
+
+        Raises:
+            CallbackURLRejected: The URL is invalid or its host resolves to a non-public address
+            OSError: The host could not be resolved
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise CallbackURLRejected("callback_url 必須是 http(s) URL")
+        host = parts.hostname.lower()
+        if host in WebhookService.allowed_hosts():
+            return
+        for *_, sockaddr in socket.getaddrinfo(host, parts.port or 443, type=socket.SOCK_STREAM):
+            address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+            if address.version == 6 and address.ipv4_mapped:
+                address = address.ipv4_mapped
+            if not address.is_global or address.is_multicast:
+                raise CallbackURLRejected(f"callback_url 主機 {host} 解析為非公開地址 {address}")
+
+    @staticmethod
+    def build_payload(task: AnalysisTask, event: str) -> Dict[str, Any]:
+        """Webhook body for a finished task"""
+        result = task.to_dict()["result"]
+        return {
+            "event": event,
+            "task_id": task.id,
+            "filename": task.filename,
+            "status": task.status,
+            "submitter": task.submitter,
+            "total_score": result.get("total_score") if isinstance(result, dict) else None,
+            "grade": result.get("grade") if isinstance(result, dict) else None,
+            "error": task.error,
+            "completed_at": task.completed_at.isoformat() if task.completed_at else None,
+            "result": result,
+        }
+
+    @staticmethod
+    def schedule(db: Session, task: AnalysisTask) -> Optional[WebhookDelivery]:
+        """
+        Add a delivery for a finished task to the session (committed by the caller)
+
+        Args:
+            db: Database session
+            task: Task that just reached completed, failed or cancelled
+
+        Returns:
+            The delivery, or None if the task has no callback_url
+        """
+        event = WebhookService.EVENTS.get(task.status)
+        if not task.callback_url or not event:
+            return None
+        delivery = WebhookDelivery(
+            task_id=task.id,
+            url=task.callback_url,
+            event=event,
+            payload=WebhookService.build_payload(task, event),
+            next_attempt_at=datetime.now()
+        )
+        db.add(delivery)
+        return delivery
+
+    @staticmethod
+    def sign(body: bytes, timestamp: str, secret: str) -> str:
+        """HMAC-SHA256 signature of "<timestamp>.<body>" """
+        digest = hmac.new(secret.encode(), timestamp.encode() + b"." + body, hashlib.sha256).hexdigest()
+        return f"sha256={digest}"
+
+    @staticmethod
+    def backoff_seconds(attempt: int) -> float:
+        """Delay before the next attempt (exponential with jitter, capped at one hour)"""
+        delay = min(settings.WEBHOOK_RETRY_BASE_SECONDS * (2 ** (attempt - 1)), 3600)
+        return delay * random.uniform(0.8, 1.2)
+
+    @staticmethod
+    def claim_due(db: Session, limit: int) -> List[Dict[str, Any]]:
+        """
+        Claim deliveries whose next attempt is due
+
+        Args:
+            db: Database session
+            limit: Maximum deliveries to claim
+
+        Returns:
+            Claimed deliveries {id, url, event, payload, attempts}
+        """
+        now = datetime.now()
+        # 發送中途進程終止的投遞,逾時後重新發送
+        db.query(WebhookDelivery).filter(
+            WebhookDelivery.status == WebhookStatus.DELIVERING.value,
+            WebhookDelivery.updated_at < now - timedelta(seconds=WebhookService.DELIVERING_TIMEOUT)
+        ).update({WebhookDelivery.status: WebhookStatus.PENDING.value}, synchronize_session=False)
+        db.commit()
+
+        due = db.query(WebhookDelivery.id).filter(
+            WebhookDelivery.status == WebhookStatus.PENDING.value,
+            WebhookDelivery.next_attempt_at <= now
+        ).order_by(WebhookDelivery.next_attempt_at).limit(limit).all()
+
+        claimed = []
+        for (delivery_id,) in due:
+            # 條件更新: 多個進程同時發送時每個投遞只由一個進程認領
+            updated = db.query(WebhookDelivery).filter(
+                WebhookDelivery.id == delivery_id,
+                WebhookDelivery.status == WebhookStatus.PENDING.value
+            ).update({
+                WebhookDelivery.status: WebhookStatus.DELIVERING.value,
+                WebhookDelivery.attempts: WebhookDelivery.attempts + 1,
+                WebhookDelivery.updated_at: now,
+            }, synchronize_session=False)
+            db.commit()
+            if updated:
+                delivery = db.query(WebhookDelivery).filter(WebhookDelivery.id == delivery_id).first()
+                claimed.append({
+                    "id": delivery.id,
+                    "url": delivery.url,
+                    "event": delivery.event,
+                    "payload": delivery.payload,
+                    "attempts": delivery.attempts,
+                })
+        return claimed
+
+    @staticmethod
+    def record_attempt(
+        db: Session,
+        delivery_id: str,
+        attempts: int,
+        status_code: Optional[int],
+        error: Optional[str],
+        retry_after: Optional[float] = None,
+        retry: bool = True
+    ):
+        """
+        Store the outcome of a delivery attempt
+
+        Args:
+            db: Database session
+            delivery_id: Delivery ID
+            attempts: Attempts made so far (including this one)
+            status_code: Receiver HTTP status (None on network errors)
+            error: Error description (None on success)
+            retry_after: Delay requested by the receiver (Retry-After)
+            retry: Whether a failed attempt may be retried (False for rejected URLs)
+        """
+        values = {
+            WebhookDelivery.last_status_code: status_code,
+            WebhookDelivery.last_error: error,
+        }
+        if error is None:
+            values[WebhookDelivery.status] = WebhookStatus.DELIVERED.value
+            values[WebhookDelivery.delivered_at] = datetime.now()
+        elif (
+            retry
+            and (status_code is None or status_code >= 500 or status_code in WebhookService.RETRYABLE_STATUS)
+            and attempts < settings.WEBHOOK_MAX_ATTEMPTS
+        ):
+            delay = max(WebhookService.backoff_seconds(attempts), retry_after or 0)
+            values[WebhookDelivery.status] = WebhookStatus.PENDING.value
+            values[WebhookDelivery.next_attempt_at] = datetime.now() + timedelta(seconds=delay)
+        else:
+            values[WebhookDelivery.status] = WebhookStatus.FAILED.value
+
+        db.query(WebhookDelivery).filter(
+            WebhookDelivery.id == delivery_id,
+            WebhookDelivery.status == WebhookStatus.DELIVERING.value
+        ).update(values, synchronize_session=False)
+        db.commit()
+
+        status = values[WebhookDelivery.status]
+        if status == WebhookStatus.FAILED.value:
+            logger.warning(f"Webhook 投遞失敗,停止重試: {delivery_id} ({error})")
+        elif status == WebhookStatus.PENDING.value:
+            logger.info(f"Webhook 投遞失敗,稍後重試: {delivery_id} ({error})")
+
+    @staticmethod
+    async def deliver(client: httpx.AsyncClient, delivery: Dict[str, Any]):
+        """
+        POST one claimed delivery and record the outcome
+
+        Args:
+            client: Shared HTTP client
+            delivery: Delivery returned by claim_due
+        """
+        body = json.dumps(delivery["payload"], ensure_ascii=False).encode("utf-8")
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": "FA-Report-Analyzer-Webhook/3.0",
+            "X-FA-Event": delivery["event"],
+            "X-FA-Delivery": delivery["id"],
+            "X-FA-Timestamp": timestamp,
+        }
+        if settings.WEBHOOK_SECRET:
+            headers["X-FA-Signature"] = WebhookService.sign(body, timestamp, settings.WEBHOOK_SECRET)
+
+        status_code = None
+        error = None
+        retry_after = None
+        retry = True
+        try:
+            # 投遞前重新解析: 主機可能在提交後改為指向內部地址
+            await asyncio.get_event_loop().run_in_executor(None, WebhookService.check_url, delivery["url"])
+            response = await client.post(delivery["url"], content=body, headers=headers)
+            status_code = response.status_code
+            if not 200 <= status_code < 300:
+                error = f"HTTP {status_code}"
+                try:
+                    retry_after = float(response.headers.get("Retry-After", ""))
+                except ValueError:
+                    pass
+        except asyncio.CancelledError:
+            # 進程停止: 交還投遞,不計入嘗試次數
+            await asyncio.shield(get_db_writer().submit(WebhookService.release, delivery["id"]))
+            raise
+        except CallbackURLRejected as e:
+            # 不允許的 URL: 重試也不會成功
+            error = str(e)
+            retry = False
+        except Exception as e:
+            # 連線錯誤、逾時或無法解析的主機
+            error = f"{type(e).__name__}: {e}"
+
+        try:
+            await get_db_writer().submit(
+                WebhookService.record_attempt,
+                delivery["id"], delivery["attempts"], status_code, error, retry_after, retry
+            )
+        except Exception as e:
+            # 投遞維持 delivering 狀態,逾時後重新發送
+            logger.error(f"記錄 webhook 投遞結果失敗: {delivery['id']} ({str(e)})")
+            return
+        if error is None:
+            logger.info(f"Webhook 已投遞: {delivery['event']} -> {delivery['url']}")
+
+    @staticmethod
+    def release(db: Session, delivery_id: str):
+        """Put a claimed delivery back without counting the attempt"""
+        db.query(WebhookDelivery).filter(
+            WebhookDelivery.id == delivery_id,
+            WebhookDelivery.status == WebhookStatus.DELIVERING.value
+        ).update({
+            WebhookDelivery.status: WebhookStatus.PENDING.value,
+            WebhookDelivery.attempts: WebhookDelivery.attempts - 1,
+        }, synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    async def run_sender(interval: Optional[float] = None):
+        """
+        Send due webhooks forever, at most WEBHOOK_CONCURRENCY at a time
+
+        Args:
+            interval: Seconds between polls for due deliveries
+        """
+        interval = interval or settings.WEBHOOK_POLL_INTERVAL
+        if not settings.WEBHOOK_SECRET:
+            logger.warning("未設定 WEBHOOK_SECRET,webhook 將不帶簽名發送")
+
+        in_flight: Set[asyncio.Task] = set()
+        async with httpx.AsyncClient(timeout=settings.WEBHOOK_TIMEOUT) as client:
+            try:
+                while True:
+                    free = settings.WEBHOOK_CONCURRENCY - len(in_flight)
+                    if free > 0:
+                        try:
+                            deliveries = await get_db_writer().submit(WebhookService.claim_due, free)
+                        except Exception as e:
+                            logger.error(f"讀取待投遞 webhook 失敗: {str(e)}")
+                            deliveries = []
+                        for delivery in deliveries:
+                            job = asyncio.create_task(WebhookService.deliver(client, delivery))
+                            in_flight.add(job)
+                            job.add_done_callback(in_flight.discard)
+                    await asyncio.sleep(interval)
+            finally:
+                for job in list(in_flight):
+                    job.cancel()
+                if in_flight:
+                    await asyncio.gather(*in_flight, return_exceptions=True)
@@ -7,16 +7,27 @@ import { router, showGlobalError } from './app.js';
 
 // 頁面狀態
 let currentTaskId = null;
+let eventSource = null;
 let pollingInterval = null;
 
+// 管線階段顯示名稱
+const STAGE_LABELS = {
+    'extract': '正在讀取報告...',
+    'preprocess_images': '正在處理圖片...',
+    'build_prompt': '正在準備分析...',
+    'llm': '正在 AI 分析...',
+    'parse': '正在解析結果...',
+    'persist': '正在保存結果...'
+};
+
 /**
  * 初始化分析頁面
  */
 export function initAnalysisPage(params = {}) {
     console.log('[Analysis] Initializing analysis page', params);
 
-    // 停止之前的輪詢
-    stopPolling();
+    // 停止之前的狀態更新
+    stopUpdates();
 
     // 獲取任務 ID
     currentTaskId = params.taskId || sessionStorage.getItem('currentTaskId');
@@ -33,12 +44,55 @@ export function initAnalysisPage(params = {}) {
     // 重置進度
     updateProgress(0, '初始化中...');
 
-    // 開始輪詢狀態
-    startPolling();
+    // 開始接收狀態更新
+    startUpdates();
 
     console.log('[Analysis] Page initialized, task ID:', currentTaskId);
 }
 
+/**
+ * 開始接收狀態更新: 優先使用服務器推送 (SSE),不支援或連線失敗時改用輪詢
+ */
+function startUpdates() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    const taskId = currentTaskId;
+    eventSource = api.openAnalysisEvents(taskId);
+
+    eventSource.addEventListener('snapshot', (event) => {
+        applyStatus(JSON.parse(event.data));
+    });
+
+    eventSource.addEventListener('progress', (event) => {
+        const data = JSON.parse(event.data);
+        updateProgress(data.progress, data.message);
+    });
+
+    eventSource.addEventListener('stage', (event) => {
+        const data = JSON.parse(event.data);
+        if (STAGE_LABELS[data.stage]) {
+            document.getElementById('analysis-status').textContent = STAGE_LABELS[data.stage];
+        }
+    });
+
+    eventSource.addEventListener('partial', (event) => {
+        const data = JSON.parse(event.data);
+        document.getElementById('analysis-message').textContent = `AI 回應中... 已接收 ${data.chars} 字元`;
+    });
+
+    eventSource.onerror = () => {
+        // 連線中斷 (或伺服器不支援): 改用輪詢,任務仍在此頁面時才切換
+        if (eventSource && currentTaskId === taskId) {
+            console.warn('[Analysis] Event stream error, falling back to polling');
+            stopUpdates();
+            startPolling();
+        }
+    };
+}
+
 /**
  * 開始輪詢任務狀態
  */
@@ -51,9 +105,13 @@ function startPolling() {
 }
 
 /**
- * 停止輪詢
+ * 停止狀態更新 (推送與輪詢)
  */
-function stopPolling() {
+function stopUpdates() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
     if (pollingInterval) {
         clearInterval(pollingInterval);
         pollingInterval = null;
@@ -66,36 +124,54 @@ function stopPolling() {
 async function pollStatus() {
     try {
         const status = await api.getAnalysisStatus(currentTaskId);
-
-        console.log('[Analysis] Status:', status);
-
-        // 更新進度
-        updateProgress(status.progress || 0, status.message || '處理中...');
-
-        // 檢查狀態
-        if (status.status === 'completed') {
-            // 分析完成
-            stopPolling();
-            handleCompleted();
-
-        } else if (status.status === 'failed') {
-            // 分析失敗
-            stopPolling();
-            handleFailed(status.error || '分析失敗');
-        }
+        applyStatus(status);
 
     } catch (error) {
         console.error('[Analysis] Poll error:', error);
 
         // 如果是 404,可能任務不存在
         if (error.message.includes('404')) {
-            stopPolling();
+            stopUpdates();
             showGlobalError('任務不存在');
             router.navigate('home');
         }
     }
 }
 
+/**
+ * 套用任務狀態 (推送的 snapshot 或輪詢結果)
+ */
+function applyStatus(status) {
+    console.log('[Analysis] Status:', status);
+
+    // 更新進度 (排隊中時顯示佇列位置與預計時間)
+    let message = status.message || '處理中...';
+    if (status.status === 'pending' && status.queue_position) {
+        message = `排隊中: 第 ${status.queue_position} 位`;
+        if (status.eta_seconds != null) {
+            message += `, 預計 ${Math.ceil(status.eta_seconds / 60)} 分鐘內完成`;
+        }
+    }
+    updateProgress(status.progress || 0, message);
+
+    // 檢查狀態
+    if (status.status === 'completed') {
+        // 分析完成
+        stopUpdates();
+        handleCompleted();
+
+    } else if (status.status === 'failed') {
+        // 分析失敗
+        stopUpdates();
+        handleFailed(status.error || '分析失敗');
+
+    } else if (status.status === 'cancelled') {
+        // 任務已取消
+        stopUpdates();
+        handleFailed(status.error || '任務已取消');
+    }
+}
+
 /**
  * 更新進度顯示
  */
@@ -138,7 +214,7 @@ function handleCompleted() {
 function handleFailed(errorMessage) {
     console.error('[Analysis] Analysis failed:', errorMessage);
 
-    stopPolling();
+    stopUpdates();
 
     // 更新 UI 顯示錯誤
     document.getElementById('analysis-status').textContent = '分析失敗';
@@ -156,5 +232,5 @@ function handleFailed(errorMessage) {
     }, 5000);
 }
 
-// 頁面離開時停止輪詢
-window.addEventListener('beforeunload', stopPolling);
+// 頁面離開時停止狀態更新
+window.addEventListener('beforeunload', stopUpdates);
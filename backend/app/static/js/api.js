@@ -75,6 +75,7 @@ export const api = {
      * @param {string} [data.model] - 模型名稱
      * @param {string} [data.api_key] - API Key
      * @param {boolean} [data.skip_images] - 是否跳過圖片
+     * @param {string} [data.priority] - 優先級 (urgent, normal, low)
      * @returns {Promise<Object>} 任務信息
      */
     async createAnalysis(data) {
@@ -122,6 +123,16 @@ export const api = {
         }
     },
 
+    /**
+     * 訂閱分析任務的狀態推送 (Server-Sent Events)
+     * 事件: snapshot (完整狀態), progress, stage, partial (LLM 輸出片段)
+     * @param {string} taskId - 任務 ID
+     * @returns {EventSource} 事件來源,呼叫 close() 停止接收
+     */
+    openAnalysisEvents(taskId) {
+        return new EventSource(`${API_BASE}/analyze/${taskId}/events`);
+    },
+
     /**
      * 獲取分析結果
      * @param {string} taskId - 任務 ID
@@ -188,7 +199,9 @@ export const api = {
      * @param {number} [params.limit] - 每頁數量
      * @param {string} [params.search] - 搜尋關鍵字
      * @param {string} [params.status] - 狀態篩選
-     * @returns {Promise<Object>} 歷史記錄列表
+     * @param {string} [params.cursor] - 游標 (上一頁響應的 nextCursor)
+     * @param {string} [params.fields] - 只返回這些欄位 (逗號分隔)
+     * @returns {Promise<Object>} 歷史記錄列表 ({items, nextCursor})
      */
     async getHistory(params = {}) {
         try {
@@ -201,9 +214,9 @@ export const api = {
                 throw new Error(`獲取歷史失敗 (${response.status})`);
             }
 
-            const result = await response.json();
-            console.log('[API] History fetched:', result);
-            return result;
+            const items = await response.json();
+            console.log('[API] History fetched:', items);
+            return { items, nextCursor: response.headers.get('X-Next-Cursor') };
         } catch (error) {
             console.error('[API] Get history error:', error);
             throw error;
@@ -81,8 +81,10 @@ async function loadHistory() {
         const tableBody = document.getElementById('history-table-body');
         tableBody.innerHTML = '<tr><td colspan="6" class="text-center"><div class="spinner-border spinner-border-sm"></div> 載入中...</td></tr>';
 
-        // 調用 API
-        const response = await api.getHistory();
+        // 調用 API (列表只需摘要欄位,不載入完整分析結果)
+        const response = await api.getHistory({
+            fields: 'task_id,filename,status,total_score,grade,created_at'
+        });
 
         historyData = response.items || response || [];
         filteredData = [...historyData];
@@ -130,13 +132,13 @@ function displayHistory() {
 
         // 總分
         const scoreCell = document.createElement('td');
-        const totalScore = item.result?.total_score;
+        const totalScore = item.total_score ?? item.result?.total_score;
         scoreCell.textContent = totalScore ? totalScore.toFixed(1) : '--';
         row.appendChild(scoreCell);
 
         // 等級
         const gradeCell = document.createElement('td');
-        let grade = item.result?.grade || '--';
+        let grade = item.grade || item.result?.grade || '--';
         // 移除"級"字，統一格式（例如 "B級" -> "B"）
         if (grade !== '--') {
             grade = grade.replace('級', '');
@@ -301,7 +303,8 @@ function getStatusBadge(status) {
         'pending': { text: '等待中', class: 'status-pending' },
         'processing': { text: '處理中', class: 'status-processing' },
         'completed': { text: '已完成', class: 'status-completed' },
-        'failed': { text: '失敗', class: 'status-failed' }
+        'failed': { text: '失敗', class: 'status-failed' },
+        'cancelled': { text: '已取消', class: 'status-cancelled' }
     };
 
     const statusInfo = statusMap[status] || { text: status, class: '' };
@@ -199,6 +199,7 @@ async function handleStartAnalysis() {
         const baseUrl = document.getElementById('base-url-input').value.trim();
         const apiKey = document.getElementById('api-key-input').value.trim();
         const skipImages = document.getElementById('skip-images').checked;
+        const priority = document.getElementById('priority-select').value;
 
         // 創建分析任務
         console.log('[Upload] Creating analysis task...');
@@ -209,7 +210,8 @@ async function handleStartAnalysis() {
             model: model || undefined,
             base_url: baseUrl || undefined,
             api_key: apiKey || undefined,
-            skip_images: skipImages
+            skip_images: skipImages,
+            priority: priority
         });
 
         console.log('[Upload] Analysis task created:', analysisResult.task_id);
@@ -0,0 +1,113 @@
+"""
+獨立分析 Worker
+從共享資料庫佇列認領分析任務並執行,與 API 伺服器分開部署以便水平擴展
+
+使用方式 (在 backend 目錄下):
+    python -m app.worker --concurrency 4
+    python -m app.worker --concurrency 2 --backends openai,anthropic
+
+API 伺服器設定 EMBEDDED_WORKER=false 時,所有分析任務都由獨立 worker 執行
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import sys
+
+from .database import init_db
+from . import models  # Import models to register them with Base
+from .services.task_runner import TaskDispatcher
+from .services.webhook import WebhookService
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+VALID_BACKENDS = ["ollama", "openai", "anthropic"]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """解析命令列參數"""
+    parser = argparse.ArgumentParser(description="FA Report Analyzer 分析 worker")
+    parser.add_argument(
+        "--concurrency", type=int, default=None,
+        help="同時執行的分析數 (預設使用 WORKER_CONCURRENCY)"
+    )
+    parser.add_argument(
+        "--backends", type=str, default=None,
+        help="只處理指定後端的任務,以逗號分隔 (例如 openai,anthropic)"
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=None,
+        help="佇列為空時的輪詢間隔秒數 (預設使用 QUEUE_POLL_INTERVAL)"
+    )
+    args = parser.parse_args(argv)
+
+    if args.concurrency is not None and args.concurrency < 1:
+        parser.error("--concurrency 必須大於 0")
+
+    if args.backends:
+        backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+        invalid = [b for b in backends if b not in VALID_BACKENDS]
+        if invalid:
+            parser.error(f"不支援的 backend: {', '.join(invalid)}。支援: {', '.join(VALID_BACKENDS)}")
+        args.backends = backends
+
+    return args
+
+
+async def run_worker(args: argparse.Namespace):
+    """
+    執行 worker 直到收到停止信號
+
+    Args:
+        args: 命令列參數
+    """
+    dispatcher = TaskDispatcher(
+        concurrency=args.concurrency,
+        backends=args.backends,
+        poll_interval=args.poll_interval
+    )
+    dispatch_loop = asyncio.create_task(dispatcher.run())
+    # 本 worker 完成的任務也在此發送 webhook
+    webhook_sender = asyncio.create_task(WebhookService.run_sender())
+
+    # 收到 SIGINT/SIGTERM 時交還執行中的任務再結束
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows 不支援 add_signal_handler,由 KeyboardInterrupt 處理
+            pass
+
+    await asyncio.wait(
+        [dispatch_loop, asyncio.create_task(stop_event.wait())],
+        return_when=asyncio.FIRST_COMPLETED
+    )
+
+    logger.info("Worker 正在停止,交還執行中的任務...")
+    await dispatcher.stop()
+    dispatch_loop.cancel()
+    webhook_sender.cancel()
+    await asyncio.gather(webhook_sender, return_exceptions=True)
+    logger.info("Worker 已停止")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    logger.info("正在初始化資料庫...")
+    init_db()
+
+    try:
+        asyncio.run(run_worker(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+測試共用設定
+
+應用在導入時讀取設定並建立資料庫引擎,因此先將環境變數指向臨時目錄中的
+SQLite 資料庫,再導入 app。外部服務 (LLM 供應商、webhook 接收端) 由
+tools/llm_standin.py 在本機的隨機埠上提供。
+
+執行:
+    cd backend
+    python -m pytest -q
+"""
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+_workdir = tempfile.mkdtemp(prefix="fa-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_workdir}/test.db",
+    "UPLOAD_DIR": f"{_workdir}/uploads",
+    "RESULT_DIR": f"{_workdir}/results",
+    "ARCHIVE_DIR": f"{_workdir}/archive",
+    "ENCRYPTION_KEY": "test-encryption-key",
+    "EMBEDDED_WORKER": "false",
+})
+
+import uvicorn  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database import SessionLocal, engine, init_db  # noqa: E402
+from app.models.batch import AnalysisBatch  # noqa: E402
+from app.models.dimension import TaskDimensionScore  # noqa: E402
+from app.models.task import AnalysisTask  # noqa: E402
+from app.models.webhook import WebhookDelivery  # noqa: E402
+from tools import llm_standin  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    """建立測試資料庫,測試結束後刪除臨時目錄"""
+    init_db()
+    yield engine
+    engine.dispose()
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+@pytest.fixture
+def db(database):
+    """資料庫會話;測試結束後清空任務、維度分數、批次與 webhook 投遞"""
+    session = SessionLocal()
+    yield session
+    session.rollback()
+    for model in (WebhookDelivery, TaskDimensionScore, AnalysisBatch, AnalysisTask):
+        session.query(model).delete(synchronize_session=False)
+    session.commit()
+    session.close()
+
+
+@pytest.fixture
+def make_task(db):
+    """建立任務 (未指定的必填欄位使用預設值)"""
+    def create(**values) -> AnalysisTask:
+        values.setdefault("filename", "report.txt")
+        values.setdefault("file_path", f"{_workdir}/uploads/report.txt")
+        values.setdefault("backend", "openai")
+        values.setdefault("model", "gpt-4o-mini")
+        task = AnalysisTask(**values)
+        db.add(task)
+        db.commit()
+        db.refresh(task)
+        return task
+    return create
+
+
+@pytest.fixture(scope="session")
+def standin():
+    """在背景執行緒中啟動替身服務器,返回其 base URL"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(llm_standin.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("替身服務器啟動逾時")
+        time.sleep(0.05)
+
+    yield f"http://127.0.0.1:{port}"
+
+    server.should_exit = True
+    thread.join(5)
+
+
+@pytest.fixture
+def webhook_receiver(standin, monkeypatch):
+    """清空替身服務器的 webhook 記錄,允許投遞至本機,返回接收端 URL"""
+    monkeypatch.setattr(settings, "WEBHOOK_ALLOWED_HOSTS", "127.0.0.1")
+    llm_standin.webhook_deliveries.clear()
+    llm_standin.webhook_attempts.clear()
+    monkeypatch.setattr(llm_standin, "WEBHOOK_SECRET", None)
+    monkeypatch.setattr(llm_standin, "WEBHOOK_FAILURES", 0)
+    return f"{standin}/webhook"
@@ -0,0 +1,78 @@
+"""
+統計測試: 由直方圖 (百分比, 筆數) 計算的百分位數與 numpy 的線性插值一致,
+以及經由 dimension_scores 表的維度統計
+"""
+import random
+from datetime import datetime
+
+import pytest
+
+from app.models.dimension import TaskDimensionScore
+from app.services.analytics import AnalyticsService, _dimension_stats, _quantile
+
+np = pytest.importorskip("numpy")
+
+
+def histogram(values):
+    """排序後的 (值, 筆數)"""
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return sorted(counts.items())
+
+
+@pytest.mark.parametrize("values", [
+    [50.0],
+    [10.0, 20.0],
+    [80.0, 80.0, 80.0, 95.0],
+    [0.0, 33.33, 33.33, 66.67, 100.0],
+    [float(v) for v in random.Random(7).choices(range(40, 101), k=501)],
+])
+@pytest.mark.parametrize("q", [0, 0.25, 0.5, 0.75, 0.9, 1])
+def test_quantile_matches_numpy_linear_interpolation(values, q):
+    expected = np.percentile(values, q * 100)
+    assert _quantile(histogram(values), len(values), q) == pytest.approx(expected)
+
+
+def test_dimension_stats_from_histogram_rows():
+    scores = {"根因分析": [18.0, 12.0, 18.0, 6.0], "改善對策": [9.0]}
+    rows = []
+    for name, values in scores.items():
+        weight = 20 if name == "根因分析" else 10
+        for score, count in histogram(values):
+            rows.append((name, score / weight * 100, count, count, score * count))
+
+    stats = _dimension_stats(rows)
+
+    root_cause = stats["根因分析"]
+    percentages = [score / 20 * 100 for score in scores["根因分析"]]
+    assert root_cause["count"] == 4
+    assert root_cause["mean_score"] == 13.5
+    assert root_cause["mean_percentage"] == 67.5
+    assert root_cause["percentiles"] == {
+        f"p{p}": round(float(np.percentile(percentages, p)), 2) for p in AnalyticsService.PERCENTILES
+    }
+    assert stats["改善對策"]["percentiles"] == {"p25": 90.0, "p50": 90.0, "p75": 90.0, "p90": 90.0}
+
+
+def test_dimension_stats_query(db, make_task):
+    percentages = [float(v) for v in random.Random(3).choices(range(0, 101, 5), k=60)]
+    task = make_task()
+    db.add_all(
+        TaskDimensionScore(
+            task_id=task.id, dimension="根因分析", score=p / 5, percentage=p, weight=20,
+            completed_at=datetime.now()
+        )
+        for p in percentages
+    )
+    db.commit()
+    AnalyticsService.invalidate()
+
+    [dimension] = AnalyticsService.dimension_stats(db, days=1)["dimensions"]
+
+    assert dimension["dimension"] == "根因分析"
+    assert dimension["weight"] == 20
+    assert dimension["count"] == len(percentages)
+    assert dimension["mean_percentage"] == round(float(np.mean(percentages)), 2)
+    for p in AnalyticsService.PERCENTILES:
+        assert dimension["percentiles"][f"p{p}"] == round(float(np.percentile(percentages, p)), 2)
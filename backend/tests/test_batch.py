@@ -0,0 +1,234 @@
+"""
+批次評分測試: 透過替身服務器的 OpenAI / Anthropic 批次 API 提交與回寫,
+submitted → collecting 的條件認領,COLLECT_TIMEOUT 後重新輪詢,
+以及提交中途進程終止後由輪詢器重新提交
+"""
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from app.core.security import get_security_manager
+from app.models.batch import AnalysisBatch, BatchStatus
+from app.models.task import AnalysisTask, TaskStatus
+from app.services.batch import BatchScoringService, OpenAIBatchProvider
+from tools import llm_standin
+
+REPORT = """失效分析報告
+產品: 電源模組 PM-200
+失效現象: 客戶端開機後輸出電壓為零
+分析: 外觀檢查發現 Q3 MOSFET 燒毀,X-ray 確認焊點空洞
+根因: 迴焊溫度曲線不足導致焊點空洞,熱阻升高
+對策: 調整迴焊曲線並增加 X-ray 抽檢
+"""
+
+
+@pytest.fixture
+def make_batch(db, make_task, standin, tmp_path):
+    """建立一個含 count 個任務的批次 (報告為文字檔)"""
+    def create(backend: str = "openai", count: int = 2, missing: int = 0) -> AnalysisBatch:
+        base_url = f"{standin}/v1" if backend == "openai" else standin
+        batch = AnalysisBatch(
+            backend=backend, model="test-model", base_url=base_url,
+            api_key=get_security_manager().encrypt("sk-test"),
+            status=BatchStatus.PREPARING.value, task_count=count + missing
+        )
+        db.add(batch)
+        db.commit()
+
+        for i in range(count + missing):
+            report = tmp_path / f"report_{backend}_{i}.txt"
+            if i < count:
+                report.write_text(REPORT, encoding="utf-8")
+            make_task(
+                filename=report.name, file_path=str(report), backend=backend, model="test-model",
+                batch_id=batch.id, status=TaskStatus.PENDING.value
+            )
+        return batch
+    return create
+
+
+def batch_state(db, batch_id: str):
+    """批次與其任務的最新狀態"""
+    batch = db.query(AnalysisBatch).populate_existing().filter(AnalysisBatch.id == batch_id).one()
+    tasks = db.query(AnalysisTask).populate_existing().filter(AnalysisTask.batch_id == batch_id).all()
+    return batch, tasks
+
+
+@pytest.mark.parametrize("backend", ["openai", "anthropic"])
+def test_submit_and_collect(db, make_batch, backend):
+    batch = make_batch(backend)
+
+    BatchScoringService._submit_sync(batch.id)
+    submitted, tasks = batch_state(db, batch.id)
+    assert submitted.status == BatchStatus.SUBMITTED.value
+    assert submitted.provider_batch_id
+    assert all(task.progress == 30 for task in tasks)
+    assert all(task.telemetry["mode"] == "batch" for task in tasks)
+
+    # 替身服務器的 OpenAI 批次在第一次查詢時尚未完成
+    if backend == "openai":
+        assert BatchScoringService.collect(batch.id) is False
+        assert batch_state(db, batch.id)[0].status == BatchStatus.SUBMITTED.value
+    assert BatchScoringService.collect(batch.id) is True
+
+    collected, tasks = batch_state(db, batch.id)
+    assert collected.status == BatchStatus.COMPLETED.value
+    assert collected.completed_at is not None
+    for task in tasks:
+        assert task.status == TaskStatus.COMPLETED.value
+        assert task.total_score is not None and task.grade
+        assert task.result["summary"] == "替身服務器返回的固定評分結果"
+        assert task.telemetry["input_tokens"] == 1200
+        assert task.telemetry["output_tokens"] == 400
+
+
+def test_submit_fails_unreadable_reports_only(db, make_batch):
+    batch = make_batch(count=1, missing=1)
+
+    BatchScoringService._submit_sync(batch.id)
+    submitted, tasks = batch_state(db, batch.id)
+    assert submitted.status == BatchStatus.SUBMITTED.value
+    assert sorted(task.status for task in tasks) == [TaskStatus.FAILED.value, TaskStatus.PROCESSING.value]
+
+
+def test_submit_without_readable_reports_fails_batch(db, make_batch):
+    batch = make_batch(count=0, missing=2)
+
+    BatchScoringService._submit_sync(batch.id)
+    failed, tasks = batch_state(db, batch.id)
+    assert failed.status == BatchStatus.FAILED.value
+    assert failed.error == "沒有可提交的報告"
+    assert failed.provider_batch_id is None
+    assert all(task.status == TaskStatus.FAILED.value for task in tasks)
+
+
+def test_collect_claim_is_exclusive(db, make_batch, monkeypatch):
+    batch = make_batch()
+    BatchScoringService._submit_sync(batch.id)
+
+    def claimed_elsewhere(self, provider_batch_id):
+        # 另一個進程在本進程確認批次完成後、認領前搶先認領
+        db.query(AnalysisBatch).filter(AnalysisBatch.id == batch.id).update({
+            AnalysisBatch.status: BatchStatus.COLLECTING.value
+        })
+        db.commit()
+        return True
+
+    monkeypatch.setattr(OpenAIBatchProvider, "is_finished", claimed_elsewhere)
+    assert BatchScoringService.collect(batch.id) is False
+
+    collecting, tasks = batch_state(db, batch.id)
+    assert collecting.status == BatchStatus.COLLECTING.value
+    assert all(task.status == TaskStatus.PROCESSING.value for task in tasks)
+
+    # 回寫中的批次不會被再次回寫
+    assert BatchScoringService.collect(batch.id) is False
+
+
+def test_collect_failure_hands_batch_back(db, make_batch, monkeypatch):
+    batch = make_batch()
+    BatchScoringService._submit_sync(batch.id)
+
+    def broken_results(self, provider_batch_id):
+        raise RuntimeError("connection reset")
+        yield
+
+    monkeypatch.setattr(OpenAIBatchProvider, "is_finished", lambda self, provider_batch_id: True)
+    monkeypatch.setattr(OpenAIBatchProvider, "results", broken_results)
+    assert BatchScoringService.collect(batch.id) is False
+    assert batch_state(db, batch.id)[0].status == BatchStatus.SUBMITTED.value
+
+
+@pytest.mark.asyncio
+async def test_poll_resumes_collecting_batches_after_timeout(db, make_batch, monkeypatch):
+    monkeypatch.setattr(llm_standin, "BATCH_POLLS", 0)
+    stale, recent = make_batch(), make_batch()
+    for batch in (stale, recent):
+        BatchScoringService._submit_sync(batch.id)
+
+    now = datetime.now()
+    for batch, updated_at in (
+        (stale, now - timedelta(seconds=BatchScoringService.COLLECT_TIMEOUT + 60)),
+        (recent, now - timedelta(seconds=60)),
+    ):
+        db.query(AnalysisBatch).filter(AnalysisBatch.id == batch.id).update({
+            AnalysisBatch.status: BatchStatus.COLLECTING.value,
+            AnalysisBatch.updated_at: updated_at,
+        })
+    db.commit()
+
+    await BatchScoringService.poll_submitted()
+
+    resumed, tasks = batch_state(db, stale.id)
+    assert resumed.status == BatchStatus.COMPLETED.value
+    assert all(task.status == TaskStatus.COMPLETED.value for task in tasks)
+
+    # 仍在回寫時限內的批次保持 collecting
+    waiting, tasks = batch_state(db, recent.id)
+    assert waiting.status == BatchStatus.COLLECTING.value
+    assert all(task.status != TaskStatus.COMPLETED.value for task in tasks)
+
+
+# 在讀取第二份報告時終止進程的提交
+KILLED_SUBMIT = """
+import os, sys
+from app.services.batch import BatchScoringService, OpenAIBatchProvider
+
+built = []
+build_request = OpenAIBatchProvider.build_request
+
+def build_then_die(self, *args):
+    built.append(args[0])
+    if len(built) == 2:
+        os._exit(9)
+    return build_request(self, *args)
+
+OpenAIBatchProvider.build_request = build_then_die
+BatchScoringService._submit_sync(sys.argv[1])
+"""
+
+
+@pytest.mark.asyncio
+async def test_poll_resubmits_batch_after_process_died_mid_prepare(db, make_batch, monkeypatch):
+    monkeypatch.setattr(llm_standin, "BATCH_POLLS", 0)
+    batch, never_submitted = make_batch(count=3), make_batch()
+
+    killed = subprocess.run(
+        [sys.executable, "-c", KILLED_SUBMIT, batch.id], cwd=Path(__file__).resolve().parent.parent
+    )
+    assert killed.returncode == 9
+    interrupted, tasks = batch_state(db, batch.id)
+    assert interrupted.status == BatchStatus.SUBMITTING.value
+    assert interrupted.provider_batch_id is None
+    assert sorted(task.status for task in tasks) == [TaskStatus.PENDING.value] + [TaskStatus.PROCESSING.value] * 2
+
+    # 提交時限內不重新提交 (可能仍在其他進程中進行)
+    await BatchScoringService.poll_submitted()
+    assert batch_state(db, batch.id)[0].status == BatchStatus.SUBMITTING.value
+
+    db.query(AnalysisBatch).filter(AnalysisBatch.id == batch.id).update({
+        AnalysisBatch.updated_at: datetime.now() - timedelta(seconds=BatchScoringService.SUBMIT_TIMEOUT + 60)
+    })
+    db.commit()
+    await BatchScoringService.poll_submitted()
+    assert batch_state(db, batch.id)[0].status == BatchStatus.SUBMITTED.value
+    # 下一次輪詢回寫結果
+    await BatchScoringService.poll_submitted()
+
+    # 中斷的與從未提交的批次 (創建後後台任務未執行) 都已提交並回寫
+    for batch_id in (batch.id, never_submitted.id):
+        resumed, tasks = batch_state(db, batch_id)
+        assert resumed.status == BatchStatus.COMPLETED.value
+        assert all(task.status == TaskStatus.COMPLETED.value for task in tasks)
+
+
+def test_submit_runs_once_per_batch(db, make_batch):
+    batch = make_batch()
+    BatchScoringService._submit_sync(batch.id)
+    provider_batch_id = batch_state(db, batch.id)[0].provider_batch_id
+
+    BatchScoringService._submit_sync(batch.id)
+    assert batch_state(db, batch.id)[0].provider_batch_id == provider_batch_id
@@ -0,0 +1,172 @@
+"""
+取消測試: 取消與完成的競爭 (只有一方生效),以及中止進行中的 LLM 串流
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.core.fa_analyzer_core import AnalysisCancelled, FAReportAnalyzer
+from app.database import SessionLocal
+from app.models.dimension import TaskDimensionScore
+from app.models.task import AnalysisTask, TaskStatus
+from app.models.webhook import WebhookDelivery
+from app.services.search import SearchService
+from app.services.task_manager import TaskManager
+from app.services.task_queue import TaskQueue
+from app.services.task_runner import TaskDispatcher
+from tools import llm_standin
+
+RESULT = {"total_score": 80, "grade": "B", "dimension_scores": {}}
+
+
+def reload(db, task_id: str) -> AnalysisTask:
+    return db.query(AnalysisTask).populate_existing().filter(AnalysisTask.id == task_id).one()
+
+
+def events(db, task_id: str):
+    return [d.event for d in db.query(WebhookDelivery).filter(WebhookDelivery.task_id == task_id)]
+
+
+def test_cancel_pending_task(db, make_task):
+    task = make_task(callback_url="http://127.0.0.1:9/webhook")
+
+    assert TaskManager.cancel(db, task.id) is True
+    cancelled = reload(db, task.id)
+    assert cancelled.status == TaskStatus.CANCELLED.value
+    assert cancelled.completed_at is not None
+    assert events(db, task.id) == ["task.cancelled"]
+    assert TaskQueue.claim(db, "worker-a") is None
+
+
+def test_cancel_wins_over_later_completion(db, make_task):
+    task = make_task(callback_url="http://127.0.0.1:9/webhook")
+    TaskQueue.claim(db, "worker-a")
+
+    assert TaskManager.cancel(db, task.id) is True
+    assert TaskManager.mark_completed(db, task.id, RESULT, lease_owner="worker-a") is False
+    assert TaskManager.mark_failed(db, task.id, "boom", lease_owner="worker-a") is False
+    assert TaskManager.checkpoint_progress(db, {task.id: (60, "Analyzing...")}) == 0
+
+    cancelled = reload(db, task.id)
+    assert cancelled.status == TaskStatus.CANCELLED.value
+    assert cancelled.result is None
+    assert cancelled.lease_owner is None
+    assert events(db, task.id) == ["task.cancelled"]
+
+
+def test_completion_wins_over_later_cancel(db, make_task):
+    task = make_task(callback_url="http://127.0.0.1:9/webhook")
+    TaskQueue.claim(db, "worker-a")
+
+    assert TaskManager.mark_completed(db, task.id, RESULT, lease_owner="worker-a") is True
+    assert TaskManager.cancel(db, task.id) is False
+
+    assert reload(db, task.id).status == TaskStatus.COMPLETED.value
+    assert events(db, task.id) == ["task.completed"]
+
+
+@pytest.mark.parametrize("finish", [
+    lambda db, task_id: TaskManager.mark_completed(db, task_id, RESULT, lease_owner="worker-a"),
+    lambda db, task_id: TaskManager.mark_failed(db, task_id, "boom", lease_owner="worker-a"),
+], ids=["completed", "failed"])
+def test_cancel_committed_while_finishing_wins(db, make_task, monkeypatch, finish):
+    task = make_task(callback_url="http://127.0.0.1:9/webhook")
+    TaskQueue.claim(db, "worker-a")
+    search_index = []
+    monkeypatch.setattr(SearchService, "index_task", lambda *args: search_index.append(args))
+
+    # 完成方準備好結果後、寫入前,另一個會話提交了取消
+    write = TaskManager._finish
+
+    def cancel_then_write(*args):
+        other = SessionLocal()
+        try:
+            assert TaskManager.cancel(other, task.id) is True
+        finally:
+            other.close()
+        return write(*args)
+
+    monkeypatch.setattr(TaskManager, "_finish", cancel_then_write)
+    assert finish(db, task.id) is False
+
+    cancelled = reload(db, task.id)
+    assert cancelled.status == TaskStatus.CANCELLED.value
+    assert cancelled.result is None
+    assert events(db, task.id) == ["task.cancelled"]
+    assert db.query(TaskDimensionScore).filter(TaskDimensionScore.task_id == task.id).count() == 0
+    assert search_index == []
+
+
+@pytest.mark.parametrize("finished", [TaskStatus.FAILED, TaskStatus.CANCELLED])
+def test_cancel_finished_task_is_a_no_op(db, make_task, finished):
+    task = make_task(status=finished.value)
+    assert TaskManager.cancel(db, task.id) is False
+    assert reload(db, task.id).status == finished.value
+
+
+def test_cancel_aborts_streaming_llm_call(standin, monkeypatch):
+    monkeypatch.setattr(llm_standin, "STREAM_SECONDS", 30)
+    analyzer = FAReportAnalyzer(backend="openai", model="test-model", api_key="sk-test", base_url=f"{standin}/v1")
+    analyzer.max_retries = 0
+
+    outcome = {}
+
+    def run():
+        try:
+            outcome["text"] = analyzer.call_llm("分析這份報告")
+        except Exception as e:
+            outcome["error"] = e
+
+    worker = threading.Thread(target=run)
+    start = time.monotonic()
+    worker.start()
+    time.sleep(1)
+    analyzer.cancel()
+    worker.join(10)
+
+    assert not worker.is_alive()
+    assert isinstance(outcome.get("error"), AnalysisCancelled)
+    assert time.monotonic() - start < 10
+
+
+@pytest.mark.asyncio
+async def test_stopping_worker_aborts_llm_call_and_requeues_task(db, make_task, standin, tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_standin, "STREAM_SECONDS", 30)
+    report = tmp_path / "report.txt"
+    report.write_text("失效分析報告\n根因: 焊點空洞", encoding="utf-8")
+    task = TaskQueue.enqueue(db, make_task(file_path=str(report)), {
+        "backend": "openai", "model": "test-model", "api_key": "sk-test",
+        "base_url": f"{standin}/v1", "skip_images": True
+    })
+
+    dispatcher = TaskDispatcher(concurrency=1, poll_interval=0.05)
+    loop = asyncio.create_task(dispatcher.run())
+    try:
+        # 等待任務進入 LLM 串流
+        for _ in range(200):
+            entry = dispatcher.running.get(task.id)
+            if entry and entry[1].analyzer and entry[1].analyzer._active_stream:
+                break
+            await asyncio.sleep(0.05)
+        [(_, analyzer)] = dispatcher.running.values()
+        assert analyzer.analyzer._active_stream is not None
+
+        await dispatcher.stop()
+    finally:
+        loop.cancel()
+        await asyncio.gather(loop, return_exceptions=True)
+
+    # 串流已關閉,執行緒不再佔用連線
+    assert analyzer.analyzer.cancel_event.is_set()
+    for _ in range(100):
+        if analyzer.analyzer._active_stream is None:
+            break
+        await asyncio.sleep(0.05)
+    assert analyzer.analyzer._active_stream is None
+
+    released = reload(db, task.id)
+    assert released.status == TaskStatus.PENDING.value
+    assert released.lease_owner is None
+    assert released.attempts == 0
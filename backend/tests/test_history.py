@@ -0,0 +1,51 @@
+"""
+歷史記錄測試: 游標分頁在同一 created_at 的多筆記錄間不重複、不遺漏,
+以及欄位投影
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException, Response
+
+from app.api.history import decode_cursor, encode_cursor, get_history
+
+
+async def history(db, limit, cursor=None, fields=None):
+    """直接呼叫 /history,返回 (記錄, 下一頁游標)"""
+    response = Response()
+    items = await get_history(
+        response=response, status=None, backend=None, filename=None, days=None,
+        limit=limit, offset=0, cursor=cursor, fields=fields, db=db
+    )
+    return items, response.headers.get("X-Next-Cursor")
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(created_at, "task-1")) == (created_at, "task-1")
+
+    with pytest.raises(HTTPException) as error:
+        decode_cursor("not a cursor")
+    assert error.value.status_code == 400
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fields", [None, "filename,status"])
+@pytest.mark.parametrize("limit", [1, 2, 3, 7])
+async def test_cursor_pages_through_equal_timestamps(db, make_task, fields, limit):
+    same = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+    created = [same + timedelta(minutes=5), same, same, same, same, same - timedelta(minutes=5)]
+    tasks = [make_task(filename=f"report_{i}.txt", created_at=at) for i, at in enumerate(created)]
+    expected = [task.id for task in sorted(tasks, key=lambda task: (task.created_at, task.id), reverse=True)]
+
+    seen, cursor = [], None
+    for _ in range(len(tasks) + 1):
+        items, cursor = await history(db, limit, cursor, fields)
+        assert len(items) <= limit
+        if fields:
+            assert all(set(item) == {"task_id", "filename", "status"} for item in items)
+        seen.extend(item["task_id"] for item in items)
+        if not cursor:
+            break
+
+    assert seen == expected
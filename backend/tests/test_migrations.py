@@ -0,0 +1,47 @@
+"""
+遷移測試: 並行套用 (其他主機先記錄了版本) 與遷移本身的約束錯誤
+"""
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from app import migrations
+from app.database import engine
+
+
+@pytest.fixture
+def pending_migration(monkeypatch):
+    """以 apply 登記一個待套用的遷移 (版本 9000),測試後刪除其記錄"""
+    def register(apply):
+        monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [(9000, "test migration", apply)])
+    yield register
+    with engine.begin() as conn:
+        conn.execute(migrations.schema_migrations.delete().where(migrations.schema_migrations.c.version == 9000))
+
+
+def test_migration_applied_elsewhere_is_skipped(pending_migration):
+    def applied_by_other_host(conn):
+        # 另一個連線 (另一台主機) 在本次交易記錄版本前先完成了同一個遷移
+        with engine.begin() as other:
+            other.execute(migrations.schema_migrations.insert().values(
+                version=9000, name="test migration", applied_at=migrations.datetime.now()
+            ))
+
+    pending_migration(applied_by_other_host)
+    assert migrations.run_migrations(engine) == []
+    assert 9000 in migrations.applied_versions(engine)
+
+
+def test_constraint_failure_in_migration_is_raised(pending_migration):
+    def broken_backfill(conn):
+        conn.execute(text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (1, 'dup', '2024-01-01')"))
+
+    pending_migration(broken_backfill)
+    with pytest.raises(IntegrityError):
+        migrations.run_migrations(engine)
+    assert 9000 not in migrations.applied_versions(engine)
+
+
+def test_run_migrations_is_idempotent():
+    assert migrations.run_migrations(engine) == []
+    assert {version for version, _, _ in migrations.MIGRATIONS} <= migrations.applied_versions(engine)
@@ -0,0 +1,105 @@
+"""
+保留策略測試: 歸檔至壓縮分段後,get_archived 讀回的記錄與歸檔前相同;
+未結束或較新的任務不歸檔,分段可整檔以標準工具解壓
+"""
+import gzip
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from app.config import settings
+from app.models.archive import ArchiveSegment, ArchivedTask
+from app.models.task import AnalysisTask, TaskStatus
+from app.services import retention
+from app.services.retention import RetentionService
+
+
+@pytest.fixture
+def archive(db, monkeypatch):
+    """小分段、小區塊的歸檔;測試結束後刪除分段與索引"""
+    monkeypatch.setattr(settings, "ARCHIVE_SEGMENT_TASKS", 25)
+    monkeypatch.setattr(RetentionService, "BLOCK_TASKS", 7)
+    yield RetentionService.archive
+    for segment in db.query(ArchiveSegment):
+        (Path(settings.ARCHIVE_DIR) / segment.filename).unlink(missing_ok=True)
+    db.query(ArchivedTask).delete(synchronize_session=False)
+    db.query(ArchiveSegment).delete(synchronize_session=False)
+    db.commit()
+
+
+def archived_form(task: AnalysisTask) -> dict:
+    """歸檔記錄經 JSON 往返後的形式"""
+    return json.loads(json.dumps(RetentionService.record(task), ensure_ascii=False, default=str))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+async def test_archive_round_trip(db, make_task, archive, monkeypatch, codec):
+    if codec == "zstd" and not retention.HAS_ZSTD:
+        pytest.skip("未安裝 zstandard")
+    monkeypatch.setattr(settings, "ARCHIVE_CODEC", codec)
+
+    old = datetime.now() - timedelta(days=100)
+    tasks = []
+    for i in range(60):
+        status = (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED)[i % 3]
+        tasks.append(make_task(
+            filename=f"報告_{i}.pdf", status=status.value, created_at=old + timedelta(minutes=i),
+            completed_at=old + timedelta(minutes=i, seconds=30),
+            total_score=60 + i % 40 if status == TaskStatus.COMPLETED else None,
+            result={"total_score": 60 + i % 40, "summary": f"第 {i} 份 <摘要>"} if status == TaskStatus.COMPLETED else None,
+            error="boom" if status == TaskStatus.FAILED else None,
+        ))
+    pending = make_task(status=TaskStatus.PENDING.value, created_at=old)
+    recent = make_task(status=TaskStatus.COMPLETED.value, created_at=datetime.now() - timedelta(days=1))
+    expected = {task.id: archived_form(task) for task in tasks}
+
+    summary = await archive(30)
+
+    assert summary["archived"] == len(tasks)
+    assert summary["segments"] == 3
+    remaining = {task_id for (task_id,) in db.query(AnalysisTask.id)}
+    assert remaining == {pending.id, recent.id}
+
+    for task_id, record in expected.items():
+        restored = RetentionService.get_archived(db, task_id)
+        assert restored.pop("archived") is True
+        assert restored.pop("archived_at")
+        assert restored == record
+    assert RetentionService.get_archived(db, recent.id) is None
+
+    # 每個區塊都是獨立的壓縮幀: gzip 分段可整檔解壓
+    if codec == "gzip":
+        lines = []
+        for segment in db.query(ArchiveSegment):
+            assert segment.filename.endswith(".jsonl.gz")
+            lines.extend(gzip.decompress((Path(settings.ARCHIVE_DIR) / segment.filename).read_bytes()).splitlines())
+        assert sorted(json.loads(line)["task_id"] for line in lines) == sorted(expected)
+
+
+@pytest.mark.asyncio
+async def test_archive_skips_tasks_changed_after_reading(db, make_task, archive, monkeypatch):
+    monkeypatch.setattr(settings, "ARCHIVE_CODEC", "gzip")
+    old = datetime.now() - timedelta(days=100)
+    kept, changed = (
+        make_task(status=TaskStatus.COMPLETED.value, created_at=old + timedelta(minutes=i)).id for i in range(2)
+    )
+
+    write_segment = RetentionService.write_segment
+
+    def regraded_meanwhile(created_before):
+        prepared = write_segment(created_before)
+        # 寫入分段後、提交前任務被重新評分
+        db.query(AnalysisTask).filter(AnalysisTask.id == changed).update({AnalysisTask.total_score: 99})
+        db.commit()
+        return prepared
+
+    monkeypatch.setattr(RetentionService, "write_segment", regraded_meanwhile)
+    summary = await archive(30)
+
+    assert summary["archived"] == 1
+    assert RetentionService.get_archived(db, kept)["task_id"] == kept
+    assert RetentionService.get_archived(db, changed) is None
+    assert db.query(AnalysisTask).filter(AnalysisTask.id == changed).one().total_score == 99
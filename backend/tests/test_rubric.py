@@ -0,0 +1,118 @@
+"""
+評分標準測試: 分析提示詞依評分標準列出維度權重與等級區間,
+以及以 SQL 重新評分 (_regrade_sql) 的結果與逐筆套用評分標準一致
+"""
+import copy
+import random
+
+import pytest
+
+from app.core.fa_analyzer_core import FAReportAnalyzer
+from app.core.rubric import DIMENSION_WEIGHTS
+from app.models.dimension import TaskDimensionScore
+from app.models.rubric import RubricVersion
+from app.models.task import AnalysisTask, TaskStatus
+from app.services.rubric import RubricService
+from app.services.task_manager import TaskManager
+from app.services.task_queue import TaskQueue
+
+RUBRIC = {
+    "weights": {"根因分析": 40.0, "改善對策": 35.0, "量測可追溯性": 25.0},
+    "grade_criteria": {"P": [75, 100, "通過"], "F": [0, 74.5, "不通過"]},
+}
+
+
+def test_prompt_lists_builtin_rubric_by_default():
+    prompt = FAReportAnalyzer(backend="openai", init_client=False).create_analysis_prompt("報告內容")
+
+    for name, weight in RubricService.builtin()["weights"].items():
+        assert f"**{name}** ({weight:g}%)" in prompt
+        assert f'"{name}": {{"score"' in prompt
+    assert "- **A級 (90-100分)**:卓越報告" in prompt
+    assert "- **F級 (<60分)**:不合格報告" in prompt
+
+
+def test_prompt_follows_given_rubric():
+    analyzer = FAReportAnalyzer(backend="openai", init_client=False, rubric=RUBRIC)
+    prompt = analyzer.create_analysis_prompt("報告內容")
+
+    assert "1. **根因分析** (40%)\n   - 根本原因的深度與準確度" in prompt
+    # 沒有評估要點的新維度只列出名稱與權重
+    assert "3. **量測可追溯性** (25%)\n\n【評分標準】" in prompt
+    assert '"量測可追溯性": {"score"' in prompt
+    assert "基本資訊完整性" not in prompt
+    assert "- **P級 (75-100分)**:通過\n- **F級 (<75分)**:不通過" in prompt
+    assert analyzer.calculate_grade(80) == ("P", "通過")
+
+
+@pytest.fixture
+def publish(db):
+    """發布評分標準版本;測試結束後刪除"""
+    def create(weights, grade_criteria=None):
+        return RubricService.create(db, weights, grade_criteria, note="test")
+    yield create
+    db.query(RubricVersion).delete(synchronize_session=False)
+    db.commit()
+
+
+def complete(db, make_task, percentages):
+    """以內建標準完成一個任務,維度完成度為 percentages"""
+    task = make_task()
+    TaskQueue.claim(db, "worker-a")
+    result = {
+        "total_score": 0, "grade": "F", "summary": "摘要",
+        "dimension_scores": {
+            name: {"score": 0, "percentage": percentage, "comment": f"{name}評語"}
+            for name, percentage in percentages.items()
+        },
+    }
+    assert TaskManager.mark_completed(db, task.id, result, lease_owner="worker-a")
+    return db.query(AnalysisTask).populate_existing().filter(AnalysisTask.id == task.id).one()
+
+
+def test_regrade_sql_matches_python_rubric(db, make_task, publish):
+    names = list(DIMENSION_WEIGHTS)
+    rng = random.Random(11)
+    tasks = [
+        complete(db, make_task, {name: round(rng.uniform(20, 100), 2) for name in names})
+        for _ in range(40)
+    ]
+    # 缺少一個維度完成度的任務不重新評分
+    partial = complete(db, make_task, {name: 80.0 for name in names[:-1]})
+    failed = make_task(status=TaskStatus.FAILED.value, total_score=None)
+    expected = {task.id: copy.deepcopy(task.result) for task in tasks}
+    partial_result = copy.deepcopy(partial.result)
+
+    weights = {names[0]: 5, names[1]: 10, names[2]: 25, names[3]: 25, names[4]: 30, names[5]: 5}
+    rubric = publish(weights, {"A": [85, 100, "卓越"], "B": [70, 84.9, "良好"], "F": [0, 69.9, "不合格"]})
+
+    summary = RubricService.regrade(db)
+
+    assert summary["version"] == rubric["version"]
+    assert summary["regraded"] == len(tasks)
+    assert summary["skipped"] == 1
+    for task in tasks:
+        want = RubricService.apply(expected[task.id], rubric)
+        regraded = db.query(AnalysisTask).populate_existing().filter(AnalysisTask.id == task.id).one()
+        assert regraded.total_score == want["total_score"]
+        assert regraded.grade == want["grade"]
+        assert regraded.rubric_version == rubric["version"]
+        assert regraded.result == want
+
+        rows = {
+            row.dimension: row for row in
+            db.query(TaskDimensionScore).filter(TaskDimensionScore.task_id == task.id)
+        }
+        for name, weight in weights.items():
+            assert rows[name].weight == weight
+            assert rows[name].score == want["dimension_scores"][name]["score"]
+
+    untouched = db.query(AnalysisTask).populate_existing().filter(AnalysisTask.id == partial.id).one()
+    assert untouched.result == partial_result
+    assert untouched.rubric_version == partial.rubric_version
+    assert db.query(AnalysisTask).filter(AnalysisTask.id == failed.id).one().total_score is None
+
+
+def test_regrade_unknown_version(db):
+    with pytest.raises(ValueError):
+        RubricService.regrade(db, version=999)
@@ -0,0 +1,74 @@
+"""
+搜尋測試: FTS5 trigram 索引與 LIKE 的結果一致,少於三個字的詞 (如「短路」)
+改用 LIKE,以及摘錄的標記與跳脫
+"""
+import pytest
+
+from app.services.search import SearchService
+from app.services.task_manager import TaskManager
+from app.services.task_queue import TaskQueue
+
+REPORTS = {
+    "pm200_void.pdf": ("X-ray 確認 Q3 MOSFET 焊點空洞,迴焊溫度曲線不足", "焊點空洞導致熱阻升高"),
+    "pm300_short.pdf": ("電容 C12 短路,外觀檢查發現錫橋", "錫橋造成短路 <C12>"),
+    "pm400_crack.pdf": ("陶瓷電容裂紋,推測為分板應力,焊點正常", "分板應力導致電容裂紋"),
+}
+
+
+@pytest.fixture
+def indexed(db, make_task):
+    """完成並索引 REPORTS 中的每份報告,返回 {檔名: 任務 ID}"""
+    ids = {}
+    for filename, (report_text, summary) in REPORTS.items():
+        task = make_task(filename=filename)
+        TaskQueue.claim(db, "worker-a")
+        result = {"total_score": 80, "grade": "B", "dimension_scores": {}, "summary": summary}
+        assert TaskManager.mark_completed(db, task.id, result, lease_owner="worker-a", report_text=report_text)
+        ids[filename] = task.id
+    return ids
+
+
+def found(results):
+    return sorted(result["task_id"] for result in results)
+
+
+@pytest.mark.parametrize("query", ["焊點空洞", "電容裂紋 分板", "MOSFET", "pm300"])
+def test_fts_matches_like(db, indexed, query):
+    if not SearchService.has_index(db):
+        pytest.skip("SQLite 未提供 FTS5 trigram")
+    terms = SearchService.terms(query)
+
+    fts = SearchService._fts_search(db, terms, [], 20, None)
+    like = SearchService._like_search(db, terms, 20, None)
+
+    assert fts and found(fts) == found(like)
+    assert all(result["rank"] is not None for result in fts)
+
+
+def test_search_ranks_with_fts(db, indexed):
+    results = SearchService.search(db, "焊點空洞")
+    if SearchService.has_index(db):
+        assert all(result["rank"] is not None for result in results)
+    # 檔名與摘要權重較高,排在只在報告內文中出現的任務之前
+    assert results[0]["task_id"] == indexed["pm200_void.pdf"]
+    assert "<mark>焊點空洞</mark>" in results[0]["snippet"]
+
+
+def test_short_terms_use_like(db, indexed):
+    results = SearchService.search(db, "短路")
+
+    assert found(results) == [indexed["pm300_short.pdf"]]
+    assert results[0]["rank"] is None
+    # 摘錄經過跳脫,只保留 <mark> 標記
+    assert results[0]["snippet"] == "錫橋造成<mark>短路</mark> &lt;C12&gt;"
+
+
+def test_short_terms_filter_fts_results(db, indexed):
+    # 「電容」「焊點」少於三個字,以 LIKE 過濾 FTS 的結果
+    assert found(SearchService.search(db, "焊點空洞 電容")) == []
+    assert found(SearchService.search(db, "陶瓷電容 焊點")) == [indexed["pm400_crack.pdf"]]
+
+
+def test_all_terms_must_match(db, indexed):
+    assert SearchService.search(db, "MOSFET 裂紋") == []
+    assert SearchService.search(db, '  "" ') == []
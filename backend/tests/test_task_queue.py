@@ -0,0 +1,206 @@
+"""
+任務佇列測試: 認領與租約、續期、交還、租約過期重新排隊與最大嘗試次數,
+以及優先級、提交者公平分配與離峰時段的認領順序
+"""
+from datetime import datetime, time, timedelta
+
+import pytest
+
+from app.config import settings
+from app.models.task import AnalysisTask, TaskPriority, TaskStatus
+from app.models.webhook import WebhookDelivery
+from app.services.task_manager import TaskManager
+from app.services.task_queue import TaskQueue
+
+
+def reload(db, task_id: str) -> AnalysisTask:
+    return db.query(AnalysisTask).populate_existing().filter(AnalysisTask.id == task_id).one()
+
+
+def expire_lease(db, task_id: str):
+    db.query(AnalysisTask).filter(AnalysisTask.id == task_id).update({
+        AnalysisTask.lease_expires_at: datetime.now() - timedelta(seconds=1)
+    })
+    db.commit()
+
+
+def test_enqueue_encrypts_api_key(db, make_task):
+    task = TaskQueue.enqueue(db, make_task(), {"backend": "openai", "api_key": "sk-secret"})
+
+    assert task.status == TaskStatus.PENDING.value
+    assert task.options["api_key"] != "sk-secret"
+    assert TaskQueue.load_config(task)["api_key"] == "sk-secret"
+
+
+def test_claim_takes_a_lease(db, make_task):
+    task = make_task()
+
+    claimed = TaskQueue.claim(db, "worker-a")
+    assert claimed.id == task.id
+    assert claimed.status == TaskStatus.PROCESSING.value
+    assert claimed.lease_owner == "worker-a"
+    assert claimed.attempts == 1
+    assert claimed.lease_expires_at > datetime.now() + timedelta(seconds=settings.TASK_LEASE_SECONDS - 5)
+
+    # 已認領的任務不會被其他 worker 認領
+    assert TaskQueue.claim(db, "worker-b") is None
+
+
+def test_claim_filters_backends_and_skips_batch_tasks(db, make_task):
+    make_task(backend="openai", batch_id="batch-1")
+    anthropic = make_task(backend="anthropic")
+
+    assert TaskQueue.claim(db, "worker-a", backends=["openai"]) is None
+    assert TaskQueue.claim(db, "worker-a", backends=["anthropic", "ollama"]).id == anthropic.id
+
+
+def test_heartbeat_renews_only_the_holders_lease(db, make_task):
+    task = make_task()
+    TaskQueue.claim(db, "worker-a")
+    expire_lease(db, task.id)
+
+    assert TaskQueue.heartbeat(db, task.id, "worker-b") is False
+    assert TaskQueue.heartbeat(db, task.id, "worker-a") is True
+    assert reload(db, task.id).lease_expires_at > datetime.now()
+
+    TaskManager.cancel(db, task.id)
+    assert TaskQueue.heartbeat(db, task.id, "worker-a") is False
+
+
+def test_release_requeues_without_counting_the_attempt(db, make_task):
+    task = make_task()
+    TaskQueue.claim(db, "worker-a")
+
+    TaskQueue.release(db, task.id, "worker-b")
+    assert reload(db, task.id).status == TaskStatus.PROCESSING.value
+
+    TaskQueue.release(db, task.id, "worker-a")
+    released = reload(db, task.id)
+    assert released.status == TaskStatus.PENDING.value
+    assert released.lease_owner is None
+    assert released.attempts == 0
+
+
+def test_requeue_expired(db, make_task):
+    expired, alive = make_task(), make_task()
+    unleased = make_task(status=TaskStatus.PROCESSING.value)
+    batched = make_task(status=TaskStatus.PROCESSING.value, batch_id="batch-1")
+    TaskQueue.claim(db, "worker-a")
+    TaskQueue.claim(db, "worker-b")
+    expire_lease(db, expired.id)
+
+    assert TaskQueue.requeue_expired(db) == 2
+
+    requeued = reload(db, expired.id)
+    assert requeued.status == TaskStatus.PENDING.value
+    assert requeued.lease_owner is None and requeued.lease_expires_at is None
+    assert requeued.message == "任務執行中斷,重新排隊"
+    assert reload(db, unleased.id).status == TaskStatus.PENDING.value
+    assert reload(db, alive.id).status == TaskStatus.PROCESSING.value
+    assert reload(db, batched.id).status == TaskStatus.PROCESSING.value
+
+    # 原持有者不能再完成已重新排隊的任務
+    assert TaskManager.mark_completed(db, expired.id, {"total_score": 80}, lease_owner="worker-a") is False
+
+
+def test_requeue_expired_fails_task_at_max_attempts(db, make_task, monkeypatch):
+    monkeypatch.setattr(settings, "TASK_MAX_ATTEMPTS", 2)
+    task = make_task(callback_url="http://127.0.0.1:9/webhook")
+
+    for attempt in (1, 2):
+        claimed = TaskQueue.claim(db, f"worker-{attempt}")
+        assert claimed.id == task.id and claimed.attempts == attempt
+        expire_lease(db, task.id)
+        assert TaskQueue.requeue_expired(db) == 1
+
+    failed = reload(db, task.id)
+    assert failed.status == TaskStatus.FAILED.value
+    assert failed.error == "任務執行中斷 2 次,已停止重試"
+    assert TaskQueue.claim(db, "worker-3") is None
+
+    [delivery] = db.query(WebhookDelivery).filter(WebhookDelivery.task_id == task.id).all()
+    assert delivery.event == "task.failed"
+
+
+@pytest.mark.parametrize("owner, expected", [("worker-a", True), ("worker-b", False)])
+def test_only_the_lease_holder_finishes_a_task(db, make_task, owner, expected):
+    task = make_task()
+    TaskQueue.claim(db, "worker-a")
+
+    assert TaskManager.mark_failed(db, task.id, "boom", lease_owner=owner) is expected
+    status = TaskStatus.FAILED if expected else TaskStatus.PROCESSING
+    assert reload(db, task.id).status == status.value
+
+
+def claim_order(db) -> list:
+    """依序認領所有可認領的任務"""
+    order = []
+    while True:
+        task = TaskQueue.claim(db, "worker-a")
+        if task is None:
+            return order
+        order.append(task.filename)
+        # 完成後不再佔用提交者的執行名額
+        TaskManager.mark_completed(db, task.id, {"total_score": 80}, lease_owner="worker-a")
+
+
+def test_claim_follows_priority_before_age(db, make_task):
+    now = datetime.now()
+    make_task(filename="low", priority=TaskPriority.LOW.value, created_at=now - timedelta(hours=3))
+    make_task(filename="normal", priority=TaskPriority.NORMAL.value, created_at=now - timedelta(hours=2))
+    make_task(filename="urgent", priority=TaskPriority.URGENT.value, created_at=now - timedelta(hours=1))
+    make_task(filename="unset", priority=None, created_at=now)
+
+    assert claim_order(db) == ["urgent", "normal", "unset", "low"]
+
+
+def test_claim_prefers_submitter_with_fewest_running(db, make_task):
+    now = datetime.now()
+    for i in range(2):
+        make_task(filename=f"busy-running-{i}", submitter="busy", created_at=now - timedelta(hours=5))
+        TaskQueue.claim(db, "worker-b")
+    make_task(filename="busy-1", submitter="busy", created_at=now - timedelta(hours=2))
+    make_task(filename="busy-2", submitter="busy", created_at=now - timedelta(hours=1))
+    make_task(filename="quiet-1", submitter="quiet", created_at=now - timedelta(minutes=30))
+
+    first = TaskQueue.claim(db, "worker-a")
+    assert first.filename == "quiet-1"
+
+    # 同一提交者的任務按創建時間先後認領
+    assert TaskQueue.claim(db, "worker-a").filename == "busy-1"
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("22:00-06:00", [(time(22, 0), time(6, 0))]),
+    ("12:00-13:30, 22:00-23:00", [(time(12, 0), time(13, 30)), (time(22, 0), time(23, 0))]),
+    ("bad, 01:00-02:00", [(time(1, 0), time(2, 0))]),
+    (None, []),
+])
+def test_parse_windows(raw, expected):
+    assert TaskQueue.parse_windows(raw) == expected
+
+
+@pytest.mark.parametrize("now, expected", [
+    (datetime(2024, 1, 1, 23, 30), True),
+    (datetime(2024, 1, 2, 5, 59), True),
+    (datetime(2024, 1, 2, 6, 0), False),
+    (datetime(2024, 1, 2, 12, 15), True),
+    (datetime(2024, 1, 2, 15, 0), False),
+])
+def test_is_offpeak_handles_windows_past_midnight(monkeypatch, now, expected):
+    monkeypatch.setattr(settings, "OFFPEAK_WINDOWS", "22:00-06:00,12:00-13:30")
+    assert TaskQueue.is_offpeak(now) is expected
+
+
+def test_low_priority_waits_for_offpeak(db, make_task, monkeypatch):
+    current = datetime.now()
+    start = (current + timedelta(hours=1)).strftime("%H:%M")
+    end = (current + timedelta(hours=2)).strftime("%H:%M")
+    monkeypatch.setattr(settings, "OFFPEAK_WINDOWS", f"{start}-{end}")
+    make_task(filename="low", priority=TaskPriority.LOW.value, created_at=current - timedelta(hours=1))
+    make_task(filename="normal", priority=TaskPriority.NORMAL.value)
+
+    assert claim_order(db) == ["normal"]
+
+    monkeypatch.setattr(settings, "OFFPEAK_WINDOWS", None)
+    assert claim_order(db) == ["low"]
@@ -0,0 +1,255 @@
+"""
+Webhook 投遞測試: 簽名、退避、認領/交還、投遞結果的狀態轉換,
+以及對替身服務器接收端的實際發送
+"""
+import asyncio
+import hashlib
+import hmac
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.models.task import TaskStatus
+from app.models.webhook import WebhookDelivery, WebhookStatus
+from app.services.webhook import CallbackURLRejected, WebhookService
+from tools import llm_standin
+
+
+def reload(db, delivery_id: str) -> WebhookDelivery:
+    """讀取寫入執行緒更新後的投遞"""
+    return db.query(WebhookDelivery).populate_existing().filter(WebhookDelivery.id == delivery_id).one()
+
+
+@pytest.fixture
+def add_delivery(db, make_task):
+    """建立一個到期的待投遞記錄"""
+    def create(url: str = "http://127.0.0.1:9/webhook", **values) -> WebhookDelivery:
+        task = make_task(status=TaskStatus.COMPLETED.value, callback_url=url)
+        values.setdefault("next_attempt_at", datetime.now() - timedelta(seconds=1))
+        delivery = WebhookDelivery(
+            task_id=task.id, url=url, event="task.completed",
+            payload={"event": "task.completed", "task_id": task.id}, **values
+        )
+        db.add(delivery)
+        db.commit()
+        return delivery
+    return create
+
+
+def test_sign_is_hmac_of_timestamp_and_body():
+    body = b'{"task_id": "t1"}'
+    expected = hmac.new(b"secret", b"1700000000." + body, hashlib.sha256).hexdigest()
+    assert WebhookService.sign(body, "1700000000", "secret") == f"sha256={expected}"
+
+
+def test_backoff_doubles_per_attempt_and_is_capped(monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_RETRY_BASE_SECONDS", 10.0)
+    assert 8 <= WebhookService.backoff_seconds(1) <= 12
+    assert 32 <= WebhookService.backoff_seconds(3) <= 48
+    assert WebhookService.backoff_seconds(30) <= 3600 * 1.2
+
+
+def test_schedule_requires_callback_url_and_finished_status(db, make_task):
+    assert WebhookService.schedule(db, make_task(status=TaskStatus.COMPLETED.value)) is None
+    assert WebhookService.schedule(db, make_task(status=TaskStatus.PROCESSING.value, callback_url="http://x")) is None
+
+    task = make_task(status=TaskStatus.FAILED.value, callback_url="http://x", error="boom")
+    delivery = WebhookService.schedule(db, task)
+    assert delivery.event == "task.failed"
+    assert delivery.payload["error"] == "boom"
+
+
+def test_claim_due_claims_each_delivery_once(db, add_delivery):
+    due = add_delivery()
+    later = add_delivery(next_attempt_at=datetime.now() + timedelta(hours=1))
+
+    claimed = WebhookService.claim_due(db, 10)
+    assert [d["id"] for d in claimed] == [due.id]
+    assert claimed[0]["attempts"] == 1
+    assert reload(db, due.id).status == WebhookStatus.DELIVERING.value
+    assert reload(db, later.id).status == WebhookStatus.PENDING.value
+
+    # 已被認領的投遞不會再被其他進程認領
+    assert WebhookService.claim_due(db, 10) == []
+
+
+def test_claim_due_resets_stale_delivering(db, add_delivery):
+    delivery = add_delivery(status=WebhookStatus.DELIVERING.value, attempts=1)
+    db.query(WebhookDelivery).filter(WebhookDelivery.id == delivery.id).update({
+        WebhookDelivery.updated_at: datetime.now() - timedelta(seconds=WebhookService.DELIVERING_TIMEOUT + 1)
+    })
+    db.commit()
+
+    claimed = WebhookService.claim_due(db, 10)
+    assert [d["id"] for d in claimed] == [delivery.id]
+    assert claimed[0]["attempts"] == 2
+
+
+def test_release_returns_delivery_without_counting_attempt(db, add_delivery):
+    delivery = add_delivery()
+    WebhookService.claim_due(db, 10)
+
+    WebhookService.release(db, delivery.id)
+    released = reload(db, delivery.id)
+    assert released.status == WebhookStatus.PENDING.value
+    assert released.attempts == 0
+
+
+@pytest.mark.parametrize("status_code, error, attempts, expected", [
+    (200, None, 1, WebhookStatus.DELIVERED),
+    (503, "HTTP 503", 1, WebhookStatus.PENDING),
+    (429, "HTTP 429", 1, WebhookStatus.PENDING),
+    (None, "ConnectError: refused", 1, WebhookStatus.PENDING),
+    (400, "HTTP 400", 1, WebhookStatus.FAILED),
+    (503, "HTTP 503", 6, WebhookStatus.FAILED),
+])
+def test_record_attempt_transitions(db, add_delivery, monkeypatch, status_code, error, attempts, expected):
+    monkeypatch.setattr(settings, "WEBHOOK_MAX_ATTEMPTS", 6)
+    delivery = add_delivery(status=WebhookStatus.DELIVERING.value, attempts=attempts)
+
+    WebhookService.record_attempt(db, delivery.id, attempts, status_code, error)
+    recorded = reload(db, delivery.id)
+    assert recorded.status == expected.value
+    assert recorded.last_status_code == status_code
+    assert recorded.last_error == error
+    if expected == WebhookStatus.PENDING:
+        assert recorded.next_attempt_at > datetime.now()
+    if expected == WebhookStatus.DELIVERED:
+        assert recorded.delivered_at is not None
+
+
+def test_record_attempt_ignores_released_delivery(db, add_delivery):
+    delivery = add_delivery()
+    WebhookService.record_attempt(db, delivery.id, 1, 200, None)
+    assert reload(db, delivery.id).status == WebhookStatus.PENDING.value
+
+
+def test_record_attempt_waits_at_least_retry_after(db, add_delivery, monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_RETRY_BASE_SECONDS", 0.01)
+    delivery = add_delivery(status=WebhookStatus.DELIVERING.value, attempts=1)
+
+    WebhookService.record_attempt(db, delivery.id, 1, 503, "HTTP 503", retry_after=120)
+    assert reload(db, delivery.id).next_attempt_at >= datetime.now() + timedelta(seconds=110)
+
+
+async def deliver_due(db):
+    """認領並發送所有到期的投遞"""
+    async with httpx.AsyncClient(timeout=5) as client:
+        for delivery in WebhookService.claim_due(db, 10):
+            await WebhookService.deliver(client, delivery)
+
+
+@pytest.mark.asyncio
+async def test_deliver_signed_success(db, add_delivery, webhook_receiver, monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET", "shared-secret")
+    monkeypatch.setattr(llm_standin, "WEBHOOK_SECRET", "shared-secret")
+    delivery = add_delivery(webhook_receiver)
+
+    await deliver_due(db)
+
+    delivered = reload(db, delivery.id)
+    assert delivered.status == WebhookStatus.DELIVERED.value
+    assert delivered.last_status_code == 200
+    [received] = llm_standin.webhook_deliveries
+    assert received["delivery_id"] == delivery.id
+    assert received["event"] == "task.completed"
+    assert received["signed"] and received["verified"]
+    assert received["payload"]["task_id"] == delivery.task_id
+
+
+@pytest.mark.asyncio
+async def test_deliver_retries_5xx_until_success(db, add_delivery, webhook_receiver, monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_RETRY_BASE_SECONDS", 0.01)
+    monkeypatch.setattr(llm_standin, "WEBHOOK_FAILURES", 1)
+    delivery = add_delivery(webhook_receiver)
+
+    await deliver_due(db)
+    retried = reload(db, delivery.id)
+    assert retried.status == WebhookStatus.PENDING.value
+    assert retried.last_status_code == 503
+    assert retried.attempts == 1
+    # 接收端的 Retry-After: 1 優先於更短的退避時間
+    assert retried.next_attempt_at >= datetime.now() + timedelta(seconds=0.5)
+
+    db.query(WebhookDelivery).filter(WebhookDelivery.id == delivery.id).update({
+        WebhookDelivery.next_attempt_at: datetime.now() - timedelta(seconds=1)
+    })
+    db.commit()
+    await deliver_due(db)
+
+    delivered = reload(db, delivery.id)
+    assert delivered.status == WebhookStatus.DELIVERED.value
+    assert delivered.attempts == 2
+    assert llm_standin.webhook_deliveries[0]["attempts"] == 2
+
+
+@pytest.mark.asyncio
+async def test_deliver_4xx_fails_without_retry(db, add_delivery, webhook_receiver, monkeypatch):
+    # 簽名不符: 接收端回應 401
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET", "our-secret")
+    monkeypatch.setattr(llm_standin, "WEBHOOK_SECRET", "their-secret")
+    delivery = add_delivery(webhook_receiver)
+
+    await deliver_due(db)
+
+    failed = reload(db, delivery.id)
+    assert failed.status == WebhookStatus.FAILED.value
+    assert failed.last_status_code == 401
+    assert failed.last_error == "HTTP 401"
+    assert llm_standin.webhook_deliveries == []
+
+
+@pytest.mark.asyncio
+async def test_run_sender_delivers_due_webhooks(db, add_delivery, webhook_receiver):
+    delivery = add_delivery(webhook_receiver)
+
+    sender = asyncio.create_task(WebhookService.run_sender(interval=0.05))
+    try:
+        for _ in range(100):
+            if reload(db, delivery.id).status == WebhookStatus.DELIVERED.value:
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
+
+    assert reload(db, delivery.id).status == WebhookStatus.DELIVERED.value
+    assert [d["delivery_id"] for d in llm_standin.webhook_deliveries] == [delivery.id]
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:8080/hook",
+    "http://localhost/hook",
+    "http://10.1.2.3/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]/hook",
+    "http://[::ffff:192.168.0.1]/hook",
+    "ftp://93.184.216.34/hook",
+])
+def test_check_url_rejects_non_public_addresses(url):
+    with pytest.raises(CallbackURLRejected):
+        WebhookService.check_url(url)
+
+
+def test_check_url_allows_public_and_listed_hosts(monkeypatch):
+    WebhookService.check_url("https://93.184.216.34/hook")
+
+    monkeypatch.setattr(settings, "WEBHOOK_ALLOWED_HOSTS", "hooks.internal, LocalHost")
+    WebhookService.check_url("http://localhost:9000/hook")
+
+
+@pytest.mark.asyncio
+async def test_deliver_rejects_private_host_without_retry(db, add_delivery, webhook_receiver, monkeypatch):
+    # 提交後允許清單已變更 (或主機改為解析至內部地址)
+    monkeypatch.setattr(settings, "WEBHOOK_ALLOWED_HOSTS", None)
+    delivery = add_delivery(webhook_receiver)
+
+    await deliver_due(db)
+
+    rejected = reload(db, delivery.id)
+    assert rejected.status == WebhookStatus.FAILED.value
+    assert rejected.last_status_code is None
+    assert "非公開地址 127.0.0.1" in rejected.last_error
+    assert llm_standin.webhook_deliveries == []
@@ -0,0 +1,200 @@
+"""
+歷史記錄查詢基準測試
+在臨時 SQLite 資料庫中寫入大量分析任務,分別在有/無索引的情況下執行
+/history 與 /history/stats/summary 的實際查詢,輸出耗時與 EXPLAIN QUERY PLAN,
+用於確認查詢計畫使用了 analysis_tasks 的索引
+
+執行:
+    cd backend
+    python -m tools.bench_history --rows 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="歷史記錄查詢基準測試")
+    parser.add_argument("--rows", type=int, default=100000, help="寫入的任務數 (預設 100000)")
+    parser.add_argument("--repeat", type=int, default=20, help="每個查詢的執行次數 (預設 20)")
+    parser.add_argument("--seed", type=int, default=42, help="隨機種子")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="fa_bench_")
+    # 必須在載入 app 之前設定,讓 engine 指向臨時資料庫
+    os.environ["DATABASE_URL"] = f"sqlite:///{Path(workdir) / 'bench.db'}"
+    os.environ.setdefault("UPLOAD_DIR", str(Path(workdir) / "uploads"))
+    os.environ.setdefault("ENCRYPTION_KEY", "bench")
+    # 量測統計查詢本身,不經過回應快取
+    os.environ["HISTORY_STATS_CACHE_SECONDS"] = "0"
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+    from fastapi import Response
+    from sqlalchemy import event, text
+    from app.api.history import encode_cursor, get_history, get_history_stats
+    from app.database import SessionLocal, engine, init_db
+    from app.migrations import MIGRATIONS
+    from app.models.task import AnalysisTask
+
+    init_db()
+    populate(engine, AnalysisTask, args.rows, args.seed)
+
+    # 每個情境對應一個端點呼叫 (參數須全部明確傳入,否則會收到 Query 預設物件)
+    history = dict(status=None, backend=None, filename=None, days=None, limit=50, offset=0, cursor=None, fields=None)
+    summary_fields = "task_id,filename,status,total_score,grade,created_at"
+    # 深分頁的偏移量 (不超過資料量的一半);游標取該頁之前的最後一筆
+    deep_offset = max(1, min(50000, args.rows // 2))
+    with engine.connect() as conn:
+        created_at, task_id = conn.execute(text(
+            "SELECT created_at, id FROM analysis_tasks ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET :offset"
+        ), {"offset": deep_offset - 1}).one()
+    deep_cursor = encode_cursor(datetime.fromisoformat(str(created_at)), task_id)
+
+    scenarios = [
+        ("history", lambda db: get_history(Response(), **history, db=db)),
+        ("history status=completed", lambda db: get_history(Response(), **{**history, "status": "completed"}, db=db)),
+        ("history backend=openai", lambda db: get_history(Response(), **{**history, "backend": "openai"}, db=db)),
+        ("history days=7", lambda db: get_history(Response(), **{**history, "days": 7}, db=db)),
+        ("history status=failed days=30", lambda db: get_history(Response(), **{**history, "status": "failed", "days": 30}, db=db)),
+        (f"history offset={deep_offset}", lambda db: get_history(Response(), **{**history, "offset": deep_offset}, db=db)),
+        (f"history cursor (offset {deep_offset})", lambda db: get_history(Response(), **{**history, "cursor": deep_cursor}, db=db)),
+        ("history limit=500 full", lambda db: get_history(Response(), **{**history, "limit": 500}, db=db)),
+        ("history limit=500 fields", lambda db: get_history(Response(), **{**history, "limit": 500, "fields": summary_fields}, db=db)),
+        ("stats summary", lambda db: get_history_stats(db=db)),
+    ]
+
+    captured = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    def measure():
+        results = {}
+        for name, call in scenarios:
+            timings = []
+            statements = []
+            for i in range(args.repeat):
+                captured.clear()
+                db = SessionLocal()
+                try:
+                    start = time.perf_counter()
+                    asyncio.run(call(db))
+                    timings.append((time.perf_counter() - start) * 1000)
+                finally:
+                    db.close()
+                if i == 0:
+                    statements = list(captured)
+            results[name] = (statistics.median(timings), explain(engine, statements))
+        return results
+
+    with_indexes = measure()
+
+    # 移除遷移建立的索引,比較全表掃描的耗時
+    with engine.begin() as conn:
+        for index in AnalysisTask.__table__.indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    without_indexes = measure()
+
+    print(f"\n{args.rows} 個任務, 每個查詢執行 {args.repeat} 次 (中位數), 遷移版本: {[v for v, _, _ in MIGRATIONS]}\n")
+    print(f"{'情境':<34}{'有索引 (ms)':>14}{'無索引 (ms)':>14}{'加速':>10}")
+    for name, _ in scenarios:
+        indexed_ms, _ = with_indexes[name]
+        scan_ms, _ = without_indexes[name]
+        print(f"{name:<36}{indexed_ms:>14.2f}{scan_ms:>14.2f}{scan_ms / max(indexed_ms, 0.001):>9.1f}x")
+
+    print("\n查詢計畫 (有索引):")
+    full_scans = 0
+    for name, _ in scenarios:
+        print(f"\n[{name}]")
+        for detail in with_indexes[name][1]:
+            print(f"  {detail}")
+            if detail.startswith("SCAN analysis_tasks") and "INDEX" not in detail:
+                full_scans += 1
+    print(f"\n全表掃描: {full_scans}")
+
+    engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def populate(engine, model, rows: int, seed: int):
+    """寫入隨機分布於一年內的任務"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    statuses = ["completed"] * 85 + ["failed"] * 8 + ["cancelled"] * 3 + ["pending"] * 3 + ["processing"]
+    backends = ["openai", "anthropic", "ollama"]
+    models = {"openai": "gpt-4o", "anthropic": "claude-3-5-sonnet", "ollama": "llama3.2-vision"}
+
+    table = model.__table__
+    chunk = 10000
+    with engine.begin() as conn:
+        for offset in range(0, rows, chunk):
+            batch = []
+            for i in range(offset, min(rows, offset + chunk)):
+                created_at = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+                status = rng.choice(statuses)
+                backend = rng.choice(backends)
+                result = sample_result(rng) if status == "completed" else None
+                batch.append({
+                    "id": f"bench-{i:08d}",
+                    "filename": f"report_{i}.pdf",
+                    "file_path": f"uploads/report_{i}.pdf",
+                    "status": status,
+                    "progress": 100 if status == "completed" else 0,
+                    "message": "",
+                    "backend": backend,
+                    "model": models[backend],
+                    "skip_images": 0,
+                    "priority": "normal",
+                    "attempts": 1,
+                    "created_at": created_at,
+                    "updated_at": created_at,
+                    "completed_at": created_at + timedelta(seconds=60) if status == "completed" else None,
+                    "result": result,
+                    "total_score": result["total_score"] if result else None,
+                    "grade": result["grade"] if result else None,
+                })
+            conn.execute(table.insert(), batch)
+        conn.exec_driver_sql("ANALYZE")
+
+
+def sample_result(rng: random.Random) -> dict:
+    """與 LLM 評分結果大小相近的 result"""
+    dimensions = ["基本資訊完整性", "問題描述與定義", "分析方法與流程", "數據與證據支持", "根因分析", "改善對策"]
+    total_score = round(rng.uniform(40, 98), 1)
+    return {
+        "total_score": total_score,
+        "grade": "A" if total_score >= 90 else "B" if total_score >= 80 else "C" if total_score >= 70 else "D",
+        "dimension_scores": {
+            name: {"score": rng.randint(5, 20), "percentage": rng.randint(40, 100), "comment": "評語" * 20}
+            for name in dimensions
+        },
+        "strengths": ["優點說明" * 5] * 3,
+        "improvements": [{"priority": "高", "item": "改善項目", "suggestion": "改善建議" * 10}] * 3,
+        "summary": "總結" * 60,
+    }
+
+
+def explain(engine, statements):
+    """EXPLAIN QUERY PLAN of each captured statement"""
+    details = []
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+            details.extend(row[-1] for row in rows)
+    return details
+
+
+if __name__ == "__main__":
+    main()
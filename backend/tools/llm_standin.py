@@ -0,0 +1,337 @@
+"""
+本地 LLM 供應商替身服務器
+模擬 OpenAI Batch API、Anthropic Message Batches API 和 OpenAI 串流 Chat Completions,
+用於在不呼叫真實供應商的情況下測試批次模式與互動分析管線;
+另提供 webhook 接收端 (POST /webhook) 用於測試任務完成通知
+
+啟動:
+    cd backend
+    uvicorn tools.llm_standin:app --port 8900
+
+使用:
+    OpenAI 批次:    base_url = http://localhost:8900/v1
+    Anthropic 批次: base_url = http://localhost:8900
+    Webhook:        callback_url = http://localhost:8900/webhook,
+                    收到的投遞可由 GET /webhook/deliveries 查看
+
+批次在被查詢 STANDIN_BATCH_POLLS 次 (預設 1) 後完成,每個請求都返回一份固定的評分結果。
+串流響應在 STANDIN_STREAM_SECONDS 秒 (預設 2) 內分段送出,用於模擬 LLM 延遲。
+設定 STANDIN_WEBHOOK_SECRET 時驗證 webhook 簽名;每個投遞的前 STANDIN_WEBHOOK_FAILURES 次
+(預設 0) 回應 503,用於測試重試。
+"""
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import Response, StreamingResponse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import time
+import uuid
+
+app = FastAPI(title="LLM Provider Stand-in")
+
+# 批次在完成前需要被查詢的次數
+BATCH_POLLS = int(os.environ.get("STANDIN_BATCH_POLLS", "1"))
+
+# 串流響應的總時長 (秒)
+STREAM_SECONDS = float(os.environ.get("STANDIN_STREAM_SECONDS", "2"))
+
+# 固定的評分結果
+CANNED_RESULT = {
+    "total_score": 82.5,
+    "grade": "B",
+    "dimension_scores": {
+        "基本資訊完整性": {"score": 13, "percentage": 86.67, "comment": "基本資訊齊全"},
+        "問題描述與定義": {"score": 12, "percentage": 80, "comment": "失效現象描述清楚"},
+        "分析方法與流程": {"score": 16, "percentage": 80, "comment": "分析步驟合理"},
+        "數據與證據支持": {"score": 16, "percentage": 80, "comment": "數據充分"},
+        "根因分析": {"score": 17, "percentage": 85, "comment": "根因推導清晰"},
+        "改善對策": {"score": 8.5, "percentage": 85, "comment": "對策可行"}
+    },
+    "strengths": ["結構完整", "數據充分", "根因明確"],
+    "improvements": [
+        {"priority": "高", "item": "驗證計畫", "suggestion": "補充對策有效性驗證數據"}
+    ],
+    "summary": "替身服務器返回的固定評分結果"
+}
+
+# Webhook 簽名密鑰與每個投遞先失敗的次數
+WEBHOOK_SECRET = os.environ.get("STANDIN_WEBHOOK_SECRET")
+WEBHOOK_FAILURES = int(os.environ.get("STANDIN_WEBHOOK_FAILURES", "0"))
+
+# 內存存儲
+files = {}
+openai_batches = {}
+anthropic_batches = {}
+webhook_deliveries = []
+webhook_attempts = {}
+
+
+def _canned_text() -> str:
+    return json.dumps(CANNED_RESULT, ensure_ascii=False)
+
+
+# ---------------------------------------------------------------------------
+# OpenAI Files / Batch API
+# ---------------------------------------------------------------------------
+
+@app.post("/v1/files")
+async def create_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    content = await file.read()
+    file_id = f"file-{uuid.uuid4().hex}"
+    files[file_id] = content
+    return {
+        "id": file_id,
+        "object": "file",
+        "bytes": len(content),
+        "created_at": int(time.time()),
+        "filename": file.filename,
+        "purpose": purpose,
+        "status": "processed"
+    }
+
+
+@app.get("/v1/files/{file_id}/content")
+async def get_file_content(file_id: str):
+    if file_id not in files:
+        raise HTTPException(status_code=404, detail="file not found")
+    return Response(content=files[file_id], media_type="application/octet-stream")
+
+
+def _openai_batch_view(batch: dict) -> dict:
+    batch["polls"] += 1
+    if batch["status"] == "in_progress" and batch["polls"] > BATCH_POLLS:
+        lines = []
+        for line in files[batch["input_file_id"]].decode("utf-8").splitlines():
+            request = json.loads(line)
+            lines.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "request_id": uuid.uuid4().hex,
+                    "body": {
+                        "id": f"chatcmpl-{uuid.uuid4().hex}",
+                        "object": "chat.completion",
+                        "model": request["body"]["model"],
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": _canned_text()},
+                            "finish_reason": "stop"
+                        }],
+                        "usage": {"prompt_tokens": 1200, "completion_tokens": 400, "total_tokens": 1600}
+                    }
+                },
+                "error": None
+            }, ensure_ascii=False))
+
+        output_file_id = f"file-{uuid.uuid4().hex}"
+        files[output_file_id] = "\n".join(lines).encode("utf-8")
+        batch.update(status="completed", output_file_id=output_file_id, completed_at=int(time.time()))
+        batch["request_counts"] = {"total": len(lines), "completed": len(lines), "failed": 0}
+
+    return {k: v for k, v in batch.items() if k != "polls"}
+
+
+@app.post("/v1/batches")
+async def create_openai_batch(request: Request):
+    body = await request.json()
+    if body["input_file_id"] not in files:
+        raise HTTPException(status_code=400, detail="input file not found")
+
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    openai_batches[batch_id] = {
+        "id": batch_id,
+        "object": "batch",
+        "endpoint": body["endpoint"],
+        "input_file_id": body["input_file_id"],
+        "completion_window": body["completion_window"],
+        "status": "in_progress",
+        "output_file_id": None,
+        "error_file_id": None,
+        "created_at": int(time.time()),
+        "completed_at": None,
+        "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        "polls": 0
+    }
+    return {k: v for k, v in openai_batches[batch_id].items() if k != "polls"}
+
+
+@app.get("/v1/batches/{batch_id}")
+async def retrieve_openai_batch(batch_id: str):
+    if batch_id not in openai_batches:
+        raise HTTPException(status_code=404, detail="batch not found")
+    return _openai_batch_view(openai_batches[batch_id])
+
+
+# ---------------------------------------------------------------------------
+# Anthropic Message Batches API
+# ---------------------------------------------------------------------------
+
+def _anthropic_batch_view(batch: dict, base_url: str) -> dict:
+    batch["polls"] += 1
+    if batch["processing_status"] == "in_progress" and batch["polls"] > BATCH_POLLS:
+        batch["processing_status"] = "ended"
+        batch["ended_at"] = _iso_now()
+        batch["request_counts"]["succeeded"] = batch["request_counts"]["processing"]
+        batch["request_counts"]["processing"] = 0
+
+    view = {k: v for k, v in batch.items() if k not in ("polls", "requests")}
+    if batch["processing_status"] == "ended":
+        view["results_url"] = f"{base_url}v1/messages/batches/{batch['id']}/results"
+    return view
+
+
+def _iso_now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+@app.post("/v1/messages/batches")
+async def create_anthropic_batch(request: Request):
+    body = await request.json()
+    batch_id = f"msgbatch_{uuid.uuid4().hex}"
+    anthropic_batches[batch_id] = {
+        "id": batch_id,
+        "type": "message_batch",
+        "processing_status": "in_progress",
+        "request_counts": {
+            "processing": len(body["requests"]),
+            "succeeded": 0,
+            "errored": 0,
+            "canceled": 0,
+            "expired": 0
+        },
+        "created_at": _iso_now(),
+        "expires_at": _iso_now(),
+        "ended_at": None,
+        "archived_at": None,
+        "cancel_initiated_at": None,
+        "results_url": None,
+        "requests": body["requests"],
+        "polls": 0
+    }
+    return _anthropic_batch_view(anthropic_batches[batch_id], str(request.base_url))
+
+
+@app.get("/v1/messages/batches/{batch_id}")
+async def retrieve_anthropic_batch(batch_id: str, request: Request):
+    if batch_id not in anthropic_batches:
+        raise HTTPException(status_code=404, detail="batch not found")
+    return _anthropic_batch_view(anthropic_batches[batch_id], str(request.base_url))
+
+
+@app.get("/v1/messages/batches/{batch_id}/results")
+async def anthropic_batch_results(batch_id: str):
+    batch = anthropic_batches.get(batch_id)
+    if not batch or batch["processing_status"] != "ended":
+        raise HTTPException(status_code=404, detail="results not available")
+
+    lines = []
+    for item in batch["requests"]:
+        lines.append(json.dumps({
+            "custom_id": item["custom_id"],
+            "result": {
+                "type": "succeeded",
+                "message": {
+                    "id": f"msg_{uuid.uuid4().hex}",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": item["params"]["model"],
+                    "content": [{"type": "text", "text": _canned_text()}],
+                    "stop_reason": "end_turn",
+                    "stop_sequence": None,
+                    "usage": {"input_tokens": 1200, "output_tokens": 400}
+                }
+            }
+        }, ensure_ascii=False))
+
+    return Response(content="\n".join(lines).encode("utf-8"), media_type="application/binary")
+
+
+# ---------------------------------------------------------------------------
+# OpenAI Chat Completions (串流)
+# ---------------------------------------------------------------------------
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    text = _canned_text()
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    usage = {"prompt_tokens": 1000, "completion_tokens": len(text) // 2, "total_tokens": 1000 + len(text) // 2}
+
+    if not body.get("stream"):
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage
+        }
+
+    pieces = [text[i:i + 40] for i in range(0, len(text), 40)]
+
+    async def events():
+        for piece in pieces:
+            await asyncio.sleep(STREAM_SECONDS / len(pieces))
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [],
+                "usage": usage
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# ---------------------------------------------------------------------------
+# Webhook 接收端
+# ---------------------------------------------------------------------------
+
+@app.post("/webhook")
+async def receive_webhook(request: Request):
+    body = await request.body()
+    delivery_id = request.headers.get("x-fa-delivery", "")
+
+    webhook_attempts[delivery_id] = webhook_attempts.get(delivery_id, 0) + 1
+    if webhook_attempts[delivery_id] <= WEBHOOK_FAILURES:
+        return Response(status_code=503, headers={"Retry-After": "1"})
+
+    signature = request.headers.get("x-fa-signature")
+    if WEBHOOK_SECRET:
+        timestamp = request.headers.get("x-fa-timestamp", "")
+        expected = "sha256=" + hmac.new(
+            WEBHOOK_SECRET.encode(), timestamp.encode() + b"." + body, hashlib.sha256
+        ).hexdigest()
+        if not signature or not hmac.compare_digest(expected, signature):
+            raise HTTPException(status_code=401, detail="invalid signature")
+
+    webhook_deliveries.append({
+        "delivery_id": delivery_id,
+        "event": request.headers.get("x-fa-event"),
+        "attempts": webhook_attempts[delivery_id],
+        "signed": signature is not None,
+        "verified": bool(WEBHOOK_SECRET),
+        "received_at": _iso_now(),
+        "payload": json.loads(body),
+    })
+    return {"received": True}
+
+
+@app.get("/webhook/deliveries")
+async def list_webhook_deliveries():
+    return webhook_deliveries